@@ -22,6 +22,8 @@ def create_app(config_class=Config):
         log_dir=app.config.get('LOG_DIR'),
         console_format=app.config.get('LOG_CONSOLE_FORMAT', 'human'),
         json_file=app.config.get('LOG_JSON_FILE', True),
+        assincrono=app.config.get('LOG_ASSINCRONO', True),
+        amostragem=app.config.get('LOG_AMOSTRAGEM'),
     )
 
     if app.config.get('QUIET_WERKZEUG_LOGS', True):
@@ -51,10 +53,45 @@ def create_app(config_class=Config):
     from app import routes, models  # noqa: F401
     app.register_blueprint(routes.bp)
 
+    # agregados de status do dashboard recalculados a cada flush de Certidao
+    from app.services import resumo_status
+    resumo_status.registrar_eventos()
+    # rebuild no boot e na virada do dia fora dos requests
+    if app.config.get('RESUMO_STATUS_MANUTENCAO', True):
+        resumo_status.iniciar_manutencao(app)
+
+    # cache de processo da configuracao/municipios invalidado a cada commit
+    from app.services import config_cache
+    config_cache.registrar_eventos()
+
+    # cache de alvos de lote invalidado a cada commit de certidao/empresa/item
+    from app.services import batch_engine
+    batch_engine.registrar_eventos()
+
+    # capacidades do agendador de emissoes (vagas de solver, navegadores)
+    from app.services import agendador
+    agendador.configurar(app.config)
+
     # persistencia do historico de diagnostico (thread escritora + prune inicial)
     if app.config.get('DIAGNOSTICO_PERSISTIR', True):
         iniciar_persistencia(app, app.config.get('DIAGNOSTICO_RETENCAO_DIAS', 30))
 
+    # metricas dos solvers de captcha (gravacao em banco + janelas de latencia)
+    if app.config.get('CAPTCHA_METRICAS_PERSISTIR', True):
+        from app.services import metricas_captcha
+        metricas_captcha.iniciar_persistencia(app, app.config.get('CAPTCHA_METRICAS_RETENCAO_DIAS', 90))
+
+    # lotes interrompidos por reinicio voltam como 'paused' (retomaveis)
+    if app.config.get('BATCH_RESTAURAR_NO_BOOT', True):
+        try:
+            from app.automation.batch_state import restaurar_lotes
+            with app.app_context():
+                restaurados = restaurar_lotes()
+            if restaurados:
+                log_event('startup_batches_restored', lotes=restaurados)
+        except Exception as e:
+            log_event('startup_batch_restore_failed', level='WARNING', error=str(e))
+
     # limpeza de capturas Selenium (screenshot/HTML) antigas
     try:
         from app.automation.capture import prune_capturas
@@ -16,18 +16,21 @@ FGTS_BATCH_STATE = batch_engine.batch_state_defaults()
 RS_BATCH_STATE = batch_engine.batch_state_defaults()
 MUNICIPAL_BATCH_STATE = batch_engine.batch_state_defaults()
 
-EMISSAO_INDIVIDUAL_LOCK = Lock()
-_EMISSAO_INDIVIDUAL_STATE = {'ativa': False}
-
-
-def emissao_individual_ativa():
-    with EMISSAO_INDIVIDUAL_LOCK:
-        return _EMISSAO_INDIVIDUAL_STATE['ativa']
-
-
-def marcar_emissao_individual(ativa):
-    with EMISSAO_INDIVIDUAL_LOCK:
-        _EMISSAO_INDIVIDUAL_STATE['ativa'] = bool(ativa)
+# chave persistida em LoteExecucao.lote -> (lock, estado)
+LOTES = {
+    'fgts': (FGTS_BATCH_LOCK, FGTS_BATCH_STATE),
+    'estadual_rs': (RS_BATCH_LOCK, RS_BATCH_STATE),
+    'municipal': (MUNICIPAL_BATCH_LOCK, MUNICIPAL_BATCH_STATE),
+}
+
+def restaurar_lotes():
+    """Recarrega do banco os lotes interrompidos por reinicio (ficam 'paused'
+    aguardando /retomar). Exige app context."""
+    restaurados = []
+    for lote, (lock, state) in LOTES.items():
+        if batch_engine.restore_batch(lock, state, lote):
+            restaurados.append(lote)
+    return restaurados
 
 
 def fgts_stop_requested():
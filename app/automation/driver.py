@@ -2,8 +2,10 @@
 
 Extraído de routes.py (C1). Sem dependência do estado de lote.
 """
+import atexit
 import json
 import os
+import time
 
 try:
     import winreg
@@ -14,7 +16,7 @@ from flask import current_app
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service as ChromeService
-from threading import Lock
+from threading import Lock, Thread
 from webdriver_manager.chrome import ChromeDriverManager
 
 from app.services.execution_logger import log_event
@@ -159,14 +161,20 @@ def _build_chrome_options(anonimo=True, usar_perfil=False, profile_dir=None, pro
     return chrome_options
 
 
-def _configurar_download_automatico_chrome(driver):
-    downloads_dir = os.path.join(os.path.expanduser("~"), "Downloads")
+def _configurar_download_automatico_chrome(driver, downloads_dir=None):
+    """Libera download automatico para downloads_dir (padrao ~/Downloads).
+
+    Retorna True se o Chrome aceitou ao menos um setDownloadBehavior; sem
+    isso o arquivo vai para a pasta das preferencias do perfil."""
+    downloads_dir = downloads_dir or os.path.join(os.path.expanduser("~"), "Downloads")
+    aplicado = False
 
     try:
         driver.execute_cdp_cmd('Page.setDownloadBehavior', {
             'behavior': 'allow',
             'downloadPath': downloads_dir,
         })
+        aplicado = True
     except Exception:
         pass
 
@@ -176,6 +184,7 @@ def _configurar_download_automatico_chrome(driver):
             'downloadPath': downloads_dir,
             'eventsEnabled': False,
         })
+        aplicado = True
     except Exception:
         pass
 
@@ -190,14 +199,112 @@ def _configurar_download_automatico_chrome(driver):
                 'eventsEnabled': False,
                 'browserContextId': browser_context_id,
             })
+            aplicado = True
     except Exception:
         pass
 
+    return aplicado
+
+
+# Cache do caminho do chromedriver resolvido pelo webdriver-manager. install()
+# consulta a versao do Chrome e varre o cache do wdm (e pode ir a rede) a cada
+# chamada; aqui o resultado vale por CHROMEDRIVER_CACHE_TTL_HORAS, por major
+# version do Chrome, e e gravado em disco para sobreviver a reinicios.
+_CHROMEDRIVER_LOCK = Lock()
+_CHROMEDRIVER_CACHE = {}  # chave (major ou 'auto') -> {'path', 'resolvido_em'}
+
+
+def _chromedriver_cache_file():
+    caminho = _get_config_value('CHROMEDRIVER_CACHE_FILE', None)
+    if caminho:
+        return caminho
+    return os.path.abspath(
+        os.path.join(os.path.dirname(__file__), '..', '..', 'instance', 'chromedriver_cache.json')
+    )
+
+
+def _chromedriver_cache_ttl():
+    try:
+        horas = float(_get_config_value('CHROMEDRIVER_CACHE_TTL_HORAS', 24) or 0)
+    except (TypeError, ValueError):
+        horas = 24
+    return max(horas, 0) * 3600
+
+
+def _ler_cache_chromedriver_disco():
+    try:
+        with open(_chromedriver_cache_file(), encoding='utf-8') as fh:
+            dados = json.load(fh)
+    except (OSError, ValueError):
+        return {}
+    return dados if isinstance(dados, dict) else {}
+
+
+def _gravar_cache_chromedriver_disco(dados):
+    caminho = _chromedriver_cache_file()
+    try:
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        tmp = caminho + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            json.dump(dados, fh)
+        os.replace(tmp, caminho)
+    except OSError as exc:
+        log_event('chromedriver_cache_write_failed', level='WARNING', error=str(exc))
+
+
+def _entrada_valida(entrada, agora, ttl):
+    if not isinstance(entrada, dict):
+        return False
+    path = entrada.get('path')
+    try:
+        resolvido_em = float(entrada.get('resolvido_em') or 0)
+    except (TypeError, ValueError):
+        return False
+    return bool(path) and agora - resolvido_em < ttl and os.path.isfile(path)
+
+
+def _resolver_chromedriver():
+    """Caminho do chromedriver compativel com o Chrome instalado.
+
+    Ordem: memoria -> arquivo de cache -> ChromeDriverManager().install().
+    Emite 'chromedriver_resolved' com a origem e o tempo gasto, separando o
+    custo de subir o driver do tempo de portal."""
+    inicio = time.monotonic()
+    major = _detectar_chrome_version_main()
+    chave = str(major) if major else 'auto'
+    ttl = _chromedriver_cache_ttl()
+
+    with _CHROMEDRIVER_LOCK:
+        agora = time.time()
+        origem = 'memoria'
+        entrada = _CHROMEDRIVER_CACHE.get(chave)
+        if not _entrada_valida(entrada, agora, ttl):
+            origem = 'disco'
+            entrada = _ler_cache_chromedriver_disco().get(chave)
+            if not _entrada_valida(entrada, agora, ttl):
+                origem = 'install'
+                entrada = {'path': ChromeDriverManager().install(), 'resolvido_em': agora}
+                dados = _ler_cache_chromedriver_disco()
+                dados[chave] = entrada
+                _gravar_cache_chromedriver_disco(dados)
+            _CHROMEDRIVER_CACHE[chave] = entrada
+
+    log_event(
+        'chromedriver_resolved', origem=origem, chrome_major=major,
+        duration_ms=int((time.monotonic() - inicio) * 1000),
+    )
+    return entrada['path']
+
 
 def _criar_driver_chrome(anonimo=True, usar_perfil=False):
+    if usar_perfil:
+        # um Chrome ocioso do pool ainda segura a pasta do perfil
+        descartar_ociosos('rs_cert')
     chrome_options = _build_chrome_options(anonimo=anonimo, usar_perfil=usar_perfil)
+    inicio = time.monotonic()
     driver = webdriver.Chrome(service=ChromeService(
-        ChromeDriverManager().install()), options=chrome_options)
+        _resolver_chromedriver()), options=chrome_options)
+    log_event('chrome_driver_started', duration_ms=int((time.monotonic() - inicio) * 1000))
 
     try:
         _configurar_download_automatico_chrome(driver)
@@ -291,6 +398,7 @@ def _criar_driver_uc(profile_dir=None, profile_name=None):
 
     if profile_dir is None and profile_name is None:
         profile_dir, profile_name = _get_municipal_profile_settings()
+        descartar_ociosos('municipal_uc')
 
     options = _build_chrome_options(
         anonimo=False, usar_perfil=True,
@@ -321,3 +429,275 @@ def _criar_driver_uc(profile_dir=None, profile_name=None):
         log_event('uc_maximize_failed', level='WARNING', error=str(exc))
 
     return driver
+
+
+# ---------------------------------------------------------------------------
+# Pool de navegadores aquecidos
+# ---------------------------------------------------------------------------
+# Subir um Chrome custa alguns segundos por emissao. Com DRIVER_POOL_ENABLED o
+# pool mantem navegadores ja abertos por tipo de perfil e os entrega em
+# milissegundos; cada um e checado antes da entrega e reciclado apos
+# DRIVER_POOL_MAX_USOS usos ou em falha. Tipos com perfil persistente
+# (certificado RS, uc municipal) sao exclusivos: o Chrome trava a pasta do
+# perfil, entao ha no maximo 1 instancia e ela nao e pre-lancada em
+# background (fica aquecida apenas quando devolvida apos o uso).
+
+TIPOS_EXCLUSIVOS = frozenset({'rs_cert', 'municipal_uc'})
+
+_POOLS = {}
+_POOLS_LOCK = Lock()
+
+
+def _driver_pool_config():
+    ativo = _to_bool(_get_config_value('DRIVER_POOL_ENABLED', False), False)
+    try:
+        tamanho = max(1, int(_get_config_value('DRIVER_POOL_TAMANHO', 2) or 2))
+    except (TypeError, ValueError):
+        tamanho = 2
+    try:
+        max_usos = max(1, int(_get_config_value('DRIVER_POOL_MAX_USOS', 20) or 20))
+    except (TypeError, ValueError):
+        max_usos = 20
+    return ativo, tamanho, max_usos
+
+
+def _encerrar_driver(driver):
+    try:
+        driver.quit()
+    except Exception:
+        pass
+
+
+def _driver_saudavel(driver):
+    """Checagem barata de vida: processo do chromedriver ativo e sessao
+    respondendo com ao menos uma janela."""
+    processo = getattr(getattr(driver, 'service', None), 'process', None)
+    if processo is not None and processo.poll() is not None:
+        return False
+    try:
+        return bool(driver.window_handles)
+    except Exception:
+        return False
+
+
+class DriverPool:
+    """Navegadores aquecidos de um tipo de perfil ('incognito', 'rs_cert',
+    'municipal_uc').
+
+    obter(fabrica) entrega um driver ocioso saudavel ou cria um novo com a
+    fabrica; devolver(driver, falhou) limpa e guarda o driver para reuso ou o
+    encerra (falha, limite de usos, pool cheio)."""
+
+    def __init__(self, tipo):
+        self.tipo = tipo
+        self.exclusivo = tipo in TIPOS_EXCLUSIVOS
+        self._lock = Lock()
+        self._ociosos = []
+        self._em_uso = []
+        self._usos = {}
+        self._aquecendo = 0
+        self._fabrica = None
+
+    def _capacidade(self, tamanho):
+        return 1 if self.exclusivo else tamanho
+
+    def obter(self, fabrica, tamanho=2, max_usos=20):
+        self._fabrica = fabrica
+        while True:
+            with self._lock:
+                driver = self._ociosos.pop() if self._ociosos else None
+            if driver is None:
+                break
+            if _driver_saudavel(driver):
+                with self._lock:
+                    self._em_uso.append(driver)
+                log_event('driver_pool_checkout', tipo=self.tipo, aquecido=True,
+                          usos=self._usos.get(id(driver), 0))
+                self._restaurar_janela(driver)
+                self.aquecer(tamanho)
+                return driver
+            self._descartar(driver)
+
+        driver = fabrica()
+        with self._lock:
+            self._em_uso.append(driver)
+            self._usos[id(driver)] = 0
+        log_event('driver_pool_checkout', tipo=self.tipo, aquecido=False)
+        self.aquecer(tamanho)
+        return driver
+
+    def possui(self, driver):
+        with self._lock:
+            return driver in self._em_uso or driver in self._ociosos
+
+    def devolver(self, driver, falhou=False, tamanho=2, max_usos=20):
+        with self._lock:
+            if driver not in self._em_uso:
+                # devolucao repetida com o driver ainda ocioso. Se ele ja
+                # foi emprestado de novo, nao ha como distinguir: quem chama
+                # deve devolver uma unica vez.
+                return
+            self._em_uso.remove(driver)
+            usos = self._usos.get(id(driver), 0) + 1
+            self._usos[id(driver)] = usos
+            cheio = len(self._ociosos) >= self._capacidade(tamanho)
+
+        motivo = None
+        if falhou:
+            motivo = 'falha'
+        elif usos >= max_usos:
+            motivo = 'max_usos'
+        elif cheio:
+            motivo = 'pool_cheio'
+        elif not _driver_saudavel(driver) or not self._limpar(driver):
+            motivo = 'nao_saudavel'
+
+        if motivo:
+            log_event('driver_pool_recycle', tipo=self.tipo, motivo=motivo, usos=usos)
+            self._descartar(driver, assincrono=True)
+            self.aquecer(tamanho)
+            return
+
+        with self._lock:
+            self._ociosos.append(driver)
+
+    def aquecer(self, tamanho=2):
+        """Completa o pool ate `tamanho` ociosos em background. Tipos
+        exclusivos nao sao pre-lancados (ver comentario do modulo)."""
+        fabrica = self._fabrica
+        if self.exclusivo or fabrica is None:
+            return
+        with self._lock:
+            faltam = tamanho - len(self._ociosos) - self._aquecendo
+            if faltam <= 0:
+                return
+            self._aquecendo += faltam
+        for _ in range(faltam):
+            Thread(target=self._lancar, args=(fabrica,),
+                   name=f'driver-pool-{self.tipo}', daemon=True).start()
+
+    def _lancar(self, fabrica):
+        inicio = time.monotonic()
+        driver = None
+        try:
+            driver = fabrica()
+            self._minimizar(driver)
+        except Exception as exc:
+            log_event('driver_pool_warm_failed', level='WARNING', tipo=self.tipo, error=str(exc))
+        finally:
+            with self._lock:
+                self._aquecendo -= 1
+                if driver is not None:
+                    self._usos[id(driver)] = 0
+                    self._ociosos.append(driver)
+        if driver is not None:
+            log_event('driver_pool_warmed', tipo=self.tipo,
+                      duration_ms=int((time.monotonic() - inicio) * 1000))
+
+    def descartar_ociosos(self):
+        """Encerra (sincrono) os ociosos, liberando a pasta do perfil para um
+        Chrome criado fora do pool."""
+        with self._lock:
+            ociosos, self._ociosos = self._ociosos, []
+        for driver in ociosos:
+            self._descartar(driver)
+        return len(ociosos)
+
+    def _descartar(self, driver, assincrono=False):
+        with self._lock:
+            self._usos.pop(id(driver), None)
+            if driver in self._em_uso:
+                self._em_uso.remove(driver)
+        if assincrono:
+            Thread(target=_encerrar_driver, args=(driver,), daemon=True).start()
+        else:
+            _encerrar_driver(driver)
+
+    def _limpar(self, driver):
+        """Deixa o navegador pronto para a proxima emissao: uma unica janela
+        em about:blank. No incognito tambem zera cookies/cache; nos perfis
+        persistentes os cookies sao justamente o que se quer manter."""
+        try:
+            janelas = list(driver.window_handles)
+            for extra in janelas[1:]:
+                driver.switch_to.window(extra)
+                driver.close()
+            driver.switch_to.window(janelas[0])
+            if not self.exclusivo:
+                driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+                driver.execute_cdp_cmd('Network.clearBrowserCache', {})
+            driver.get('about:blank')
+        except Exception as exc:
+            log_event('driver_pool_reset_failed', level='WARNING', tipo=self.tipo, error=str(exc))
+            return False
+        self._minimizar(driver)
+        return True
+
+    @staticmethod
+    def _minimizar(driver):
+        # ocioso fica fora do caminho do operador; volta maximizado no obter()
+        try:
+            driver.minimize_window()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _restaurar_janela(driver):
+        try:
+            driver.maximize_window()
+        except Exception:
+            pass
+
+    def encerrar(self):
+        with self._lock:
+            drivers, self._ociosos = self._ociosos, []
+        for driver in drivers:
+            _encerrar_driver(driver)
+
+
+def _pool(tipo):
+    with _POOLS_LOCK:
+        pool = _POOLS.get(tipo)
+        if pool is None:
+            pool = _POOLS[tipo] = DriverPool(tipo)
+        return pool
+
+
+def obter_driver(tipo, fabrica):
+    """Entrega um WebDriver do tipo pedido. Com o pool desligado equivale a
+    chamar fabrica(); ligado, reaproveita um navegador aquecido."""
+    ativo, tamanho, max_usos = _driver_pool_config()
+    if not ativo:
+        return fabrica()
+    return _pool(tipo).obter(fabrica, tamanho=tamanho, max_usos=max_usos)
+
+
+def devolver_driver(driver, falhou=False):
+    """Devolve um driver obtido via obter_driver (reuso ou reciclagem). Driver
+    fora do pool e simplesmente encerrado. Idempotente."""
+    if driver is None:
+        return
+    _, tamanho, max_usos = _driver_pool_config()
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+    for pool in pools:
+        if pool.possui(driver):
+            pool.devolver(driver, falhou=falhou, tamanho=tamanho, max_usos=max_usos)
+            return
+    _encerrar_driver(driver)
+
+
+def descartar_ociosos(tipo):
+    with _POOLS_LOCK:
+        pool = _POOLS.get(tipo)
+    return pool.descartar_ociosos() if pool is not None else 0
+
+
+def encerrar_pools():
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+    for pool in pools:
+        pool.encerrar()
+
+
+atexit.register(encerrar_pools)
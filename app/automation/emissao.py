@@ -4,12 +4,12 @@ Extraído de routes.py (C1.4). Concentra a automação Selenium de emissão e
 os utilitários de validade/status/download usados por ela e por baixar_certidao.
 """
 import base64
+import hashlib
 import json
 import os
 import random
 import re
 import string
-import tempfile
 import time
 from datetime import date, datetime, timedelta
 from threading import Thread
@@ -33,6 +33,8 @@ from app.automation.sites import SITES_CERTIDOES, VALIDADES_CERTIDOES
 from app.automation.driver import (
     _configurar_download_automatico_chrome,
     _criar_driver_chrome,
+    devolver_driver,
+    obter_driver,
 )
 from app.automation.batch_state import (
     FGTS_BATCH_LOCK,
@@ -45,24 +47,25 @@ from app.automation.batch_state import (
     municipal_batch_stop_requested as _municipal_batch_stop_requested,
     rs_batch_stop_requested as _rs_batch_stop_requested,
 )
-from app.captcha_solver import solve_normal_captcha
+from app.captcha_solver import solve_normal_captcha, solve_normal_captcha_async
 from app.errors import map_exception_to_error_type, mensagem_usuario
 from app.models import (
     Certidao,
-    Municipio,
     StatusEspecial,
     SubtipoCertidao,
     TipoCertidao,
     get_a_vencer_dias,
 )
-from app.services import batch_engine
+from app.services import batch_engine, config_cache, monitor_download, ocr_captcha
 from app.services.correlation import CorrelationContext
 from app.services.retry import retry_call
 from app.services.execution_logger import log_event
 from app.services.rs_altcha import (
+    antecipar_altcha_rs as _antecipar_altcha_rs,
     clicar_enviar_estadual_rs as _clicar_enviar_estadual_rs,
     resolver_altcha_rs_com_2captcha as _resolver_altcha_rs_com_2captcha,
 )
+from app.utils import to_bool as _to_bool
 
 
 def _classe_status_por_data(data, tipo=None):
@@ -279,79 +282,25 @@ def _municipal_batch_suportado(cidade):
     return cidade_norm in {'IMBE', 'TRAMANDAI'}
 
 
-def _snapshot_downloads_pdf():
-    pasta_downloads = os.path.join(os.path.expanduser("~"), "Downloads")
-    snapshot = {}
-
-    try:
-        nomes = os.listdir(pasta_downloads)
-    except Exception:
-        return snapshot
-
-    for nome in nomes:
-        caminho = os.path.join(pasta_downloads, nome)
-        if not os.path.isfile(caminho):
-            continue
-
-        nome_l = nome.lower()
-        if not nome_l.endswith('.pdf'):
-            continue
-        if nome_l.endswith('.crdownload') or nome_l.endswith('.tmp'):
-            continue
-
-        try:
-            stat = os.stat(caminho)
-            snapshot[caminho] = {
-                'mtime': stat.st_mtime,
-                'size': stat.st_size,
-            }
-        except OSError:
-            continue
-
-    return snapshot
-
-
-def _pick_changed_download_pdf(snapshot_before):
-    current = _snapshot_downloads_pdf()
-    candidatos = []
-
-    for caminho, info in current.items():
-        base = snapshot_before.get(caminho)
-        if base is None:
-            candidatos.append((info['mtime'], caminho))
-            continue
-
-        if info['mtime'] > base.get('mtime', 0) or info['size'] != base.get('size', -1):
-            candidatos.append((info['mtime'], caminho))
-
-    if not candidatos:
-        return None
-
-    candidatos.sort(key=lambda item: item[0], reverse=True)
-    return candidatos[0][1]
-
-
-def _wait_file_stable(caminho_arquivo, checks=3, interval=0.6):
-    ultimo_tamanho = None
-    estavel = 0
-
-    for _ in range(max(2, int(checks))):
+def _iniciar_monitor_download(driver, certidao_id, termos_ignorar=None):
+    """Aponta os downloads do Chrome para uma pasta exclusiva da emissao e
+    devolve o monitor sobre ela. Se o Chrome nao aceitar a pasta, observa
+    ~/Downloads como antes."""
+    pasta = None
+    if driver is not None:
         try:
-            tamanho = os.path.getsize(caminho_arquivo)
-        except OSError:
-            return False
-
-        if tamanho > 0 and tamanho == ultimo_tamanho:
-            estavel += 1
-            if estavel >= 2:
-                return True
-        else:
-            estavel = 0
-
-        ultimo_tamanho = tamanho
-        time.sleep(interval)
-
-    return False
+            pasta = monitor_download.pasta_emissao(certidao_id)
+        except OSError as exc:
+            log_event('download_emissao_dir_failed', level='WARNING', certidao_id=certidao_id, error=str(exc))
+        if pasta and not _configurar_download_automatico_chrome(driver, pasta):
+            monitor_download.remover_pasta_emissao(pasta)
+            pasta = None
+    return monitor_download.MonitorDownload(
+        pasta,
+        termos_ignorar=termos_ignorar,
+        contexto={'certidao_id': certidao_id},
+        pasta_propria=True,
+    )
 
 
 def _rs_pagina_solicitacao_pronta(driver, cnpj_field_name='campoCnpj', timeout=3):
@@ -395,6 +344,13 @@ def _rs_preencher_cnpj_com_confirmacao(driver, cnpj_field_name, cnpj_limpo, tent
     return False
 
 
+def _rs_lote_tem_proximo():
+    with RS_BATCH_LOCK:
+        return (RS_BATCH_STATE.get('status') == 'running'
+                and not RS_BATCH_STATE.get('stop_requested')
+                and RS_BATCH_STATE.get('index', 0) + 1 < RS_BATCH_STATE.get('total', 0))
+
+
 def _emitir_estadual_rs_certidao(certidao_id, driver=None, usar_2captcha=False, execution_id=None):
     if execution_id:
         CorrelationContext.set_execution_id(execution_id)
@@ -416,17 +372,25 @@ def _emitir_estadual_rs_certidao(certidao_id, driver=None, usar_2captcha=False,
 
     local_driver = driver
     criado_localmente = False
+    monitor = None
     inicio_fluxo = time.time()
+    fim_etapa_anterior = [inicio_fluxo]
 
     def _log_etapa(etapa, extra=''):
-        state = _rs_get_page_state(local_driver)
-        elapsed = time.time() - inicio_fluxo
+        # so url/titulo: ler o texto do body a cada etapa custava uma ida ao driver
+        state = _rs_get_page_state(local_driver, incluir_corpo=False)
+        agora = time.time()
+        elapsed = agora - inicio_fluxo
+        # etapa_ms: tempo desde a etapa anterior (histograma por etapa em /metrics)
+        etapa_ms = int((agora - fim_etapa_anterior[0]) * 1000)
+        fim_etapa_anterior[0] = agora
         log_event(
             'rs_batch_stage',
             certidao_id=certidao_id,
             empresa_id=certidao.empresa_id if certidao else None,
             stage=etapa,
             duration_ms=int(elapsed * 1000),
+            etapa_ms=etapa_ms,
             status='running',
             extra=extra,
             url=state['url'],
@@ -465,6 +429,8 @@ def _emitir_estadual_rs_certidao(certidao_id, driver=None, usar_2captcha=False,
             _log_etapa('Sessão expirada detectada após preencher CNPJ')
             return False, False, 'Sessão RS expirada após preencher CNPJ.'
 
+        monitor = _iniciar_monitor_download(local_driver, certidao_id)
+
         if usar_2captcha:
             altcha_resultado = None
             for tentativa_altcha in range(1, 3):
@@ -474,6 +440,7 @@ def _emitir_estadual_rs_certidao(certidao_id, driver=None, usar_2captcha=False,
                     'Retorno ALTCHA',
                     extra=(
                         f"status={altcha_resultado.get('status')} "
+                        f"solver={altcha_resultado.get('solver') or '-'} "
                         f"msg={(altcha_resultado.get('message') or '')[:180]}"
                     )
                 )
@@ -512,7 +479,6 @@ def _emitir_estadual_rs_certidao(certidao_id, driver=None, usar_2captcha=False,
 
             time.sleep(0.5)
             _log_etapa('Tentando clicar Enviar')
-            snapshot_downloads_antes_envio = _snapshot_downloads_pdf()
             try:
                 handle_principal_rs = local_driver.current_window_handle
             except Exception:
@@ -522,6 +488,10 @@ def _emitir_estadual_rs_certidao(certidao_id, driver=None, usar_2captcha=False,
             if not envio_rs.get('clicked'):
                 return False, False, 'Não foi possível acionar o botão Enviar no lote RS.'
 
+            # o proximo item ja vai para o 2captcha enquanto este baixa e salva o PDF
+            if _rs_lote_tem_proximo() and _antecipar_altcha_rs(current_app.config, execution_id=execution_id):
+                _log_etapa('ALTCHA do próximo item enviado ao 2captcha')
+
             time.sleep(0.7)
             if _rs_fechar_abas_processamento(local_driver, handle_principal=handle_principal_rs):
                 _log_etapa('Certidão em processamento detectada; mantendo pendente e seguindo lote')
@@ -562,29 +532,20 @@ def _emitir_estadual_rs_certidao(certidao_id, driver=None, usar_2captcha=False,
                 _log_etapa('Sessão expirada detectada durante espera de download')
                 return False, False, 'Sessão RS expirada durante espera do download.'
 
-            if usar_2captcha:
-                candidato = _pick_changed_download_pdf(snapshot_downloads_antes_envio)
-            else:
-                candidato = file_manager.verificar_novo_arquivo(inicio_monitoramento)
-
+            candidato = monitor.esperar(1.0)
             if candidato:
-                if not _wait_file_stable(candidato, checks=4, interval=0.6):
-                    _log_etapa('Arquivo detectado ainda instável', extra=f'arquivo={os.path.basename(candidato)}')
-                    time.sleep(0.8)
-                    continue
                 novo_arquivo = candidato
                 _log_etapa('Download detectado', extra=f'arquivo={os.path.basename(candidato)}')
                 break
 
-            time.sleep(1)
-
         if not novo_arquivo:
             return False, True, 'Timeout aguardando download da certidão Estadual RS.'
 
         sucesso, caminho_final = file_manager.mover_e_renomear(
             novo_arquivo,
             certidao.empresa.nome,
-            certidao.tipo.value
+            certidao.tipo.value,
+            empresa_id=certidao.empresa_id,
         )
         if not sucesso:
             return False, True, f'Falha ao mover arquivo Estadual RS: {caminho_final}'
@@ -662,6 +623,8 @@ def _emitir_estadual_rs_certidao(certidao_id, driver=None, usar_2captcha=False,
         )
         return False, True, mensagem_usuario(exc, contexto='lote Estadual RS')
     finally:
+        if monitor:
+            monitor.fechar()
         if criado_localmente:
             RS_BATCH_STATE['driver'] = None
             if local_driver:
@@ -750,46 +713,86 @@ def _imbe_fechar_modal_erro_captcha(driver, timeout=3):
     return False
 
 
-def _imbe_resolver_captcha_2captcha(driver, execution_id=None):
+def _imbe_antecipar_captcha(driver, execution_id=None):
+    """Envia o captcha ao 2captcha assim que a imagem aparece, para a resposta
+    chegar enquanto os campos sao preenchidos. (sha256 da imagem, Future) ou None.
+    Nao envia quando o OCR local ja tem palpite confiavel para a imagem."""
+    if not _to_bool(current_app.config.get('CAPTCHA_PREFETCH_ENABLED', True), True):
+        return None
+    imagem = _imbe_encontrar_captcha_imagem(driver, timeout=2)
+    if not imagem:
+        return None
+    try:
+        captcha_bytes = imagem.screenshot_as_png
+        if not captcha_bytes:
+            return None
+        ocr = ocr_captcha.reconhecer(current_app.config, captcha_bytes, execution_id=execution_id)
+        if ocr and ocr['aceito']:
+            return None
+        futuro = solve_normal_captcha_async(
+            current_app.config, image_bytes=captcha_bytes, execution_id=execution_id,
+        )
+    except Exception as exc:
+        log_event('imbe_captcha_prefetch_failed', level='WARNING', error=str(exc))
+        return None
+    return hashlib.sha256(captcha_bytes).hexdigest(), futuro
+
+
+def _imbe_resolver_captcha(driver, execution_id=None, antecipado=None, usar_ocr=True):
+    """Preenche o captcha: OCR local quando confiante (usar_ocr), senao 2captcha.
+    (ok, erro, tentativa); tentativa vai para ocr_captcha.registrar_tentativa
+    quando o portal aceitar/recusar a resposta."""
     imagem = _imbe_encontrar_captcha_imagem(driver)
     if not imagem:
-        return False, 'Imagem do captcha não encontrada.'
+        return False, 'Imagem do captcha não encontrada.', None
 
     campo = _imbe_encontrar_campo_captcha(driver)
     if not campo:
-        return False, 'Campo do captcha não encontrado.'
+        return False, 'Campo do captcha não encontrado.', None
 
-    arquivo_tmp = None
     try:
         captcha_bytes = imagem.screenshot_as_png
         if not captcha_bytes:
-            return False, 'Captcha sem imagem capturada.'
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as tmp:
-            tmp.write(captcha_bytes)
-            arquivo_tmp = tmp.name
-
-        resultado = solve_normal_captcha(
-            current_app.config,
-            image_path=arquivo_tmp,
-            execution_id=execution_id,
-        )
+            return False, 'Captcha sem imagem capturada.', None
+
+        tentativa = {'imagem': captcha_bytes, 'solver': '2captcha', 'ocr': None}
+        resultado = None
+        if usar_ocr:
+            ocr = ocr_captcha.reconhecer(current_app.config, captcha_bytes, execution_id=execution_id)
+            tentativa['ocr'] = ocr
+            if ocr and ocr['aceito']:
+                tentativa['solver'] = 'ocr'
+                resultado = {'code': ocr['texto']}
+                if antecipado:
+                    antecipado[1].cancel()
+        if resultado is None and antecipado:
+            hash_enviado, futuro = antecipado
+            # a resposta antecipada so vale se a imagem ainda e a mesma
+            if hashlib.sha256(captcha_bytes).hexdigest() == hash_enviado:
+                try:
+                    resultado = futuro.result()
+                except Exception as exc:
+                    log_event('imbe_captcha_prefetch_failed', level='WARNING', error=str(exc))
+            else:
+                futuro.cancel()
+                log_event('imbe_captcha_prefetch_discarded', motivo='imagem_mudou')
+        if resultado is None:
+            resultado = solve_normal_captcha(
+                current_app.config,
+                image_bytes=captcha_bytes,
+                execution_id=execution_id,
+            )
         codigo = (resultado.get('code') or '').strip()
         if not codigo:
-            return False, 'Resposta do 2captcha vazia.'
+            return False, 'Resposta do 2captcha vazia.', None
+        tentativa['resposta'] = codigo
 
         campo.clear()
         campo.click()
         campo.send_keys(codigo)
-        return True, None
+        return True, None, tentativa
     except Exception as exc:
-        return False, f'Falha ao resolver captcha: {exc}'
-    finally:
-        if arquivo_tmp and os.path.exists(arquivo_tmp):
-            try:
-                os.remove(arquivo_tmp)
-            except Exception:
-                pass
+        return False, f'Falha ao resolver captcha: {exc}', None
 
 
 def _emitir_municipal_certidao_lote(certidao_id, driver=None, execution_id=None):
@@ -851,6 +854,7 @@ def _emitir_municipal_certidao_lote(certidao_id, driver=None, execution_id=None)
 
     local_driver = driver
     criado_localmente = False
+    monitor = None
 
     try:
         if local_driver is None:
@@ -861,15 +865,7 @@ def _emitir_municipal_certidao_lote(certidao_id, driver=None, execution_id=None)
 
         wait = WebDriverWait(local_driver, 20)
         local_driver.get(info_site.get('url'))
-        try:
-            _configurar_download_automatico_chrome(local_driver)
-        except Exception as exc:
-            log_event(
-                'municipal_batch_download_config_failed', level='WARNING',
-                certidao_id=certidao_id, error=str(exc),
-            )
-
-        snapshot_before = _snapshot_downloads_pdf()
+        monitor = _iniciar_monitor_download(local_driver, certidao_id)
 
         steps_before = config_municipal.get('before_cnpj', []) if config_municipal else []
         resultado_steps = steps.executar_municipio(
@@ -898,6 +894,10 @@ def _emitir_municipal_certidao_lote(certidao_id, driver=None, execution_id=None)
                 except Exception:
                     pass
 
+        captcha_antecipado = None
+        if cidade_regra_norm == 'IMBE':
+            captcha_antecipado = _imbe_antecipar_captcha(local_driver, execution_id=execution_id)
+
         if info_site.get('cnpj_field_id'):
             by_map = steps.BY_MAP
             field_by = by_map.get(info_site.get('by'))
@@ -948,7 +948,12 @@ def _emitir_municipal_certidao_lote(certidao_id, driver=None, execution_id=None)
                     _imbe_fechar_modal_erro_captcha(local_driver)
                     time.sleep(0.4)
 
-                ok, erro_msg = _imbe_resolver_captcha_2captcha(local_driver, execution_id=execution_id)
+                # OCR local so na 1a tentativa: resposta recusada vai ao 2captcha
+                ok, erro_msg, captcha_tentativa = _imbe_resolver_captcha(
+                    local_driver, execution_id=execution_id,
+                    antecipado=captcha_antecipado if tentativa == 1 else None,
+                    usar_ocr=tentativa == 1,
+                )
                 if not ok:
                     if tentativa >= 2:
                         return False, False, erro_msg or 'Falha ao resolver captcha IMBE.'
@@ -978,10 +983,15 @@ def _emitir_municipal_certidao_lote(certidao_id, driver=None, execution_id=None)
                     except Exception:
                         pass
                     try:
-                        _configurar_download_automatico_chrome(local_driver)
+                        _configurar_download_automatico_chrome(local_driver, monitor.pasta)
                     except Exception:
                         pass
                 mensagem = _imbe_obter_mensagem_sistema(local_driver, timeout=4)
+                ocr_captcha.registrar_tentativa(
+                    current_app.config, captcha_tentativa,
+                    'recusado' if mensagem == 'captcha_incorreto' else 'aceito',
+                    execution_id=execution_id,
+                )
                 if mensagem == 'captcha_incorreto':
                     if tentativa >= 2:
                         return False, False, 'Captcha incorreto (2 tentativas).'
@@ -1017,15 +1027,13 @@ def _emitir_municipal_certidao_lote(certidao_id, driver=None, execution_id=None)
             if _municipal_batch_stop_requested():
                 return False, False, 'Lote interrompido.'
 
-            novo_arquivo = _pick_changed_download_pdf(snapshot_before)
-            if not novo_arquivo:
-                novo_arquivo = file_manager.verificar_novo_arquivo(tempo_inicio)
-
+            novo_arquivo = monitor.esperar(1.0)
             if novo_arquivo:
                 sucesso, msg = file_manager.mover_e_renomear(
                     novo_arquivo,
                     certidao.empresa.nome,
                     nome_certidao_arquivo,
+                    empresa_id=certidao.empresa_id,
                 )
 
                 if not sucesso:
@@ -1074,8 +1082,6 @@ def _emitir_municipal_certidao_lote(certidao_id, driver=None, execution_id=None)
                     }
                 return True, False, 'Certidão municipal emitida com sucesso.'
 
-            time.sleep(1)
-
         return False, False, 'Tempo esgotado sem download.'
     except UnexpectedAlertPresentException:
         try:
@@ -1119,6 +1125,8 @@ def _emitir_municipal_certidao_lote(certidao_id, driver=None, execution_id=None)
         )
         return False, True, mensagem_usuario(exc, contexto='lote municipal')
     finally:
+        if monitor:
+            monitor.fechar()
         if local_driver and not criado_localmente:
             _fgts_fechar_abas_extras(local_driver)
         if criado_localmente and local_driver:
@@ -1146,13 +1154,14 @@ def _emitir_fgts_certidao(certidao_id, driver=None, execution_id=None):
 
     local_driver = driver
     criado_localmente = False
+    falhou = False
     try:
         log_event('fgts_emit_start', certidao_id=certidao_id, empresa_id=certidao.empresa_id)
         if _fgts_stop_requested():
             return False, False, 'Lote interrompido.'
 
         if local_driver is None:
-            local_driver = _criar_driver_chrome()
+            local_driver = obter_driver('incognito', _criar_driver_chrome)
             criado_localmente = True
 
         FGTS_BATCH_STATE['driver'] = local_driver
@@ -1259,6 +1268,7 @@ def _emitir_fgts_certidao(certidao_id, driver=None, execution_id=None):
             return True, False, None
         return False, False, 'Falha ao gerar PDF FGTS.'
     except Exception as exc:
+        falhou = True
         log_event(
             'fgts_emit_error',
             level='ERROR',
@@ -1276,10 +1286,7 @@ def _emitir_fgts_certidao(certidao_id, driver=None, execution_id=None):
         if criado_localmente:
             FGTS_BATCH_STATE['driver'] = None
         if criado_localmente and local_driver:
-            try:
-                local_driver.quit()
-            except Exception:
-                pass
+            devolver_driver(local_driver, falhou=falhou)
 
 
 def calcular_validade_padrao(certidao, data_encontrada=None):
@@ -1311,7 +1318,7 @@ def calcular_validade_padrao(certidao, data_encontrada=None):
     return None
 
 
-def _rs_get_page_state(driver):
+def _rs_get_page_state(driver, incluir_corpo=True):
     try:
         url = (driver.current_url or '').strip()
     except Exception:
@@ -1322,10 +1329,12 @@ def _rs_get_page_state(driver):
     except Exception:
         title = ''
 
-    try:
-        body_text = (driver.find_element(By.TAG_NAME, 'body').text or '').strip().lower()
-    except Exception:
-        body_text = ''
+    body_text = ''
+    if incluir_corpo:
+        try:
+            body_text = (driver.find_element(By.TAG_NAME, 'body').text or '').strip().lower()
+        except Exception:
+            body_text = ''
 
     return {
         'url': url,
@@ -1629,7 +1638,8 @@ def _automatizar_fgts(contexto, driver, wait, certidao, detectar_impedimento=Fal
             sucesso, msg = file_manager.mover_e_renomear(
                 caminho_pdf,
                 certidao.empresa.nome,
-                certidao.tipo.value
+                certidao.tipo.value,
+                empresa_id=certidao.empresa_id,
             )
 
             if sucesso:
@@ -1684,15 +1694,8 @@ def _carregar_config_municipio(regra_municipio):
 
 
 def _buscar_municipio_por_cidade(cidade):
-    cidade_norm = file_manager.remover_acentos((cidade or '').strip()).upper()
-    if not cidade_norm:
-        return None
-
-    for municipio in Municipio.query.all():
-        nome_norm = file_manager.remover_acentos(municipio.nome or '').upper()
-        if nome_norm == cidade_norm:
-            return municipio
-    return None
+    # snapshot do cache de processo: sem query por item de lote
+    return config_cache.municipio_por_cidade(cidade)
 
 
 def _resolve_imbe_tipo_from_subtipo(cert_subtipo):
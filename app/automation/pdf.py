@@ -3,8 +3,11 @@
 Extraído de routes.py (C1). São funções puras de I/O + parsing, sem
 dependência de Selenium nem do estado de lote.
 """
+import hashlib
 import os
 import re
+import threading
+from collections import OrderedDict
 from datetime import datetime
 
 import pdfplumber
@@ -12,36 +15,128 @@ import pdfplumber
 from app import db, file_manager
 from app.models import StatusEspecial
 from app.services.execution_logger import log_event
+from app.utils import get_config_value
 
 
-def extrair_validade_federal(caminho_pdf):
-    if not caminho_pdf:
-        return None
+# Cache de extracao por conteudo: o mesmo PDF e lido varias vezes na mesma
+# emissao (validade federal, classificacao, tratamento de positiva). A chave e
+# o SHA-256 do arquivo; (tamanho, mtime) por caminho evita recalcular o hash
+# enquanto o arquivo nao muda. Guarda texto da 1a pagina, texto completo,
+# classificacao e validade federal; falha de leitura nao entra no cache.
+_NAO_CALCULADO = object()
+_cache_lock = threading.Lock()
+_CACHE = OrderedDict()   # sha256 -> entrada
+_POR_CAMINHO = {}        # caminho -> (tamanho, mtime_ns, sha256)
+
 
+def _max_itens_cache():
     try:
-        with pdfplumber.open(caminho_pdf) as pdf:
-            texto = "\n".join(page.extract_text() or "" for page in pdf.pages)
-    except Exception as exc:
-        log_event('federal_pdf_read_error', level='WARNING', error=str(exc))
+        return max(0, int(get_config_value('PDF_CACHE_MAX_ITENS', 256)))
+    except (TypeError, ValueError):
+        return 256
+
+
+def _sha256_arquivo(caminho_pdf):
+    h = hashlib.sha256()
+    with open(caminho_pdf, 'rb') as fh:
+        for bloco in iter(lambda: fh.read(1024 * 1024), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def _entrada_cache(caminho_pdf):
+    """Entrada do cache para o arquivo (criada vazia) ou None se o arquivo
+    nao puder ser lido / cache desligado."""
+    if not caminho_pdf or _max_itens_cache() <= 0:
         return None
+    caminho = os.path.abspath(str(caminho_pdf))
+    try:
+        st = os.stat(caminho)
+        chave_caminho = (st.st_size, st.st_mtime_ns)
+        with _cache_lock:
+            conhecido = _POR_CAMINHO.get(caminho)
+        if conhecido and conhecido[:2] == chave_caminho:
+            sha = conhecido[2]
+        else:
+            sha = _sha256_arquivo(caminho)
+    except OSError:
+        return None
+
+    with _cache_lock:
+        _POR_CAMINHO[caminho] = chave_caminho + (sha,)
+        entrada = _CACHE.get(sha)
+        if entrada is None:
+            entrada = {
+                'primeira_pagina': _NAO_CALCULADO,
+                'texto': _NAO_CALCULADO,
+                'classificacao': _NAO_CALCULADO,
+                'validade_federal': _NAO_CALCULADO,
+            }
+            _CACHE[sha] = entrada
+            while len(_CACHE) > _max_itens_cache():
+                _CACHE.popitem(last=False)
+        else:
+            _CACHE.move_to_end(sha)
+        if len(_POR_CAMINHO) > 4 * _max_itens_cache():
+            _POR_CAMINHO.clear()
+    return entrada
 
-    match = re.search(r"Válida\s+até\s+(\d{2}/\d{2}/\d{4})", texto, re.IGNORECASE)
+
+def limpar_cache():
+    with _cache_lock:
+        _CACHE.clear()
+        _POR_CAMINHO.clear()
+
+
+def _extrair(caminho_pdf, so_primeira_pagina=False):
+    with pdfplumber.open(caminho_pdf) as pdf:
+        paginas = pdf.pages[:1] if so_primeira_pagina else pdf.pages
+        return "\n".join(page.extract_text() or "" for page in paginas)
+
+
+def _texto_cacheado(caminho_pdf, entrada, so_primeira_pagina=False):
+    """Texto (1a pagina ou completo) via cache; levanta a excecao de leitura."""
+    campo = 'primeira_pagina' if so_primeira_pagina else 'texto'
+    if entrada is not None:
+        texto = entrada[campo]
+        if texto is not _NAO_CALCULADO:
+            return texto
+        if so_primeira_pagina and entrada['texto'] is not _NAO_CALCULADO:
+            # ja tem o documento inteiro: nao vale reabrir
+            return entrada['texto']
+    texto = _extrair(caminho_pdf, so_primeira_pagina=so_primeira_pagina)
+    if entrada is not None:
+        entrada[campo] = texto
+    return texto
+
+
+def _validade_federal_no_texto(texto):
+    match = re.search(r"Válida\s+até\s+(\d{2}/\d{2}/\d{4})", texto or '', re.IGNORECASE)
     if not match:
         return None
-
     try:
         return datetime.strptime(match.group(1), "%d/%m/%Y").date()
     except ValueError:
         return None
 
 
+def extrair_validade_federal(caminho_pdf):
+    if not caminho_pdf:
+        return None
+
+    try:
+        return _analisar(caminho_pdf, ('validade_federal',))['validade_federal']
+    except Exception as exc:
+        log_event('federal_pdf_read_error', level='WARNING', error=str(exc))
+        return None
+
+
 def extrair_texto(caminho_pdf, origem_log='PDF'):
     if not caminho_pdf:
         return ''
 
     try:
-        with pdfplumber.open(caminho_pdf) as pdf:
-            return "\n".join(page.extract_text() or "" for page in pdf.pages)
+        return _texto_cacheado(caminho_pdf, _entrada_cache(caminho_pdf))
     except Exception as exc:
         log_event('pdf_read_error', level='WARNING', origem=origem_log, error=str(exc))
         return ''
@@ -74,8 +169,74 @@ def classificar_texto(texto):
     return 'desconhecida'
 
 
+# campo -> (funcao sobre o texto, valor "sem resposta")
+_CALCULOS = {
+    'classificacao': (classificar_texto, 'desconhecida'),
+    'validade_federal': (_validade_federal_no_texto, None),
+}
+
+
+def analise_em_cache(caminho_pdf, campos):
+    """Campos ja calculados para o arquivo (dict) ou None se falta algum."""
+    entrada = _entrada_cache(caminho_pdf)
+    if entrada is None or any(entrada[c] is _NAO_CALCULADO for c in campos):
+        return None
+    return {c: entrada[c] for c in campos}
+
+
+def registrar_analise(caminho_pdf, resultado):
+    """Grava no cache deste processo uma analise feita em outro (pool)."""
+    entrada = _entrada_cache(caminho_pdf)
+    if entrada is None:
+        return
+    for campo, valor in resultado.items():
+        if campo in entrada:
+            entrada[campo] = valor
+
+
+def analisar_arquivo(caminho_pdf, campos=('classificacao', 'validade_federal')):
+    """Le o PDF e calcula os campos pedidos, tentando so a 1a pagina (onde
+    ficam o titulo e o "Valida ate") antes do documento inteiro.
+
+    Unidade de trabalho do pool de processos (services.classificacao_pdf);
+    levanta a excecao de leitura."""
+    entrada = _entrada_cache(caminho_pdf)
+    resultado = {}
+    for campo in campos:
+        if entrada is not None and entrada[campo] is not _NAO_CALCULADO:
+            resultado[campo] = entrada[campo]
+
+    for so_primeira_pagina in (True, False):
+        pendentes = [c for c in campos if c not in resultado]
+        if not pendentes:
+            break
+        texto = _texto_cacheado(caminho_pdf, entrada, so_primeira_pagina=so_primeira_pagina)
+        for campo in pendentes:
+            calcular, vazio = _CALCULOS[campo]
+            valor = calcular(texto)
+            if valor != vazio or not so_primeira_pagina:
+                resultado[campo] = valor
+
+    if entrada is not None:
+        for campo, valor in resultado.items():
+            entrada[campo] = valor
+    return resultado
+
+
+def _analisar(caminho_pdf, campos):
+    from app.services import classificacao_pdf
+    return classificacao_pdf.analisar(caminho_pdf, campos)
+
+
 def classificar_status(caminho_pdf, origem_log='PDF'):
-    return classificar_texto(extrair_texto(caminho_pdf, origem_log=origem_log))
+    if not caminho_pdf:
+        return 'desconhecida'
+
+    try:
+        return _analisar(caminho_pdf, ('classificacao',))['classificacao']
+    except Exception as exc:
+        log_event('pdf_read_error', level='WARNING', origem=origem_log, error=str(exc))
+        return 'desconhecida'
 
 
 def classificar_e_tratar_positivo(certidao, caminho_pdf, origem_log='PDF', tipo_label=None):
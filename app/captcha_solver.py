@@ -1,12 +1,32 @@
+"""Cliente 2captcha (ALTCHA do RS e captcha de imagem de Imbe).
+
+As resolucoes rodam no AsyncTwoCaptcha, num event loop proprio em thread de
+fundo: varias tarefas ficam em voo ao mesmo tempo (ate CAPTCHA_2_CONCORRENCIA)
+e o polling do 2captcha nao prende thread de lote. solve_*_async devolve um
+concurrent.futures.Future, para o fluxo enviar o desafio e seguir trabalhando
+no navegador; solve_altcha/solve_normal_captcha esperam o resultado.
+
+Cada resolucao alimenta metricas_captcha (latencia, retries, consultas), e a
+espera pelo resultado segue a agenda adaptativa de la em vez do intervalo
+fixo do cliente.
+"""
+import asyncio
+import base64
 import json
+import threading
 import time
 
-from twocaptcha import TwoCaptcha
+from twocaptcha import AsyncTwoCaptcha, NetworkException, TimeoutException
 
 from app.errors import ErrorType, map_exception_to_error_type
+from app.services import metricas_captcha
 from app.services.correlation import CorrelationContext
 from app.services.execution_logger import log_event
-from app.services.retry import retry_call
+from app.services.retry import retry_call_async
+
+_loop = None
+_loop_lock = threading.Lock()
+_semaforos = {}
 
 
 class AltchaSolverError(Exception):
@@ -51,78 +71,130 @@ def _extract_code(result):
     return ''
 
 
-def solve_altcha(config, page_url, challenge_json=None, challenge_url=None, execution_id=None):
-    if execution_id:
-        CorrelationContext.set_execution_id(execution_id)
+def _obter_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='captcha-2captcha', daemon=True).start()
+            _loop = loop
+        return _loop
+
 
+def _semaforo(limite):
+    # criado e usado so dentro do loop
+    semaforo = _semaforos.get(limite)
+    if semaforo is None:
+        semaforo = _semaforos[limite] = asyncio.Semaphore(limite)
+    return semaforo
+
+
+def _limite_concorrencia(config):
+    return max(1, _parse_int(config.get('CAPTCHA_2_CONCORRENCIA'), 4))
+
+
+def _criar_solver(config):
     api_key = (config.get('CAPTCHA_2_API_KEY') or '').strip()
     if not api_key:
         raise AltchaSolverConfigError('CAPTCHA_2_API_KEY não configurada.')
 
-    if not challenge_json and not challenge_url:
-        raise AltchaSolverConfigError('Challenge ALTCHA não disponível para envio ao 2captcha.')
-
     server = (config.get('CAPTCHA_2_SERVER') or '2captcha.com').strip() or '2captcha.com'
-    solver = TwoCaptcha(
+    solver = AsyncTwoCaptcha(
         apiKey=api_key,
         server=server,
         defaultTimeout=_parse_int(config.get('CAPTCHA_2_DEFAULT_TIMEOUT'), 180),
         pollingInterval=_parse_int(config.get('CAPTCHA_2_POLLING_INTERVAL'), 10),
     )
-
-    payload = {
-        'pageurl': page_url,
-    }
-
-    if challenge_json:
-        if isinstance(challenge_json, (dict, list)):
-            payload['challenge_json'] = json.dumps(challenge_json, separators=(',', ':'))
-        else:
-            payload['challenge_json'] = str(challenge_json)
-    else:
-        payload['challenge_url'] = str(challenge_url)
-
-    def _resolver():
-        return solver.altcha(**payload)
-
-    def _retry_if(exc):
-        err_type = map_exception_to_error_type(exc)
-        return err_type in {ErrorType.TIMEOUT, ErrorType.NETWORK_PATH, ErrorType.PORTAL}
-
-    start_time = time.time()
-    try:
-        result = retry_call(
-            _resolver,
-            max_attempts=3,
-            base_delay=0.5,
-            jitter=0.2,
-            retry_if=_retry_if,
-            on_retry=lambda attempt, delay, exc: log_event(
-                'altcha_retry',
-                level='WARNING',
-                attempt=attempt,
-                delay_ms=int(delay * 1000),
-                error_type=map_exception_to_error_type(exc).value,
-                error=str(exc),
-            ),
-        )
-    except Exception as exc:
-        err_type = map_exception_to_error_type(exc)
+    return solver, server
+
+
+def _polling_adaptativo(solver, nome):
+    """Troca o wait_result do cliente: 1a consulta perto da mediana de
+    latencia do solver, consultas mais proximas ate o p95 e o intervalo
+    configurado dali em diante. Devolve o contador de consultas."""
+    contador = {'consultas': 0}
+
+    async def wait_result(id_, timeout, polling_interval):
+        espera, rapido, fim_rapido, padrao = metricas_captcha.agenda_polling(nome, polling_interval)
+        inicio = time.monotonic()
+        limite = inicio + timeout
+        await asyncio.sleep(min(espera, timeout))
+        while True:
+            contador['consultas'] += 1
+            try:
+                return await solver.get_result(id_)
+            except NetworkException:
+                agora = time.monotonic()
+                if agora >= limite:
+                    break
+                intervalo = rapido if agora - inicio < fim_rapido else padrao
+                await asyncio.sleep(min(intervalo, limite - agora))
+        raise TimeoutException(f'timeout {timeout} exceeded')
+
+    solver.wait_result = wait_result
+    return contador
+
+
+def _retry_if(exc):
+    err_type = map_exception_to_error_type(exc)
+    return err_type in {ErrorType.TIMEOUT, ErrorType.NETWORK_PATH, ErrorType.PORTAL}
+
+
+async def _resolver(evento, chamada, limite, server, execution_id, msg_falha, msg_vazia,
+                    contador):
+    tentativas = [1]
+
+    def _on_retry(attempt, delay, exc):
+        tentativas[0] = attempt + 1
         log_event(
-            'altcha_error',
-            level='ERROR',
-            error_type=err_type.value,
+            f'{evento}_retry',
+            level='WARNING',
+            attempt=attempt,
+            delay_ms=int(delay * 1000),
+            error_type=map_exception_to_error_type(exc).value,
             error=str(exc),
-            server=server,
+            execution_id=execution_id,
         )
-        raise AltchaSolverRuntimeError(f'Falha ao resolver ALTCHA no 2captcha: {exc}') from exc
+
+    def _registrar(sucesso, error_type=None):
+        metricas_captcha.registrar(
+            evento, sucesso, int((time.time() - start_time) * 1000), tentativas=tentativas[0],
+            consultas=contador['consultas'], error_type=error_type, execution_id=execution_id,
+        )
+
+    async with _semaforo(limite):
+        start_time = time.time()
+        try:
+            result = await retry_call_async(
+                chamada,
+                max_attempts=3,
+                base_delay=0.5,
+                jitter=0.2,
+                retry_if=_retry_if,
+                on_retry=_on_retry,
+            )
+        except Exception as exc:
+            err_type = map_exception_to_error_type(exc)
+            _registrar(False, err_type.value)
+            log_event(
+                f'{evento}_error',
+                level='ERROR',
+                error_type=err_type.value,
+                error=str(exc),
+                server=server,
+                execution_id=execution_id,
+            )
+            raise AltchaSolverRuntimeError(f'{msg_falha}: {exc}') from exc
 
     duration_ms = int((time.time() - start_time) * 1000)
     code = _extract_code(result)
     if not code:
-        raise AltchaSolverRuntimeError(f'Resposta ALTCHA sem token reutilizável: {result}')
+        _registrar(False, ErrorType.PORTAL.value)
+        raise AltchaSolverRuntimeError(f'{msg_vazia}: {result}')
 
-    log_event('altcha_solved', status='ok', duration_ms=duration_ms, server=server)
+    _registrar(True)
+    log_event(f'{evento}_solved', status='ok', duration_ms=duration_ms, server=server,
+              tentativas=tentativas[0], consultas=contador['consultas'], execution_id=execution_id)
 
     return {
         'code': code,
@@ -130,68 +202,71 @@ def solve_altcha(config, page_url, challenge_json=None, challenge_url=None, exec
     }
 
 
-def solve_normal_captcha(config, image_path=None, execution_id=None):
+def _submeter(evento, solver, chamada, config, server, execution_id, msg_falha, msg_vazia):
+    # o loop e compartilhado entre threads: o execution_id vai explicito
+    # (CorrelationContext e por thread)
     if execution_id:
         CorrelationContext.set_execution_id(execution_id)
+    else:
+        execution_id = CorrelationContext.get_execution_id()
+    contador = _polling_adaptativo(solver, evento)
+    coro = _resolver(evento, chamada, _limite_concorrencia(config), server, execution_id,
+                     msg_falha, msg_vazia, contador)
+    return asyncio.run_coroutine_threadsafe(coro, _obter_loop())
 
-    api_key = (config.get('CAPTCHA_2_API_KEY') or '').strip()
-    if not api_key:
-        raise AltchaSolverConfigError('CAPTCHA_2_API_KEY não configurada.')
 
-    if not image_path:
-        raise AltchaSolverConfigError('Imagem do captcha não informada para o 2captcha.')
+def solve_altcha_async(config, page_url, challenge_json=None, challenge_url=None, execution_id=None):
+    """Envia o ALTCHA ao 2captcha sem esperar; Future com {'code', 'raw'}.
 
-    server = (config.get('CAPTCHA_2_SERVER') or '2captcha.com').strip() or '2captcha.com'
-    solver = TwoCaptcha(
-        apiKey=api_key,
-        server=server,
-        defaultTimeout=_parse_int(config.get('CAPTCHA_2_DEFAULT_TIMEOUT'), 180),
-        pollingInterval=_parse_int(config.get('CAPTCHA_2_POLLING_INTERVAL'), 10),
+    Erro de configuracao sobe na hora; falha da resolucao sai no Future como
+    AltchaSolverRuntimeError."""
+    solver, server = _criar_solver(config)
+
+    if not challenge_json and not challenge_url:
+        raise AltchaSolverConfigError('Challenge ALTCHA não disponível para envio ao 2captcha.')
+
+    payload = {
+        'pageurl': page_url,
+    }
+
+    if challenge_json:
+        if isinstance(challenge_json, (dict, list)):
+            payload['challenge_json'] = json.dumps(challenge_json, separators=(',', ':'))
+        else:
+            payload['challenge_json'] = str(challenge_json)
+    else:
+        payload['challenge_url'] = str(challenge_url)
+
+    return _submeter(
+        'altcha', solver, lambda: solver.altcha(**payload), config, server, execution_id,
+        'Falha ao resolver ALTCHA no 2captcha', 'Resposta ALTCHA sem token reutilizável',
     )
 
-    def _resolver():
-        return solver.normal(image_path)
 
-    def _retry_if(exc):
-        err_type = map_exception_to_error_type(exc)
-        return err_type in {ErrorType.TIMEOUT, ErrorType.NETWORK_PATH, ErrorType.PORTAL}
+def solve_altcha(config, page_url, challenge_json=None, challenge_url=None, execution_id=None):
+    return solve_altcha_async(
+        config, page_url, challenge_json=challenge_json, challenge_url=challenge_url,
+        execution_id=execution_id,
+    ).result()
 
-    start_time = time.time()
-    try:
-        result = retry_call(
-            _resolver,
-            max_attempts=3,
-            base_delay=0.5,
-            jitter=0.2,
-            retry_if=_retry_if,
-            on_retry=lambda attempt, delay, exc: log_event(
-                'normal_captcha_retry',
-                level='WARNING',
-                attempt=attempt,
-                delay_ms=int(delay * 1000),
-                error_type=map_exception_to_error_type(exc).value,
-                error=str(exc),
-            ),
-        )
-    except Exception as exc:
-        err_type = map_exception_to_error_type(exc)
-        log_event(
-            'normal_captcha_error',
-            level='ERROR',
-            error_type=err_type.value,
-            error=str(exc),
-            server=server,
-        )
-        raise AltchaSolverRuntimeError(f'Falha ao resolver captcha de imagem no 2captcha: {exc}') from exc
 
-    duration_ms = int((time.time() - start_time) * 1000)
-    code = _extract_code(result)
-    if not code:
-        raise AltchaSolverRuntimeError(f'Resposta de captcha sem texto utilizável: {result}')
+def solve_normal_captcha_async(config, image_path=None, execution_id=None, image_bytes=None):
+    """Envia o captcha de imagem (arquivo ou bytes PNG) sem esperar; Future
+    com {'code', 'raw'}."""
+    solver, server = _criar_solver(config)
 
-    log_event('normal_captcha_solved', status='ok', duration_ms=duration_ms, server=server)
+    if not image_path and not image_bytes:
+        raise AltchaSolverConfigError('Imagem do captcha não informada para o 2captcha.')
+    # bytes vao em base64 (o cliente reconhece pelo formato): sem arquivo temporario
+    imagem = base64.b64encode(image_bytes).decode('ascii') if image_bytes else image_path
 
-    return {
-        'code': code,
-        'raw': result,
-    }
+    return _submeter(
+        'normal_captcha', solver, lambda: solver.normal(imagem), config, server, execution_id,
+        'Falha ao resolver captcha de imagem no 2captcha', 'Resposta de captcha sem texto utilizável',
+    )
+
+
+def solve_normal_captcha(config, image_path=None, execution_id=None, image_bytes=None):
+    return solve_normal_captcha_async(
+        config, image_path=image_path, execution_id=execution_id, image_bytes=image_bytes,
+    ).result()
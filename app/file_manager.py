@@ -1,13 +1,12 @@
 import os
 import shutil
 import time
-import glob
 import unicodedata
 from thefuzz import process, fuzz
 
 from app.errors import map_exception_to_error_type
+from app.services import indice_pastas
 from app.services.execution_logger import log_event
-from app.services.retry import retry_call
 
 # fallback quando nao ha config no banco: env CAMINHO_REDE ou default
 CAMINHO_REDE = os.environ.get('CAMINHO_REDE') or r"Z:\\PASTAS EMPRESAS"
@@ -18,8 +17,8 @@ def get_caminho_rede():
     config no banco (UI) > env CAMINHO_REDE > default. Best-effort: cai para o
     fallback se nao houver app context ou linha de configuracao."""
     try:
-        from app.models import ConfiguracaoSistema
-        config = ConfiguracaoSistema.query.get(1)
+        from app.services import config_cache
+        config = config_cache.obter_configuracao()
         if config and (config.caminho_rede or '').strip():
             return config.caminho_rede.strip()
     except Exception:
@@ -80,6 +79,44 @@ def remover_acentos(texto):
     return unicodedata.normalize('NFKD', texto).encode('ASCII', 'ignore').decode('ASCII')
 
 
+def _candidatos_por_token(pastas, tokens_nome):
+    """Pastas que podem dar token_set_ratio 100: um conjunto de tokens contem o outro."""
+    return [
+        p for p in pastas
+        if tokens_nome <= set(p['tokens']) or set(p['tokens']) <= tokens_nome
+    ]
+
+
+def _casar_pasta(caminho_base, nome_banco, pastas):
+    nomes = [p['pasta'] for p in pastas]
+
+    resultado = process.extractOne(nome_banco, nomes, score_cutoff=95)
+    if resultado:
+        log_event('pasta_match', caminho_base=caminho_base, pasta=resultado[0], metodo='direto')
+        return resultado[0]
+
+    nome_banco_clean = remover_acentos(nome_banco).upper()
+    candidatos = _candidatos_por_token(pastas, indice_pastas.tokens(nome_banco_clean))
+
+    for pasta in candidatos:
+        if fuzz.token_set_ratio(nome_banco, pasta['pasta']) == 100:
+            log_event('pasta_match', caminho_base=caminho_base, pasta=pasta['pasta'], metodo='inteligente')
+            return pasta['pasta']
+
+    for pasta in candidatos:
+        if fuzz.token_set_ratio(nome_banco_clean, pasta['limpo']) == 100:
+            log_event('pasta_match', caminho_base=caminho_base, pasta=pasta['pasta'], metodo='sem_acentos')
+            return pasta['pasta']
+
+    nome_upper = nome_banco.upper()
+    for pasta in pastas:
+        if pasta['upper'] == nome_upper:
+            log_event('pasta_match', caminho_base=caminho_base, pasta=pasta['pasta'], metodo='exato')
+            return pasta['pasta']
+
+    return None
+
+
 def buscar_na_pasta_especifica(caminho_base, nome_banco):
     if not nome_banco or not str(nome_banco).strip():
         return None
@@ -87,54 +124,25 @@ def buscar_na_pasta_especifica(caminho_base, nome_banco):
         return None
 
     try:
-        todas_pastas_brutas = retry_call(
-            lambda: os.listdir(caminho_base),
-            max_attempts=3,
-            base_delay=0.4,
-            jitter=0.2,
-            retry_if=lambda exc: isinstance(exc, OSError),
-            on_retry=lambda attempt, delay, exc: log_event(
-                'network_path_retry',
-                level='WARNING',
-                path=caminho_base,
-                attempt=attempt,
-                delay_ms=int(delay * 1000),
-                error_type=map_exception_to_error_type(exc).value,
-                error=str(exc),
-            ),
-        )
-
-        todas_pastas = [
-            pasta for pasta in todas_pastas_brutas
-            if not any(word.upper() in pasta.upper() for word in ["FILIAL", "ANTIGA"])
-        ]
-
-        resultado = process.extractOne(
-            nome_banco, todas_pastas, score_cutoff=95)
-        if resultado:
-            pasta_encontrada = resultado[0]
-            log_event('pasta_match', caminho_base=caminho_base, pasta=pasta_encontrada, metodo='direto')
-            return os.path.join(caminho_base, pasta_encontrada)
-
-        resultado_token = process.extractOne(
-            nome_banco, todas_pastas, scorer=fuzz.token_set_ratio, score_cutoff=100)
-        if resultado_token:
-            pasta_encontrada = resultado_token[0]
-            log_event('pasta_match', caminho_base=caminho_base, pasta=pasta_encontrada, metodo='inteligente')
-            return os.path.join(caminho_base, pasta_encontrada)
-
-        nome_banco_clean = remover_acentos(nome_banco).upper()
-        for pasta in todas_pastas:
-            pasta_clean = remover_acentos(pasta).upper()
-            score = fuzz.token_set_ratio(nome_banco_clean, pasta_clean)
-            if score == 100:
-                log_event('pasta_match', caminho_base=caminho_base, pasta=pasta, metodo='sem_acentos')
-                return os.path.join(caminho_base, pasta)
-
-        for pasta in todas_pastas:
-            if pasta.upper() == nome_banco.upper():
-                log_event('pasta_match', caminho_base=caminho_base, pasta=pasta, metodo='exato')
-                return os.path.join(caminho_base, pasta)
+        indice, do_cache = indice_pastas.obter_indice(caminho_base)
+        achou, pasta = indice_pastas.match_memorizado(indice, nome_banco)
+        if not achou:
+            pastas = [
+                p for p in indice['pastas']
+                if not any(word in p['upper'] for word in ["FILIAL", "ANTIGA"])
+            ]
+            pasta = _casar_pasta(caminho_base, nome_banco, pastas)
+            if pasta is None and do_cache:
+                # mtime com resolucao grossa (rede) pode esconder pasta recem-criada
+                indice, _ = indice_pastas.obter_indice(caminho_base, forcar=True)
+                pastas = [
+                    p for p in indice['pastas']
+                    if not any(word in p['upper'] for word in ["FILIAL", "ANTIGA"])
+                ]
+                pasta = _casar_pasta(caminho_base, nome_banco, pastas)
+            indice_pastas.memorizar_match(indice, nome_banco, pasta)
+        if pasta:
+            return os.path.join(caminho_base, pasta)
 
     except Exception as e:
         log_event(
@@ -191,61 +199,77 @@ def encontrar_pasta_empresa(nome_banco):
 
 
 def encontrar_caminho_final(caminho_empresa):
+    memorizado = indice_pastas.caminho_final_memorizado(caminho_empresa)
+    if memorizado:
+        return memorizado
+
     pasta_destino = caminho_empresa
 
-    for variacao in VARIACOES_DOCS:
-        try:
-            pastas_da_empresa = retry_call(
-                lambda: os.listdir(caminho_empresa),
-                max_attempts=3,
-                base_delay=0.4,
-                jitter=0.2,
-                retry_if=lambda exc: isinstance(exc, OSError),
-                on_retry=lambda attempt, delay, exc: log_event(
-                    'network_path_retry',
-                    level='WARNING',
-                    path=caminho_empresa,
-                    attempt=attempt,
-                    delay_ms=int(delay * 1000),
-                    error_type=map_exception_to_error_type(exc).value,
-                    error=str(exc),
-                ),
-            )
+    try:
+        pastas_da_empresa = indice_pastas.listar_com_retry(caminho_empresa)
+    except Exception as e:
+        pastas_da_empresa = []
+        log_event(
+            'network_path_read_error',
+            level='ERROR',
+            path=caminho_empresa,
+            error_type=map_exception_to_error_type(e).value,
+            error=str(e),
+            status='error',
+        )
 
-            for pasta_encontrada in pastas_da_empresa:
-                caminho_completo = os.path.join(caminho_empresa, pasta_encontrada)
-                if os.path.isdir(caminho_completo) and variacao.upper() in pasta_encontrada.upper():
-                    pasta_destino = caminho_completo
-                    log_event('pasta_docs_encontrada', pasta=pasta_encontrada, variacao=variacao)
-                    break
-            else:
+    for variacao in VARIACOES_DOCS:
+        for pasta_encontrada in pastas_da_empresa:
+            if variacao.upper() not in pasta_encontrada.upper():
                 continue
-            break
-        except Exception as e:
-            log_event(
-                'network_path_read_error',
-                level='ERROR',
-                path=caminho_empresa,
-                error_type=map_exception_to_error_type(e).value,
-                error=str(e),
-                status='error',
-            )
+            caminho_completo = os.path.join(caminho_empresa, pasta_encontrada)
+            if os.path.isdir(caminho_completo):
+                pasta_destino = caminho_completo
+                log_event('pasta_docs_encontrada', pasta=pasta_encontrada, variacao=variacao)
+                break
+        else:
+            continue
+        break
 
     variacoes_certidoes = ["CERTIDOES", "CERTIDÕES", "Certidoes", "Certidões"]
 
     for nome_pasta in variacoes_certidoes:
         caminho_teste = os.path.join(pasta_destino, nome_pasta)
         if os.path.exists(caminho_teste):
+            indice_pastas.memorizar_caminho_final(caminho_empresa, caminho_teste)
             return caminho_teste
 
     pasta_padrao = os.path.join(pasta_destino, "CERTIDOES")
     try:
         os.makedirs(pasta_padrao, exist_ok=True)
+        indice_pastas.memorizar_caminho_final(caminho_empresa, pasta_padrao)
         return pasta_padrao
     except OSError:
         return pasta_destino
 
 
+def resolver_pasta_certidoes(nome_empresa, empresa_id=None):
+    """Pasta CERTIDOES da empresa ou None se a pasta da empresa nao existe.
+
+    Com empresa_id, consulta antes o memo em banco (PastaEmpresa) e grava o
+    resultado novo na sessao corrente."""
+    caminho_rede = get_caminho_rede()
+    if empresa_id is not None:
+        memorizado = indice_pastas.pasta_da_empresa(empresa_id, nome_empresa, caminho_rede)
+        if memorizado:
+            log_event('empresa_pasta_memo', empresa_id=empresa_id, caminho=memorizado)
+            return memorizado
+
+    caminho_empresa = encontrar_pasta_empresa(nome_empresa)
+    if not caminho_empresa:
+        return None
+    destino = encontrar_caminho_final(caminho_empresa)
+    if empresa_id is not None and indice_pastas.caminho_final_memorizado(caminho_empresa) == destino:
+        indice_pastas.memorizar_pasta_da_empresa(
+            empresa_id, nome_empresa, caminho_rede, caminho_empresa, destino)
+    return destino
+
+
 def limpar_versoes_antigas(pasta_destino, novo_nome_padrao, tipo_certidao):
     try:
         arquivos_existentes = os.listdir(pasta_destino)
@@ -271,58 +295,12 @@ def limpar_versoes_antigas(pasta_destino, novo_nome_padrao, tipo_certidao):
         log_event('limpar_versoes_erro', level='WARNING', error=str(e))
 
 
-def verificar_novo_arquivo(tempo_inicio, termos_ignorar=None, extensoes_permitidas=('.pdf',)):
-    pasta_downloads = os.path.join(os.path.expanduser("~"), "Downloads")
-    padrao_busca = os.path.join(pasta_downloads, "*")
-
-    arquivos = glob.glob(padrao_busca)
-    arquivos = [f for f in arquivos if os.path.isfile(f)]
-
-    if not arquivos:
-        return None
-
-    candidatos = []
-
-    for caminho in arquivos:
-        try:
-            tempo_criacao = os.path.getctime(caminho)
-        except OSError:
-            continue
-
-        if tempo_criacao <= tempo_inicio:
-            continue
-
-        nome_arquivo = os.path.basename(caminho).lower()
-
-        # ignora temp
-        if nome_arquivo.endswith(('.crdownload', '.tmp')):
-            continue
-
-        # apenas pdf
-        if extensoes_permitidas and not nome_arquivo.endswith(extensoes_permitidas):
-            continue
-
-        if termos_ignorar and any(termo.lower() in nome_arquivo for termo in termos_ignorar):
-            log_event('arquivo_ignorado_filtro', arquivo=nome_arquivo, filtro=list(termos_ignorar))
-            continue
-
-        candidatos.append((tempo_criacao, caminho))
-
-    if not candidatos:
-        return None
-
-    # pega o mais recente
-    _, arquivo_mais_recente = max(candidatos, key=lambda x: x[0])
-    log_event('arquivo_aceito', arquivo=os.path.basename(arquivo_mais_recente).lower())
-    return arquivo_mais_recente
-
-
-def mover_e_renomear(caminho_arquivo_origem, nome_empresa, tipo_certidao):
+def mover_e_renomear(caminho_arquivo_origem, nome_empresa, tipo_certidao, empresa_id=None):
     inicio = time.time()
     log_event('arquivo_mover_inicio', empresa_nome=nome_empresa, tipo_certidao=tipo_certidao)
-    caminho_empresa = encontrar_pasta_empresa(nome_empresa)
+    destino_final = resolver_pasta_certidoes(nome_empresa, empresa_id=empresa_id)
 
-    if not caminho_empresa:
+    if not destino_final:
         log_event(
             'arquivo_mover_falha',
             level='ERROR',
@@ -334,8 +312,6 @@ def mover_e_renomear(caminho_arquivo_origem, nome_empresa, tipo_certidao):
         )
         return False, "Pasta da empresa não encontrada no Z:"
 
-    destino_final = encontrar_caminho_final(caminho_empresa)
-
     extensao = os.path.splitext(caminho_arquivo_origem)[1]
     tipo_certidao_limpo = (tipo_certidao or '').strip().upper()
     if tipo_certidao_limpo.startswith('CERTIDAO '):
@@ -389,13 +365,9 @@ def _normalizar_nome(texto):
     return remover_acentos(str(texto or '')).upper().strip()
 
 
-def localizar_certidao_existente(nome_empresa, tipo_certidao, subtipo=None):
-    caminho_empresa = encontrar_pasta_empresa(nome_empresa)
-    if not caminho_empresa:
-        return None
-
-    pasta_certidoes = encontrar_caminho_final(caminho_empresa)
-    if not os.path.exists(pasta_certidoes):
+def localizar_certidao_existente(nome_empresa, tipo_certidao, subtipo=None, empresa_id=None):
+    pasta_certidoes = resolver_pasta_certidoes(nome_empresa, empresa_id=empresa_id)
+    if not pasta_certidoes or not os.path.exists(pasta_certidoes):
         return None
 
     arquivos = [
@@ -50,9 +50,14 @@ class Certidao(db.Model):
     data_validade = db.Column(db.Date, nullable=True)
     caminho_arquivo = db.Column(db.String(500), nullable=True)
     empresa_id = db.Column(db.Integer, db.ForeignKey(
-        'empresa.id'), nullable=False)
+        'empresa.id'), nullable=False, index=True)
     status_especial = db.Column(db.Enum(StatusEspecial), nullable=True)
 
+    # classificacao de status em SQL (resumo_status.expressao_status)
+    __table_args__ = (
+        db.Index('ix_certidao_tipo_validade_especial', 'tipo', 'data_validade', 'status_especial'),
+    )
+
     def __repr__(self):
         if self.subtipo:
             return f'<Certidao {self.tipo.value} - {self.subtipo.value} - {self.empresa.nome}>'
@@ -123,6 +128,14 @@ class EventoDiagnostico(db.Model):
     """Historico persistente de erros/avisos para o painel de diagnostico.
     Sobrevive a reinicios do sistema (o buffer em memoria nao)."""
     __tablename__ = 'evento_diagnostico'
+    # filtros do painel + paginacao por id (keyset): cada indice ja entrega
+    # as linhas do filtro na ordem do cursor
+    __table_args__ = (
+        db.Index('ix_evento_diagnostico_execution_id_id', 'execution_id', 'id'),
+        db.Index('ix_evento_diagnostico_certidao_id_id', 'certidao_id', 'id'),
+        db.Index('ix_evento_diagnostico_alvo_id', 'alvo', 'id'),
+        db.Index('ix_evento_diagnostico_error_type_id', 'error_type', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     criado_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
@@ -161,6 +174,137 @@ class EventoDiagnostico(db.Model):
         return f'<EventoDiagnostico {self.nivel} {self.evento}>'
 
 
+class ResolucaoCaptcha(db.Model):
+    """Uma resolucao no 2captcha (ALTCHA RS ou captcha de imagem): base das
+    metricas de latencia/custo e do polling adaptativo (metricas_captcha)."""
+    __tablename__ = 'resolucao_captcha'
+
+    id = db.Column(db.Integer, primary_key=True)
+    criado_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    solver = db.Column(db.String(20), nullable=False)
+    sucesso = db.Column(db.Boolean, nullable=False, default=True)
+    duracao_ms = db.Column(db.Integer, nullable=False, default=0)
+    tentativas = db.Column(db.Integer, nullable=False, default=1)
+    consultas = db.Column(db.Integer, nullable=False, default=0)
+    error_type = db.Column(db.String(30), nullable=True)
+    execution_id = db.Column(db.String(40), nullable=True, index=True)
+
+    def __repr__(self):
+        return f'<ResolucaoCaptcha {self.solver} {self.duracao_ms}ms>'
+
+
+class LoteExecucao(db.Model):
+    """Espelho persistente do estado de um lote (FGTS/Estadual RS/Municipal).
+    Permite retomar o lote de onde parou apos reinicio do processo."""
+    __tablename__ = 'lote_execucao'
+
+    id = db.Column(db.Integer, primary_key=True)
+    lote = db.Column(db.String(20), nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False, default='running')
+    scope = db.Column(db.String(20), nullable=False, default='default')
+    execution_id = db.Column(db.String(40), nullable=True)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    processados = db.Column(db.Integer, nullable=False, default=0)
+    sucesso = db.Column(db.Integer, nullable=False, default=0)
+    falhas = db.Column(db.Integer, nullable=False, default=0)
+    vencidas = db.Column(db.Integer, nullable=False, default=0)
+    a_vencer = db.Column(db.Integer, nullable=False, default=0)
+    pendentes = db.Column(db.Integer, nullable=False, default=0)
+    fgts_marcadas_pendente = db.Column(db.Integer, nullable=False, default=0)
+    positivas = db.Column(db.Integer, nullable=False, default=0)
+    negativas = db.Column(db.Integer, nullable=False, default=0)
+    efeito_negativas = db.Column(db.Integer, nullable=False, default=0)
+    mensagem = db.Column(db.String(500), nullable=True)
+    iniciado_em = db.Column(db.DateTime, nullable=True)
+    finalizado_em = db.Column(db.DateTime, nullable=True)
+    atualizado_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    itens = db.relationship(
+        'LoteItem', backref='execucao', lazy='select', cascade="all, delete-orphan")
+
+    def __repr__(self):
+        return f'<LoteExecucao {self.lote} {self.status}>'
+
+
+class LoteItem(db.Model):
+    """Resultado por certidao de um LoteExecucao (tentativas, duracao, mensagem)."""
+    __tablename__ = 'lote_item'
+    __table_args__ = (
+        db.UniqueConstraint('execucao_id', 'certidao_id', name='uq_lote_item_execucao_certidao'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    execucao_id = db.Column(db.Integer, db.ForeignKey(
+        'lote_execucao.id'), nullable=False, index=True)
+    certidao_id = db.Column(db.Integer, nullable=False)
+    # posicao na fila original; concluido_seq e a posicao em ids[:index]
+    ordem = db.Column(db.Integer, nullable=False, default=0)
+    concluido_seq = db.Column(db.Integer, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='pendente')
+    tentativas = db.Column(db.Integer, nullable=False, default=0)
+    duracao_ms = db.Column(db.Integer, nullable=True)
+    mensagem = db.Column(db.String(500), nullable=True)
+    atualizado_em = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<LoteItem {self.certidao_id} {self.status}>'
+
+
+class ResumoStatus(db.Model):
+    """Contagem agregada de certidoes por (empresa, tipo, status do dashboard).
+
+    Mantida por app.services.resumo_status a cada flush que toca Certidao e
+    reconstruida por completo na virada do dia ou quando os prazos de
+    "a vencer" mudam (ResumoStatusControle)."""
+    __tablename__ = 'resumo_status'
+    __table_args__ = (
+        db.UniqueConstraint('empresa_id', 'tipo', 'status', name='uq_resumo_status_empresa_tipo_status'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    empresa_id = db.Column(db.Integer, nullable=False, index=True)
+    tipo = db.Column(db.String(20), nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    quantidade = db.Column(db.Integer, nullable=False, default=0)
+    menor_validade = db.Column(db.Date, nullable=True)
+
+    def __repr__(self):
+        return f'<ResumoStatus {self.empresa_id} {self.tipo} {self.status}={self.quantidade}>'
+
+
+class ResumoStatusControle(db.Model):
+    """Linha unica (id=1) com a data e os prazos usados no ultimo rebuild de
+    ResumoStatus; divergencia com o dia/config atuais dispara novo rebuild."""
+    __tablename__ = 'resumo_status_controle'
+
+    id = db.Column(db.Integer, primary_key=True)
+    data_referencia = db.Column(db.Date, nullable=False)
+    limites = db.Column(db.String(200), nullable=False)
+    atualizado_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ResumoStatusControle {self.data_referencia}>'
+
+
+class PastaEmpresa(db.Model):
+    """Pasta CERTIDOES resolvida na rede para a empresa (memo do file_manager).
+
+    Guarda o nome da empresa e o caminho base usados na resolucao; qualquer
+    divergencia, ou a pasta deixar de existir, faz o file_manager resolver de
+    novo pelo indice de pastas (app.services.indice_pastas)."""
+    __tablename__ = 'pasta_empresa'
+
+    empresa_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    nome_empresa = db.Column(db.String(120), nullable=False)
+    caminho_rede = db.Column(db.String(500), nullable=False)
+    caminho_empresa = db.Column(db.String(500), nullable=False)
+    caminho_certidoes = db.Column(db.String(500), nullable=False)
+    atualizado_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<PastaEmpresa {self.empresa_id} {self.caminho_certidoes}>'
+
+
 class ConfiguracaoSistema(db.Model):
     __tablename__ = 'configuracao_sistema'
 
@@ -196,21 +340,10 @@ def _validar_dias(valor_raw):
 
 
 def _get_config_cached():
-    """Retorna ConfiguracaoSistema do cache flask.g (1 query por request)."""
-    try:
-        from flask import g
-        if not hasattr(g, '_config_sistema'):
-            try:
-                g._config_sistema = ConfiguracaoSistema.query.get(1)
-            except Exception:
-                g._config_sistema = None
-        return g._config_sistema
-    except RuntimeError:
-        # Fora de contexto de request (ex: scripts, testes sem request)
-        try:
-            return ConfiguracaoSistema.query.get(1)
-        except Exception:
-            return None
+    """Snapshot de ConfiguracaoSistema do cache de processo (config_cache),
+    compartilhado entre requests e workers de lote."""
+    from app.services import config_cache
+    return config_cache.obter_configuracao()
 
 
 def get_a_vencer_dias(tipo=None, default=7):
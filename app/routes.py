@@ -27,22 +27,22 @@ from app.automation import SITES_CERTIDOES, capture, pdf, steps
 from app.automation.batch_state import (
     FGTS_BATCH_LOCK,
     FGTS_BATCH_STATE,
+    LOTES,
     MUNICIPAL_BATCH_LOCK,
     MUNICIPAL_BATCH_STATE,
     RS_BATCH_LOCK,
     RS_BATCH_STATE,
-    emissao_individual_ativa,
-    marcar_emissao_individual,
 )
 from app.automation.driver import (
     UcIndisponivelError,
     _ativar_politica_autoselect_rs_temporaria,
-    _configurar_download_automatico_chrome,
     _criar_driver_chrome,
     _criar_driver_uc,
     _desativar_politica_autoselect_rs_temporaria,
     _municipal_profile_acquire,
     _municipal_profile_release,
+    devolver_driver,
+    obter_driver,
 )
 from app.automation.sites import is_ipm_atende
 from app.automation.emissao import (
@@ -58,13 +58,12 @@ from app.automation.emissao import (
     _fgts_quit_driver_async,
     _fgts_status_por_data,
     _formatar_cnpj,
+    _iniciar_monitor_download,
     _login_certificado_rs,
     _municipal_batch_suportado,
     _nome_certidao_imbe,
     _normalizar_cnpj,
-    _pick_changed_download_pdf,
     _resolve_imbe_tipo_from_subtipo,
-    _snapshot_downloads_pdf,
     calcular_validade_padrao,
 )
 from app.models import (
@@ -78,7 +77,21 @@ from app.models import (
     get_a_vencer_dias,
 )
 from app.utils import get_config_value as _get_config_value, to_bool as _to_bool
-from app.services import batch_engine, certidao_service, diagnostics, preflight
+from app.services import (
+    agendador,
+    auditoria_pdf,
+    batch_engine,
+    certidao_service,
+    config_cache,
+    diagnostics,
+    metricas,
+    metricas_captcha,
+    monitor_download,
+    preflight,
+    resumo_status,
+    rs_altcha,
+    stream_eventos,
+)
 from app.services.correlation import CorrelationContext
 from app.services.execution_logger import log_event
 from app.services.health import run_health_checks
@@ -101,10 +114,14 @@ def _after_request_observability(response):
 
     path = request.path or ''
     is_static = path.startswith('/static/') or path == '/favicon.ico'
-    is_batch_poll = path in {'/fgts/lote/status', '/estadual-rs/lote/status', '/municipal/lote/status'}
+    is_batch_poll = path in {
+        '/fgts/lote/status', '/estadual-rs/lote/status', '/municipal/lote/status', '/auditoria/status',
+    }
     is_health_ok = path == '/health' and response.status_code == 200
+    # coleta periodica do Prometheus/painel nao vira evento nem metrica
+    is_metrics = path == '/metrics'
 
-    if is_static or is_health_ok or (is_batch_poll and response.status_code == 200):
+    if is_static or is_health_ok or is_metrics or (is_batch_poll and response.status_code == 200):
         CorrelationContext.clear()
         return response
 
@@ -146,6 +163,7 @@ def _calc_fgts_targets_by_scope(start_certidao_id, scope='default'):
         extra_filter=lambda query: query.filter(Certidao.tipo == TipoCertidao.FGTS),
         scope=scope,
         tipo=TipoCertidao.FGTS,
+        cache_chave='fgts',
     )
 
 
@@ -159,6 +177,7 @@ def _calc_estadual_rs_targets_by_scope(start_certidao_id, scope='default'):
         ),
         scope=scope,
         tipo=TipoCertidao.ESTADUAL,
+        cache_chave='estadual_rs',
     )
 
 
@@ -184,13 +203,15 @@ def _calc_municipal_targets_by_scope(start_certidao_id, scope='default'):
         return _batch_targets_vazios(scope=scope)
 
     subtipo = certidao.subtipo
+    if not (subtipo and file_manager.remover_acentos(cidade).upper() == 'IMBE'):
+        subtipo = None
 
     def _extra_filter(query):
         query = (query
                  .join(Empresa, Empresa.id == Certidao.empresa_id)
                  .filter(Certidao.tipo == TipoCertidao.MUNICIPAL)
                  .filter(Empresa.cidade == cidade))
-        if subtipo and file_manager.remover_acentos(cidade).upper() == 'IMBE':
+        if subtipo:
             query = query.filter(Certidao.subtipo == subtipo)
         return query
 
@@ -199,6 +220,7 @@ def _calc_municipal_targets_by_scope(start_certidao_id, scope='default'):
         extra_filter=_extra_filter,
         scope=scope,
         tipo=TipoCertidao.MUNICIPAL,
+        cache_chave=('municipal', cidade, subtipo),
     )
 
 
@@ -209,11 +231,22 @@ def _parse_batch_scope(raw_scope):
     return 'default'
 
 
+def _workers_do_lote(app, chave):
+    """Concorrencia configurada para o lote (>= 1; invalido cai para 1)."""
+    try:
+        return max(1, int(app.config.get(chave) or 1))
+    except (TypeError, ValueError):
+        return 1
+
+
 def _rs_batch_worker(app):
+    # RS fica sequencial: todos os itens usam o mesmo perfil do Chrome com o
+    # certificado, e o Chrome nao abre duas instancias no mesmo user-data-dir.
     def _on_setup(_app):
         return _ativar_politica_autoselect_rs_temporaria()
 
     def _on_teardown(rs_policy_ativa):
+        rs_altcha.descartar_altcha_antecipado('fim_do_lote')
         if rs_policy_ativa:
             _desativar_politica_autoselect_rs_temporaria()
 
@@ -232,10 +265,12 @@ def _rs_batch_worker(app):
         eager_driver=True,
         on_setup=_on_setup,
         on_teardown=_on_teardown,
+        recursos={'perfil_rs': 1, 'solver': 1, 'navegador': 1},
     )
 
 
 def _municipal_batch_worker(app):
+    workers = _workers_do_lote(app, 'MUNICIPAL_BATCH_WORKERS')
     batch_engine.run_batch_loop(
         app,
         lock=MUNICIPAL_BATCH_LOCK,
@@ -248,10 +283,15 @@ def _municipal_batch_worker(app):
         tag='MUNICIPAL-LOTE',
         event_prefix='municipal_batch_worker',
         create_driver=_criar_driver_chrome,
+        workers=workers,
+        # captcha de imagem (Imbe) em qualquer worker
+        recursos={'solver': workers, 'navegador': workers},
     )
 
 
 def _fgts_batch_worker(app):
+    workers = _workers_do_lote(app, 'FGTS_BATCH_WORKERS')
+
     def _recover(certidao_id, execution_id, driver, sucesso, grave, mensagem):
         # FGTS: recria o driver e tenta de novo apos falha de carregamento da pagina
         if grave and mensagem == 'Erro ao carregar página FGTS.':
@@ -281,6 +321,8 @@ def _fgts_batch_worker(app):
         event_prefix='fgts_batch_worker',
         create_driver=_criar_driver_chrome,
         recover_fn=_recover,
+        workers=workers,
+        recursos={'navegador': workers},
     )
 
 
@@ -333,11 +375,6 @@ def _register_batch_routes(prefix, endpoint_base, cfg):
         scope = _parse_batch_scope(dados.get('scope'))
         if not certidao_id:
             return _json_error('Certidão inválida.', 400)
-        if emissao_individual_ativa():
-            return _json_error(
-                'Há uma emissão individual em andamento. Aguarde concluir para iniciar o lote.',
-                400,
-            )
         if precondicao is not None:
             erro = precondicao()
             if erro is not None:
@@ -345,7 +382,7 @@ def _register_batch_routes(prefix, endpoint_base, cfg):
         dados_lote = batch_engine.init_batch_run(
             lock, state, certidao_id,
             lambda start_id: calc_targets(start_id, scope=scope),
-            worker, app_factory=_current_app_object,
+            worker, app_factory=_current_app_object, lote=cfg.get('lote'),
         )
         if dados_lote is None:
             return _json_error(cfg['msg_em_andamento'], 400)
@@ -363,21 +400,23 @@ def _register_batch_routes(prefix, endpoint_base, cfg):
         return jsonify({'status': 'ok'})
 
     def pausar():
-        driver = batch_engine.request_pause(lock, state)
+        drivers = batch_engine.request_pause(lock, state)
         log_event('batch_paused', level='WARNING', lote=nome, tag=tag)
         with lock:
             batch_engine.append_batch_message(
                 state, f"Lote {nome} pausado por solicitação.", level='warning')
-        _fgts_quit_driver_async(driver)
+        for driver in drivers:
+            _fgts_quit_driver_async(driver)
         return jsonify({'status': 'ok', 'message': cfg['msg_pausado']})
 
     def parar():
-        driver = batch_engine.request_stop(lock, state)
+        drivers = batch_engine.request_stop(lock, state)
         log_event('batch_stopped', level='WARNING', lote=nome, tag=tag)
         with lock:
             batch_engine.append_batch_message(
                 state, f"Lote {nome} interrompido por solicitação.", level='warning')
-        _fgts_quit_driver_async(driver)
+        for driver in drivers:
+            _fgts_quit_driver_async(driver)
         return jsonify({'status': 'ok', 'message': cfg['msg_interrompido']})
 
     def retomar():
@@ -404,6 +443,7 @@ _register_batch_routes('/fgts', 'fgts_lote', {
     'lock': FGTS_BATCH_LOCK, 'state': FGTS_BATCH_STATE,
     'worker': _fgts_batch_worker, 'calc_targets': _calc_fgts_targets_by_scope,
     'started_event': 'fgts_batch_started', 'tag': 'FGTS-LOTE', 'nome_lote': 'FGTS',
+    'lote': 'fgts',
     'precondicao': _preflight_precondicao(),
     'msg_em_andamento': 'Já existe um lote em andamento.',
     'msg_vazio_pendentes': 'Nenhuma certidão FGTS pendente para emissão.',
@@ -417,6 +457,7 @@ _register_batch_routes('/estadual-rs', 'estadual_rs_lote', {
     'lock': RS_BATCH_LOCK, 'state': RS_BATCH_STATE,
     'worker': _rs_batch_worker, 'calc_targets': _calc_estadual_rs_targets_by_scope,
     'started_event': 'rs_batch_started', 'tag': 'ESTADUAL-RS-LOTE', 'nome_lote': 'Estadual RS',
+    'lote': 'estadual_rs',
     'precondicao': _preflight_precondicao(_rs_lote_precondicao, precisa_solver=True),
     'msg_em_andamento': 'Já existe um lote Estadual RS em andamento.',
     'msg_vazio_pendentes': 'Nenhuma certidão Estadual RS pendente para emissão.',
@@ -430,6 +471,7 @@ _register_batch_routes('/municipal', 'municipal_lote', {
     'lock': MUNICIPAL_BATCH_LOCK, 'state': MUNICIPAL_BATCH_STATE,
     'worker': _municipal_batch_worker, 'calc_targets': _calc_municipal_targets_by_scope,
     'started_event': 'municipal_batch_started', 'tag': None, 'nome_lote': 'Municipal',
+    'lote': 'municipal',
     'precondicao': _preflight_precondicao(),
     'msg_em_andamento': 'Já existe um lote Municipal em andamento.',
     'msg_vazio_pendentes': 'Nenhuma certidão Municipal pendente para emissão.',
@@ -455,13 +497,62 @@ def diagnostico():
 
 @bp.route('/diagnostico/eventos')
 def diagnostico_eventos():
+    """Historico do painel. Filtros: execution_id, certidao_id, empresa_id,
+    alvo, error_type, nivel. Paginacao: antes_de=<id> (mais antigos) e
+    desde_id=<id> (so os novos, para o polling)."""
+    filtros = {}
+    for nome in diagnostics.FILTROS_HISTORICO:
+        valor = (request.args.get(nome) or '').strip()
+        if not valor:
+            continue
+        if nome in ('certidao_id', 'empresa_id'):
+            if not valor.isdigit():
+                return _json_error(f'{nome} inválido.', 400)
+            valor = int(valor)
+        elif nome == 'nivel':
+            valor = valor.upper()
+        filtros[nome] = valor
+
+    limite = max(1, min(request.args.get('limite', default=100, type=int) or 100, 500))
+    pagina = diagnostics.eventos_para_painel(
+        limite=limite,
+        filtros=filtros,
+        antes_de=request.args.get('antes_de', type=int),
+        desde_id=request.args.get('desde_id', type=int),
+    )
     return jsonify({
         'status': 'ok',
-        'eventos': diagnostics.eventos_para_painel(limite=100),
+        **pagina,
         'alertas': diagnostics.alertas_ativos(),
+        'persistencia': diagnostics.estatisticas_persistencia(),
     })
 
 
+@bp.route('/metrics')
+def metrics():
+    """Texto do Prometheus; ?format=json (ou Accept: application/json) para o painel."""
+    quer_json = request.args.get('format') == 'json' or (
+        request.accept_mimetypes.best_match(['text/plain', 'application/json']) == 'application/json'
+    )
+    if quer_json:
+        return jsonify({'status': 'ok', **metricas.exportar_json()})
+    return current_app.response_class(
+        metricas.exportar_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
+@bp.route('/agendador/status')
+def agendador_status():
+    """Recursos do agendador: capacidades, em uso, tarefas ativas e na fila."""
+    return jsonify({'status': 'ok', **agendador.estado()})
+
+
+@bp.route('/diagnostico/captcha')
+def diagnostico_captcha():
+    dias = request.args.get('dias', default=30, type=int) or 30
+    return jsonify({'status': 'ok', **metricas_captcha.resumo(current_app.config, dias=max(1, min(dias, 365)))})
+
+
 @bp.route('/fgts/emitir_unico', methods=['POST'])
 def fgts_emitir_unico():
     dados = request.get_json() or {}
@@ -478,8 +569,14 @@ def fgts_emitir_unico():
     if erro_preflight is not None:
         return erro_preflight
 
+    reserva, erro = _reservar_emissao_individual(certidao_id, {'navegador': 1})
+    if erro is not None:
+        return erro
     execution_id = CorrelationContext.new_execution_id()
-    sucesso, grave, mensagem = _emitir_fgts_certidao(certidao_id, execution_id=execution_id)
+    try:
+        sucesso, grave, mensagem = _emitir_fgts_certidao(certidao_id, execution_id=execution_id)
+    finally:
+        reserva.liberar()
 
     if grave:
         return _json_error(mensagem or 'Erro grave no FGTS.', 500)
@@ -548,26 +645,12 @@ def inject_year():
 def _contar_pendencias():
     """Total global de certidões que exigem ação (vencidas + a vencer).
 
-    Consulta apenas as colunas necessárias para não materializar objetos
-    Certidao a cada chamada. Reutilizado pelo context processor (title da
-    aba no page-load) e pelo endpoint /api/pendencias (polling em tempo real).
+    Lê o agregado mantido em resumo_status (soma de poucas linhas) em vez de
+    reclassificar todas as certidões. Reutilizado pelo context processor
+    (title da aba no page-load) e pelo endpoint /api/pendencias (polling).
+    Só lê: o rebuild da virada do dia fica com a manutenção do resumo_status.
     """
-    hoje = date.today()
-    limites_por_tipo = {t: get_a_vencer_dias(tipo=t) for t in TipoCertidao}
-
-    total = 0
-    linhas = db.session.query(
-        Certidao.tipo,
-        Certidao.data_validade,
-        Certidao.status_especial,
-    ).all()
-    for tipo, data_validade, status_especial in linhas:
-        if status_especial == StatusEspecial.PENDENTE or not data_validade:
-            continue
-        if data_validade < hoje or (data_validade - hoje).days <= limites_por_tipo[tipo]:
-            total += 1
-
-    return total
+    return resumo_status.total_pendencias()
 
 
 @bp.context_processor
@@ -578,47 +661,86 @@ def inject_pendencias_total():
 
 @bp.route('/api/pendencias')
 def api_pendencias():
-    """Total de pendências para o polling do title da aba (base.html)."""
+    """Total de pendências para o title da aba (base.html, sem SSE)."""
     return jsonify({'total': _contar_pendencias()})
 
-@bp.route('/')
-def dashboard():
-    status_filtros = request.args.getlist('status')
-    tipo_filtros = request.args.getlist('tipo')
-    estado_filtro = request.args.get('estado', '')
-    cidade_filtro = (request.args.get('cidade', '') or '').strip()
-    ordem = (request.args.get('ordem') or 'urgencia').strip().lower()
 
-    query = db.session.query(Empresa).distinct()
+def _fonte_lote(lock, state):
+    def snapshot():
+        with lock:
+            return batch_engine.build_batch_status_payload(state)
+    return snapshot
+
+
+@bp.route('/eventos/stream')
+def eventos_stream():
+    """SSE: progresso dos tres lotes (evento 'lote', chave fgts/estadual_rs/
+    municipal) e total de pendências (evento 'pendencias'), só com os campos
+    que mudaram. Substitui o polling de /<lote>/lote/status e /api/pendencias."""
+    app = current_app._get_current_object()
+
+    def pendencias():
+        with app.app_context():
+            return {'total': _contar_pendencias()}
+
+    fontes = [(lote, 'lote', _fonte_lote(lock, state), None) for lote, (lock, state) in LOTES.items()]
+    fontes.append(('pendencias', 'pendencias', pendencias, 'pendencias'))
+    corpo = stream_eventos.fluxo(
+        fontes,
+        intervalo=app.config.get('SSE_INTERVALO_SEGUNDOS', 1.0),
+        duracao_maxima=app.config.get('SSE_DURACAO_MAXIMA_SEGUNDOS', 300),
+    )
+    return app.response_class(corpo, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
 
-    hoje = date.today()
-    a_vencer_dias = get_a_vencer_dias()
-    limites_por_tipo = {t: get_a_vencer_dias(tipo=t) for t in TipoCertidao}
+
+_TIPOS_DASHBOARD = {'federal', 'fgts', 'estadual', 'municipal', 'trabalhista'}
+
+
+def _filtros_dashboard(args):
+    """Normaliza os filtros do dashboard (querystring da página e da API)."""
+    status_filtros = args.getlist('status')
+    tipo_filtros = args.getlist('tipo')
+    ordem = (args.get('ordem') or 'urgencia').strip().lower()
     if ordem not in {'urgencia', 'az', 'vencimento'}:
         ordem = 'urgencia'
 
-    if not status_filtros:
-        status_filtros = ['todas']
-    elif 'todas' in status_filtros:
+    if not status_filtros or 'todas' in status_filtros:
         status_filtros = ['todas']
 
-    if not tipo_filtros:
-        tipo_filtros = ['todas']
-    elif 'todas' in tipo_filtros:
+    if not tipo_filtros or 'todas' in tipo_filtros:
         tipo_filtros = ['todas']
     else:
-        tipos_validos = {'federal', 'fgts', 'estadual', 'municipal', 'trabalhista'}
-        tipo_filtros = [t for t in tipo_filtros if t in tipos_validos]
+        tipo_filtros = [t for t in tipo_filtros if t in _TIPOS_DASHBOARD]
         if not tipo_filtros:
             tipo_filtros = ['todas']
 
-    if estado_filtro:
-        query = query.filter(Empresa.estado == estado_filtro)
+    pagina = args.get('pagina', 1, type=int) or 1
+    por_pagina = args.get('por_pagina', type=int) or current_app.config.get('DASHBOARD_POR_PAGINA', 50)
+    return {
+        'status': status_filtros,
+        'tipo': tipo_filtros,
+        'estado': args.get('estado', ''),
+        'cidade': (args.get('cidade', '') or '').strip(),
+        'busca': (args.get('q') or '').strip(),
+        'ordem': ordem,
+        'pagina': max(pagina, 1),
+        'por_pagina': min(max(por_pagina, 1), 200),
+    }
+
 
-    # Query única para cidades e estados (evita round-trip extra ao banco)
+def _cidades_dashboard():
+    """Estados e cidades (variantes agrupadas pela forma normalizada) para os selects."""
     cidades_variantes = {}
     estados_set = set()
-    for cidade, estado in db.session.query(Empresa.cidade, Empresa.estado).all():
+    linhas = (
+        db.session.query(Empresa.cidade, Empresa.estado, db.func.count(Empresa.id))
+        .group_by(Empresa.cidade, Empresa.estado)
+        .all()
+    )
+    for cidade, estado, quantidade in linhas:
         if estado:
             estados_set.add(estado)
         cidade = (cidade or '').strip()
@@ -628,20 +750,24 @@ def dashboard():
         if not chave_normalizada:
             continue
         variantes = cidades_variantes.setdefault(chave_normalizada, {})
-        variantes[cidade] = variantes.get(cidade, 0) + 1
-
-    estados_disponiveis = sorted(estados_set)
+        variantes[cidade] = variantes.get(cidade, 0) + quantidade
 
     cidades_por_chave = {
         chave: _escolher_cidade_canonica_dashboard(variantes)
         for chave, variantes in cidades_variantes.items()
     }
-    cidades_disponiveis = sorted(
-        cidades_por_chave.values(),
-        key=_normalizar_cidade_dashboard,
-    )
+    return sorted(estados_set), cidades_variantes, cidades_por_chave
+
 
-    # Filtro de cidade aplicado no banco (WHERE IN) antes de carregar certidões
+def _escopo_empresas_dashboard(filtros, cidades_variantes, cidades_por_chave):
+    """Query de Empresa com estado/cidade/busca aplicados (sem status/tipo).
+
+    Devolve também a cidade canônica do filtro, para marcar o select."""
+    query = Empresa.query
+    if filtros['estado']:
+        query = query.filter(Empresa.estado == filtros['estado'])
+
+    cidade_filtro = filtros['cidade']
     if cidade_filtro:
         chave_filtro = _normalizar_cidade_dashboard(cidade_filtro)
         if chave_filtro and chave_filtro in cidades_variantes:
@@ -651,48 +777,51 @@ def dashboard():
         elif chave_filtro:
             query = query.filter(Empresa.cidade == cidade_filtro)
 
-    empresas = query.order_by(Empresa.id).all()
+    if filtros['busca']:
+        query = query.filter(Empresa.nome.ilike(f"%{filtros['busca']}%"))
+    return query, cidade_filtro
 
-    # Pré-computa contadores e status de cada certidão em Python,
-    # eliminando dois loops Jinja2 por empresa no template.
-    contadores_por_empresa = {}
-    status_por_cert = {}
-    certidoes_por_empresa = {}
-    for empresa in empresas:
-        counts = {
-            'total': 0, 'validas': 0, 'a_vencer': 0, 'vencidas': 0,
-            'pendentes': 0, 'nao_definida': 0,
-            'tipo_total': 0, 'tipo_federal': 0, 'tipo_fgts': 0,
-            'tipo_estadual': 0, 'tipo_municipal': 0, 'tipo_trabalhista': 0,
-            'menor_validade': '9999-12-31',
-        }
-        for c in empresa.certidoes:
-            if c.status_especial == StatusEspecial.PENDENTE:
-                sc = 'pendentes'
-            elif not c.data_validade:
-                sc = 'nao_definida'
-            elif c.data_validade < hoje:
-                sc = 'vencidas'
-            elif (c.data_validade - hoje).days <= limites_por_tipo[c.tipo]:
-                sc = 'a_vencer'
-            else:
-                sc = 'validas'
-            status_por_cert[c.id] = sc
-            counts['total'] += 1
-            counts[sc] += 1
-            counts['tipo_total'] += 1
-            counts['tipo_' + c.tipo.name.lower()] = counts.get('tipo_' + c.tipo.name.lower(), 0) + 1
-            if c.data_validade and sc != 'pendentes':
-                dval = c.data_validade.strftime('%Y-%m-%d')
-                if dval < counts['menor_validade']:
-                    counts['menor_validade'] = dval
-        contadores_por_empresa[empresa.id] = counts
-        certidoes_por_empresa[empresa.id] = sorted(empresa.certidoes, key=lambda c: c.ordem_exibicao)
-
-    municipios = Municipio.query.all()
 
+def _pagina_dashboard(filtros, escopo):
+    """Uma página de empresas já filtrada, ordenada e limitada no banco, com o
+    que o template dos cards precisa e os totais dos chips do escopo inteiro."""
+    resumo_status.garantir_atualizado()
+    query = resumo_status.filtrar_empresas(escopo, filtros['status'], filtros['tipo'])
+    query = resumo_status.ordenar_empresas(query, filtros['ordem'])
+
+    por_pagina = filtros['por_pagina']
+    inicio = (filtros['pagina'] - 1) * por_pagina
+    # busca um a mais para saber se existe próxima página sem COUNT
+    empresas = query.offset(inicio).limit(por_pagina + 1).all()
+    tem_mais = len(empresas) > por_pagina
+    empresas = empresas[:por_pagina]
+
+    hoje = date.today()
+    empresa_ids = [e.id for e in empresas]
+    contadores_por_empresa = resumo_status.contadores_por_empresa(empresa_ids)
+    status_por_cert = resumo_status.status_por_certidao(empresa_ids, hoje)
+    certidoes_por_empresa = {
+        empresa.id: sorted(empresa.certidoes, key=lambda c: c.ordem_exibicao)
+        for empresa in empresas
+    }
+
+    return {
+        'empresas': empresas,
+        'contadores_por_empresa': contadores_por_empresa,
+        'status_por_cert': status_por_cert,
+        'certidoes_por_empresa': certidoes_por_empresa,
+        'hoje': hoje,
+        'proxima_pagina': filtros['pagina'] + 1 if tem_mais else None,
+        'totais': resumo_status.totais_filtros(
+            escopo.with_entities(Empresa.id), filtros['status'], filtros['tipo']),
+        'sites_urls': SITES_CERTIDOES,
+        'urls_municipais': _urls_municipais_dashboard(),
+    }
+
+
+def _urls_municipais_dashboard():
     urls_municipais = {}
-    for m in municipios:
+    for m in config_cache.municipios():
         if not m.url_certidao:
             continue
         nome = (m.nome or '').strip()
@@ -709,27 +838,57 @@ def dashboard():
             if url_geral:
                 urls_municipais[nome + '_GERAL'] = url_geral
                 urls_municipais[nome_sem + '_GERAL'] = url_geral
+    return urls_municipais
+
+
+@bp.route('/')
+def dashboard():
+    filtros = _filtros_dashboard(request.args)
+    # a página sempre abre do início; as seguintes vêm de /api/dashboard/empresas
+    filtros['pagina'] = 1
+    estados_disponiveis, cidades_variantes, cidades_por_chave = _cidades_dashboard()
+    cidades_disponiveis = sorted(cidades_por_chave.values(), key=_normalizar_cidade_dashboard)
+    escopo, cidade_filtro = _escopo_empresas_dashboard(filtros, cidades_variantes, cidades_por_chave)
 
     return render_template(
         'dashboard.html',
-        empresas=empresas,
-        contadores_por_empresa=contadores_por_empresa,
-        status_por_cert=status_por_cert,
-        certidoes_por_empresa=certidoes_por_empresa,
-        status_filtros=status_filtros,
-        tipo_filtros=tipo_filtros,
-        estado_filtro=estado_filtro,
+        status_filtros=filtros['status'],
+        tipo_filtros=filtros['tipo'],
+        estado_filtro=filtros['estado'],
         cidade_filtro=cidade_filtro,
+        busca=filtros['busca'],
         estados_disponiveis=estados_disponiveis,
         cidades_disponiveis=cidades_disponiveis,
-        hoje=hoje,
-        a_vencer_dias=a_vencer_dias,
-        ordem=ordem,
-        sites_urls=SITES_CERTIDOES,
-        urls_municipais=urls_municipais
+        a_vencer_dias=get_a_vencer_dias(),
+        ordem=filtros['ordem'],
+        **_pagina_dashboard(filtros, escopo),
     )
 
 
+@bp.route('/api/dashboard/empresas')
+def api_dashboard_empresas():
+    """Próxima página de cards do dashboard (scroll infinito) com os mesmos
+    filtros da página. Com apenas_totais=1 devolve só as contagens dos chips."""
+    filtros = _filtros_dashboard(request.args)
+    _, cidades_variantes, cidades_por_chave = _cidades_dashboard()
+    escopo, _ = _escopo_empresas_dashboard(filtros, cidades_variantes, cidades_por_chave)
+
+    if _to_bool(request.args.get('apenas_totais'), False):
+        resumo_status.garantir_atualizado()
+        totais = resumo_status.totais_filtros(
+            escopo.with_entities(Empresa.id), filtros['status'], filtros['tipo'])
+        return jsonify({'totais': totais})
+
+    pagina = _pagina_dashboard(filtros, escopo)
+    html = render_template('_dashboard_empresas.html', **pagina)
+    return jsonify({
+        'html': html,
+        'quantidade': len(pagina['empresas']),
+        'proxima_pagina': pagina['proxima_pagina'],
+        'totais': pagina['totais'],
+    })
+
+
 @bp.route('/empresas')
 def empresas():
     termo = (request.args.get('q') or '').strip()
@@ -903,6 +1062,42 @@ def pagina_nova_empresa():
     return render_template('nova_empresa.html', municipios=municipios)
 
 
+@bp.route('/auditoria/iniciar', methods=['POST'])
+def auditoria_iniciar():
+    total = auditoria_pdf.iniciar(_current_app_object)
+    if total is None:
+        return _json_error('Já existe uma auditoria em andamento.', 400)
+    if not total:
+        return _json_error('Nenhuma certidão cadastrada para auditar.', 400)
+    log_event('auditoria_requested', total=total)
+    return jsonify({'status': 'ok', 'total': total})
+
+
+@bp.route('/auditoria/parar', methods=['POST'])
+def auditoria_parar():
+    if not auditoria_pdf.parar():
+        return _json_error('Nenhuma auditoria em andamento.', 400)
+    return jsonify({'status': 'ok', 'message': 'Auditoria será interrompida.'})
+
+
+@bp.route('/auditoria/status')
+def auditoria_status():
+    return jsonify(auditoria_pdf.status_payload())
+
+
+@bp.route('/auditoria/relatorio')
+def auditoria_relatorio():
+    caminho = auditoria_pdf.caminho_relatorio()
+    if not caminho:
+        return _json_error('Nenhum relatório de auditoria disponível.', 404)
+    return send_file(
+        caminho,
+        mimetype='text/csv',
+        as_attachment=True,
+        download_name=os.path.basename(caminho),
+    )
+
+
 @bp.route('/relatorios')
 def relatorios():
     hoje = date.today()
@@ -1178,15 +1373,6 @@ def _validar_baixar(certidao):
     para seguir com a automacao.
     """
     tipo_certidao_chave = certidao.tipo.name
-    estado = (certidao.empresa.estado or '').strip().upper()
-
-    if tipo_certidao_chave == 'ESTADUAL' and estado == 'RS':
-        erro = _lote_bloqueia_emissao(
-            RS_BATCH_LOCK, RS_BATCH_STATE,
-            'Lote Estadual RS em andamento. Aguarde finalizar ou interrompa o lote.',
-        )
-        if erro is not None:
-            return erro
 
     if tipo_certidao_chave == 'FGTS':
         erro = _lote_bloqueia_emissao(
@@ -1401,7 +1587,9 @@ def _baixar_classificar_pdf(certidao, cfg, caminho_arquivo):
 
 
 def _baixar_fechar_navegador(driver, certidao):
-    """Fecha aba extra (se houver) e encerra o Chrome apos salvar o arquivo."""
+    """Fecha aba extra (se houver) apos salvar o arquivo. O Chrome e encerrado
+    (ou devolvido aquecido ao pool) uma unica vez, no finally de
+    _executar_automacao_baixar."""
     try:
         janelas_abertas = list(driver.window_handles)
     except Exception:
@@ -1412,20 +1600,16 @@ def _baixar_fechar_navegador(driver, certidao):
         try:
             driver.switch_to.window(ultima)
             driver.close()
-        except Exception:
-            pass
+        except Exception as e_close:
+            log_event(
+                'emit_chrome_close_warning', level='WARNING',
+                certidao_id=certidao.id, error=str(e_close),
+            )
 
     time.sleep(1)
-    try:
-        driver.quit()
-    except Exception as e_quit:
-        log_event(
-            'emit_chrome_close_warning', level='WARNING',
-            certidao_id=certidao.id, error=str(e_quit),
-        )
 
 
-def _baixar_monitorar_download(driver, certidao, cfg, tempo_inicio, arquivo_salvo_msg=None):
+def _baixar_monitorar_download(driver, certidao, cfg, monitor, arquivo_salvo_msg=None):
     """Aguarda o download, move/renomeia o arquivo, classifica o PDF e fecha o
     navegador. Retorna (arquivo_salvo_msg, classif_dict)."""
     nome_certidao_arquivo = cfg['nome_certidao_arquivo']
@@ -1442,7 +1626,7 @@ def _baixar_monitorar_download(driver, certidao, cfg, tempo_inicio, arquivo_salv
             break
 
         if not download_detectado:
-            novo_arquivo = file_manager.verificar_novo_arquivo(tempo_inicio)
+            novo_arquivo = monitor.esperar(1.0)
 
             if novo_arquivo:
                 log_event('emit_file_detected', certidao_id=certidao.id, arquivo=str(novo_arquivo))
@@ -1450,7 +1634,8 @@ def _baixar_monitorar_download(driver, certidao, cfg, tempo_inicio, arquivo_salv
                 sucesso, msg = file_manager.mover_e_renomear(
                     novo_arquivo,
                     certidao.empresa.nome,
-                    nome_certidao_arquivo
+                    nome_certidao_arquivo,
+                    empresa_id=certidao.empresa_id,
                 )
 
                 if sucesso:
@@ -1481,8 +1666,9 @@ def _baixar_monitorar_download(driver, certidao, cfg, tempo_inicio, arquivo_salv
                         'emit_file_save_error', level='ERROR',
                         certidao_id=certidao.id, error=str(msg),
                     )
-
-        time.sleep(1)
+        else:
+            # arquivo ja salvo: so aguarda o usuario fechar a janela
+            time.sleep(1)
 
     return arquivo_salvo_msg, classif
 
@@ -1552,7 +1738,8 @@ def _abrir_driver_baixar(cfg, certidao, resultado):
 
     Municipal IPM Atende.Net -> undetected-chromedriver com perfil dedicado
     (serializado por lock); demais tipos/municipios -> _criar_driver_chrome
-    atual. Em falha de pre-condicao (perfil ocupado / uc indisponivel)
+    atual. Ambos passam pelo pool de navegadores aquecidos (obter_driver),
+    que so e usado com DRIVER_POOL_ENABLED. Em falha de pre-condicao (perfil ocupado / uc indisponivel)
     preenche resultado['erro_acionavel'] e retorna (None, False) — fail-fast,
     sem fallback para incognito. Retorna (driver, lock_municipal_ativo)."""
     tipo_certidao_chave = cfg['tipo_certidao_chave']
@@ -1569,7 +1756,7 @@ def _abrir_driver_baixar(cfg, certidao, resultado):
             }
             return None, False
         try:
-            driver = _criar_driver_uc()
+            driver = obter_driver('municipal_uc', _criar_driver_uc)
         except UcIndisponivelError as exc:
             log_event('uc_indisponivel', level='ERROR', certidao_id=certidao.id, error=str(exc))
             _municipal_profile_release()
@@ -1582,9 +1769,12 @@ def _abrir_driver_baixar(cfg, certidao, resultado):
             return None, False
         return driver, True
 
-    driver = _criar_driver_chrome(
-        anonimo=not usar_rs_autoselect,
-        usar_perfil=usar_rs_autoselect,
+    driver = obter_driver(
+        'rs_cert' if usar_rs_autoselect else 'incognito',
+        lambda: _criar_driver_chrome(
+            anonimo=not usar_rs_autoselect,
+            usar_perfil=usar_rs_autoselect,
+        ),
     )
     return driver, False
 
@@ -1629,7 +1819,7 @@ def _executar_automacao_baixar(certidao, cfg):
         'data_encontrada': None
     }
 
-    tempo_inicio = time.time()
+    monitor = None
 
     try:
         log_event('emit_automation_start', certidao_id=certidao.id, tipo=tipo_certidao_chave)
@@ -1654,13 +1844,7 @@ def _executar_automacao_baixar(certidao, cfg):
             log_event('emit_navigate', certidao_id=certidao.id, url=info_site.get('url'))
             driver.get(info_site.get('url'))
 
-        try:
-            _configurar_download_automatico_chrome(driver)
-        except Exception as exc:
-            log_event(
-                'download_config_retry_failed', level='WARNING',
-                certidao_id=certidao.id, error=str(exc),
-            )
+        monitor = _iniciar_monitor_download(driver, certidao.id)
 
         if tipo_certidao_chave == 'MUNICIPAL':
             if usar_config_municipal:
@@ -1674,10 +1858,8 @@ def _executar_automacao_baixar(certidao, cfg):
                     etapa_label='before_cnpj'
                 )
                 if resultado_steps and resultado_steps.get('encerrar_sem_arquivo'):
-                    try:
-                        driver.quit()
-                    except Exception:
-                        pass
+                    devolver_driver(driver, falhou=True)
+                    driver = None
                     resultado['window_closed'] = True
                     return resultado
 
@@ -1731,10 +1913,8 @@ def _executar_automacao_baixar(certidao, cfg):
                 etapa_label='after_cnpj'
             )
             if resultado_steps and resultado_steps.get('encerrar_sem_arquivo'):
-                try:
-                    driver.quit()
-                except Exception:
-                    pass
+                devolver_driver(driver, falhou=True)
+                driver = None
                 resultado['window_closed'] = True
                 return resultado
 
@@ -1767,7 +1947,7 @@ def _executar_automacao_baixar(certidao, cfg):
 
         if not pular_monitoramento:
             arquivo_salvo_msg, classif = _baixar_monitorar_download(
-                driver, certidao, cfg, tempo_inicio, arquivo_salvo_msg
+                driver, certidao, cfg, monitor, arquivo_salvo_msg
             )
             rs_estadual_classificacao = classif['rs_estadual_classificacao']
             rs_estadual_msg = classif['rs_estadual_msg']
@@ -1777,15 +1957,7 @@ def _executar_automacao_baixar(certidao, cfg):
             certidao_pdf_msg = classif['certidao_pdf_msg']
         else:
             log_event('fgts_monitor_skipped', certidao_id=certidao.id)
-            if driver:
-                try:
-                    time.sleep(1)
-                    driver.quit()
-                except Exception as e_quit:
-                    log_event(
-                        'emit_chrome_close_warning', level='WARNING',
-                        certidao_id=certidao.id, error=str(e_quit),
-                    )
+            time.sleep(1)
 
     except Exception as e:
         log_event('emit_selenium_error', level='ERROR', certidao_id=certidao.id, error=str(e))
@@ -1794,24 +1966,29 @@ def _executar_automacao_baixar(certidao, cfg):
                 'emit_browser_closed', level='WARNING', certidao_id=certidao.id,
                 message='Chrome fechado durante a automação; retornando fluxo pendente.',
             )
-            if driver:
-                try:
-                    driver.quit()
-                except Exception:
-                    pass
+            devolver_driver(driver, falhou=True)
+            driver = None
             resultado['window_closed'] = True
             return resultado
         capture.capturar_contexto_falha(
             driver, f'baixar_{tipo_certidao_chave}', certidao_id=certidao.id,
         )
-        if driver:
-            try:
-                driver.quit()
-            except Exception:
-                pass
+        devolver_driver(driver, falhou=True)
+        driver = None
         resultado['erro_500'] = "Ocorreu um erro na automação."
         return resultado
     finally:
+        if monitor:
+            monitor.fechar()
+        # unica devolucao no caminho normal; os ramos de erro ja devolveram
+        # com falhou=True e zeraram driver
+        try:
+            devolver_driver(driver)
+        except Exception as e_quit:
+            log_event(
+                'emit_chrome_close_warning', level='WARNING',
+                certidao_id=certidao.id, error=str(e_quit),
+            )
         if rs_autoselect_temporario_ativo:
             _desativar_politica_autoselect_rs_temporaria()
         if municipal_profile_lock_ativo:
@@ -1933,6 +2110,36 @@ def _montar_resposta_baixar(certidao, cfg, resultado):
     return jsonify(response_data)
 
 
+def _reservar_emissao_individual(certidao_id, recursos):
+    """Entra na fila do agendador por ate AGENDADOR_ESPERA_INDIVIDUAL_SEGUNDOS.
+    (reserva, None) ou (None, resposta 409 com quem ocupa o recurso)."""
+    try:
+        espera = max(0, int(_get_config_value('AGENDADOR_ESPERA_INDIVIDUAL_SEGUNDOS', 15)))
+    except (TypeError, ValueError):
+        espera = 15
+    reserva = agendador.reservar(
+        f'Emissão individual #{certidao_id}', recursos, tipo='individual', timeout=espera,
+    )
+    if reserva is not None:
+        return reserva, None
+    ocupantes = ', '.join(agendador.ocupantes(recursos)) or 'outra emissão'
+    return None, _json_error(
+        f'Recurso ocupado por: {ocupantes}. Aguarde concluir ou pause o lote.', 409,
+        error_type=ErrorType.PORTAL.value,
+    )
+
+
+def _recursos_emissao_individual(cfg):
+    """Recursos do agendador ocupados pela emissao individual (mesma escolha
+    de perfil de _abrir_driver_baixar)."""
+    recursos = {'navegador': 1}
+    if cfg['tipo_certidao_chave'] == 'MUNICIPAL' and is_ipm_atende(cfg['info_site'].get('url')):
+        recursos['perfil_municipal'] = 1
+    elif cfg['usar_rs_autoselect']:
+        recursos['perfil_rs'] = 1
+    return recursos
+
+
 @bp.route('/certidao/baixar/<int:certidao_id>')
 def baixar_certidao(certidao_id):
     file_manager.criar_chave_interrupcao()
@@ -1946,11 +2153,13 @@ def baixar_certidao(certidao_id):
     if erro is not None:
         return erro
 
-    marcar_emissao_individual(True)
+    reserva, erro = _reservar_emissao_individual(certidao.id, _recursos_emissao_individual(cfg))
+    if erro is not None:
+        return erro
     try:
         resultado = _executar_automacao_baixar(certidao, cfg)
     finally:
-        marcar_emissao_individual(False)
+        reserva.liberar()
 
     return _montar_resposta_baixar(certidao, cfg, resultado)
 
@@ -1987,96 +2196,90 @@ def monitorar_download_federal(certidao_id):
 
     minha_chave_ts = file_manager.criar_chave_interrupcao()
 
-    # Captura um snapshot antes de iniciar a janela de monitoramento
-    # para detectar arquivos criados/alterados mesmo se o download iniciar cedo.
-    snapshot_before = _snapshot_downloads_pdf()
-    log_event('federal_monitor_snapshot', certidao_id=certidao_id, pdfs=len(snapshot_before))
+    # O download federal e feito no navegador do usuario (pasta padrao): o
+    # monitor nasce antes da janela de espera para pegar download que comece
+    # cedo; a linha de base ignora o que ja estava em ~/Downloads.
+    monitor = monitor_download.MonitorDownload(
+        termos_ignorar=['consulta regularidade', 'crf', 'cndt', 'sitafe'],
+        contexto={'certidao_id': certidao_id},
+    )
+    try:
+        time.sleep(2)
 
-    time.sleep(2)
+        # Se a chave foi recriada durante o sleep (por /stop ou nova sessão), sair.
+        if file_manager.chave_interrupcao_mais_recente_que(minha_chave_ts):
+            file_manager.remover_chave_interrupcao()
+            return _json_error('Monitoramento interrompido antes de iniciar.', 409, status='interrupted')
 
-    # Se a chave foi recriada durante o sleep (por /stop ou nova sessão), sair.
-    if file_manager.chave_interrupcao_mais_recente_que(minha_chave_ts):
         file_manager.remover_chave_interrupcao()
-        return _json_error('Monitoramento interrompido antes de iniciar.', 409, status='interrupted')
-
-    file_manager.remover_chave_interrupcao()
-
-    tempo_limite = 180
-    tempo_inicio = time.time()
-    chave_interrupcao = file_manager.obter_caminho_chave_interrupcao()
-    ultimo_log = tempo_inicio
 
-    termos_proibidos = [
-        'consulta regularidade',
-        'crf',
-        'cndt',
-        'sitafe'
-    ]
+        tempo_limite = 180
+        tempo_inicio = time.time()
+        chave_interrupcao = file_manager.obter_caminho_chave_interrupcao()
+        ultimo_log = tempo_inicio
 
-    while (time.time() - tempo_inicio) < tempo_limite:
-        if os.path.exists(chave_interrupcao):
-            log_event(
-                'federal_monitor_interrupted', level='WARNING', certidao_id=certidao_id,
-                message='Monitoramento interrompido por nova requisição.',
-            )
-            file_manager.remover_chave_interrupcao()
-            return _json_error('Monitoramento interrompido.', 409, status='interrupted')
+        while (time.time() - tempo_inicio) < tempo_limite:
+            if os.path.exists(chave_interrupcao):
+                log_event(
+                    'federal_monitor_interrupted', level='WARNING', certidao_id=certidao_id,
+                    message='Monitoramento interrompido por nova requisição.',
+                )
+                file_manager.remover_chave_interrupcao()
+                return _json_error('Monitoramento interrompido.', 409, status='interrupted')
 
-        novo_arquivo = _pick_changed_download_pdf(snapshot_before)
-        if not novo_arquivo:
-            novo_arquivo = file_manager.verificar_novo_arquivo(
-                tempo_inicio, termos_ignorar=termos_proibidos)
+            novo_arquivo = monitor.esperar(1.0)
 
-        agora = time.time()
-        if (agora - ultimo_log) >= 5:
-            restante = max(0, int(tempo_limite - (agora - tempo_inicio)))
-            log_event(
-                'federal_monitor_waiting', certidao_id=certidao_id,
-                restante_s=restante, novo_arquivo=bool(novo_arquivo),
-            )
-            ultimo_log = agora
+            agora = time.time()
+            if (agora - ultimo_log) >= 5:
+                restante = max(0, int(tempo_limite - (agora - tempo_inicio)))
+                log_event(
+                    'federal_monitor_waiting', certidao_id=certidao_id,
+                    restante_s=restante, novo_arquivo=bool(novo_arquivo),
+                )
+                ultimo_log = agora
 
-        if novo_arquivo:
-            log_event('federal_file_detected', certidao_id=certidao_id, arquivo=str(novo_arquivo))
+            if novo_arquivo:
+                log_event('federal_file_detected', certidao_id=certidao_id, arquivo=str(novo_arquivo))
 
-            sucesso, msg = file_manager.mover_e_renomear(
-                novo_arquivo,
-                certidao.empresa.nome,
-                certidao.tipo.value
-            )
+                sucesso, msg = file_manager.mover_e_renomear(
+                    novo_arquivo,
+                    certidao.empresa.nome,
+                    certidao.tipo.value,
+                    empresa_id=certidao.empresa_id,
+                )
 
-            if sucesso:
-                try:
-                    certidao.caminho_arquivo = msg
-                    db.session.commit()
-                except Exception as e_db:
-                    db.session.rollback()
-                    log_event(
-                        'federal_db_save_failed', level='WARNING',
-                        certidao_id=certidao_id, error=str(e_db),
-                    )
-                validade_pdf = pdf.extrair_validade_federal(msg)
-                if validade_pdf:
+                if sucesso:
+                    try:
+                        certidao.caminho_arquivo = msg
+                        db.session.commit()
+                    except Exception as e_db:
+                        db.session.rollback()
+                        log_event(
+                            'federal_db_save_failed', level='WARNING',
+                            certidao_id=certidao_id, error=str(e_db),
+                        )
+                    validade_pdf = pdf.extrair_validade_federal(msg)
+                    if validade_pdf:
+                        return jsonify({
+                            'status': 'success',
+                            'mensagem': f"Arquivo salvo no servidor: {msg}",
+                            'visualizar_token': _gerar_visualizar_token(certidao_id),
+                            'data_validade': validade_pdf.strftime('%Y-%m-%d'),
+                            'data_validade_formatada': validade_pdf.strftime('%d/%m/%Y')
+                        })
                     return jsonify({
                         'status': 'success',
                         'mensagem': f"Arquivo salvo no servidor: {msg}",
-                        'visualizar_token': _gerar_visualizar_token(certidao_id),
-                        'data_validade': validade_pdf.strftime('%Y-%m-%d'),
-                        'data_validade_formatada': validade_pdf.strftime('%d/%m/%Y')
+                        'visualizar_token': _gerar_visualizar_token(certidao_id)
                     })
-                return jsonify({
-                    'status': 'success',
-                    'mensagem': f"Arquivo salvo no servidor: {msg}",
-                    'visualizar_token': _gerar_visualizar_token(certidao_id)
-                })
-            else:
-                return _json_error(f"Erro ao mover: {msg}", 500)
-
-        time.sleep(1)
+                else:
+                    return _json_error(f"Erro ao mover: {msg}", 500)
 
-    # limpeza final por segurança
-    file_manager.remover_chave_interrupcao()
-    return _json_error('Tempo esgotado sem download.', 408, status='timeout')
+        # limpeza final por segurança
+        file_manager.remover_chave_interrupcao()
+        return _json_error('Tempo esgotado sem download.', 408, status='timeout')
+    finally:
+        monitor.fechar()
 
 
 @bp.route('/certidao/monitorar_download_federal/stop', methods=['POST'])
@@ -2098,7 +2301,8 @@ def visualizar_certidao(token):
         caminho = file_manager.localizar_certidao_existente(
             certidao.empresa.nome,
             certidao.tipo.value,
-            certidao.subtipo.value if certidao.subtipo else None
+            certidao.subtipo.value if certidao.subtipo else None,
+            empresa_id=certidao.empresa_id,
         )
         if caminho:
             certidao.caminho_arquivo = caminho
@@ -2128,7 +2332,8 @@ def gerar_token_visualizar(certidao_id):
         caminho = file_manager.localizar_certidao_existente(
             certidao.empresa.nome,
             certidao.tipo.value,
-            certidao.subtipo.value if certidao.subtipo else None
+            certidao.subtipo.value if certidao.subtipo else None,
+            empresa_id=certidao.empresa_id,
         )
         if caminho:
             certidao.caminho_arquivo = caminho
@@ -0,0 +1,195 @@
+"""Agendador unico das emissoes (lotes e emissao individual) por recurso.
+
+Cada tarefa declara os recursos que vai ocupar enquanto roda:
+
+- perfil_rs: o perfil do Chrome com o certificado do RS (um Chrome por vez);
+- perfil_municipal: o perfil do undetected-chromedriver dos portais IPM;
+- solver: vagas de resolucao de captcha (CAPTCHA_2_CONCORRENCIA);
+- navegador: Chromes abertos ao mesmo tempo (AGENDADOR_MAX_NAVEGADORES;
+  0 = sem limite).
+
+Tarefas que nao disputam recurso rodam juntas; as que disputam entram numa
+fila por ordem de chegada. Quem chega depois so passa na frente de quem esta
+esperando se couber no que sobra depois de reservar o pedido dela (nao ha
+fome). Substitui o bloqueio global "emissao individual em andamento impede
+qualquer lote".
+
+O lote espera na propria thread de worker (pausar/parar tira da fila); a
+emissao individual espera ate AGENDADOR_ESPERA_INDIVIDUAL_SEGUNDOS e desiste.
+"""
+import itertools
+import threading
+import time
+
+from app.services.execution_logger import log_event
+
+_cond = threading.Condition()
+_capacidades = {'perfil_rs': 1, 'perfil_municipal': 1}
+_em_uso = {}
+_ativas = {}   # id -> _Tarefa
+_fila = []     # _Tarefa aguardando, em ordem de chegada
+_ids = itertools.count(1)
+
+_ESPERA_PASSO = 0.5
+
+
+class _Tarefa:
+    __slots__ = ('id', 'nome', 'tipo', 'recursos', 'desde')
+
+    def __init__(self, nome, tipo, recursos):
+        self.id = next(_ids)
+        self.nome = nome
+        self.tipo = tipo
+        self.recursos = {r: int(q) for r, q in (recursos or {}).items() if q and int(q) > 0}
+        self.desde = time.time()
+
+    def como_dict(self):
+        return {
+            'id': self.id,
+            'nome': self.nome,
+            'tipo': self.tipo,
+            'recursos': dict(self.recursos),
+            'desde': self.desde,
+        }
+
+
+class Reserva:
+    """Recursos admitidos para uma tarefa; liberar() e idempotente."""
+
+    def __init__(self, tarefa):
+        self.tarefa = tarefa
+        self._liberada = False
+
+    def liberar(self):
+        with _cond:
+            if self._liberada:
+                return
+            self._liberada = True
+            _ativas.pop(self.tarefa.id, None)
+            for recurso, qtd in self.tarefa.recursos.items():
+                _em_uso[recurso] = max(0, _em_uso.get(recurso, 0) - qtd)
+            _cond.notify_all()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.liberar()
+        return False
+
+
+def configurar(config):
+    """Capacidades a partir da configuracao do app (chamado no create_app)."""
+    def _inteiro(nome, padrao):
+        try:
+            return max(0, int(config.get(nome, padrao)))
+        except (TypeError, ValueError):
+            return padrao
+
+    with _cond:
+        _capacidades['solver'] = max(1, _inteiro('CAPTCHA_2_CONCORRENCIA', 4))
+        navegadores = _inteiro('AGENDADOR_MAX_NAVEGADORES', 0)
+        if navegadores:
+            _capacidades['navegador'] = navegadores
+        else:
+            _capacidades.pop('navegador', None)
+        _cond.notify_all()
+
+
+def _pode_admitir(tarefa):
+    """Cabe no que sobra depois de reservar o pedido de quem chegou antes e
+    ainda espera (recurso sem capacidade configurada nao limita)."""
+    livre = {r: c - _em_uso.get(r, 0) for r, c in _capacidades.items()}
+    for anterior in _fila:
+        if anterior is tarefa:
+            break
+        for recurso, qtd in anterior.recursos.items():
+            if recurso in livre:
+                livre[recurso] -= qtd
+    for recurso, qtd in tarefa.recursos.items():
+        if recurso not in livre or qtd <= livre[recurso]:
+            continue
+        # pedido maior que a capacidade inteira: admite sozinho no recurso
+        if livre[recurso] < _capacidades[recurso]:
+            return False
+    return True
+
+
+def _disputam(a, b):
+    return any(r in _capacidades for r in a.recursos.keys() & b.recursos.keys())
+
+
+def _bloqueios(tarefa):
+    """Tarefas (ativas ou antes na fila) que disputam recurso com `tarefa`."""
+    nomes = []
+    for outra in list(_ativas.values()) + _fila:
+        if outra is tarefa:
+            break
+        if _disputam(outra, tarefa):
+            nomes.append(outra.nome)
+    return nomes
+
+
+def reservar(nome, recursos, tipo='lote', timeout=None, cancelado=None, ao_enfileirar=None):
+    """Admite a tarefa assim que os recursos estiverem livres.
+
+    timeout: segundos de espera (None = sem limite). cancelado(): consultado
+    durante a espera; True tira a tarefa da fila. ao_enfileirar(bloqueios) e
+    chamado uma vez, fora do lock, quando a tarefa precisa esperar.
+    Devolve Reserva ou None (timeout/cancelada)."""
+    tarefa = _Tarefa(nome, tipo, recursos)
+    prazo = None if timeout is None else time.monotonic() + max(0.0, float(timeout))
+    avisado = False
+    inicio = time.monotonic()
+    with _cond:
+        _fila.append(tarefa)
+    try:
+        while True:
+            with _cond:
+                if _pode_admitir(tarefa):
+                    _fila.remove(tarefa)
+                    for recurso, qtd in tarefa.recursos.items():
+                        _em_uso[recurso] = _em_uso.get(recurso, 0) + qtd
+                    _ativas[tarefa.id] = tarefa
+                    _cond.notify_all()
+                    espera_ms = int((time.monotonic() - inicio) * 1000)
+                    break
+                bloqueios = _bloqueios(tarefa)
+                restante = None if prazo is None else prazo - time.monotonic()
+                if restante is not None and restante <= 0:
+                    return None
+                if avisado or ao_enfileirar is None:
+                    _cond.wait(_ESPERA_PASSO if restante is None else min(_ESPERA_PASSO, restante))
+            if cancelado is not None and cancelado():
+                return None
+            if not avisado:
+                avisado = True
+                log_event('agendador_tarefa_na_fila', tarefa=nome, tipo=tipo,
+                          recursos=tarefa.recursos, bloqueios=bloqueios)
+                if ao_enfileirar is not None:
+                    ao_enfileirar(bloqueios)
+    finally:
+        with _cond:
+            if tarefa in _fila:
+                _fila.remove(tarefa)
+                _cond.notify_all()
+
+    if avisado:
+        log_event('agendador_tarefa_admitida', tarefa=nome, tipo=tipo, espera_ms=espera_ms)
+    return Reserva(tarefa)
+
+
+def ocupantes(recursos):
+    """Nomes das tarefas ativas que usam algum dos `recursos`."""
+    with _cond:
+        return [t.nome for t in _ativas.values() if t.recursos.keys() & set(recursos or {})]
+
+
+def estado():
+    with _cond:
+        return {
+            'capacidades': dict(_capacidades),
+            'em_uso': {r: q for r, q in _em_uso.items() if q},
+            'ativas': [t.como_dict() for t in _ativas.values()],
+            'fila': [t.como_dict() for t in _fila],
+        }
@@ -0,0 +1,209 @@
+"""Resolucao local do ALTCHA (prova de trabalho) em pool de processos.
+
+O desafio ALTCHA pede o numero n em [0, maxnumber] tal que
+hash(salt + str(n)) == challenge; o widget envia de volta, em base64, o JSON
+{algorithm, challenge, number, salt, signature, took}. E so CPU: resolvido
+aqui leva milissegundos, contra dezenas de segundos no 2captcha, que fica
+como fallback (desafio fora do formato, limite estourado ou pool fora do ar).
+
+A faixa de busca e fatiada em blocos de _BLOCO numeros, em ordem crescente,
+distribuidos a RS_ALTCHA_LOCAL_PROCESSOS processos (spawn, como o pool de
+PDF); o primeiro bloco que acha o numero encerra a busca. Faixa pequena ou um
+processo so: busca na thread atual.
+"""
+import base64
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from app.errors import ErrorType
+from app.services import metricas_captcha
+from app.services.execution_logger import log_event
+
+ALGORITMOS = {'SHA-1': 'sha1', 'SHA-256': 'sha256', 'SHA-512': 'sha512'}
+SOLVER = 'altcha_local'
+
+_BLOCO = 50_000
+_MAXNUMBER_PADRAO = 1_000_000  # padrao do widget quando o desafio nao informa
+
+_lock = threading.Lock()
+_executor = None
+_workers = 0
+
+
+def _config_int(config, nome, padrao, minimo):
+    try:
+        return max(minimo, int(config.get(nome, padrao)))
+    except (TypeError, ValueError):
+        return padrao
+
+
+def interpretar_desafio(challenge_json):
+    """Dict normalizado do desafio (texto ou dict) ou None se nao for um
+    desafio ALTCHA que sabemos resolver."""
+    if isinstance(challenge_json, dict):
+        dados = challenge_json
+    else:
+        try:
+            dados = json.loads(str(challenge_json or ''))
+        except ValueError:
+            return None
+    if not isinstance(dados, dict):
+        return None
+
+    algoritmo = str(dados.get('algorithm') or 'SHA-256').upper()
+    challenge = str(dados.get('challenge') or '').strip().lower()
+    salt = dados.get('salt')
+    if algoritmo not in ALGORITMOS or not challenge or salt is None or not dados.get('signature'):
+        return None
+    try:
+        maxnumber = int(dados.get('maxnumber') or dados.get('maxNumber') or _MAXNUMBER_PADRAO)
+    except (TypeError, ValueError):
+        return None
+    return {
+        'algorithm': algoritmo,
+        'challenge': challenge,
+        'salt': str(salt),
+        'signature': dados['signature'],
+        'maxnumber': max(0, maxnumber),
+    }
+
+
+def buscar_faixa(algoritmo, salt, challenge, inicio, fim):
+    """Numero em [inicio, fim) cujo hash bate com o desafio, ou None. Roda
+    nos processos do pool (funcao de modulo: precisa ser picklable)."""
+    base = hashlib.new(ALGORITMOS[algoritmo], salt.encode())
+    for numero in range(inicio, fim):
+        h = base.copy()
+        h.update(str(numero).encode())
+        if h.hexdigest() == challenge:
+            return numero
+    return None
+
+
+def montar_payload(desafio, numero, took_ms):
+    """Token no formato que o widget envia (e que _injetar_resposta_altcha grava)."""
+    dados = {
+        'algorithm': desafio['algorithm'],
+        'challenge': desafio['challenge'],
+        'number': numero,
+        'salt': desafio['salt'],
+        'signature': desafio['signature'],
+        'took': int(took_ms),
+    }
+    return base64.b64encode(json.dumps(dados, separators=(',', ':')).encode()).decode()
+
+
+def _processos(config):
+    valor = _config_int(config, 'RS_ALTCHA_LOCAL_PROCESSOS', 0, 0)
+    return valor or (os.cpu_count() or 1)
+
+
+def _obter_executor(workers):
+    global _executor, _workers
+    with _lock:
+        if _executor is None or _workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False, cancel_futures=True)
+            # spawn: fork de um processo com threads do Flask/Selenium nao e seguro
+            _executor = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+            )
+            _workers = workers
+            log_event('altcha_local_pool_started', workers=workers)
+        return _executor
+
+
+def encerrar():
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _buscar_no_pool(desafio, workers, limite):
+    executor = _obter_executor(workers)
+    args = (desafio['algorithm'], desafio['salt'], desafio['challenge'])
+    blocos = iter(range(0, desafio['maxnumber'] + 1, _BLOCO))
+    fim_faixa = desafio['maxnumber'] + 1
+    em_voo = set()
+    prazo = time.monotonic() + limite
+
+    def _enviar():
+        inicio = next(blocos, None)
+        if inicio is not None:
+            em_voo.add(executor.submit(buscar_faixa, *args, inicio, min(inicio + _BLOCO, fim_faixa)))
+
+    # 2 blocos por processo: sempre ha trabalho na fila quando um termina
+    for _ in range(workers * 2):
+        _enviar()
+    try:
+        while em_voo:
+            restante = prazo - time.monotonic()
+            if restante <= 0:
+                raise TimeoutError(f'ALTCHA local excedeu {limite}s')
+            prontos, em_voo_restante = wait(em_voo, timeout=restante, return_when=FIRST_COMPLETED)
+            em_voo.clear()
+            em_voo.update(em_voo_restante)
+            for futuro in prontos:
+                numero = futuro.result()
+                if numero is not None:
+                    return numero
+                _enviar()
+        return None
+    finally:
+        for futuro in em_voo:
+            futuro.cancel()
+
+
+def resolver(config, challenge_json, execution_id=None):
+    """Resolve o desafio localmente. {'code', 'number', 'took_ms'} ou None
+    (desafio nao suportado, sem solucao na faixa, limite de tempo ou pool
+    indisponivel): quem chama segue para o 2captcha."""
+    desafio = interpretar_desafio(challenge_json)
+    if desafio is None:
+        log_event('altcha_local_unsupported', level='WARNING', execution_id=execution_id)
+        return None
+
+    workers = _processos(config)
+    limite = _config_int(config, 'RS_ALTCHA_LOCAL_TIMEOUT_SEGUNDOS', 20, 1)
+    inicio = time.monotonic()
+    try:
+        if workers <= 1 or desafio['maxnumber'] < _BLOCO * 2:
+            numero = buscar_faixa(desafio['algorithm'], desafio['salt'], desafio['challenge'],
+                                  0, desafio['maxnumber'] + 1)
+        else:
+            numero = _buscar_no_pool(desafio, workers, limite)
+    except Exception as exc:
+        duracao_ms = int((time.monotonic() - inicio) * 1000)
+        expirou = isinstance(exc, TimeoutError)
+        err_type = ErrorType.TIMEOUT if expirou else ErrorType.UNKNOWN
+        metricas_captcha.registrar(SOLVER, False, duracao_ms, error_type=err_type.value,
+                                   execution_id=execution_id)
+        log_event('altcha_local_error', level='WARNING', error_type=err_type.value, error=str(exc),
+                  duration_ms=duracao_ms, execution_id=execution_id)
+        if not expirou:
+            encerrar()  # pool quebrado: o proximo uso recria
+        return None
+
+    duracao_ms = int((time.monotonic() - inicio) * 1000)
+    if numero is None:
+        metricas_captcha.registrar(SOLVER, False, duracao_ms, error_type=ErrorType.CAPTCHA.value,
+                                   execution_id=execution_id)
+        log_event('altcha_local_not_found', level='WARNING', maxnumber=desafio['maxnumber'],
+                  duration_ms=duracao_ms, execution_id=execution_id)
+        return None
+
+    metricas_captcha.registrar(SOLVER, True, duracao_ms, execution_id=execution_id)
+    log_event('altcha_local_solved', status='ok', duration_ms=duracao_ms, workers=workers,
+              execution_id=execution_id)
+    return {
+        'code': montar_payload(desafio, numero, duracao_ms),
+        'number': numero,
+        'took_ms': duracao_ms,
+    }
@@ -0,0 +1,354 @@
+"""Auditoria em massa dos PDFs de certidao.
+
+Percorre todas as certidoes em blocos (keyset por id, sem carregar a tabela
+inteira) e confere, para cada uma:
+
+- o arquivo de caminho_arquivo existe; se nao, tenta relocalizar na pasta da
+  empresa (file_manager.localizar_certidao_existente) e atualiza o caminho;
+- o PDF e legivel (classificacao no pool de processos, classificacao_pdf;
+  com o pool sem vaga o arquivo espera e e lido de novo, nao vira ilegivel);
+- PDF positivo em certidao nao pendente (ou negativo em certidao pendente);
+- Federal: validade impressa no PDF diferente de data_validade.
+
+Cada divergencia vira uma linha do relatorio CSV (AUDITORIA_DIR), gravado
+enquanto a auditoria anda. O progresso sai no mesmo formato do status dos
+lotes (batch_engine.build_batch_status_payload) mais os contadores proprios.
+"""
+import csv
+import os
+import threading
+import time
+from datetime import datetime
+
+from app.models import Certidao, Empresa, StatusEspecial, TipoCertidao
+from app.services import batch_engine, classificacao_pdf
+from app.services.correlation import CorrelationContext
+from app.services.execution_logger import log_event
+from app.utils import get_config_value
+
+TAMANHO_BLOCO = 200
+# pool de PDF ocupado pela emissao: pausa antes de tentar os arquivos de novo
+ESPERA_POOL_OCUPADO = 2.0
+
+COLUNAS_RELATORIO = (
+    'certidao_id', 'empresa', 'tipo', 'subtipo', 'divergencia', 'detalhe',
+    'caminho_arquivo', 'data_validade', 'validade_pdf', 'classificacao_pdf',
+)
+
+AUDITORIA_LOCK = threading.Lock()
+
+
+def _estado_padrao():
+    estado = batch_engine.batch_state_defaults()
+    estado.update({
+        'divergencias': 0,
+        'caminhos_atualizados': 0,
+        'por_divergencia': {},
+        'relatorio': None,
+    })
+    return estado
+
+
+AUDITORIA_STATE = _estado_padrao()
+
+
+def _pasta_relatorios():
+    caminho = get_config_value('AUDITORIA_DIR', None)
+    if caminho:
+        return caminho
+    return os.path.abspath(
+        os.path.join(os.path.dirname(__file__), '..', '..', 'instance', 'auditoria')
+    )
+
+
+def status_payload():
+    with AUDITORIA_LOCK:
+        payload = batch_engine.build_batch_status_payload(AUDITORIA_STATE)
+        payload.update({
+            'divergencias': AUDITORIA_STATE['divergencias'],
+            'caminhos_atualizados': AUDITORIA_STATE['caminhos_atualizados'],
+            'por_divergencia': dict(AUDITORIA_STATE['por_divergencia']),
+            'relatorio_disponivel': bool(AUDITORIA_STATE['relatorio']),
+        })
+        return payload
+
+
+def caminho_relatorio():
+    """CSV da ultima auditoria (em andamento ou concluida), se existir."""
+    with AUDITORIA_LOCK:
+        caminho = AUDITORIA_STATE['relatorio']
+    if caminho and os.path.isfile(caminho):
+        return caminho
+    return None
+
+
+def iniciar(app_factory):
+    """Dispara a auditoria em thread. None se ja houver uma rodando; senao o
+    total de certidoes a conferir (0: nada a fazer, nao inicia)."""
+    with AUDITORIA_LOCK:
+        if AUDITORIA_STATE['status'] == 'running':
+            return None
+        total = Certidao.query.count()
+        if not total:
+            return 0
+        AUDITORIA_STATE.clear()
+        AUDITORIA_STATE.update(_estado_padrao())
+        AUDITORIA_STATE.update({
+            'status': 'running',
+            'total': total,
+            'started_at': datetime.utcnow(),
+            'execution_id': CorrelationContext.new_execution_id(),
+        })
+        batch_engine.append_batch_message(
+            AUDITORIA_STATE, f'Auditoria iniciada. Total={total}.', level='info')
+    batch_engine.run_worker(executar, app_factory)
+    return total
+
+
+def parar():
+    with AUDITORIA_LOCK:
+        if AUDITORIA_STATE['status'] != 'running':
+            return False
+        AUDITORIA_STATE['stop_requested'] = True
+        return True
+
+
+def _parada_solicitada():
+    with AUDITORIA_LOCK:
+        return AUDITORIA_STATE['stop_requested']
+
+
+def _bloco(ultimo_id):
+    from app import db
+    return (
+        db.session.query(
+            Certidao.id, Certidao.tipo, Certidao.subtipo, Certidao.data_validade,
+            Certidao.caminho_arquivo, Certidao.status_especial, Certidao.empresa_id,
+            Empresa.nome,
+        )
+        .join(Empresa, Empresa.id == Certidao.empresa_id)
+        .filter(Certidao.id > ultimo_id)
+        .order_by(Certidao.id)
+        .limit(TAMANHO_BLOCO)
+        .all()
+    )
+
+
+def _arquivo_ok(caminho):
+    return bool(caminho) and os.path.isfile(caminho)
+
+
+def _relocalizar(linha):
+    from app import file_manager
+    try:
+        return file_manager.localizar_certidao_existente(
+            linha.nome,
+            linha.tipo.value,
+            linha.subtipo.value if linha.subtipo else None,
+            empresa_id=linha.empresa_id,
+        )
+    except OSError as exc:
+        log_event('auditoria_localizar_falhou', level='WARNING', certidao_id=linha.id, error=str(exc))
+        return None
+
+
+def comparar(linha, resultado):
+    """Divergencias [(tipo, detalhe)] entre o banco e a leitura do PDF."""
+    divergencias = []
+    classificacao = resultado.get('classificacao')
+    pendente = linha.status_especial == StatusEspecial.PENDENTE
+    if classificacao == 'positiva' and not pendente:
+        divergencias.append(('positiva_nao_pendente', 'PDF positivo em certidão não pendente.'))
+    elif classificacao in {'negativa', 'efeito_negativa'} and pendente:
+        divergencias.append(('pendente_com_negativa', 'Certidão pendente com PDF negativo.'))
+
+    validade_pdf = resultado.get('validade_federal')
+    if linha.tipo == TipoCertidao.FEDERAL and validade_pdf and validade_pdf != linha.data_validade:
+        atual = linha.data_validade.strftime('%d/%m/%Y') if linha.data_validade else 'vazia'
+        divergencias.append((
+            'validade_divergente',
+            f"PDF vale até {validade_pdf.strftime('%d/%m/%Y')}; cadastro: {atual}.",
+        ))
+    return divergencias
+
+
+class _Relatorio:
+    def __init__(self, caminho):
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        # ; e BOM: abre direto no Excel em pt-BR
+        self._fh = open(caminho, 'w', encoding='utf-8-sig', newline='')
+        self._csv = csv.writer(self._fh, delimiter=';')
+        self._csv.writerow(COLUNAS_RELATORIO)
+
+    def escrever(self, linha, divergencia, detalhe, caminho=None, resultado=None):
+        resultado = resultado or {}
+        validade_pdf = resultado.get('validade_federal')
+        self._csv.writerow([
+            linha.id,
+            linha.nome,
+            linha.tipo.value,
+            linha.subtipo.value if linha.subtipo else '',
+            divergencia,
+            detalhe,
+            caminho or linha.caminho_arquivo or '',
+            linha.data_validade.isoformat() if linha.data_validade else '',
+            validade_pdf.isoformat() if validade_pdf else '',
+            resultado.get('classificacao') or '',
+        ])
+        self._fh.flush()
+
+    def fechar(self):
+        self._fh.close()
+
+
+def _registrar(relatorio, linha, divergencia, detalhe, caminho=None, resultado=None):
+    relatorio.escrever(linha, divergencia, detalhe, caminho=caminho, resultado=resultado)
+    with AUDITORIA_LOCK:
+        por = AUDITORIA_STATE['por_divergencia']
+        por[divergencia] = por.get(divergencia, 0) + 1
+        if divergencia == 'caminho_atualizado':
+            AUDITORIA_STATE['caminhos_atualizados'] += 1
+        else:
+            AUDITORIA_STATE['divergencias'] += 1
+        if divergencia == 'ilegivel':
+            AUDITORIA_STATE['falhas'] += 1
+
+
+def _avancar(certidao_id):
+    with AUDITORIA_LOCK:
+        AUDITORIA_STATE['index'] += 1
+        AUDITORIA_STATE['success'] = AUDITORIA_STATE['index'] - AUDITORIA_STATE['falhas']
+        AUDITORIA_STATE['current_id'] = certidao_id
+
+
+def _auditar_bloco(linhas, relatorio):
+    """Confere um bloco; devolve False se a parada foi pedida no meio."""
+    from app import db
+
+    # caminho -> certidoes que apontam para ele, separadas pelos campos a ler
+    por_campos = {('classificacao',): {}, classificacao_pdf.CAMPOS_PADRAO: {}}
+    novos_caminhos = {}
+    for linha in linhas:
+        caminho = linha.caminho_arquivo
+        if not _arquivo_ok(caminho):
+            encontrado = _relocalizar(linha)
+            if encontrado:
+                novos_caminhos[linha.id] = encontrado
+                _registrar(relatorio, linha, 'caminho_atualizado',
+                           'Arquivo relocalizado na pasta da empresa.', caminho=encontrado)
+                caminho = encontrado
+            else:
+                if linha.caminho_arquivo:
+                    _registrar(relatorio, linha, 'arquivo_ausente', 'Arquivo não encontrado.')
+                elif linha.data_validade and linha.status_especial != StatusEspecial.PENDENTE:
+                    _registrar(relatorio, linha, 'sem_arquivo', 'Certidão com validade e sem arquivo.')
+                _avancar(linha.id)
+                continue
+        campos = (classificacao_pdf.CAMPOS_PADRAO if linha.tipo == TipoCertidao.FEDERAL
+                  else ('classificacao',))
+        por_campos[campos].setdefault(caminho, []).append(linha)
+
+    if novos_caminhos:
+        for certidao_id, caminho in novos_caminhos.items():
+            certidao = db.session.get(Certidao, certidao_id)
+            if certidao is not None:
+                certidao.caminho_arquivo = caminho
+        try:
+            db.session.commit()
+        except Exception as exc:
+            db.session.rollback()
+            log_event('auditoria_caminho_commit_failed', level='ERROR', error=str(exc))
+
+    for campos, caminhos in por_campos.items():
+        pendentes = list(caminhos)
+        while pendentes:
+            adiados = []
+            lote = classificacao_pdf.analisar_lote(pendentes, campos=campos)
+            try:
+                for caminho, resultado, erro in lote:
+                    if isinstance(erro, classificacao_pdf.FilaCheiaError):
+                        # sem vaga nao e PDF ilegivel: tenta de novo sem avancar
+                        adiados.append(caminho)
+                        continue
+                    for linha in caminhos[caminho]:
+                        if erro:
+                            _registrar(relatorio, linha, 'ilegivel', f'PDF ilegível: {erro}',
+                                       caminho=caminho)
+                        else:
+                            for divergencia, detalhe in comparar(linha, resultado):
+                                _registrar(relatorio, linha, divergencia, detalhe,
+                                           caminho=caminho, resultado=resultado)
+                        _avancar(linha.id)
+                    if _parada_solicitada():
+                        return False
+            finally:
+                lote.close()
+            if adiados:
+                log_event('auditoria_pool_ocupado', level='WARNING', arquivos=len(adiados))
+                time.sleep(ESPERA_POOL_OCUPADO)
+                if _parada_solicitada():
+                    return False
+            pendentes = adiados
+    return True
+
+
+def executar(app):
+    """Worker da auditoria (thread); grava o CSV e atualiza AUDITORIA_STATE."""
+    with app.app_context():
+        from app import db
+
+        nome = f"auditoria-{datetime.now().strftime('%Y%m%d-%H%M%S')}.csv"
+        caminho = os.path.join(_pasta_relatorios(), nome)
+        with AUDITORIA_LOCK:
+            execution_id = AUDITORIA_STATE['execution_id']
+        CorrelationContext.set_execution_id(execution_id)
+        log_event('auditoria_started', relatorio=caminho, execution_id=execution_id)
+        relatorio = None
+        try:
+            relatorio = _Relatorio(caminho)
+            with AUDITORIA_LOCK:
+                AUDITORIA_STATE['relatorio'] = caminho
+            ultimo_id = 0
+            while True:
+                if _parada_solicitada():
+                    break
+                linhas = _bloco(ultimo_id)
+                # libera a conexao entre blocos; a leitura dos PDFs e longa
+                db.session.remove()
+                if not linhas:
+                    break
+                ultimo_id = linhas[-1].id
+                if not _auditar_bloco(linhas, relatorio):
+                    break
+        except Exception as exc:
+            log_event('auditoria_failed', level='ERROR', error=str(exc), execution_id=execution_id)
+            with AUDITORIA_LOCK:
+                AUDITORIA_STATE['status'] = 'error'
+                AUDITORIA_STATE['finished_at'] = datetime.utcnow()
+                batch_engine.append_batch_message(
+                    AUDITORIA_STATE, f'Auditoria falhou: {exc}', level='error')
+            return
+        finally:
+            if relatorio is not None:
+                relatorio.fechar()
+            db.session.remove()
+
+        with AUDITORIA_LOCK:
+            AUDITORIA_STATE['current_id'] = None
+            AUDITORIA_STATE['finished_at'] = datetime.utcnow()
+            resumo = (f"{AUDITORIA_STATE['index']}/{AUDITORIA_STATE['total']} conferidas, "
+                      f"{AUDITORIA_STATE['divergencias']} divergência(s)")
+            if AUDITORIA_STATE['stop_requested']:
+                AUDITORIA_STATE['status'] = 'stopped'
+                batch_engine.append_batch_message(
+                    AUDITORIA_STATE, f'Auditoria interrompida: {resumo}.', level='warning')
+            else:
+                AUDITORIA_STATE['status'] = 'completed'
+                batch_engine.append_batch_message(
+                    AUDITORIA_STATE, f'Auditoria concluída: {resumo}.', level='info')
+            evento = dict(
+                status=AUDITORIA_STATE['status'], total=AUDITORIA_STATE['total'],
+                processados=AUDITORIA_STATE['index'], divergencias=AUDITORIA_STATE['divergencias'],
+                caminhos_atualizados=AUDITORIA_STATE['caminhos_atualizados'],
+            )
+        log_event('auditoria_finished', execution_id=execution_id, **evento)
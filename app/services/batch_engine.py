@@ -1,12 +1,42 @@
+import time
+from collections import OrderedDict
 from datetime import date, datetime, timedelta
-from threading import Thread
-
-from sqlalchemy import or_
-
-from app.models import Certidao, StatusEspecial, TipoCertidao, get_a_vencer_dias
+from threading import Lock, Thread
+
+from flask import current_app
+from sqlalchemy import case, event, func, literal, or_
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import (
+    Certidao,
+    Empresa,
+    LoteItem,
+    StatusEspecial,
+    TipoCertidao,
+    get_a_vencer_dias,
+)
+from app.services import agendador, batch_store, config_cache, stream_eventos
 from app.services.correlation import CorrelationContext
 from app.services.execution_logger import log_event
 
+# ordem da fila do lote: 'urgencia' (vencidas/mais perto de vencer primeiro,
+# pendentes antes, quem falhou menos antes) ou 'id' (ordem de cadastro)
+ORDENS = ('urgencia', 'id')
+# falhas em LoteItem dentro desta janela pesam na prioridade
+_JANELA_FALHAS_DIAS = 30
+# ID fora do banco (removido durante o lote) vai para o fim da fila
+_SEM_PRIORIDADE = (float('inf'),)
+_LOTE_CONSULTA = 500
+
+# resultado de calc_targets por (filtro, escopo, tipo, ordem, dia, versoes)
+_cache_alvos_lock = Lock()
+_cache_alvos = OrderedDict()
+_CACHE_ALVOS_MAX = 32
+# sobe a cada commit que cria/altera/remove Certidao, Empresa ou LoteItem
+_versao_alvos = 0
+_eventos_registrados = False
+
 
 def batch_state_defaults():
     return {
@@ -24,6 +54,9 @@ def batch_state_defaults():
         'stop_requested': False,
         'stop_action': None,
         'driver': None,
+        'drivers': [],
+        'workers': 1,
+        'em_andamento': [],
         'last_completed': None,
         'started_at': None,
         'finished_at': None,
@@ -34,6 +67,15 @@ def batch_state_defaults():
         'efeito_negativas': 0,
         'execution_id': None,
         'last_messages': [],
+        # chave do lote ('fgts'/'estadual_rs'/'municipal') e id do LoteExecucao
+        # espelhado em banco; sem run_id a persistencia fica desligada
+        'lote': None,
+        'run_id': None,
+        # tarefas do agendador que seguram os recursos do lote na fila
+        'aguardando': None,
+        # ordem da fila e o index da ultima repriorizacao de ids[index:]
+        'ordem': None,
+        'repriorizado_em': 0,
     }
 
 
@@ -52,12 +94,16 @@ def build_batch_status_payload(batch_state):
         'processed': index,
         'remaining': remaining,
         'scope': batch_state.get('scope', 'default'),
+        'ordem': batch_state.get('ordem'),
         'falhas': batch_state['falhas'],
         'current_id': batch_state['current_id'],
+        'current_ids': list(batch_state.get('em_andamento') or []),
+        'workers': batch_state.get('workers', 1),
         'vencidas': batch_state['vencidas'],
         'a_vencer': batch_state['a_vencer'],
         'pendentes': batch_state.get('pendentes', 0),
         'message': batch_state['message'],
+        'aguardando': batch_state.get('aguardando'),
         'last_messages': list(batch_state.get('last_messages', [])),
         'last_completed': batch_state.get('last_completed'),
         'success': batch_state.get('success', 0),
@@ -86,6 +132,7 @@ def append_batch_message(batch_state, message, level='info', certidao_id=None, m
         del messages[:-max_items]
 
     batch_state['message'] = message
+    stream_eventos.notificar('lote')
 
 
 def run_worker(worker_fn, app_factory):
@@ -109,6 +156,8 @@ def run_batch_loop(
     on_setup=None,
     on_teardown=None,
     recover_fn=None,
+    workers=1,
+    recursos=None,
 ):
     """Loop generico de lote compartilhado por FGTS, Estadual RS e Municipal.
 
@@ -125,7 +174,109 @@ def run_batch_loop(
       recover_fn(certidao_id, execution_id, driver, sucesso, grave, mensagem)
         -> (driver, sucesso, grave, mensagem): recuperacao opcional pos-emissao
         (ex.: recriar driver do FGTS apos falha de carregamento).
+      workers: quantidade de emissoes simultaneas. Com 1 (default) o loop e
+        sequencial; acima disso cada worker tem o proprio driver e consome os
+        IDs pendentes de uma fila compartilhada (ver _run_batch_loop_paralelo).
+      recursos: {recurso: quantidade} ocupados enquanto o lote roda (ver
+        services.agendador); o lote espera na fila enquanto houver conflito.
     """
+    try:
+        workers = max(1, int(workers or 1))
+    except (TypeError, ValueError):
+        workers = 1
+
+    reserva = _aguardar_recursos(app, lock, state, nome_lote, recursos)
+    if reserva is None:
+        return None
+    try:
+        return _executar_lote(
+            app,
+            lock=lock,
+            state=state,
+            emit_fn=emit_fn,
+            nome_lote=nome_lote,
+            curto=curto,
+            tag=tag,
+            event_prefix=event_prefix,
+            create_driver=create_driver,
+            eager_driver=eager_driver,
+            on_setup=on_setup,
+            on_teardown=on_teardown,
+            recover_fn=recover_fn,
+            workers=workers,
+        )
+    finally:
+        reserva.liberar()
+
+
+def _aguardar_recursos(app, lock, state, nome_lote, recursos):
+    """Reserva no agendador os recursos do lote; enquanto espera, o lote
+    segue 'running' com o motivo nas mensagens. None se foi pausado/parado
+    na fila (status ja atualizado e persistido)."""
+    def _na_fila(bloqueios):
+        with lock:
+            state['aguardando'] = bloqueios
+            append_batch_message(
+                state,
+                f"Lote {nome_lote} na fila: aguardando {', '.join(bloqueios) or 'recursos'}.",
+                level='warning',
+            )
+
+    def _cancelado():
+        with lock:
+            return bool(state['stop_requested'])
+
+    reserva = agendador.reservar(
+        f'Lote {nome_lote}', recursos, tipo='lote', cancelado=_cancelado, ao_enfileirar=_na_fila,
+    )
+    with lock:
+        aguardou = state.get('aguardando') is not None
+        state['aguardando'] = None
+        if reserva is None:
+            _registrar_parada(state, nome_lote)
+        elif aguardou:
+            append_batch_message(state, f'Lote {nome_lote} liberado na fila, iniciando.', level='info')
+    if reserva is None:
+        with app.app_context():
+            _persistir_execucao(lock, state)
+    return reserva
+
+
+def _executar_lote(
+    app,
+    *,
+    lock,
+    state,
+    emit_fn,
+    nome_lote,
+    curto,
+    tag,
+    event_prefix,
+    create_driver,
+    eager_driver,
+    on_setup,
+    on_teardown,
+    recover_fn,
+    workers,
+):
+    if workers > 1:
+        return _run_batch_loop_paralelo(
+            app,
+            lock=lock,
+            state=state,
+            emit_fn=emit_fn,
+            nome_lote=nome_lote,
+            curto=curto,
+            tag=tag,
+            event_prefix=event_prefix,
+            create_driver=create_driver,
+            eager_driver=eager_driver,
+            on_setup=on_setup,
+            on_teardown=on_teardown,
+            recover_fn=recover_fn,
+            workers=workers,
+        )
+
     with app.app_context():
         driver = None
         setup_ctx = None
@@ -143,31 +294,11 @@ def run_batch_loop(
             while True:
                 with lock:
                     if state['stop_requested']:
-                        if state.get('stop_action') == 'stop':
-                            state['status'] = 'stopped'
-                            append_batch_message(
-                                state,
-                                f'Lote {nome_lote} interrompido por solicitação.',
-                                level='warning',
-                            )
-                        else:
-                            state['status'] = 'paused'
-                            append_batch_message(
-                                state,
-                                f'Lote {nome_lote} pausado por solicitação.',
-                                level='warning',
-                            )
+                        _registrar_parada(state, nome_lote)
                         break
 
                     if state['index'] >= state['total']:
-                        state['status'] = 'completed'
-                        state['current_id'] = None
-                        state['finished_at'] = datetime.utcnow()
-                        append_batch_message(
-                            state,
-                            f'Lote {nome_lote} concluído com sucesso.',
-                            level='info',
-                        )
+                        _registrar_conclusao(state, nome_lote)
                         break
 
                     certidao_id = state['ids'][state['index']]
@@ -183,46 +314,42 @@ def run_batch_loop(
                 if driver is None and create_driver:
                     driver = create_driver()
 
+                inicio = time.monotonic()
                 sucesso, grave, mensagem = emit_fn(certidao_id, driver, execution_id)
 
                 if recover_fn:
                     driver, sucesso, grave, mensagem = recover_fn(
                         certidao_id, execution_id, driver, sucesso, grave, mensagem
                     )
+                duracao_ms = int((time.monotonic() - inicio) * 1000)
 
+                encerrar = False
                 with lock:
                     if state['stop_requested']:
                         state['status'] = (
                             'stopped' if state.get('stop_action') == 'stop' else 'paused'
                         )
-                        break
-
-                    if grave:
+                        registro = _registro_item(state, 'pendente')
+                        encerrar = True
+                    elif grave:
                         state['status'] = 'error'
                         state['message'] = mensagem or f'Erro grave no lote {nome_lote}.'
                         append_batch_message(
                             state, state['message'], level='error', certidao_id=certidao_id
                         )
-                        break
-
-                    if not sucesso:
-                        state['falhas'] += 1
-                        append_batch_message(
-                            state,
-                            f"{curto} falhou ID={certidao_id}: {mensagem}",
-                            level='warning',
-                            certidao_id=certidao_id,
-                        )
+                        registro = _registro_item(state, 'erro')
+                        encerrar = True
                     else:
-                        state['success'] += 1
-                        append_batch_message(
-                            state,
-                            f"{curto} OK ID={certidao_id}.",
-                            level='info',
-                            certidao_id=certidao_id,
-                        )
-
-                    state['index'] += 1
+                        _contabilizar_item(state, certidao_id, sucesso, mensagem, curto)
+                        concluido_seq = state['index']
+                        state['index'] += 1
+                        registro = _registro_item(
+                            state, 'sucesso' if sucesso else 'falha', concluido_seq=concluido_seq)
+
+                _persistir_item(registro, certidao_id, duracao_ms, mensagem)
+                if encerrar:
+                    break
+                repriorizar_restantes(lock, state)
         finally:
             if driver:
                 try:
@@ -234,17 +361,320 @@ def run_batch_loop(
                     on_teardown(setup_ctx)
                 except Exception:
                     pass
+            _persistir_execucao(lock, state)
             log_event(f'{event_prefix}_end', status=state.get('status'), tag=tag)
             CorrelationContext.clear()
 
 
+def _contabilizar_item(state, certidao_id, sucesso, mensagem, curto):
+    """Atualiza contadores/mensagens de um item concluido. Exige o lock."""
+    if not sucesso:
+        state['falhas'] += 1
+        append_batch_message(
+            state,
+            f"{curto} falhou ID={certidao_id}: {mensagem}",
+            level='warning',
+            certidao_id=certidao_id,
+        )
+    else:
+        state['success'] += 1
+        append_batch_message(
+            state,
+            f"{curto} OK ID={certidao_id}.",
+            level='info',
+            certidao_id=certidao_id,
+        )
+
+
+def _registro_item(state, status, concluido_seq=None):
+    """Captura (sob o lock) o que sera gravado em LoteItem/LoteExecucao; a
+    escrita em banco acontece fora do lock em _persistir_item."""
+    if not state.get('run_id'):
+        return None
+    return (state['run_id'], status, concluido_seq, batch_store.snapshot(state))
+
+
+def _persistir_item(registro, certidao_id, duracao_ms, mensagem):
+    if registro is None:
+        return
+    run_id, status, concluido_seq, snap = registro
+    batch_store.registrar_item(
+        run_id, certidao_id, status, snap,
+        duracao_ms=duracao_ms, mensagem=mensagem, concluido_seq=concluido_seq,
+    )
+
+
+def _persistir_execucao(lock, state):
+    with lock:
+        run_id = state.get('run_id')
+        snap = batch_store.snapshot(state) if run_id else None
+    if run_id:
+        batch_store.atualizar_execucao(run_id, snap)
+    stream_eventos.notificar('lote')
+
+
+def _registrar_parada(state, nome_lote):
+    if state.get('stop_action') == 'stop':
+        state['status'] = 'stopped'
+        append_batch_message(
+            state,
+            f'Lote {nome_lote} interrompido por solicitação.',
+            level='warning',
+        )
+    else:
+        state['status'] = 'paused'
+        append_batch_message(
+            state,
+            f'Lote {nome_lote} pausado por solicitação.',
+            level='warning',
+        )
+
+
+def _registrar_conclusao(state, nome_lote):
+    state['status'] = 'completed'
+    state['current_id'] = None
+    state['finished_at'] = datetime.utcnow()
+    append_batch_message(
+        state,
+        f'Lote {nome_lote} concluído com sucesso.',
+        level='info',
+    )
+
+
+def _proximo_id_livre(state):
+    """Primeiro ID ainda nao processado que nenhum worker pegou. Exige o lock."""
+    em_andamento = state.setdefault('em_andamento', [])
+    for certidao_id in state['ids'][state['index']:]:
+        if certidao_id not in em_andamento:
+            return certidao_id
+    return None
+
+
+def _marcar_processado(state, certidao_id):
+    """Move o ID concluido para o prefixo processado (ids[:index]) e avanca o
+    indice. Mantem o invariante do loop sequencial mesmo com conclusao fora de
+    ordem, de modo que pausar/retomar reprocessa exatamente ids[index:], na
+    ordem original (rotaciona em vez de trocar). Exige o lock."""
+    ids = state['ids']
+    index = state['index']
+    try:
+        pos = ids.index(certidao_id, index)
+    except ValueError:
+        return
+    ids.insert(index, ids.pop(pos))
+    state['index'] = index + 1
+
+
+def _run_batch_loop_paralelo(
+    app,
+    *,
+    lock,
+    state,
+    emit_fn,
+    nome_lote,
+    curto,
+    tag,
+    event_prefix,
+    create_driver,
+    eager_driver,
+    on_setup,
+    on_teardown,
+    recover_fn,
+    workers,
+):
+    """Variante de run_batch_loop com N workers, cada um com o proprio driver.
+
+    Os workers disputam os IDs de ids[index:] sob o mesmo lock do estado; os
+    contadores, last_messages e a semantica de pausa/parada/erro grave sao os
+    mesmos do loop sequencial. Um item interrompido por pausa/parada nao e
+    contabilizado e volta a ser emitido na retomada."""
+    with app.app_context():
+        setup_ctx = None
+        execution_id = state.get('execution_id')
+        if execution_id:
+            CorrelationContext.set_execution_id(execution_id)
+        log_event(f'{event_prefix}_start', status='running', tag=tag, workers=workers)
+
+        with lock:
+            state['workers'] = workers
+            state['em_andamento'] = []
+            state['drivers'] = []
+
+        controle = {'abortar': False}
+        try:
+            if on_setup:
+                setup_ctx = on_setup(app)
+
+            threads = [
+                Thread(
+                    target=_batch_worker_slot,
+                    args=(app, slot),
+                    kwargs=dict(
+                        lock=lock, state=state, emit_fn=emit_fn, nome_lote=nome_lote,
+                        curto=curto, event_prefix=event_prefix, create_driver=create_driver,
+                        eager_driver=eager_driver, recover_fn=recover_fn,
+                        execution_id=execution_id, controle=controle,
+                    ),
+                    name=f'{event_prefix}-{slot}',
+                    daemon=True,
+                )
+                for slot in range(workers)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            with lock:
+                state['current_id'] = None
+                if state['status'] != 'error':
+                    if state['stop_requested']:
+                        _registrar_parada(state, nome_lote)
+                    elif state['index'] >= state['total']:
+                        _registrar_conclusao(state, nome_lote)
+        finally:
+            if on_teardown:
+                try:
+                    on_teardown(setup_ctx)
+                except Exception:
+                    pass
+            _persistir_execucao(lock, state)
+            log_event(f'{event_prefix}_end', status=state.get('status'), tag=tag, workers=workers)
+            CorrelationContext.clear()
+
+
+def _batch_worker_slot(
+    app,
+    slot,
+    *,
+    lock,
+    state,
+    emit_fn,
+    nome_lote,
+    curto,
+    event_prefix,
+    create_driver,
+    eager_driver,
+    recover_fn,
+    execution_id,
+    controle,
+):
+    def _registrar_driver(novo, antigo=None):
+        with lock:
+            drivers = state.setdefault('drivers', [])
+            if antigo is not None and antigo in drivers:
+                drivers.remove(antigo)
+            if novo is not None and novo not in drivers:
+                drivers.append(novo)
+
+    with app.app_context():
+        if execution_id:
+            CorrelationContext.set_execution_id(execution_id)
+        driver = None
+        try:
+            if eager_driver and create_driver:
+                driver = create_driver()
+                _registrar_driver(driver)
+
+            while True:
+                with lock:
+                    if controle['abortar'] or state['stop_requested']:
+                        break
+
+                    certidao_id = _proximo_id_livre(state)
+                    if certidao_id is None:
+                        break
+
+                    state['em_andamento'].append(certidao_id)
+                    state['current_id'] = certidao_id
+                    append_batch_message(
+                        state,
+                        f"{curto} iniciando ID={certidao_id} "
+                        f"({state['index'] + len(state['em_andamento'])}/{state['total']}).",
+                        level='info',
+                        certidao_id=certidao_id,
+                    )
+
+                inicio = time.monotonic()
+                try:
+                    if driver is None and create_driver:
+                        driver = create_driver()
+                        _registrar_driver(driver)
+
+                    sucesso, grave, mensagem = emit_fn(certidao_id, driver, execution_id)
+
+                    if recover_fn:
+                        anterior = driver
+                        driver, sucesso, grave, mensagem = recover_fn(
+                            certidao_id, execution_id, driver, sucesso, grave, mensagem
+                        )
+                        if driver is not anterior:
+                            _registrar_driver(driver, anterior)
+                except Exception as exc:
+                    log_event(
+                        f'{event_prefix}_slot_error', level='ERROR',
+                        slot=slot, certidao_id=certidao_id, error=str(exc),
+                    )
+                    sucesso, grave, mensagem = False, True, f'Erro inesperado no lote {nome_lote}: {exc}'
+                duracao_ms = int((time.monotonic() - inicio) * 1000)
+
+                encerrar = False
+                with lock:
+                    if certidao_id in state['em_andamento']:
+                        state['em_andamento'].remove(certidao_id)
+
+                    if state['stop_requested']:
+                        registro = _registro_item(state, 'pendente')
+                        encerrar = True
+                    elif grave:
+                        controle['abortar'] = True
+                        state['status'] = 'error'
+                        state['message'] = mensagem or f'Erro grave no lote {nome_lote}.'
+                        append_batch_message(
+                            state, state['message'], level='error', certidao_id=certidao_id
+                        )
+                        registro = _registro_item(state, 'erro')
+                        encerrar = True
+                    else:
+                        _contabilizar_item(state, certidao_id, sucesso, mensagem, curto)
+                        concluido_seq = state['index']
+                        _marcar_processado(state, certidao_id)
+                        registro = _registro_item(
+                            state, 'sucesso' if sucesso else 'falha', concluido_seq=concluido_seq)
+
+                _persistir_item(registro, certidao_id, duracao_ms, mensagem)
+                if encerrar:
+                    break
+                repriorizar_restantes(lock, state)
+        finally:
+            if driver:
+                _registrar_driver(None, driver)
+                try:
+                    driver.quit()
+                except Exception:
+                    pass
+            CorrelationContext.clear()
+
+
+def drivers_do_lote(batch_state):
+    """Drivers vivos do lote: o do loop sequencial (state['driver']) e os dos
+    workers paralelos (state['drivers']), sem repeticao."""
+    drivers = []
+    for driver in [batch_state.get('driver')] + list(batch_state.get('drivers') or []):
+        if driver is not None and driver not in drivers:
+            drivers.append(driver)
+    return drivers
+
+
 def request_pause(batch_lock, batch_state):
     with batch_lock:
         batch_state['stop_requested'] = True
         batch_state['stop_action'] = 'pause'
         if batch_state['status'] == 'running':
             batch_state['status'] = 'paused'
-        return batch_state.get('driver')
+        drivers = drivers_do_lote(batch_state)
+    _persistir_execucao(batch_lock, batch_state)
+    return drivers
 
 
 def request_stop(batch_lock, batch_state):
@@ -253,7 +683,9 @@ def request_stop(batch_lock, batch_state):
         batch_state['stop_action'] = 'stop'
         batch_state['status'] = 'stopped'
         batch_state['finished_at'] = datetime.utcnow()
-        return batch_state.get('driver')
+        drivers = drivers_do_lote(batch_state)
+    _persistir_execucao(batch_lock, batch_state)
+    return drivers
 
 
 def resume_batch(batch_lock, batch_state, worker_fn, app_factory):
@@ -264,11 +696,30 @@ def resume_batch(batch_lock, batch_state, worker_fn, app_factory):
         batch_state['stop_requested'] = False
         batch_state['status'] = 'running'
 
+    _persistir_execucao(batch_lock, batch_state)
     run_worker(worker_fn, app_factory)
     return True
 
 
-def init_batch_run(batch_lock, batch_state, start_id, calc_targets_fn, worker_fn, app_factory):
+def restore_batch(batch_lock, batch_state, lote):
+    """Recarrega do banco o ultimo lote `lote` interrompido (running/paused)
+    como 'paused'. Chamado no boot, com app context; retorna True se restaurou."""
+    with batch_lock:
+        if batch_state['status'] in ['running', 'paused']:
+            return False
+        if not batch_store.restaurar(lote, batch_state):
+            return False
+        append_batch_message(
+            batch_state,
+            'Lote restaurado após reinício. Clique em retomar para continuar '
+            f"({batch_state['index']}/{batch_state['total']} processadas).",
+            level='warning',
+        )
+        return True
+
+
+def init_batch_run(batch_lock, batch_state, start_id, calc_targets_fn, worker_fn, app_factory,
+                   lote=None):
     with batch_lock:
         if batch_state['status'] in ['running', 'paused']:
             return None
@@ -286,11 +737,15 @@ def init_batch_run(batch_lock, batch_state, start_id, calc_targets_fn, worker_fn
             'vencidas': dados_lote['vencidas'],
             'a_vencer': dados_lote['a_vencer'],
             'pendentes': dados_lote.get('pendentes', 0),
+            'ordem': dados_lote.get('ordem'),
             'started_at': datetime.utcnow(),
             'finished_at': None,
             'success': 0,
             'execution_id': CorrelationContext.new_execution_id(),
+            'lote': lote,
         })
+        if lote:
+            batch_state['run_id'] = batch_store.criar_execucao(lote, batch_state)
 
     run_worker(worker_fn, app_factory)
     return dados_lote
@@ -301,7 +756,183 @@ def status_payload_locked(batch_lock, batch_state):
         return build_batch_status_payload(batch_state)
 
 
-def calc_targets(start_certidao_id, extra_filter=None, scope='default', tipo=None):
+def ordem_configurada():
+    """BATCH_ORDEM da configuracao ('urgencia' quando ausente ou invalida)."""
+    try:
+        valor = str(current_app.config.get('BATCH_ORDEM') or 'urgencia').strip().lower()
+    except RuntimeError:
+        valor = 'urgencia'
+    return valor if valor in ORDENS else 'urgencia'
+
+
+def _consulta_falhas_recentes(dias=_JANELA_FALHAS_DIAS):
+    desde = datetime.utcnow() - timedelta(days=dias)
+    return (db.session.query(LoteItem.certidao_id.label('certidao_id'),
+                             func.count(LoteItem.id).label('falhas'))
+            .filter(LoteItem.status.in_(('falha', 'erro')))
+            .filter(LoteItem.atualizado_em >= desde)
+            .group_by(LoteItem.certidao_id))
+
+
+def falhas_recentes(dias=_JANELA_FALHAS_DIAS):
+    """certidao_id -> itens de lote com falha/erro nos ultimos `dias`."""
+    return dict(_consulta_falhas_recentes(dias).all())
+
+
+def chave_urgencia(data_validade, status_especial, falhas, hoje):
+    """Chave de ordenacao (menor = mais urgente).
+
+    Vencidas e sem data empatam em 0 dias; dentro do empate vem a pendencia,
+    depois quem falhou menos nos ultimos lotes (tende a sair de primeira) e por
+    fim a mais atrasada."""
+    dias = (data_validade - hoje).days if data_validade else 0
+    pendente = status_especial == StatusEspecial.PENDENTE
+    return (max(dias, 0), 0 if pendente else 1, falhas, dias)
+
+
+def prioridades(ids):
+    """certidao_id -> chave_urgencia com os dados atuais do banco."""
+    hoje = date.today()
+    falhas = falhas_recentes()
+    resultado = {}
+    ids = list(ids)
+    for inicio in range(0, len(ids), _LOTE_CONSULTA):
+        linhas = (db.session.query(Certidao.id, Certidao.data_validade, Certidao.status_especial)
+                  .filter(Certidao.id.in_(ids[inicio:inicio + _LOTE_CONSULTA]))
+                  .all())
+        for certidao_id, data_validade, status_especial in linhas:
+            resultado[certidao_id] = chave_urgencia(
+                data_validade, status_especial, falhas.get(certidao_id, 0), hoje)
+    return resultado
+
+
+def _intervalo_repriorizacao():
+    try:
+        return max(0, int(current_app.config.get('BATCH_REPRIORIZAR_A_CADA', 5)))
+    except (RuntimeError, TypeError, ValueError):
+        return 5
+
+
+def repriorizar_restantes(lock, state, forcar=False):
+    """Reordena ids[index:] pela urgencia atual a cada BATCH_REPRIORIZAR_A_CADA
+    itens concluidos: validade/pendencia alteradas por outra emissao e falhas
+    novas (inclusive deste lote) mudam a fila do que falta. So permuta o
+    sufixo nao processado, entao pausar/retomar e _proximo_id_livre continuam
+    valendo. Consulta o banco fora do lock; nunca propaga erro."""
+    intervalo = _intervalo_repriorizacao()
+    with lock:
+        if (state.get('ordem') or ordem_configurada()) != 'urgencia':
+            return False
+        index = state['index']
+        if not forcar and (not intervalo or index - state.get('repriorizado_em', 0) < intervalo):
+            return False
+        state['repriorizado_em'] = index
+        restantes = list(state['ids'][index:])
+    if len(restantes) < 2:
+        return False
+
+    try:
+        chaves = prioridades(restantes)
+    except Exception as exc:
+        db.session.rollback()
+        log_event('batch_repriorizar_error', level='WARNING', error=str(exc))
+        return False
+
+    with lock:
+        index = state['index']
+        # sort estavel: empate (ou ID sem chave) mantem a ordem atual
+        state['ids'][index:] = sorted(
+            state['ids'][index:], key=lambda cid: chaves.get(cid, _SEM_PRIORIDADE))
+        proximos = state['ids'][index:index + 3]
+    log_event('batch_repriorizado', restantes=len(restantes), proximos=proximos)
+    return True
+
+
+def _chave_cache(cache_chave, scope, tipo, ordem):
+    # config_cache.versao(): prazos de "a vencer"; _versao_alvos: certidoes,
+    # empresas (filtros por estado/cidade) e historico de falhas
+    return (cache_chave, scope, getattr(tipo, 'name', tipo), ordem, date.today(),
+            config_cache.versao(), _versao_alvos)
+
+
+def _ttl_cache_alvos():
+    try:
+        return max(0, int(current_app.config.get('LOTE_ALVOS_CACHE_SEGUNDOS', 10)))
+    except (RuntimeError, TypeError, ValueError):
+        return 10
+
+
+def limpar_cache_alvos():
+    """Invalida o cache de calc_targets (entradas em calculo agora nao valem)."""
+    global _versao_alvos
+    with _cache_alvos_lock:
+        _versao_alvos += 1
+        _cache_alvos.clear()
+
+
+def _apos_flush(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (Certidao, Empresa, LoteItem)):
+            session.info['alvos_sujos'] = True
+            return
+
+
+def _apos_commit(session):
+    # so apos o commit: antes disso outra thread recalcularia o valor antigo
+    if session.info.pop('alvos_sujos', False):
+        limpar_cache_alvos()
+
+
+def _apos_rollback(session, previous_transaction):
+    session.info.pop('alvos_sujos', None)
+
+
+def registrar_eventos():
+    """Liga a invalidacao do cache de alvos por commit (idempotente)."""
+    global _eventos_registrados
+    if _eventos_registrados:
+        return
+    event.listen(Session, 'after_flush', _apos_flush)
+    event.listen(Session, 'after_commit', _apos_commit)
+    event.listen(Session, 'after_soft_rollback', _apos_rollback)
+    _eventos_registrados = True
+
+
+def _com_inicio(dados, start_certidao_id):
+    """Copia de dados com o ID de inicio na frente (o lote muta ids)."""
+    ids = list(dados['ids'])
+    if start_certidao_id in ids:
+        ids.remove(start_certidao_id)
+        ids.insert(0, start_certidao_id)
+    return {**dados, 'ids': ids}
+
+
+def calc_targets(start_certidao_id, extra_filter=None, scope='default', tipo=None, ordem=None,
+                 cache_chave=None):
+    """IDs do lote (ID de inicio primeiro) e contagens vencidas/a_vencer/
+    pendentes, sem carregar objetos Certidao: uma consulta so de IDs, ja na
+    ordem do lote, e uma de agregados (COUNT de CASE).
+
+    cache_chave identifica o filtro (extra_filter e uma funcao): com ela o
+    resultado fica em cache por LOTE_ALVOS_CACHE_SEGUNDOS, por escopo, tipo,
+    ordem e dia. Commit pelo ORM em Certidao, Empresa, LoteItem ou na
+    configuracao invalida na hora; escrita fora do ORM (SQL direto, outro
+    processo, bulk insert) pode ser servida com ate o TTL de atraso."""
+    scope_norm = (scope or 'default').strip().lower()
+    if scope_norm != 'pendentes':
+        scope_norm = 'default'
+    ordem = (ordem or ordem_configurada()).strip().lower()
+    if ordem not in ORDENS:
+        ordem = 'id'
+
+    ttl = _ttl_cache_alvos() if cache_chave is not None else 0
+    if ttl:
+        chave = _chave_cache(cache_chave, scope_norm, tipo, ordem)
+        with _cache_alvos_lock:
+            item = _cache_alvos.get(chave)
+            if item is not None and time.monotonic() - item[0] < ttl:
+                return _com_inicio(item[1], start_certidao_id)
+
     hoje = date.today()
     if tipo is not None:
         # Lote de tipo unico: usa o prazo de validade configurado para esse tipo,
@@ -311,16 +942,15 @@ def calc_targets(start_certidao_id, extra_filter=None, scope='default', tipo=Non
         dias_limite = max(get_a_vencer_dias(tipo=t) for t in TipoCertidao)
     limite = hoje + timedelta(days=dias_limite)
 
-    query = Certidao.query.order_by(Certidao.id)
+    query = db.session.query(Certidao.id)
 
     if extra_filter is not None:
         query = extra_filter(query)
 
-    scope_norm = (scope or 'default').strip().lower()
+    pendente = Certidao.status_especial == StatusEspecial.PENDENTE
     if scope_norm == 'pendentes':
-        query = query.filter(Certidao.status_especial == StatusEspecial.PENDENTE)
+        query = query.filter(pendente)
     else:
-        scope_norm = 'default'
         query = (query
                  .filter(Certidao.data_validade.isnot(None))
                  .filter(Certidao.data_validade <= limite)
@@ -329,25 +959,41 @@ def calc_targets(start_certidao_id, extra_filter=None, scope='default', tipo=Non
                      Certidao.status_especial != StatusEspecial.PENDENTE,
                  )))
 
-    certidoes = query.all()
-
-    ids = [c.id for c in certidoes if c.data_validade]
-    if scope_norm == 'pendentes':
-        ids = [c.id for c in certidoes]
-
-    vencidas = sum(1 for c in certidoes if c.data_validade and c.data_validade < hoje)
-    a_vencer = sum(1 for c in certidoes if c.data_validade and hoje <= c.data_validade <= limite)
-    pendentes = sum(1 for c in certidoes if c.status_especial == StatusEspecial.PENDENTE)
-
-    if start_certidao_id in ids:
-        ids.remove(start_certidao_id)
-        ids.insert(0, start_certidao_id)
+    vencidas, a_vencer, pendentes = query.with_entities(
+        func.count(case((Certidao.data_validade < hoje, 1))),
+        func.count(case((Certidao.data_validade.between(hoje, limite), 1))),
+        func.count(case((pendente, 1))),
+    ).one()
+
+    if ordem == 'urgencia':
+        # mesma ordem de chave_urgencia, em SQL: datas no lugar de dias
+        falhas = _consulta_falhas_recentes().subquery()
+        hoje_sql = literal(hoje, type_=db.Date)
+        query = query.outerjoin(falhas, falhas.c.certidao_id == Certidao.id).order_by(
+            case((or_(Certidao.data_validade.is_(None), Certidao.data_validade < hoje), hoje_sql),
+                 else_=Certidao.data_validade),
+            case((pendente, 0), else_=1),
+            func.coalesce(falhas.c.falhas, 0),
+            func.coalesce(Certidao.data_validade, hoje_sql),
+            Certidao.id,
+        )
+    else:
+        query = query.order_by(Certidao.id)
 
-    return {
-        'ids': ids,
-        'total': len(ids),
+    dados = {
+        'ids': [certidao_id for (certidao_id,) in query.all()],
         'scope': scope_norm,
-        'vencidas': vencidas,
-        'a_vencer': a_vencer,
-        'pendentes': pendentes,
+        'ordem': ordem,
+        'vencidas': int(vencidas or 0),
+        'a_vencer': int(a_vencer or 0),
+        'pendentes': int(pendentes or 0),
     }
+    dados['total'] = len(dados['ids'])
+
+    if ttl:
+        with _cache_alvos_lock:
+            _cache_alvos[chave] = (time.monotonic(), dados)
+            _cache_alvos.move_to_end(chave)
+            while len(_cache_alvos) > _CACHE_ALVOS_MAX:
+                _cache_alvos.popitem(last=False)
+    return _com_inicio(dados, start_certidao_id)
@@ -0,0 +1,193 @@
+"""Persistencia write-through do estado dos lotes (LoteExecucao/LoteItem).
+
+O estado em memoria (batch_state) continua sendo a fonte de verdade durante a
+execucao; este modulo apenas espelha cada transicao no banco para que um
+reinicio do processo nao perca o progresso. No boot, restaurar() remonta o
+estado do ultimo lote nao finalizado como 'paused', com os IDs ja concluidos
+em ids[:index], de modo que /retomar continua exatamente de onde parou.
+
+Todas as funcoes exigem app context, usam transacao curta propria e nunca
+propagam erro (falha de persistencia nao pode derrubar o lote).
+"""
+from datetime import datetime
+
+from app import db
+from app.models import LoteExecucao, LoteItem
+from app.services.execution_logger import log_event
+
+# estado em memoria -> coluna de LoteExecucao
+_CAMPOS = {
+    'status': 'status',
+    'scope': 'scope',
+    'execution_id': 'execution_id',
+    'total': 'total',
+    'index': 'processados',
+    'success': 'sucesso',
+    'falhas': 'falhas',
+    'vencidas': 'vencidas',
+    'a_vencer': 'a_vencer',
+    'pendentes': 'pendentes',
+    'fgts_marcadas_pendente': 'fgts_marcadas_pendente',
+    'positivas': 'positivas',
+    'negativas': 'negativas',
+    'efeito_negativas': 'efeito_negativas',
+    'message': 'mensagem',
+    'started_at': 'iniciado_em',
+    'finished_at': 'finalizado_em',
+}
+
+# lotes nesses status ainda tem itens a emitir e sao restaurados no boot
+_STATUS_RETOMAVEIS = ('running', 'paused')
+
+
+def snapshot(state):
+    """Copia os campos persistidos do estado. Chamar com o lock do lote."""
+    return {chave: state.get(chave) for chave in _CAMPOS}
+
+
+def _aplicar_snapshot(execucao, snap):
+    for chave, coluna in _CAMPOS.items():
+        valor = snap.get(chave)
+        if coluna == 'mensagem' and valor:
+            valor = str(valor)[:500]
+        if valor is None and coluna not in ('mensagem', 'execution_id', 'iniciado_em', 'finalizado_em'):
+            continue
+        setattr(execucao, coluna, valor)
+    execucao.atualizado_em = datetime.utcnow()
+
+
+def criar_execucao(lote, state):
+    """Grava um novo LoteExecucao com um LoteItem pendente por ID da fila.
+    Lotes anteriores ainda marcados como retomaveis sao encerrados ('stopped').
+    Retorna o id da execucao (ou None em falha)."""
+    try:
+        (LoteExecucao.query
+         .filter(LoteExecucao.lote == lote)
+         .filter(LoteExecucao.status.in_(_STATUS_RETOMAVEIS))
+         .update({'status': 'stopped', 'atualizado_em': datetime.utcnow()},
+                 synchronize_session=False))
+        execucao = LoteExecucao(lote=lote)
+        _aplicar_snapshot(execucao, snapshot(state))
+        db.session.add(execucao)
+        db.session.flush()
+        db.session.bulk_insert_mappings(LoteItem, [
+            {'execucao_id': execucao.id, 'certidao_id': certidao_id, 'ordem': ordem,
+             'status': 'pendente', 'tentativas': 0}
+            for ordem, certidao_id in enumerate(state.get('ids') or [])
+        ])
+        db.session.commit()
+        return execucao.id
+    except Exception as exc:
+        db.session.rollback()
+        log_event('batch_store_error', level='WARNING', lote=lote, op='criar', error=str(exc))
+        return None
+
+
+def atualizar_execucao(run_id, snap):
+    """Atualiza status/contadores do LoteExecucao a partir de um snapshot."""
+    if not run_id:
+        return
+    try:
+        execucao = db.session.get(LoteExecucao, run_id)
+        if execucao is None:
+            return
+        _aplicar_snapshot(execucao, snap)
+        db.session.commit()
+    except Exception as exc:
+        db.session.rollback()
+        log_event('batch_store_error', level='WARNING', op='atualizar', error=str(exc))
+
+
+def registrar_item(run_id, certidao_id, status, snap, *, duracao_ms=None,
+                   mensagem=None, concluido_seq=None):
+    """Grava o resultado de uma tentativa do item (tentativas += 1) e o
+    snapshot do lote na mesma transacao.
+
+    status: 'sucesso' | 'falha' | 'erro' | 'pendente' (interrompido por
+    pausa/parada, volta a ser emitido na retomada)."""
+    if not run_id:
+        return
+    try:
+        item = LoteItem.query.filter_by(execucao_id=run_id, certidao_id=certidao_id).first()
+        if item is None:
+            item = LoteItem(execucao_id=run_id, certidao_id=certidao_id, tentativas=0)
+            db.session.add(item)
+        item.status = status
+        item.tentativas = (item.tentativas or 0) + 1
+        item.duracao_ms = duracao_ms
+        item.mensagem = str(mensagem)[:500] if mensagem else None
+        item.concluido_seq = concluido_seq
+        item.atualizado_em = datetime.utcnow()
+
+        execucao = db.session.get(LoteExecucao, run_id)
+        if execucao is not None:
+            _aplicar_snapshot(execucao, snap)
+        db.session.commit()
+    except Exception as exc:
+        db.session.rollback()
+        log_event(
+            'batch_store_error', level='WARNING', op='item',
+            certidao_id=certidao_id, error=str(exc),
+        )
+
+
+def restaurar(lote, state):
+    """Remonta no dicionario de estado o ultimo lote retomavel de `lote`.
+
+    O lote volta como 'paused' (o worker morreu junto com o processo): os IDs
+    concluidos ficam em ids[:index] na ordem de conclusao e os demais seguem a
+    ordem original. Retorna True se algo foi restaurado."""
+    try:
+        execucao = (LoteExecucao.query
+                    .filter(LoteExecucao.lote == lote)
+                    .filter(LoteExecucao.status.in_(_STATUS_RETOMAVEIS))
+                    .order_by(LoteExecucao.id.desc())
+                    .first())
+        if execucao is None:
+            return False
+
+        itens = LoteItem.query.filter_by(execucao_id=execucao.id).all()
+        concluidos = sorted(
+            (i for i in itens if i.concluido_seq is not None),
+            key=lambda i: i.concluido_seq,
+        )
+        restantes = sorted(
+            (i for i in itens if i.concluido_seq is None),
+            key=lambda i: i.ordem,
+        )
+        ids = [i.certidao_id for i in concluidos] + [i.certidao_id for i in restantes]
+    except Exception as exc:
+        db.session.rollback()
+        log_event('batch_store_error', level='WARNING', lote=lote, op='restaurar', error=str(exc))
+        return False
+
+    state.update({
+        'status': 'paused',
+        'ids': ids,
+        'index': len(concluidos),
+        'total': len(ids),
+        'scope': execucao.scope or 'default',
+        'execution_id': execucao.execution_id,
+        'success': execucao.sucesso or 0,
+        'falhas': execucao.falhas or 0,
+        'vencidas': execucao.vencidas or 0,
+        'a_vencer': execucao.a_vencer or 0,
+        'pendentes': execucao.pendentes or 0,
+        'fgts_marcadas_pendente': execucao.fgts_marcadas_pendente or 0,
+        'positivas': execucao.positivas or 0,
+        'negativas': execucao.negativas or 0,
+        'efeito_negativas': execucao.efeito_negativas or 0,
+        'started_at': execucao.iniciado_em,
+        'finished_at': None,
+        'stop_requested': True,
+        'stop_action': 'pause',
+        'run_id': execucao.id,
+        'lote': lote,
+    })
+    if execucao.status != 'paused':
+        atualizar_execucao(execucao.id, snapshot(state))
+    log_event(
+        'batch_restored', lote=lote, run_id=execucao.id,
+        processed=len(concluidos), total=len(ids),
+    )
+    return True
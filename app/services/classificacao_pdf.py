@@ -0,0 +1,366 @@
+"""Classificacao de PDFs em pool de processos.
+
+O parsing do pdfplumber e CPU puro e rodava na thread do request ou do worker
+de lote, disputando o GIL com a orquestracao do Selenium. Aqui a leitura
+(pdf.analisar_arquivo: 1a pagina, depois o documento inteiro) vai para um
+ProcessPoolExecutor:
+
+- no maximo PDF_POOL_WORKERS tarefas em voo (uma por processo, nada fica na
+  fila interna do executor); ate PDF_POOL_FILA chamadas esperam vaga, cada
+  uma ate o timeout. Sem vaga, analisar() le inline na thread atual;
+- timeout por arquivo (PDF_POOL_TIMEOUT_SEGUNDOS) contado de quando o
+  processo filho comeca a ler o arquivo. Estourou: so aquela tarefa falha; o
+  pool e aposentado (tarefas novas vao para um pool novo) e encerrado, com o
+  processo travado, quando as demais tarefas dele terminarem;
+- analisar_lote() recebe muitos arquivos e devolve conforme terminam,
+  usando todos os processos (re-classificar uma pasta inteira).
+
+O resultado volta para o cache de pdf.py do processo principal. Com
+PDF_POOL_ENABLED=false (ou se o pool nao subir) roda na thread atual.
+"""
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from app.automation import pdf
+from app.services.execution_logger import log_event
+from app.utils import get_config_value
+
+CAMPOS_PADRAO = ('classificacao', 'validade_federal')
+
+_lock = threading.Lock()
+_pool = None        # _Pool que recebe as tarefas novas
+_esperando = 0      # chamadas aguardando vaga
+
+_PASSO = 0.25
+_tarefas = itertools.count(1)
+
+# no processo filho: por onde avisar o inicio de cada tarefa
+_fila_inicio = None
+
+
+class FilaCheiaError(RuntimeError):
+    """Sem vaga na fila do pool dentro do timeout."""
+
+
+def _inicializar_worker(fila):
+    global _fila_inicio
+    _fila_inicio = fila
+
+
+def _analisar_no_worker(tarefa, caminho_pdf, campos):
+    """Roda no processo filho: avisa o inicio (o timeout conta daqui) e le."""
+    if _fila_inicio is not None:
+        _fila_inicio.put((tarefa, time.time()))
+    return pdf.analisar_arquivo(caminho_pdf, campos)
+
+
+class _Pool:
+    """Executor, vagas (uma por processo) e a hora de inicio das tarefas.
+
+    Aposentado apos um timeout: nao recebe tarefas novas e e encerrado
+    (processos travados incluidos) quando nao sobra tarefa viva nele."""
+
+    def __init__(self, workers):
+        contexto = multiprocessing.get_context('spawn')
+        self.workers = workers
+        self.vagas = threading.BoundedSemaphore(workers)
+        self._avisos = contexto.Queue()
+        # spawn: fork de um processo com threads do Flask/Selenium nao e seguro
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=contexto,
+            initializer=_inicializar_worker, initargs=(self._avisos,),
+        )
+        self._lock = threading.Lock()
+        self._inicios = {}
+        self._vivas = set()
+        self.aposentado = False
+        self._encerrado = False
+
+    def submeter(self, caminho_pdf, campos):
+        tarefa = next(_tarefas)
+        futuro = self.executor.submit(_analisar_no_worker, tarefa, caminho_pdf, campos)
+        futuro.tarefa = tarefa
+        futuro.enviado_em = time.time()
+        with self._lock:
+            self._vivas.add(futuro)
+        futuro.add_done_callback(self._terminou)
+        return futuro
+
+    def _terminou(self, futuro):
+        self.vagas.release()
+        with self._lock:
+            self._vivas.discard(futuro)
+            self._inicios.pop(futuro.tarefa, None)
+            vazio = self.aposentado and not self._vivas
+        if vazio:
+            self.encerrar()
+
+    def inicio(self, futuro):
+        """time.time() em que o filho comecou a tarefa, ou None."""
+        with self._lock:
+            while True:
+                try:
+                    tarefa, quando = self._avisos.get_nowait()
+                except (queue.Empty, OSError, ValueError):
+                    break
+                self._inicios[tarefa] = quando
+            return self._inicios.get(futuro.tarefa)
+
+    def vencido(self, futuro, timeout):
+        """Rodando ha mais que `timeout` (ou sem comecar nesse prazo: o
+        processo nem subiu)."""
+        inicio = self.inicio(futuro)
+        referencia = inicio if inicio is not None else futuro.enviado_em
+        return not futuro.done() and time.time() - referencia > timeout
+
+    def abandonar(self, futuros):
+        """Timeout: as tarefas saem do pool (quem esperava recebe erro) e o
+        pool e aposentado; encerra ja se nada mais roda nele."""
+        with self._lock:
+            for futuro in futuros:
+                self._vivas.discard(futuro)
+            self.aposentado = True
+            vazio = not self._vivas
+        if vazio:
+            self.encerrar()
+
+    def encerrar(self):
+        with self._lock:
+            if self._encerrado:
+                return
+            self._encerrado = True
+            self.aposentado = True
+        # processos presos num parse nao respondem ao shutdown: encerra na marra
+        for processo in list((getattr(self.executor, '_processes', None) or {}).values()):
+            try:
+                processo.terminate()
+            except Exception:
+                pass
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        try:
+            self._avisos.close()
+        except Exception:
+            pass
+
+
+def _config_int(nome, padrao, minimo):
+    try:
+        return max(minimo, int(get_config_value(nome, padrao)))
+    except (TypeError, ValueError):
+        return padrao
+
+
+def habilitado():
+    valor = get_config_value('PDF_POOL_ENABLED', True)
+    if isinstance(valor, str):
+        return valor.strip().lower() in {'1', 'true', 'yes', 'on', 'sim'}
+    return bool(valor)
+
+
+def _limite_fila():
+    return _config_int('PDF_POOL_FILA', 16, 1)
+
+
+def _timeout_padrao():
+    return _config_int('PDF_POOL_TIMEOUT_SEGUNDOS', 60, 1)
+
+
+def _obter_pool():
+    global _pool
+    with _lock:
+        if _pool is None or _pool.aposentado:
+            workers = _config_int('PDF_POOL_WORKERS', 2, 1)
+            _pool = _Pool(workers)
+            log_event('pdf_pool_started', workers=workers, fila=_limite_fila())
+        return _pool
+
+
+def encerrar(motivo='shutdown'):
+    """Derruba o pool atual (processos travados incluidos); o proximo uso
+    recria. Pools aposentados se encerram sozinhos ao esvaziar."""
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is None:
+        return
+    pool.encerrar()
+    log_event('pdf_pool_stopped', motivo=motivo)
+
+
+def _aposentar(pool, futuros, timeout, arquivos):
+    log_event('pdf_pool_timeout', level='WARNING', arquivos=arquivos, timeout_s=timeout,
+              aposentado=True)
+    pool.abandonar(futuros)
+
+
+def _reservar_vaga(pool, timeout_fila):
+    global _esperando
+    if pool.vagas.acquire(blocking=False):
+        return
+    with _lock:
+        if not timeout_fila or _esperando >= _limite_fila():
+            raise FilaCheiaError('Fila de classificacao de PDF cheia.')
+        _esperando += 1
+    try:
+        if not pool.vagas.acquire(timeout=timeout_fila):
+            raise FilaCheiaError('Fila de classificacao de PDF cheia.')
+    finally:
+        with _lock:
+            _esperando -= 1
+
+
+def _submeter(caminho_pdf, campos, timeout_fila):
+    """(pool, futuro). Espera vaga (processo livre) ate timeout_fila."""
+    while True:
+        pool = _obter_pool()
+        _reservar_vaga(pool, timeout_fila)
+        if not pool.aposentado:
+            break
+        # aposentado durante a espera: a vaga e de um pool que nao aceita mais
+        pool.vagas.release()
+    try:
+        futuro = pool.submeter(caminho_pdf, tuple(campos))
+    except BaseException:
+        pool.vagas.release()
+        raise
+    return pool, futuro
+
+
+def _concluir(caminho_pdf, resultado):
+    pdf.registrar_analise(caminho_pdf, resultado)
+    return resultado
+
+
+def _aguardar(pool, futuro, timeout):
+    while True:
+        try:
+            return futuro.result(timeout=_PASSO)
+        except FuturesTimeoutError:
+            if pool.vencido(futuro, timeout):
+                raise
+
+
+def analisar(caminho_pdf, campos=CAMPOS_PADRAO, timeout=None, levantar_fila_cheia=False):
+    """Analisa um PDF (cache -> pool -> inline). Levanta a excecao de leitura
+    ou TimeoutError.
+
+    Pool sem vaga: le inline, como antes do pool (a emissao nunca classifica
+    errado por capacidade); com levantar_fila_cheia=True levanta
+    FilaCheiaError para o chamador tentar depois."""
+    campos = tuple(campos)
+    em_cache = pdf.analise_em_cache(caminho_pdf, campos)
+    if em_cache is not None:
+        return em_cache
+    if not habilitado():
+        return pdf.analisar_arquivo(caminho_pdf, campos)
+
+    timeout = timeout or _timeout_padrao()
+    try:
+        pool, futuro = _submeter(caminho_pdf, campos, timeout)
+    except FilaCheiaError as exc:
+        if levantar_fila_cheia:
+            raise
+        log_event('pdf_pool_fila_cheia', level='WARNING', inline=True, error=str(exc))
+        return pdf.analisar_arquivo(caminho_pdf, campos)
+    except (OSError, RuntimeError) as exc:
+        log_event('pdf_pool_indisponivel', level='WARNING', error=str(exc))
+        encerrar('indisponivel')
+        return pdf.analisar_arquivo(caminho_pdf, campos)
+
+    try:
+        resultado = _aguardar(pool, futuro, timeout)
+    except FuturesTimeoutError:
+        _aposentar(pool, [futuro], timeout, os.path.basename(str(caminho_pdf)))
+        raise TimeoutError(f'Leitura do PDF excedeu {timeout}s.')
+    except BrokenProcessPool as exc:
+        log_event('pdf_pool_indisponivel', level='WARNING', error=str(exc))
+        pool.encerrar()
+        return pdf.analisar_arquivo(caminho_pdf, campos)
+    return _concluir(caminho_pdf, resultado)
+
+
+def analisar_lote(caminhos, campos=CAMPOS_PADRAO, timeout=None):
+    """Analisa muitos PDFs em paralelo; gera (caminho, resultado, erro) na
+    ordem de termino. Mantem no maximo um arquivo em voo por processo, entao
+    aceita um iterador longo sem materializar tudo.
+
+    erro e a mensagem (str) da falha de leitura; sem vaga no pool vem a
+    propria FilaCheiaError: o arquivo nao foi lido e pode ser tentado de novo."""
+    campos = tuple(campos)
+    timeout = timeout or _timeout_padrao()
+    em_voo = {}   # futuro -> (caminho, pool)
+    fila = iter(caminhos)
+    proximo = None
+    esgotado = False
+
+    def _inline(caminho):
+        try:
+            return caminho, pdf.analisar_arquivo(caminho, campos), None
+        except Exception as exc:
+            return caminho, None, str(exc)
+
+    while True:
+        while not esgotado:
+            if proximo is None:
+                try:
+                    proximo = next(fila)
+                except StopIteration:
+                    esgotado = True
+                    break
+                em_cache = pdf.analise_em_cache(proximo, campos)
+                if em_cache is not None:
+                    yield proximo, em_cache, None
+                    proximo = None
+                    continue
+                if not habilitado():
+                    yield _inline(proximo)
+                    proximo = None
+                    continue
+            try:
+                # com arquivos em voo nao bloqueia: volta a colher resultados
+                pool, futuro = _submeter(proximo, campos, 0 if em_voo else timeout)
+            except FilaCheiaError as exc:
+                if em_voo:
+                    break
+                yield proximo, None, exc
+                proximo = None
+                continue
+            except (OSError, RuntimeError) as exc:
+                log_event('pdf_pool_indisponivel', level='WARNING', error=str(exc))
+                encerrar('indisponivel')
+                yield _inline(proximo)
+                proximo = None
+                continue
+            em_voo[futuro] = (proximo, pool)
+            proximo = None
+
+        if not em_voo:
+            if esgotado:
+                return
+            continue
+
+        feitos, _ = wait(list(em_voo), timeout=_PASSO, return_when=FIRST_COMPLETED)
+        for futuro in feitos:
+            caminho, _pool_futuro = em_voo.pop(futuro)
+            try:
+                yield caminho, _concluir(caminho, futuro.result()), None
+            except Exception as exc:
+                yield caminho, None, str(exc)
+
+        vencidos = {}
+        for futuro, (caminho, pool) in em_voo.items():
+            if pool.vencido(futuro, timeout):
+                vencidos.setdefault(pool, []).append(futuro)
+        for pool, futuros in vencidos.items():
+            # so os travados falham; os demais em voo terminam no pool antigo
+            _aposentar(pool, futuros, timeout, len(futuros))
+            for futuro in futuros:
+                caminho, _pool_futuro = em_voo.pop(futuro)
+                yield caminho, None, f'Leitura do PDF excedeu {timeout}s.'
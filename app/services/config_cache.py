@@ -0,0 +1,156 @@
+"""Cache de processo para ConfiguracaoSistema e regras de Municipio.
+
+Antes a configuracao era lida uma vez por request (flask.g) e, fora de
+request (workers de lote, calc_targets), a cada chamada; as regras municipais
+eram carregadas inteiras a cada item do lote. Aqui ficam snapshots imutaveis
+(SimpleNamespace com os valores das colunas), seguros para as threads dos
+workers, invalidados por:
+
+- commit que cria/altera/remove ConfiguracaoSistema ou Municipio (inclui o
+  POST de /configuracoes e as telas de municipio);
+- CONFIG_CACHE_TTL_SEGUNDOS, rede de seguranca para escrita fora do ORM ou
+  por outro processo.
+
+Cada invalidacao incrementa versao(), que outros caches usam como chave.
+"""
+import threading
+import time
+from types import SimpleNamespace
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app import db, file_manager
+from app.models import ConfiguracaoSistema, Municipio
+from app.services.execution_logger import log_event
+from app.utils import get_config_value
+
+_NAO_CARREGADO = object()
+
+_lock = threading.Lock()
+_versao = 0
+_config = _NAO_CARREGADO
+_config_em = 0.0
+_municipios = None
+_municipios_em = 0.0
+
+_eventos_registrados = False
+
+
+def versao():
+    """Carimbo da configuracao atual (muda a cada invalidacao)."""
+    return _versao
+
+
+def invalidar(motivo='manual'):
+    global _versao, _config, _municipios
+    with _lock:
+        _versao += 1
+        _config = _NAO_CARREGADO
+        _municipios = None
+        versao_atual = _versao
+    log_event('config_cache_invalidated', motivo=motivo, versao=versao_atual)
+
+
+def _ttl():
+    try:
+        return int(get_config_value('CONFIG_CACHE_TTL_SEGUNDOS', 300))
+    except (TypeError, ValueError):
+        return 300
+
+
+def _snapshot(obj):
+    return SimpleNamespace(**{
+        attr.key: getattr(obj, attr.key) for attr in inspect(obj).mapper.column_attrs
+    })
+
+
+def _normalizar_cidade(nome):
+    return file_manager.remover_acentos((nome or '').strip()).upper()
+
+
+def obter_configuracao():
+    """Snapshot de ConfiguracaoSistema (id=1) ou None se nao houver linha.
+
+    Sem app context/tabela devolve None sem guardar nada em cache."""
+    global _config, _config_em
+    agora = time.monotonic()
+    with _lock:
+        if _config is not _NAO_CARREGADO and agora - _config_em < _ttl():
+            return _config
+        versao_leitura = _versao
+    try:
+        row = db.session.get(ConfiguracaoSistema, 1)
+        snap = _snapshot(row) if row else None
+    except Exception:
+        return None
+    with _lock:
+        # nao grava por cima de uma invalidacao feita durante a leitura
+        if _versao == versao_leitura:
+            _config = snap
+            _config_em = agora
+    return snap
+
+
+def _carregar_municipios():
+    global _municipios, _municipios_em
+    agora = time.monotonic()
+    with _lock:
+        if _municipios is not None and agora - _municipios_em < _ttl():
+            return _municipios
+        versao_leitura = _versao
+    try:
+        lista = [_snapshot(m) for m in Municipio.query.order_by(Municipio.id).all()]
+    except Exception:
+        return {'lista': [], 'por_cidade': {}}
+    por_cidade = {}
+    for municipio in lista:
+        por_cidade.setdefault(_normalizar_cidade(municipio.nome), municipio)
+    carregado = {'lista': lista, 'por_cidade': por_cidade}
+    with _lock:
+        if _versao == versao_leitura:
+            _municipios = carregado
+            _municipios_em = agora
+    return carregado
+
+
+def municipios():
+    """Snapshots de todas as regras municipais."""
+    return list(_carregar_municipios()['lista'])
+
+
+def municipio_por_cidade(cidade):
+    """Regra do municipio pelo nome da cidade (sem acento/caixa) ou None."""
+    cidade_norm = _normalizar_cidade(cidade)
+    if not cidade_norm:
+        return None
+    return _carregar_municipios()['por_cidade'].get(cidade_norm)
+
+
+def _apos_flush(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (ConfiguracaoSistema, Municipio)):
+            session.info['config_cache_sujo'] = True
+            return
+
+
+def _apos_commit(session):
+    # so apos o commit: invalidar no flush deixaria outra thread recarregar
+    # o valor antigo antes da gravacao ficar visivel
+    if session.info.pop('config_cache_sujo', False):
+        invalidar('commit')
+
+
+def _apos_rollback(session, previous_transaction):
+    session.info.pop('config_cache_sujo', None)
+
+
+def registrar_eventos():
+    """Liga a invalidacao por commit em toda sessao (idempotente)."""
+    global _eventos_registrados
+    if _eventos_registrados:
+        return
+    event.listen(Session, 'after_flush', _apos_flush)
+    event.listen(Session, 'after_commit', _apos_commit)
+    event.listen(Session, 'after_soft_rollback', _apos_rollback)
+    _eventos_registrados = True
@@ -2,14 +2,19 @@
 recorrentes (mesmo erro N vezes no mesmo alvo => provavel quebra de seletor
 ou portal fora do ar).
 
+O mesmo handler alimenta o registro de metricas (services.metricas).
+
 Alimentado por um logging.Handler que le o payload ja anexado por log_event,
 evitando acoplar o execution_logger a este modulo."""
 import logging
 import queue
 import threading
+import time
 from collections import deque
 from datetime import datetime, timedelta, timezone
 
+from app.services import metricas
+
 _MAX_EVENTOS = 200
 _LIMIAR_RECORRENCIA = 3  # falhas iguais seguidas para abrir um alerta
 _NIVEIS_PERSISTIDOS = {'WARNING', 'ERROR'}
@@ -21,10 +26,19 @@ _alertas = {}      # (error_type, alvo) -> alerta ativo
 
 # Persistencia desacoplada: a fila e drenada por uma unica thread escritora,
 # com sessao/transacao propria, para nao colidir com a transacao do chamador
-# (workers de lote fazem rollback no meio) nem travar o SQLite.
-_fila = queue.Queue()
+# (workers de lote fazem rollback no meio) nem travar o SQLite. A escritora
+# grava em lotes (um INSERT multi-linha e um commit por lote, fechado por
+# tamanho ou tempo); com a fila cheia o evento e descartado e contado.
+_LOTE_MAX = 100
+_LOTE_ESPERA_SEGUNDOS = 2.0
+_PRUNE_INTERVALO_SEGUNDOS = 6 * 3600
+
+_fila = queue.Queue(maxsize=2000)
 _app = None
 _writer_iniciado = False
+_retencao_dias = 30
+_descartados = 0
+_gravados = 0
 
 _PREFIXOS = (
     ('fgts', 'FGTS'), ('rs_', 'RS'), ('estadual', 'RS'), ('altcha', 'RS'),
@@ -32,14 +46,18 @@ _PREFIXOS = (
 )
 
 
-def _alvo(payload):
-    if payload.get('municipio'):
-        return str(payload['municipio'])
+def _portal(payload):
     ev = str(payload.get('event') or '').lower()
     for prefixo, nome in _PREFIXOS:
         if ev.startswith(prefixo):
             return nome
-    return ev or '-'
+    return None
+
+
+def _alvo(payload):
+    if payload.get('municipio'):
+        return str(payload['municipio'])
+    return _portal(payload) or str(payload.get('event') or '').lower() or '-'
 
 
 def _hipotese(error_type):
@@ -85,7 +103,17 @@ def registrar(payload):
                 _alertas.pop(chave, None)
 
     if _writer_iniciado and nivel in _NIVEIS_PERSISTIDOS:
-        _fila.put((payload, alvo))
+        _enfileirar(payload, alvo)
+
+
+def _enfileirar(payload, alvo):
+    global _descartados
+    try:
+        _fila.put_nowait((payload, alvo))
+    except queue.Full:
+        # backpressure: o fluxo nunca espera o banco; o painel mostra a perda
+        with _lock:
+            _descartados += 1
 
 
 def eventos_recentes(limite=50, nivel=None):
@@ -111,12 +139,14 @@ def limpar():
 
 
 class DiagnosticsHandler(logging.Handler):
-    """Observa o logger estruturado e alimenta o diagnostico em memoria."""
+    """Observa o logger estruturado e alimenta o diagnostico em memoria e as
+    metricas."""
 
     def emit(self, record):
         payload = getattr(record, 'payload', None)
         if isinstance(payload, dict):
             registrar(payload)
+            metricas.observar(payload, portal=_portal(payload))
 
 
 def attach_handler(logger_name='certidoes'):
@@ -125,41 +155,90 @@ def attach_handler(logger_name='certidoes'):
         logger.addHandler(DiagnosticsHandler())
 
 
-def gravar_evento(payload, alvo=None):
-    """Persiste um evento na tabela de historico. Exige app context ativo.
-    Usa transacao propria e nunca propaga erro (diagnostico nao pode derrubar
-    o fluxo principal)."""
+def _linha(payload, alvo=None):
+    return {
+        'evento': str(payload.get('event') or '')[:80],
+        'nivel': str(payload.get('level') or 'ERROR').upper()[:10],
+        'error_type': (payload.get('error_type') or None),
+        'alvo': (alvo or _alvo(payload))[:80],
+        'mensagem': _mensagem(payload),
+        'request_id': payload.get('request_id'),
+        'execution_id': payload.get('execution_id'),
+        'certidao_id': payload.get('certidao_id'),
+        'empresa_id': payload.get('empresa_id'),
+    }
+
+
+def gravar_lote(itens):
+    """Persiste [(payload, alvo), ...] num unico INSERT/commit. Exige app
+    context ativo. Usa transacao propria e nunca propaga erro (diagnostico
+    nao pode derrubar o fluxo principal). Devolve quantas linhas gravou."""
+    from sqlalchemy import insert
+
     from app import db
     from app.models import EventoDiagnostico
 
+    if not itens:
+        return 0
     try:
-        evento = EventoDiagnostico(
-            evento=str(payload.get('event') or '')[:80],
-            nivel=str(payload.get('level') or 'ERROR').upper()[:10],
-            error_type=(payload.get('error_type') or None),
-            alvo=(alvo or _alvo(payload))[:80],
-            mensagem=_mensagem(payload),
-            request_id=payload.get('request_id'),
-            execution_id=payload.get('execution_id'),
-            certidao_id=payload.get('certidao_id'),
-            empresa_id=payload.get('empresa_id'),
-        )
-        db.session.add(evento)
+        db.session.execute(insert(EventoDiagnostico), [_linha(p, a) for p, a in itens])
         db.session.commit()
+        return len(itens)
     except Exception:
         db.session.rollback()
+        return 0
+
+
+def gravar_evento(payload, alvo=None):
+    """Persiste um unico evento (ver gravar_lote)."""
+    return gravar_lote([(payload, alvo)]) == 1
+
+
+def coletar_lote(fila, espera_primeiro):
+    """Bloqueia ate o 1o item de `fila` (ou espera_primeiro segundos) e junta
+    os que chegarem ate fechar o lote por tamanho ou por tempo. Usado tambem
+    pela escritora das metricas de captcha."""
+    try:
+        itens = [fila.get(timeout=espera_primeiro)]
+    except queue.Empty:
+        return []
+    limite = time.monotonic() + _LOTE_ESPERA_SEGUNDOS
+    while len(itens) < _LOTE_MAX:
+        restante = limite - time.monotonic()
+        if restante <= 0:
+            break
+        try:
+            itens.append(fila.get(timeout=restante))
+        except queue.Empty:
+            break
+    return itens
+
+
+def _coletar_lote(espera_primeiro):
+    return coletar_lote(_fila, espera_primeiro)
 
 
 def _drenar():
+    global _gravados
+    proximo_prune = time.monotonic() + _PRUNE_INTERVALO_SEGUNDOS
     while True:
-        payload, alvo = _fila.get()
+        itens = _coletar_lote(max(1.0, proximo_prune - time.monotonic()))
+        prune_devido = time.monotonic() >= proximo_prune
+        if not itens and not prune_devido:
+            continue
         try:
             with _app.app_context():
-                gravar_evento(payload, alvo)
+                gravados = gravar_lote(itens)
+                if prune_devido:
+                    prune(_retencao_dias)
+                    proximo_prune = time.monotonic() + _PRUNE_INTERVALO_SEGUNDOS
+            with _lock:
+                _gravados += gravados
         except Exception:
             pass
         finally:
-            _fila.task_done()
+            for _ in itens:
+                _fila.task_done()
 
 
 def prune(retencao_dias=30):
@@ -176,11 +255,13 @@ def prune(retencao_dias=30):
 
 
 def iniciar_persistencia(app, retencao_dias=30):
-    """Liga a persistencia em banco: faz prune inicial e sobe a thread escritora."""
-    global _app, _writer_iniciado
+    """Liga a persistencia em banco: faz prune inicial e sobe a thread
+    escritora (que repete o prune a cada _PRUNE_INTERVALO_SEGUNDOS)."""
+    global _app, _writer_iniciado, _retencao_dias
     if _writer_iniciado:
         return
     _app = app
+    _retencao_dias = retencao_dias
     with app.app_context():
         prune(retencao_dias)
     thread = threading.Thread(target=_drenar, name='diagnostics-writer', daemon=True)
@@ -188,14 +269,59 @@ def iniciar_persistencia(app, retencao_dias=30):
     _writer_iniciado = True
 
 
-def historico(limite=100):
-    """Eventos persistidos mais recentes primeiro (para o painel)."""
+def estatisticas_persistencia():
+    """Saude da escritora para o painel: pendentes, gravados e descartados
+    (fila cheia) desde o boot."""
+    with _lock:
+        return {
+            'ativa': _writer_iniciado,
+            'pendentes': _fila.qsize(),
+            'gravados': _gravados,
+            'descartados': _descartados,
+        }
+
+
+# filtros aceitos pelo painel/API -> coluna de EventoDiagnostico
+FILTROS_HISTORICO = ('execution_id', 'certidao_id', 'empresa_id', 'alvo', 'error_type', 'nivel')
+
+
+def consultar_historico(filtros=None, antes_de=None, desde_id=None, limite=100):
+    """Historico persistido, mais novos primeiro, paginado por id (keyset).
+
+    - antes_de: pagina seguinte (ids menores que o cursor);
+    - desde_id: delta do polling (so ids maiores). Se chegaram mais que
+      `limite` eventos novos, 'truncado' vem True e o painel recarrega.
+
+    Devolve {'eventos', 'proximo_cursor', 'ultimo_id', 'truncado'}."""
     from app.models import EventoDiagnostico
 
-    rows = (EventoDiagnostico.query
-            .order_by(EventoDiagnostico.criado_em.desc(), EventoDiagnostico.id.desc())
-            .limit(limite).all())
-    return [r.to_dict() for r in rows]
+    query = EventoDiagnostico.query
+    for nome, valor in (filtros or {}).items():
+        if nome in FILTROS_HISTORICO and valor not in (None, ''):
+            query = query.filter(getattr(EventoDiagnostico, nome) == valor)
+    if antes_de is not None:
+        query = query.filter(EventoDiagnostico.id < antes_de)
+    if desde_id is not None:
+        query = query.filter(EventoDiagnostico.id > desde_id)
+
+    rows = query.order_by(EventoDiagnostico.id.desc()).limit(limite + 1).all()
+    mais = len(rows) > limite
+    rows = rows[:limite]
+    eventos = [r.to_dict() for r in rows]
+    if desde_id is not None:
+        ultimo = rows[0].id if rows else desde_id
+        return {'eventos': eventos, 'proximo_cursor': None, 'ultimo_id': ultimo, 'truncado': mais}
+    return {
+        'eventos': eventos,
+        'proximo_cursor': rows[-1].id if (rows and mais) else None,
+        'ultimo_id': rows[0].id if rows else None,
+        'truncado': False,
+    }
+
+
+def historico(limite=100):
+    """Eventos persistidos mais recentes primeiro (para o painel)."""
+    return consultar_historico(limite=limite)['eventos']
 
 
 def _payload_para_painel(p):
@@ -213,15 +339,26 @@ def _payload_para_painel(p):
     }
 
 
-def eventos_para_painel(limite=100):
-    """Fonte unica do painel: historico persistido; se a persistencia estiver
-    desligada/indisponivel, cai para os erros/avisos do buffer em memoria."""
+def eventos_para_painel(limite=100, filtros=None, antes_de=None, desde_id=None):
+    """Fonte unica do painel: historico persistido (filtrado/paginado); se a
+    persistencia estiver desligada/indisponivel, cai para os erros/avisos do
+    buffer em memoria (sem paginacao: 'fonte' = 'memoria')."""
     try:
-        persistidos = historico(limite=limite)
+        pagina = consultar_historico(filtros, antes_de=antes_de, desde_id=desde_id, limite=limite)
     except Exception:
-        persistidos = []
-    if persistidos:
-        return persistidos
-    memoria = [e for e in eventos_recentes(limite=limite)
+        pagina = None
+    if pagina is not None and (pagina['eventos'] or pagina['ultimo_id'] is not None
+                               or antes_de is not None or _writer_iniciado):
+        return dict(pagina, fonte='banco')
+    memoria = [_payload_para_painel(e) for e in eventos_recentes(limite=_MAX_EVENTOS)
                if str(e.get('level') or 'INFO').upper() in _NIVEIS_PERSISTIDOS]
-    return [_payload_para_painel(e) for e in memoria]
+    for nome, valor in (filtros or {}).items():
+        if nome in FILTROS_HISTORICO and valor not in (None, ''):
+            memoria = [e for e in memoria if str(e.get(nome)) == str(valor)]
+    return {
+        'eventos': memoria[:limite],
+        'proximo_cursor': None,
+        'ultimo_id': None,
+        'truncado': False,
+        'fonte': 'memoria',
+    }
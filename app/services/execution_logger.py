@@ -1,10 +1,26 @@
+"""Log estruturado (log_event) e configuracao dos handlers.
+
+log_event so monta o payload e enfileira: console e arquivo JSONL rodam numa
+thread propria (QueueHandler/QueueListener), com o arquivo gravado em blocos.
+O JSON e gerado uma unica vez, la, na primeira formatacao. O handler do
+diagnostico continua direto no logger (memoria apenas; o painel e os alertas
+enxergam o evento na hora).
+
+Eventos repetitivos (ex.: federal_monitor_waiting) podem ser amostrados:
+LOG_AMOSTRAGEM="evento:N" mantem 1 a cada N no console e no arquivo;
+WARNING/ERROR nunca sao descartados. O diagnostico e as metricas
+(DiagnosticsHandler) continuam vendo todos os eventos.
+"""
+import atexit
+import itertools
 import json
 import logging
 import os
+import queue
 import socket
 import sys
 from datetime import datetime, timezone
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 from app.services.correlation import CorrelationContext
 
@@ -34,6 +50,27 @@ _RESET = '\033[0m'
 # chaves que viram colunas fixas (ou sao ruido) e nao se repetem no "extra"
 _CAMPOS_FIXOS = {'timestamp', 'event', 'level', 'request_id', 'execution_id', 'host', 'pid'}
 
+_NIVEIS = {'ERROR': logging.ERROR, 'WARNING': logging.WARNING}
+
+_amostragem = {}  # evento -> N (mantem 1 a cada N)
+_contagens = {}   # evento -> itertools.count
+_listener = None
+
+
+class _PayloadJson:
+    """Mensagem do registro: o payload vira JSON sob demanda, uma vez so
+    (na thread do listener, nao na de quem chamou log_event)."""
+    __slots__ = ('payload', '_texto')
+
+    def __init__(self, payload):
+        self.payload = payload
+        self._texto = None
+
+    def __str__(self):
+        if self._texto is None:
+            self._texto = json.dumps(self.payload, ensure_ascii=False, default=str)
+        return self._texto
+
 
 class HumanFormatter(logging.Formatter):
     """Renderiza o payload estruturado como uma linha legivel para humanos.
@@ -99,47 +136,219 @@ class HumanFormatter(logging.Formatter):
         return '  '.join(partes)
 
 
+class _FilaHandler(QueueHandler):
+    def prepare(self, record):
+        # sem format() aqui: a serializacao fica para a thread do listener
+        return record
+
+
+class _ArquivoEmLote(RotatingFileHandler):
+    """JSONL rotativo gravado em blocos: acumula as linhas e faz uma escrita
+    (e um flush) por lote. ERROR descarrega na hora; o listener descarrega
+    quando a fila fica ociosa."""
+
+    def __init__(self, *args, lote=100, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lote = lote
+        self._pendentes = []
+
+    def emit(self, record):
+        try:
+            self._pendentes.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+            return
+        if len(self._pendentes) >= self.lote or record.levelno >= logging.ERROR:
+            self.descarregar()
+
+    def descarregar(self):
+        self.acquire()
+        try:
+            if not self._pendentes:
+                return
+            texto = '\n'.join(self._pendentes) + '\n'
+            self._pendentes = []
+            if self.stream is None:
+                self.stream = self._open()
+            if self.maxBytes > 0:
+                self.stream.seek(0, 2)
+                if self.stream.tell() and self.stream.tell() + len(texto.encode('utf-8')) > self.maxBytes:
+                    self.doRollover()
+            self.stream.write(texto)
+            self.stream.flush()
+        except Exception:
+            pass  # falha de disco no log nao deve derrubar o listener
+        finally:
+            self.release()
+
+    def flush(self):
+        self.descarregar()
+
+    def close(self):
+        self.descarregar()
+        super().close()
+
+
+class _Escoador(QueueListener):
+    """QueueListener que descarrega os arquivos em lote quando a fila fica
+    ociosa por `intervalo` segundos."""
+
+    def __init__(self, fila, *handlers, intervalo=0.5):
+        super().__init__(fila, *handlers, respect_handler_level=True)
+        self.intervalo = intervalo
+
+    def dequeue(self, block):
+        while True:
+            try:
+                return self.queue.get(block=block, timeout=self.intervalo if block else None)
+            except queue.Empty:
+                self.descarregar()
+                if not block:
+                    raise
+
+    def descarregar(self):
+        for handler in self.handlers:
+            if isinstance(handler, _ArquivoEmLote):
+                handler.descarregar()
+
+    def stop(self):
+        if self._thread is not None:
+            super().stop()
+        self.descarregar()
+
+
+def _parse_amostragem(valor):
+    """'evento:N,outro:M' (ou dict) -> {evento: N}; ignora entradas invalidas."""
+    if isinstance(valor, dict):
+        itens = valor.items()
+    else:
+        itens = []
+        for parte in str(valor or '').split(','):
+            nome, _, n = parte.partition(':')
+            itens.append((nome, n))
+    taxas = {}
+    for nome, n in itens:
+        try:
+            n = int(str(n).strip())
+        except ValueError:
+            continue
+        if str(nome).strip() and n > 1:
+            taxas[str(nome).strip()] = n
+    return taxas
+
+
+def definir_amostragem(valor):
+    _amostragem.clear()
+    _amostragem.update(_parse_amostragem(valor))
+    _contagens.clear()
+
+
+def _amostrado(event, nivel):
+    """N do evento se este registro for mantido, 0 se for descartado, None
+    se o evento nao e amostrado."""
+    n = _amostragem.get(event)
+    if not n or nivel in _NIVEIS:
+        return None
+    contador = _contagens.setdefault(event, itertools.count())
+    return n if next(contador) % n == 0 else 0
+
+
+_NAO_DECIDIDO = object()
+
+
+class _FiltroAmostragem(logging.Filter):
+    """Amostragem so na saida (console/arquivo). A decisao e tomada uma vez
+    por registro, mesmo com varios handlers filtrando (modo sincrono)."""
+
+    def filter(self, record):
+        amostra = getattr(record, 'amostra', _NAO_DECIDIDO)
+        if amostra is _NAO_DECIDIDO:
+            payload = getattr(record, 'payload', None)
+            if not isinstance(payload, dict):
+                return True
+            amostra = _amostrado(payload.get('event'), str(payload.get('level') or 'INFO').upper())
+            record.amostra = amostra
+            if amostra:
+                # copia: o dict original e o que log_event entregou ao logger
+                anotado = dict(payload, amostragem=amostra)
+                record.payload = anotado
+                record.msg = _PayloadJson(anotado)
+        return amostra != 0
+
+
+def parar_listener():
+    """Drena a fila e grava o que faltar (chamado no atexit)."""
+    global _listener
+    listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+
+
 def _suporta_cor():
     if os.environ.get('NO_COLOR'):
         return False
     return bool(getattr(sys.stderr, 'isatty', lambda: False)())
 
 
-def configure_logging(level='INFO', log_dir=None, console_format='human', json_file=True):
+def configure_logging(level='INFO', log_dir=None, console_format='human', json_file=True,
+                      assincrono=True, amostragem=None):
+    global _listener
     logger = logging.getLogger(LOGGER_NAME)
     if logger.handlers:
         return logger
 
     logger.setLevel(level)
     logger.propagate = False
+    definir_amostragem(amostragem)
 
+    handlers = []
     console = logging.StreamHandler()
     if str(console_format).lower() == 'human':
         console.setFormatter(HumanFormatter(usar_cor=_suporta_cor()))
     else:
         console.setFormatter(logging.Formatter('%(message)s'))
-    logger.addHandler(console)
+    handlers.append(console)
 
     if json_file:
         destino = log_dir or os.path.join(os.getcwd(), 'logs')
         try:
             os.makedirs(destino, exist_ok=True)
-            arquivo = RotatingFileHandler(
+            classe = _ArquivoEmLote if assincrono else RotatingFileHandler
+            arquivo = classe(
                 os.path.join(destino, 'app.jsonl'),
                 maxBytes=5 * 1024 * 1024,
                 backupCount=5,
                 encoding='utf-8',
             )
             arquivo.setFormatter(logging.Formatter('%(message)s'))
-            logger.addHandler(arquivo)
+            handlers.append(arquivo)
         except OSError:
             pass  # sem arquivo de log nao deve derrubar a aplicacao
 
+    amostragem_filtro = _FiltroAmostragem()
+    if not assincrono:
+        for handler in handlers:
+            handler.addFilter(amostragem_filtro)
+            logger.addHandler(handler)
+        return logger
+
+    fila = queue.SimpleQueue()
+    fila_handler = _FilaHandler(fila)
+    fila_handler.addFilter(amostragem_filtro)
+    logger.addHandler(fila_handler)
+    _listener = _Escoador(fila, *handlers)
+    _listener.start()
+    # registrado depois do logging: roda antes do logging.shutdown fechar os arquivos
+    atexit.register(parar_listener)
     return logger
 
 
 def log_event(event, level='INFO', **fields):
     logger = logging.getLogger(LOGGER_NAME)
+    lvl = str(level or 'INFO').upper()
+    if not logger.isEnabledFor(_NIVEIS.get(lvl, logging.INFO)):
+        return
+
     payload = {
         'timestamp': datetime.now(timezone.utc).isoformat(),
         'event': event,
@@ -151,12 +360,4 @@ def log_event(event, level='INFO', **fields):
     }
     payload.update(fields)
 
-    text = json.dumps(payload, ensure_ascii=False, default=str)
-    extra = {'payload': payload}
-    lvl = str(level or 'INFO').upper()
-    if lvl == 'ERROR':
-        logger.error(text, extra=extra)
-    elif lvl == 'WARNING':
-        logger.warning(text, extra=extra)
-    else:
-        logger.info(text, extra=extra)
+    logger.log(_NIVEIS.get(lvl, logging.INFO), _PayloadJson(payload), extra={'payload': payload})
@@ -0,0 +1,204 @@
+"""Indice persistente das pastas de empresa na rede.
+
+O file_manager listava o compartilhamento inteiro (SMB) a cada arquivo
+movido. Aqui cada pasta base (principal e SEM MOVIMENTO) tem sua listagem
+guardada com nomes normalizados e conjunto de tokens, validada pelo mtime do
+diretorio: enquanto ninguem cria/renomeia/remove pasta, um stat substitui o
+listdir. A listagem vai para PASTAS_INDICE_FILE e sobrevive a reinicio.
+
+Em cima dele:
+- match nome da empresa -> pasta, memorizado ate a listagem mudar;
+- pasta da empresa -> subpasta CERTIDOES (encontrar_caminho_final);
+- empresa_id -> caminhos em banco (PastaEmpresa), validado por existencia.
+"""
+import json
+import os
+import re
+import threading
+import unicodedata
+from datetime import datetime
+
+from app.errors import map_exception_to_error_type
+from app.services.execution_logger import log_event
+from app.services.retry import retry_call
+from app.utils import get_config_value
+
+_lock = threading.Lock()
+_INDICES = {}      # caminho_base -> {'mtime', 'pastas': [...], 'matches': {}}
+_CAMINHO_FINAL = {}  # caminho_empresa -> pasta CERTIDOES resolvida
+_disco_carregado = False
+
+
+def _indice_file():
+    caminho = get_config_value('PASTAS_INDICE_FILE', None)
+    if caminho:
+        return caminho
+    return os.path.abspath(
+        os.path.join(os.path.dirname(__file__), '..', '..', 'instance', 'pastas_indice.json')
+    )
+
+
+def normalizar(texto):
+    """Maiusculas sem acento (mesma regra de file_manager.remover_acentos)."""
+    if not texto:
+        return ''
+    return unicodedata.normalize('NFKD', str(texto)).encode('ASCII', 'ignore').decode('ASCII').upper()
+
+
+def tokens(texto_normalizado):
+    """Tokens como o processador do thefuzz os ve (nao alfanumerico separa)."""
+    return frozenset(re.sub(r'[\W_]+', ' ', texto_normalizado.lower()).split())
+
+
+def _entrada(pasta):
+    limpo = normalizar(pasta)
+    return {'pasta': pasta, 'upper': pasta.upper(), 'limpo': limpo, 'tokens': sorted(tokens(limpo))}
+
+
+def listar_com_retry(caminho):
+    return retry_call(
+        lambda: os.listdir(caminho),
+        max_attempts=3,
+        base_delay=0.4,
+        jitter=0.2,
+        retry_if=lambda exc: isinstance(exc, OSError),
+        on_retry=lambda attempt, delay, exc: log_event(
+            'network_path_retry',
+            level='WARNING',
+            path=caminho,
+            attempt=attempt,
+            delay_ms=int(delay * 1000),
+            error_type=map_exception_to_error_type(exc).value,
+            error=str(exc),
+        ),
+    )
+
+
+def _carregar_disco():
+    global _disco_carregado
+    if _disco_carregado:
+        return
+    _disco_carregado = True
+    try:
+        with open(_indice_file(), encoding='utf-8') as fh:
+            dados = json.load(fh)
+    except (OSError, ValueError):
+        return
+    if not isinstance(dados, dict):
+        return
+    for caminho_base, indice in dados.items():
+        if isinstance(indice, dict) and isinstance(indice.get('pastas'), list):
+            _INDICES.setdefault(caminho_base, {
+                'mtime': indice.get('mtime'), 'pastas': indice['pastas'], 'matches': {},
+            })
+
+
+def _gravar_disco():
+    caminho = _indice_file()
+    dados = {
+        base: {'mtime': indice['mtime'], 'pastas': indice['pastas']}
+        for base, indice in _INDICES.items()
+    }
+    try:
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        tmp = caminho + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            json.dump(dados, fh, ensure_ascii=False)
+        os.replace(tmp, caminho)
+    except OSError as exc:
+        log_event('pastas_indice_write_failed', level='WARNING', error=str(exc))
+
+
+def obter_indice(caminho_base, forcar=False):
+    """Indice da pasta base, relistado so quando o mtime do diretorio muda
+    (ou forcar=True). Devolve (indice, veio_do_cache).
+
+    Levanta OSError se a pasta nao puder ser lida (mesmo contrato do listdir)."""
+    mtime = os.stat(caminho_base).st_mtime
+    with _lock:
+        _carregar_disco()
+        indice = _INDICES.get(caminho_base)
+        if not forcar and indice is not None and indice['mtime'] == mtime:
+            return indice, True
+
+    pastas = sorted(listar_com_retry(caminho_base))
+    indice = {'mtime': mtime, 'pastas': [_entrada(p) for p in pastas], 'matches': {}}
+    with _lock:
+        _INDICES[caminho_base] = indice
+        _gravar_disco()
+    log_event('pastas_indice_atualizado', caminho_base=caminho_base, pastas=len(pastas))
+    return indice, False
+
+
+def match_memorizado(indice, nome_banco):
+    """(True, pasta|None) se o nome ja foi resolvido nesta listagem."""
+    chave = nome_banco.strip().upper()
+    with _lock:
+        if chave in indice['matches']:
+            return True, indice['matches'][chave]
+    return False, None
+
+
+def memorizar_match(indice, nome_banco, pasta):
+    # mesmo lock de obter_indice: outra thread pode estar lendo/relistando
+    with _lock:
+        indice['matches'][nome_banco.strip().upper()] = pasta
+
+
+def caminho_final_memorizado(caminho_empresa):
+    """Subpasta CERTIDOES ja resolvida para a pasta da empresa, se ainda existe."""
+    with _lock:
+        destino = _CAMINHO_FINAL.get(caminho_empresa)
+    if destino and os.path.isdir(destino):
+        return destino
+    return None
+
+
+def memorizar_caminho_final(caminho_empresa, destino):
+    with _lock:
+        _CAMINHO_FINAL[caminho_empresa] = destino
+
+
+def pasta_da_empresa(empresa_id, nome_empresa, caminho_rede):
+    """Pasta CERTIDOES memorizada em banco para a empresa, ou None.
+
+    Vale so se o nome da empresa e o caminho base da rede forem os mesmos da
+    resolucao e a pasta ainda existir (empresa movida/renomeada re-resolve)."""
+    try:
+        from app import db
+        from app.models import PastaEmpresa
+        memo = db.session.get(PastaEmpresa, empresa_id)
+    except Exception:
+        return None
+    if (memo is None or memo.nome_empresa != nome_empresa
+            or memo.caminho_rede != caminho_rede
+            or not os.path.isdir(memo.caminho_certidoes or '')):
+        return None
+    return memo.caminho_certidoes
+
+
+def memorizar_pasta_da_empresa(empresa_id, nome_empresa, caminho_rede, caminho_empresa, caminho_certidoes):
+    """Grava/atualiza o memo na sessao corrente; vai para o banco junto com o
+    commit da emissao (nao faz commit proprio para nao misturar transacoes)."""
+    try:
+        from app import db
+        from app.models import PastaEmpresa
+        db.session.merge(PastaEmpresa(
+            empresa_id=empresa_id,
+            nome_empresa=nome_empresa,
+            caminho_rede=caminho_rede,
+            caminho_empresa=caminho_empresa,
+            caminho_certidoes=caminho_certidoes,
+            atualizado_em=datetime.utcnow(),
+        ))
+    except Exception as exc:
+        log_event('pasta_empresa_memo_failed', level='WARNING', empresa_id=empresa_id, error=str(exc))
+
+
+def limpar():
+    """Esquece indices e memos em memoria (testes / troca do caminho de rede)."""
+    global _disco_carregado
+    with _lock:
+        _INDICES.clear()
+        _CAMINHO_FINAL.clear()
+        _disco_carregado = False
@@ -0,0 +1,180 @@
+"""Registro de metricas em processo (contadores + histogramas de duracao).
+
+Alimentado pelo mesmo DiagnosticsHandler do painel: todo evento de log_event
+incrementa certidoes_eventos_total{event,level}; os que trazem duracao viram
+uma observacao em certidoes_duracao_ms{event,stage,portal,municipio}. Nenhum
+fluxo precisa chamar este modulo diretamente.
+
+Duracao observada: 'etapa_ms' quando presente (tempo so daquela etapa, ex.:
+rs_batch_stage), senao 'duration_ms'.
+
+Servido em /metrics no formato texto do Prometheus e em JSON (painel de
+diagnostico). Os valores zeram a cada reinicio do processo.
+"""
+import threading
+
+# limites (ms) dos buckets: de request HTTP a emissao com captcha
+BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 120000, 300000)
+_ROTULOS_DURACAO = ('event', 'stage', 'portal', 'municipio')
+
+_lock = threading.Lock()
+_contadores = {}   # (event, level) -> int
+_histogramas = {}  # tupla de _ROTULOS_DURACAO -> _Histograma
+
+
+class _Histograma:
+    __slots__ = ('baldes', 'soma', 'contagem', 'maximo')
+
+    def __init__(self):
+        self.baldes = [0] * (len(BUCKETS_MS) + 1)  # ultimo = +Inf
+        self.soma = 0.0
+        self.contagem = 0
+        self.maximo = 0.0
+
+    def observar(self, valor):
+        for i, limite in enumerate(BUCKETS_MS):
+            if valor <= limite:
+                self.baldes[i] += 1
+                break
+        else:
+            self.baldes[-1] += 1
+        self.soma += valor
+        self.contagem += 1
+        self.maximo = max(self.maximo, valor)
+
+    def quantil(self, q):
+        """Estimativa por interpolacao dentro do bucket (como histogram_quantile)."""
+        if not self.contagem:
+            return None
+        alvo = q * self.contagem
+        acumulado = 0
+        for i, n in enumerate(self.baldes):
+            if acumulado + n >= alvo and n:
+                if i == len(BUCKETS_MS):
+                    return self.maximo
+                inferior = BUCKETS_MS[i - 1] if i else 0
+                estimativa = inferior + (BUCKETS_MS[i] - inferior) * ((alvo - acumulado) / n)
+                return min(estimativa, self.maximo)
+            acumulado += n
+        return self.maximo
+
+
+def _duracao(payload):
+    for chave in ('etapa_ms', 'duration_ms'):
+        valor = payload.get(chave)
+        if valor is None:
+            continue
+        try:
+            return max(0.0, float(valor))
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def observar(payload, portal=None):
+    """Contabiliza um evento estruturado (o dict montado por log_event)."""
+    evento = str(payload.get('event') or '')
+    if not evento:
+        return
+    nivel = str(payload.get('level') or 'INFO').upper()
+    duracao = _duracao(payload)
+    with _lock:
+        chave = (evento, nivel)
+        _contadores[chave] = _contadores.get(chave, 0) + 1
+        if duracao is None:
+            return
+        rotulos = (
+            evento,
+            str(payload.get('stage') or ''),
+            portal or '',
+            str(payload.get('municipio') or ''),
+        )
+        histograma = _histogramas.get(rotulos)
+        if histograma is None:
+            histograma = _histogramas[rotulos] = _Histograma()
+        histograma.observar(duracao)
+
+
+def limpar():
+    with _lock:
+        _contadores.clear()
+        _histogramas.clear()
+
+
+def _copia():
+    with _lock:
+        contadores = dict(_contadores)
+        histogramas = {}
+        for rotulos, h in _histogramas.items():
+            copia = _Histograma()
+            copia.baldes = list(h.baldes)
+            copia.soma, copia.contagem, copia.maximo = h.soma, h.contagem, h.maximo
+            histogramas[rotulos] = copia
+    return contadores, histogramas
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _rotulos_texto(pares):
+    return ','.join(f'{nome}="{_escapar(valor)}"' for nome, valor in pares if valor != '')
+
+
+def _numero(valor):
+    return str(int(valor)) if float(valor).is_integer() else repr(float(valor))
+
+
+def exportar_prometheus():
+    """Texto no formato de exposicao do Prometheus (text/plain; version=0.0.4)."""
+    contadores, histogramas = _copia()
+    linhas = [
+        '# HELP certidoes_eventos_total Eventos estruturados emitidos por log_event.',
+        '# TYPE certidoes_eventos_total counter',
+    ]
+    for (evento, nivel), total in sorted(contadores.items()):
+        linhas.append(f'certidoes_eventos_total{{{_rotulos_texto((("event", evento), ("level", nivel)))}}} {total}')
+
+    linhas += [
+        '# HELP certidoes_duracao_ms Duracao (ms) por evento/etapa/portal/municipio.',
+        '# TYPE certidoes_duracao_ms histogram',
+    ]
+    for rotulos, h in sorted(histogramas.items()):
+        base = list(zip(_ROTULOS_DURACAO, rotulos))
+        acumulado = 0
+        for limite, n in zip(list(BUCKETS_MS) + ['+Inf'], h.baldes):
+            acumulado += n
+            texto = _rotulos_texto(base + [('le', limite)])
+            linhas.append(f'certidoes_duracao_ms_bucket{{{texto}}} {acumulado}')
+        texto = _rotulos_texto(base)
+        linhas.append(f'certidoes_duracao_ms_sum{{{texto}}} {_numero(h.soma)}')
+        linhas.append(f'certidoes_duracao_ms_count{{{texto}}} {h.contagem}')
+    return '\n'.join(linhas) + '\n'
+
+
+def exportar_json():
+    """Contadores e resumo dos histogramas (p50/p95 estimados), series com
+    mais tempo total primeiro."""
+    contadores, histogramas = _copia()
+    duracoes = []
+    for rotulos, h in histogramas.items():
+        item = dict(zip(_ROTULOS_DURACAO, rotulos))
+        p50 = h.quantil(0.5)
+        p95 = h.quantil(0.95)
+        item.update({
+            'contagem': h.contagem,
+            'total_ms': int(h.soma),
+            'media_ms': int(h.soma / h.contagem),
+            'p50_ms': int(p50) if p50 is not None else None,
+            'p95_ms': int(p95) if p95 is not None else None,
+            'max_ms': int(h.maximo),
+        })
+        duracoes.append(item)
+    duracoes.sort(key=lambda d: d['total_ms'], reverse=True)
+    return {
+        'eventos': [
+            {'event': evento, 'level': nivel, 'total': total}
+            for (evento, nivel), total in sorted(contadores.items())
+        ],
+        'duracoes': duracoes,
+    }
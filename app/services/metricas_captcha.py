@@ -0,0 +1,275 @@
+"""Metricas dos solvers do 2captcha e agenda adaptativa de polling.
+
+Cada resolucao (ALTCHA RS, captcha de imagem de Imbe) vira uma linha de
+ResolucaoCaptcha: duracao, sucesso, retries, consultas ao 2captcha e o
+execution_id (o do lote). Dela saem p50/p95, taxa de sucesso e custo
+estimado por lote (resumo()).
+O ALTCHA resolvido na maquina (altcha_local) entra como solver proprio,
+com custo zero.
+
+As duracoes recentes de cada solver ficam tambem numa janela em memoria, que
+define quando consultar o resultado (agenda_polling): a 1a consulta perto da
+mediana e, entre mediana e p95, consultas mais proximas; depois disso volta
+ao CAPTCHA_2_POLLING_INTERVAL. Menos espera ociosa e menos chamadas "not
+ready" que o intervalo fixo.
+
+A gravacao e feita por uma thread escritora (como o historico de
+diagnostico): o registro acontece no event loop do cliente 2captcha, que nao
+tem app context. A fila e limitada (cheia, a linha e descartada e contada) e
+a escritora grava em lotes, um INSERT e um commit por lote.
+"""
+import queue
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from app.services.diagnostics import coletar_lote
+from app.services.execution_logger import log_event
+
+_JANELA = 200
+_MIN_AMOSTRAS = 10
+# 2captcha pede pelo menos 5s entre consultas de resultado
+_INTERVALO_MINIMO = 5.0
+
+_lock = threading.Lock()
+_duracoes = {}  # solver -> deque(duracao_ms) das resolucoes com sucesso
+
+_fila = queue.Queue(maxsize=2000)
+_app = None
+_writer_iniciado = False
+_descartados = 0
+
+
+def percentil(valores_ordenados, p):
+    """Percentil por interpolacao linear (valores ja ordenados)."""
+    if not valores_ordenados:
+        return None
+    pos = (len(valores_ordenados) - 1) * (p / 100.0)
+    base = int(pos)
+    topo = min(base + 1, len(valores_ordenados) - 1)
+    return valores_ordenados[base] + (valores_ordenados[topo] - valores_ordenados[base]) * (pos - base)
+
+
+def _janela(solver):
+    janela = _duracoes.get(solver)
+    if janela is None:
+        janela = _duracoes[solver] = deque(maxlen=_JANELA)
+    return janela
+
+
+def registrar(solver, sucesso, duracao_ms, tentativas=1, consultas=0, error_type=None,
+              execution_id=None):
+    """Registra uma resolucao (qualquer thread); grava em banco em segundo plano."""
+    if sucesso and duracao_ms is not None:
+        with _lock:
+            _janela(solver).append(int(duracao_ms))
+    if _writer_iniciado:
+        _enfileirar({
+            'solver': solver,
+            'sucesso': bool(sucesso),
+            'duracao_ms': int(duracao_ms or 0),
+            'tentativas': int(tentativas or 1),
+            'consultas': int(consultas or 0),
+            'error_type': error_type,
+            'execution_id': execution_id,
+            'criado_em': datetime.utcnow(),
+        })
+
+
+def _enfileirar(item):
+    global _descartados
+    try:
+        _fila.put_nowait(item)
+    except queue.Full:
+        # o solver nunca espera o banco; a agenda em memoria ja foi atualizada
+        with _lock:
+            _descartados += 1
+
+
+def agenda_polling(solver, intervalo_padrao):
+    """(espera_inicial, intervalo_rapido, fim_rapido, intervalo_padrao) em
+    segundos para a proxima resolucao deste solver.
+
+    Sem amostras suficientes: 1a consulta apos o intervalo minimo e o
+    intervalo configurado dali em diante."""
+    intervalo_padrao = max(_INTERVALO_MINIMO, float(intervalo_padrao or _INTERVALO_MINIMO))
+    with _lock:
+        amostras = sorted(_duracoes.get(solver) or ())
+    if len(amostras) < _MIN_AMOSTRAS:
+        return _INTERVALO_MINIMO, intervalo_padrao, 0.0, intervalo_padrao
+
+    p50 = percentil(amostras, 50) / 1000.0
+    p95 = percentil(amostras, 95) / 1000.0
+    espera_inicial = max(_INTERVALO_MINIMO, p50)
+    intervalo_rapido = min(intervalo_padrao, max(_INTERVALO_MINIMO, (p95 - p50) / 3.0))
+    return espera_inicial, intervalo_rapido, max(espera_inicial, p95), intervalo_padrao
+
+
+def limpar():
+    with _lock:
+        _duracoes.clear()
+
+
+def gravar_lote(itens):
+    """Persiste as resolucoes num unico INSERT/commit. Exige app context e
+    nunca propaga erro. Devolve quantas linhas gravou."""
+    from sqlalchemy import insert
+
+    from app import db
+    from app.models import ResolucaoCaptcha
+
+    if not itens:
+        return 0
+    try:
+        db.session.execute(insert(ResolucaoCaptcha), itens)
+        db.session.commit()
+        return len(itens)
+    except Exception:
+        db.session.rollback()
+        return 0
+
+
+def _drenar():
+    while True:
+        itens = coletar_lote(_fila, 60.0)
+        if not itens:
+            continue
+        try:
+            with _app.app_context():
+                gravar_lote(itens)
+        except Exception:
+            pass
+        finally:
+            for _ in itens:
+                _fila.task_done()
+
+
+def _carregar_janelas():
+    """Semeia as janelas com as ultimas resolucoes gravadas (agenda adaptada
+    desde o primeiro captcha apos um reinicio)."""
+    from app.models import ResolucaoCaptcha
+
+    for (solver,) in ResolucaoCaptcha.query.with_entities(ResolucaoCaptcha.solver).distinct():
+        linhas = (ResolucaoCaptcha.query
+                  .with_entities(ResolucaoCaptcha.duracao_ms)
+                  .filter(ResolucaoCaptcha.solver == solver, ResolucaoCaptcha.sucesso.is_(True))
+                  .order_by(ResolucaoCaptcha.id.desc())
+                  .limit(_JANELA).all())
+        with _lock:
+            janela = _janela(solver)
+            janela.clear()
+            janela.extend(d for (d,) in reversed(linhas))
+
+
+def prune(retencao_dias=90):
+    from app import db
+    from app.models import ResolucaoCaptcha
+
+    corte = datetime.utcnow() - timedelta(days=retencao_dias)
+    try:
+        ResolucaoCaptcha.query.filter(ResolucaoCaptcha.criado_em < corte).delete()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+
+
+def iniciar_persistencia(app, retencao_dias=90):
+    """Liga a gravacao em banco: prune, carga das janelas e thread escritora."""
+    global _app, _writer_iniciado
+    if _writer_iniciado:
+        return
+    _app = app
+    with app.app_context():
+        prune(retencao_dias)
+        try:
+            _carregar_janelas()
+        except Exception as exc:
+            log_event('captcha_metricas_load_failed', level='WARNING', error=str(exc))
+    thread = threading.Thread(target=_drenar, name='captcha-metricas-writer', daemon=True)
+    thread.start()
+    _writer_iniciado = True
+
+
+def _preco_por_mil(config, solver):
+    if solver.endswith('_local'):
+        return 0.0  # resolvido na maquina (altcha_local): sem custo
+    chave = 'CAPTCHA_2_PRECO_MIL_ALTCHA' if solver == 'altcha' else 'CAPTCHA_2_PRECO_MIL_NORMAL'
+    try:
+        return max(0.0, float(config.get(chave) or 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _agregar(linhas, config, solver):
+    duracoes = sorted(d for d, ok, _t, _c in linhas if ok)
+    total = len(linhas)
+    sucessos = len(duracoes)
+    p50 = percentil(duracoes, 50)
+    p95 = percentil(duracoes, 95)
+    return {
+        'resolucoes': total,
+        'sucessos': sucessos,
+        'taxa_sucesso': round(sucessos / total, 4) if total else None,
+        'p50_ms': int(p50) if p50 is not None else None,
+        'p95_ms': int(p95) if p95 is not None else None,
+        'retries': sum(max(0, t - 1) for _d, _ok, t, _c in linhas),
+        'consultas': sum(c for _d, _ok, _t, c in linhas),
+        # o 2captcha cobra so o que foi resolvido
+        'custo_estimado': round(sucessos * _preco_por_mil(config, solver) / 1000.0, 4),
+    }
+
+
+def resumo(config, dias=30, lotes=10):
+    """Metricas por solver na janela de `dias` e custo das ultimas execucoes
+    (execution_id de lote/emissao). Exige app context."""
+    from app.models import ResolucaoCaptcha
+
+    desde = datetime.utcnow() - timedelta(days=dias)
+    linhas = (ResolucaoCaptcha.query
+              .with_entities(ResolucaoCaptcha.solver, ResolucaoCaptcha.execution_id,
+                             ResolucaoCaptcha.duracao_ms, ResolucaoCaptcha.sucesso,
+                             ResolucaoCaptcha.tentativas, ResolucaoCaptcha.consultas,
+                             ResolucaoCaptcha.criado_em)
+              .filter(ResolucaoCaptcha.criado_em >= desde)
+              .order_by(ResolucaoCaptcha.id)
+              .all())
+
+    por_solver = {}
+    por_execucao = {}
+    for solver, execution_id, duracao, ok, tentativas, consultas, criado_em in linhas:
+        item = (duracao, ok, tentativas, consultas)
+        por_solver.setdefault(solver, []).append(item)
+        if execution_id:
+            execucao = por_execucao.setdefault(execution_id, {'inicio': criado_em, 'solvers': {}})
+            execucao['fim'] = criado_em
+            execucao['solvers'].setdefault(solver, []).append(item)
+
+    execucoes = []
+    for execution_id, dados in por_execucao.items():
+        solvers = {s: _agregar(itens, config, s) for s, itens in dados['solvers'].items()}
+        execucoes.append({
+            'execution_id': execution_id,
+            # gravado em UTC naive: marca o fuso para o front converter
+            'inicio': dados['inicio'].replace(tzinfo=timezone.utc).isoformat(),
+            'fim': dados['fim'].replace(tzinfo=timezone.utc).isoformat(),
+            'resolucoes': sum(s['resolucoes'] for s in solvers.values()),
+            'custo_estimado': round(sum(s['custo_estimado'] for s in solvers.values()), 4),
+            'solvers': solvers,
+        })
+    execucoes.sort(key=lambda e: e['fim'], reverse=True)
+
+    solvers = {}
+    for solver, itens in por_solver.items():
+        solvers[solver] = _agregar(itens, config, solver)
+        espera, rapido, fim_rapido, padrao = agenda_polling(
+            solver, config.get('CAPTCHA_2_POLLING_INTERVAL') or 10)
+        solvers[solver]['polling'] = {
+            'espera_inicial_s': round(espera, 1),
+            'intervalo_rapido_s': round(rapido, 1),
+            'fim_rapido_s': round(fim_rapido, 1),
+            'intervalo_s': round(padrao, 1),
+        }
+    with _lock:
+        descartados = _descartados
+    return {'dias': dias, 'solvers': solvers, 'execucoes': execucoes[:lotes],
+            'descartados': descartados}
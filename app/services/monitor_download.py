@@ -0,0 +1,265 @@
+"""Deteccao de download concluido por evento de sistema de arquivos.
+
+Substitui o polling de ~/Downloads (listdir + stat de tudo a cada segundo e
+esperas fixas de estabilidade). No Linux usa inotify: o Chrome grava em
+.crdownload e renomeia ao concluir (IN_MOVED_TO), e quem grava direto fecha o
+arquivo (IN_CLOSE_WRITE) -- o aviso chega no instante em que o arquivo fica
+pronto. Em outros sistemas (ou se o inotify falhar) cai para varredura curta
+da pasta com confirmacao de tamanho.
+
+Cada emissao pode ter a propria pasta de download (pasta_emissao), entao
+fluxos simultaneos nao pegam o PDF um do outro.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import shutil
+import struct
+import sys
+import time
+import uuid
+
+from app.services.execution_logger import log_event
+from app.utils import get_config_value
+
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_EVENTO = struct.Struct('iIII')
+
+_EXTENSOES_TEMPORARIAS = ('.crdownload', '.tmp', '.part', '.download')
+
+_libc = None
+
+
+def pasta_downloads_padrao():
+    return os.path.join(os.path.expanduser("~"), "Downloads")
+
+
+def _base_emissoes():
+    caminho = get_config_value('DOWNLOADS_EMISSAO_DIR', None)
+    if caminho:
+        return caminho
+    return os.path.join(pasta_downloads_padrao(), 'certidoes_emissao')
+
+
+def pasta_emissao(certidao_id):
+    """Cria uma pasta de download exclusiva para uma emissao."""
+    pasta = os.path.join(_base_emissoes(), f'{certidao_id}-{uuid.uuid4().hex[:8]}')
+    os.makedirs(pasta, exist_ok=True)
+    return pasta
+
+
+def remover_pasta_emissao(pasta):
+    """Remove a pasta da emissao (best-effort; so dentro da base de emissoes).
+
+    Arquivo que sobrou (nao foi movido para a rede) vai para ~/Downloads,
+    onde o usuario o procuraria antes."""
+    if not pasta:
+        return
+    base = os.path.abspath(_base_emissoes())
+    if os.path.dirname(os.path.abspath(pasta)) != base:
+        return
+    try:
+        restantes = [e for e in os.scandir(pasta) if e.is_file()]
+    except OSError:
+        restantes = []
+    for entrada in restantes:
+        if entrada.name.lower().endswith(_EXTENSOES_TEMPORARIAS):
+            continue
+        destino = os.path.join(pasta_downloads_padrao(), entrada.name)
+        if os.path.exists(destino):
+            raiz, ext = os.path.splitext(entrada.name)
+            destino = os.path.join(pasta_downloads_padrao(), f'{raiz} {uuid.uuid4().hex[:6]}{ext}')
+        try:
+            shutil.move(entrada.path, destino)
+            log_event('download_emissao_preservado', arquivo=entrada.name, destino=destino)
+        except OSError as exc:
+            log_event('download_emissao_preservar_falhou', level='WARNING', arquivo=entrada.name, error=str(exc))
+    shutil.rmtree(pasta, ignore_errors=True)
+
+
+def _carregar_libc():
+    global _libc
+    if _libc is None:
+        nome = ctypes.util.find_library('c') or 'libc.so.6'
+        libc = ctypes.CDLL(nome, use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        _libc = libc
+    return _libc
+
+
+class _Inotify:
+    def __init__(self, pasta):
+        libc = _carregar_libc()
+        self.fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1')
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(pasta), _IN_CLOSE_WRITE | _IN_MOVED_TO)
+        if wd < 0:
+            erro = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(erro, 'inotify_add_watch')
+
+    def ler(self, timeout):
+        """Nomes de arquivo finalizados dentro de timeout segundos."""
+        prontos, _, _ = select.select([self.fd], [], [], max(0.0, timeout))
+        if not prontos:
+            return []
+        try:
+            dados = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        nomes = []
+        pos = 0
+        while pos + _EVENTO.size <= len(dados):
+            _wd, _mask, _cookie, tamanho = _EVENTO.unpack_from(dados, pos)
+            pos += _EVENTO.size
+            nome = dados[pos:pos + tamanho].rstrip(b'\0')
+            pos += tamanho
+            if nome:
+                nomes.append(os.fsdecode(nome))
+        return nomes
+
+    def fechar(self):
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+
+
+class MonitorDownload:
+    """Observa uma pasta e devolve o primeiro arquivo novo/alterado ja concluido.
+
+    O estado da pasta na criacao e a linha de base: arquivos que ja estavam
+    la (sem mudanca) sao ignorados. Com pasta_propria=True (pasta_emissao),
+    fechar() remove a pasta."""
+
+    def __init__(self, pasta=None, extensoes=('.pdf',), termos_ignorar=None, contexto=None,
+                 pasta_propria=False):
+        self.pasta = pasta or pasta_downloads_padrao()
+        self.pasta_propria = bool(pasta and pasta_propria)
+        self.extensoes = tuple(extensoes or ())
+        self.termos_ignorar = [t.lower() for t in (termos_ignorar or [])]
+        self.contexto = contexto or {}
+        self._pendentes = []
+        self._tamanhos = {}
+        self._aceitos = {}   # caminho -> (mtime, tamanho) ja devolvido por esperar()
+        self._inotify = None
+        if sys.platform.startswith('linux'):
+            try:
+                self._inotify = _Inotify(self.pasta)
+            except (OSError, AttributeError) as exc:
+                log_event('download_monitor_polling', level='WARNING', pasta=self.pasta, error=str(exc))
+        # linha de base depois do watch. Um arquivo que termine entre os dois
+        # entra na base ja com o estado final, mas o evento dele chega: no
+        # modo inotify o evento vale por si (_novo_por_evento), a base so
+        # serve a varredura
+        self._base = self._varrer()
+        log_event(
+            'download_monitor_start', pasta=self.pasta, existentes=len(self._base),
+            modo='inotify' if self._inotify else 'polling', **self.contexto,
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+    def fechar(self):
+        if self._inotify:
+            self._inotify.fechar()
+            self._inotify = None
+        if self.pasta_propria:
+            remover_pasta_emissao(self.pasta)
+            self.pasta_propria = False
+
+    def _aceita(self, nome):
+        nome_l = nome.lower()
+        if nome_l.endswith(_EXTENSOES_TEMPORARIAS):
+            return False
+        if self.extensoes and not nome_l.endswith(self.extensoes):
+            return False
+        return not any(t in nome_l for t in self.termos_ignorar)
+
+    def _varrer(self):
+        estado = {}
+        try:
+            entradas = list(os.scandir(self.pasta))
+        except OSError:
+            return estado
+        for entrada in entradas:
+            try:
+                if not entrada.is_file():
+                    continue
+                st = entrada.stat()
+            except OSError:
+                continue
+            estado[entrada.path] = (st.st_mtime, st.st_size)
+        return estado
+
+    def _novo_por_evento(self, caminho):
+        """Arquivo com evento de fechamento/renomeacao depois do watch: e novo
+        mesmo que bata com a base (terminou entre o watch e a varredura). So
+        descarta vazio ou o mesmo estado ja devolvido (evento repetido)."""
+        try:
+            st = os.stat(caminho)
+        except OSError:
+            return False
+        if st.st_size <= 0:
+            return False
+        return self._aceitos.get(caminho) != (st.st_mtime, st.st_size)
+
+    def _concluido_por_varredura(self):
+        # sem evento de fechamento: novo/alterado e com tamanho igual ao da
+        # varredura anterior
+        candidatos = []
+        estado = self._varrer()
+        for caminho, (mtime, tamanho) in estado.items():
+            if not self._aceita(os.path.basename(caminho)):
+                continue
+            if self._base.get(caminho) == (mtime, tamanho) or tamanho <= 0:
+                continue
+            if self._tamanhos.get(caminho) == tamanho:
+                candidatos.append((mtime, caminho))
+        self._tamanhos = {c: t for c, (_m, t) in estado.items()}
+        if not candidatos:
+            return None
+        return max(candidatos)[1]
+
+    def _aceitar(self, caminho):
+        try:
+            st = os.stat(caminho)
+            self._base[caminho] = self._aceitos[caminho] = (st.st_mtime, st.st_size)
+        except OSError:
+            pass
+        log_event('arquivo_aceito', arquivo=os.path.basename(caminho).lower(), **self.contexto)
+        return caminho
+
+    def esperar(self, timeout=1.0, intervalo_polling=0.5):
+        """Bloqueia ate timeout segundos; devolve o caminho do download
+        concluido ou None. Chamado em loop pelo fluxo (que checa parada/sessao
+        entre as chamadas)."""
+        limite = time.monotonic() + max(0.0, timeout)
+        if self._inotify:
+            while True:
+                while self._pendentes:
+                    caminho = os.path.join(self.pasta, self._pendentes.pop(0))
+                    if self._aceita(os.path.basename(caminho)) and self._novo_por_evento(caminho):
+                        return self._aceitar(caminho)
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    return None
+                self._pendentes.extend(self._inotify.ler(restante))
+        while True:
+            caminho = self._concluido_por_varredura()
+            if caminho:
+                return self._aceitar(caminho)
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                return None
+            time.sleep(min(intervalo_polling, restante))
@@ -0,0 +1,296 @@
+"""OCR local do captcha de imagem de Imbe, antes do 2captcha.
+
+A imagem capturada passa por um pre-processamento (cinza, ampliacao,
+contraste, filtro de ruido e binarizacao por Otsu) e por um reconhecedor de
+CPU plugavel (BACKENDS; padrao 'tesseract', que exige pytesseract e o
+binario do Tesseract instalados). Cada variante pre-processada gera um
+palpite com confianca 0..1; vale o de maior confianca. Palpite fora do
+alfabeto/tamanho esperado tem confianca zero.
+
+Palpite abaixo de IMBE_OCR_CONFIANCA_MINIMA (ou backend indisponivel) vai
+para o 2captcha; resposta recusada pelo portal tambem (a 2a tentativa e
+sempre no 2captcha).
+
+Cada tentativa e gravada em IMBE_OCR_AMOSTRAS_DIR (png + linha em
+amostras.jsonl com o palpite do OCR, a resposta enviada e o desfecho no
+portal): respostas aceitas viram rotulos para medir acuracia e latencia
+offline (avaliar_amostras / tools/benchmark_ocr_imbe.py).
+"""
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from PIL import Image, ImageFilter, ImageOps
+
+from app.services import metricas_captcha
+from app.services.execution_logger import log_event
+from app.utils import to_bool as _to_bool
+
+SOLVER = 'normal_local'
+CARACTERES_PADRAO = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+
+BACKENDS = {}
+
+_cache_lock = threading.Lock()
+_cache = OrderedDict()  # sha256 da imagem -> resultado (antecipacao + resolucao)
+_CACHE_MAX = 16
+_amostras_lock = threading.Lock()
+
+
+def registrar_backend(nome, reconhecedor):
+    """reconhecedor(imagem_pil, caracteres) -> (texto, confianca 0..1).
+    Levanta ImportError/OSError quando a dependencia nao esta instalada."""
+    BACKENDS[nome] = reconhecedor
+
+
+def _tesseract(imagem, caracteres):
+    import pytesseract
+
+    # psm 7: uma linha de texto; sem dicionario (captcha nao e palavra)
+    opcoes = (f'--psm 7 -c tessedit_char_whitelist={caracteres} '
+              '-c load_system_dawg=0 -c load_freq_dawg=0')
+    dados = pytesseract.image_to_data(imagem, config=opcoes, output_type=pytesseract.Output.DICT)
+    partes, confiancas = [], []
+    for texto, conf in zip(dados.get('text') or [], dados.get('conf') or []):
+        texto = (texto or '').strip()
+        try:
+            conf = float(conf)
+        except (TypeError, ValueError):
+            continue
+        if texto and conf >= 0:
+            partes.append(texto)
+            confiancas.append(conf)
+    if not partes:
+        return '', 0.0
+    # a palavra menos confiavel define a confianca do captcha inteiro
+    return ''.join(partes), min(confiancas) / 100.0
+
+
+registrar_backend('tesseract', _tesseract)
+
+
+def _limiar_otsu(imagem_cinza):
+    histograma = imagem_cinza.histogram()[:256]
+    total = sum(histograma)
+    soma_total = sum(i * n for i, n in enumerate(histograma))
+    soma_fundo = peso_fundo = 0
+    melhor, limiar = -1.0, 127
+    for i, n in enumerate(histograma):
+        peso_fundo += n
+        if not peso_fundo:
+            continue
+        peso_frente = total - peso_fundo
+        if not peso_frente:
+            break
+        soma_fundo += i * n
+        media_fundo = soma_fundo / peso_fundo
+        media_frente = (soma_total - soma_fundo) / peso_frente
+        variancia = peso_fundo * peso_frente * (media_fundo - media_frente) ** 2
+        if variancia > melhor:
+            melhor, limiar = variancia, i
+    return limiar
+
+
+def preprocessar(png_bytes):
+    """Variantes da imagem para o reconhecedor: binarizada (Otsu) e cinza
+    com contraste, ambas ampliadas 3x."""
+    imagem = Image.open(io.BytesIO(png_bytes))
+    if imagem.mode in ('RGBA', 'LA', 'P'):
+        fundo = Image.new('RGB', imagem.size, 'white')
+        fundo.paste(imagem.convert('RGBA'), mask=imagem.convert('RGBA').split()[-1])
+        imagem = fundo
+    cinza = ImageOps.grayscale(imagem)
+    cinza = cinza.resize((cinza.width * 3, cinza.height * 3), Image.LANCZOS)
+    cinza = ImageOps.autocontrast(cinza.filter(ImageFilter.MedianFilter(3)))
+    limiar = _limiar_otsu(cinza)
+    binaria = cinza.point(lambda p: 255 if p > limiar else 0, mode='1').convert('L')
+    # texto sempre escuro sobre fundo claro
+    if sum(binaria.histogram()[:128]) > binaria.width * binaria.height / 2:
+        binaria = ImageOps.invert(binaria)
+    return [binaria, cinza]
+
+
+def _float(valor, padrao):
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return padrao
+
+
+def _parametros(config):
+    caracteres = (config.get('IMBE_OCR_CARACTERES') or CARACTERES_PADRAO).strip()
+    try:
+        tamanho = max(0, int(config.get('IMBE_OCR_TAMANHO') or 0))
+    except (TypeError, ValueError):
+        tamanho = 0
+    minima = min(1.0, max(0.0, _float(config.get('IMBE_OCR_CONFIANCA_MINIMA'), 0.8)))
+    return caracteres, tamanho, minima
+
+
+def _validar(texto, confianca, caracteres, tamanho):
+    if not texto or any(c not in caracteres for c in texto):
+        return 0.0
+    if tamanho and len(texto) != tamanho:
+        return 0.0
+    return max(0.0, min(1.0, confianca))
+
+
+def backend_configurado(config):
+    nome = (config.get('IMBE_OCR_BACKEND') or '').strip().lower()
+    return nome if nome in BACKENDS else None
+
+
+def reconhecer(config, png_bytes, execution_id=None):
+    """Palpite do OCR: {'texto', 'confianca', 'aceito', 'backend',
+    'duracao_ms'} ou None (OCR desligado/indisponivel). 'aceito' = confianca
+    acima do minimo configurado."""
+    nome = backend_configurado(config)
+    if not nome or not png_bytes:
+        return None
+    chave = hashlib.sha256(png_bytes).hexdigest()
+    with _cache_lock:
+        if chave in _cache:
+            return dict(_cache[chave])
+
+    caracteres, tamanho, minima = _parametros(config)
+    inicio = time.monotonic()
+    melhor = ('', 0.0)
+    try:
+        for variante in preprocessar(png_bytes):
+            texto, confianca = BACKENDS[nome](variante, caracteres)
+            texto = (texto or '').replace(' ', '')
+            confianca = _validar(texto, confianca, caracteres, tamanho)
+            if confianca > melhor[1]:
+                melhor = (texto, confianca)
+    except (ImportError, OSError) as exc:
+        # pytesseract/binario ausente: sem OCR ate reiniciar
+        log_event('imbe_ocr_indisponivel', level='WARNING', backend=nome, error=str(exc))
+        BACKENDS.pop(nome, None)
+        return None
+    except Exception as exc:
+        log_event('imbe_ocr_error', level='WARNING', backend=nome, error=str(exc),
+                  execution_id=execution_id)
+        return None
+
+    duracao_ms = int((time.monotonic() - inicio) * 1000)
+    resultado = {
+        'texto': melhor[0],
+        'confianca': round(melhor[1], 4),
+        'aceito': bool(melhor[0]) and melhor[1] >= minima,
+        'backend': nome,
+        'duracao_ms': duracao_ms,
+    }
+    log_event('imbe_ocr_result', backend=nome, confianca=resultado['confianca'],
+              aceito=resultado['aceito'], duration_ms=duracao_ms, execution_id=execution_id)
+    with _cache_lock:
+        _cache[chave] = resultado
+        while len(_cache) > _CACHE_MAX:
+            _cache.popitem(last=False)
+    return dict(resultado)
+
+
+def limpar_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+def _diretorio_amostras(config):
+    if not _to_bool(config.get('IMBE_OCR_AMOSTRAS_ENABLED', True), True):
+        return None
+    return config.get('IMBE_OCR_AMOSTRAS_DIR') or os.path.join(os.getcwd(), 'logs', 'ocr_imbe')
+
+
+def registrar_tentativa(config, tentativa, desfecho, execution_id=None):
+    """Grava o desfecho no portal ('aceito'/'recusado') de uma tentativa
+    montada pelo fluxo de Imbe: {'imagem', 'solver', 'resposta', 'ocr'}.
+    Alimenta as metricas do solver local e o conjunto de amostras.
+    Best-effort: nunca levanta."""
+    ocr = tentativa.get('ocr')
+    if tentativa.get('solver') == 'ocr' and ocr:
+        metricas_captcha.registrar(SOLVER, desfecho == 'aceito', ocr.get('duracao_ms'),
+                                   error_type=None if desfecho == 'aceito' else 'CAPTCHA',
+                                   execution_id=execution_id)
+    destino = _diretorio_amostras(config)
+    imagem = tentativa.get('imagem')
+    if not destino or not imagem:
+        return None
+    nome = hashlib.sha256(imagem).hexdigest()[:20] + '.png'
+    linha = {
+        'arquivo': nome,
+        'solver': tentativa.get('solver'),
+        'resposta': tentativa.get('resposta'),
+        'desfecho': desfecho,
+        'ocr_texto': (ocr or {}).get('texto'),
+        'ocr_confianca': (ocr or {}).get('confianca'),
+        'ocr_ms': (ocr or {}).get('duracao_ms'),
+        'ocr_backend': (ocr or {}).get('backend'),
+        'criado_em': datetime.now().isoformat(timespec='seconds'),
+    }
+    try:
+        os.makedirs(destino, exist_ok=True)
+        caminho_png = os.path.join(destino, nome)
+        if not os.path.exists(caminho_png):
+            with open(caminho_png, 'wb') as f:
+                f.write(imagem)
+        with _amostras_lock, open(os.path.join(destino, 'amostras.jsonl'), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(linha, ensure_ascii=False) + '\n')
+    except OSError as exc:
+        log_event('imbe_ocr_amostra_error', level='WARNING', error=str(exc))
+        return None
+    return linha
+
+
+def avaliar_amostras(config, diretorio=None, backend=None):
+    """Reexecuta o OCR nas amostras rotuladas (resposta aceita pelo portal) e
+    mede acuracia, latencia e cobertura no limiar de confianca configurado."""
+    diretorio = diretorio or _diretorio_amostras(config) or ''
+    config = dict(config, IMBE_OCR_BACKEND=backend or config.get('IMBE_OCR_BACKEND') or 'tesseract')
+    rotulos = {}
+    try:
+        with open(os.path.join(diretorio, 'amostras.jsonl'), encoding='utf-8') as f:
+            for linha in f:
+                try:
+                    item = json.loads(linha)
+                except ValueError:
+                    continue
+                if item.get('desfecho') == 'aceito' and item.get('resposta'):
+                    rotulos[item['arquivo']] = item['resposta']
+    except OSError:
+        pass
+
+    duracoes, acertos, aceitos, acertos_aceitos = [], 0, 0, 0
+    for arquivo, esperado in sorted(rotulos.items()):
+        try:
+            with open(os.path.join(diretorio, arquivo), 'rb') as f:
+                imagem = f.read()
+        except OSError:
+            continue
+        limpar_cache()
+        resultado = reconhecer(config, imagem)
+        if resultado is None:
+            break
+        duracoes.append(resultado['duracao_ms'])
+        certo = resultado['texto'] == esperado
+        acertos += certo
+        if resultado['aceito']:
+            aceitos += 1
+            acertos_aceitos += certo
+
+    total = len(duracoes)
+    duracoes.sort()
+    p50 = metricas_captcha.percentil(duracoes, 50)
+    p95 = metricas_captcha.percentil(duracoes, 95)
+    return {
+        'amostras': total,
+        'acuracia': round(acertos / total, 4) if total else None,
+        # das respostas que o fluxo enviaria sem 2captcha, quantas acertam
+        'cobertura': round(aceitos / total, 4) if total else None,
+        'acuracia_aceitos': round(acertos_aceitos / aceitos, 4) if aceitos else None,
+        'p50_ms': int(p50) if p50 is not None else None,
+        'p95_ms': int(p95) if p95 is not None else None,
+    }
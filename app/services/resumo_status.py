@@ -0,0 +1,418 @@
+"""Agregados de status do dashboard (ResumoStatus) mantidos na escrita.
+
+Em vez de reclassificar todas as certidoes a cada request, o dashboard e o
+contador de pendencias leem contagens prontas por (empresa, tipo, status):
+
+- cada flush que cria/altera/remove Certidao recalcula, na mesma transacao
+  (num savepoint), as linhas das empresas tocadas (certidao_service, workers
+  de lote, rotas); se falhar, as linhas antigas ficam e o controle e apagado
+  para forcar o rebuild;
+- a classificacao depende da data e dos prazos de "a vencer", entao
+  garantir_atualizado compara o dia/prazos do ultimo rebuild guardados em
+  ResumoStatusControle e reconstroi tudo uma vez na virada do dia ou quando
+  a configuracao muda. Roda no boot, na thread de manutencao (a cada
+  minuto) e no dashboard, sempre em conexao e transacao proprias e sob um
+  lock: nunca commita nem descarta a sessao do request. O contador de
+  pendencias (title da aba, SSE) so le.
+
+Os filtros de status/tipo, a ordem e as contagens dos chips da lista paginada
+do dashboard tambem rodam em SQL sobre essas linhas.
+"""
+import json
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import case, delete, event, insert, inspect, select
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import (
+    Certidao,
+    Empresa,
+    ResumoStatus,
+    ResumoStatusControle,
+    StatusEspecial,
+    TipoCertidao,
+    get_a_vencer_dias,
+)
+from app.services import stream_eventos
+from app.services.execution_logger import log_event
+
+STATUS = ('validas', 'a_vencer', 'vencidas', 'pendentes', 'nao_definida')
+# status que entram no contador global de pendencias (title da aba)
+STATUS_PENDENCIA = ('vencidas', 'a_vencer')
+_MENOR_VALIDADE_VAZIA = '9999-12-31'
+# ordem "urgencia" do dashboard: bucket do pior status da empresa
+_BUCKET_URGENCIA = {'vencidas': 0, 'a_vencer': 1, 'pendentes': 2, 'nao_definida': 3}
+_BUCKET_SEM_URGENCIA = 4
+
+_eventos_registrados = False
+_rebuild_lock = threading.Lock()
+_manutencao_iniciada = False
+_MANUTENCAO_INTERVALO = 60
+
+
+def limites_atuais():
+    """Prazo de "a vencer" por tipo (nome do enum -> dias)."""
+    return {t.name: get_a_vencer_dias(tipo=t) for t in TipoCertidao}
+
+
+def classificar(tipo, data_validade, status_especial, hoje, limites):
+    """Status do dashboard de uma certidao (mesma regra de expressao_status)."""
+    if status_especial == StatusEspecial.PENDENTE:
+        return 'pendentes'
+    if not data_validade:
+        return 'nao_definida'
+    if data_validade < hoje:
+        return 'vencidas'
+    chave = tipo.name if hasattr(tipo, 'name') else str(tipo)
+    if (data_validade - hoje).days <= limites.get(chave, 7):
+        return 'a_vencer'
+    return 'validas'
+
+
+def expressao_status(hoje, limites, tabela=None):
+    """CASE SQL equivalente a classificar() sobre as colunas de Certidao.
+
+    O prazo de "a vencer" por tipo vira uma data de corte (hoje + dias do
+    tipo), assim a comparacao usa data_validade direto e aproveita o indice
+    (tipo, data_validade, status_especial)."""
+    tabela = tabela if tabela is not None else Certidao.__table__
+    corte = case(
+        *((tabela.c.tipo == t, hoje + timedelta(days=limites.get(t.name, 7))) for t in TipoCertidao),
+        else_=hoje + timedelta(days=7),
+    )
+    return case(
+        (tabela.c.status_especial == StatusEspecial.PENDENTE, 'pendentes'),
+        (tabela.c.data_validade.is_(None), 'nao_definida'),
+        (tabela.c.data_validade < hoje, 'vencidas'),
+        (tabela.c.data_validade <= corte, 'a_vencer'),
+        else_='validas',
+    )
+
+
+def _select_agregado(empresa_ids, hoje, limites):
+    """SELECT agrupado por (empresa, tipo, status) pronto para o INSERT.
+
+    A classificacao fica numa subquery e o GROUP BY usa a coluna dela: MySQL
+    e Postgres nao reconhecem dois CASE com parametros como a mesma expressao."""
+    tabela = Certidao.__table__
+    base = select(
+        tabela.c.empresa_id,
+        tabela.c.tipo,
+        expressao_status(hoje, limites, tabela).label('status'),
+        tabela.c.data_validade,
+    )
+    if empresa_ids is not None:
+        base = base.where(tabela.c.empresa_id.in_(empresa_ids))
+    base = base.subquery()
+    # menor validade so conta certidoes com data (pendente nao entra)
+    validade_datada = case((base.c.status.in_(('validas', 'a_vencer', 'vencidas')), base.c.data_validade))
+    return (
+        select(
+            base.c.empresa_id,
+            base.c.tipo,
+            base.c.status,
+            db.func.count().label('quantidade'),
+            db.func.min(validade_datada).label('menor_validade'),
+        )
+        .group_by(base.c.empresa_id, base.c.tipo, base.c.status)
+    )
+
+
+def _gravar(conn, empresa_ids, hoje, limites):
+    """Substitui as linhas de ResumoStatus das empresas (None = todas) com um
+    INSERT ... SELECT agrupado: a classificacao roda inteira no banco."""
+    tabela = ResumoStatus.__table__
+    stmt = delete(tabela)
+    if empresa_ids is not None:
+        stmt = stmt.where(tabela.c.empresa_id.in_(empresa_ids))
+    conn.execute(stmt)
+    conn.execute(
+        insert(tabela).from_select(
+            ['empresa_id', 'tipo', 'status', 'quantidade', 'menor_validade'],
+            _select_agregado(empresa_ids, hoje, limites),
+        )
+    )
+
+
+def status_por_certidao(empresa_ids, hoje=None, limites=None):
+    """{certidao_id: status} das empresas pedidas, classificado em SQL."""
+    if not empresa_ids:
+        return {}
+    hoje = hoje or date.today()
+    limites = limites if limites is not None else limites_atuais()
+    tabela = Certidao.__table__
+    linhas = db.session.execute(
+        select(tabela.c.id, expressao_status(hoje, limites, tabela))
+        .where(tabela.c.empresa_id.in_(list(empresa_ids)))
+    ).all()
+    return dict(linhas)
+
+
+def _ler_controle(conn):
+    tabela = ResumoStatusControle.__table__
+    return conn.execute(select(tabela).where(tabela.c.id == 1)).first()
+
+
+def _desatualizado(controle, hoje, limites):
+    return (controle is None or controle.data_referencia != hoje
+            or controle.limites != json.dumps(limites, sort_keys=True))
+
+
+def _reconstruir_em(conn, hoje, limites):
+    controle_tab = ResumoStatusControle.__table__
+    _gravar(conn, None, hoje, limites)
+    conn.execute(delete(controle_tab))
+    conn.execute(insert(controle_tab), [{
+        'id': 1, 'data_referencia': hoje,
+        'limites': json.dumps(limites, sort_keys=True),
+        'atualizado_em': datetime.utcnow(),
+    }])
+
+
+def reconstruir(hoje=None, limites=None, somente_se_desatualizado=False):
+    """Rebuild completo (uma passada so nas colunas necessarias), em conexao
+    e transacao proprias e sob lock (rebuilds concorrentes nao se sobrepoem).
+    Retorna True se reconstruiu."""
+    hoje = hoje or date.today()
+    limites = limites if limites is not None else limites_atuais()
+    with _rebuild_lock:
+        try:
+            with db.engine.begin() as conn:
+                # outra thread pode ter reconstruido enquanto esperavamos o lock
+                if somente_se_desatualizado and not _desatualizado(_ler_controle(conn), hoje, limites):
+                    return False
+                _reconstruir_em(conn, hoje, limites)
+        except Exception as exc:
+            log_event('resumo_status_rebuild_failed', level='WARNING', error=str(exc))
+            return False
+    log_event('resumo_status_rebuild', data_referencia=hoje.isoformat())
+    stream_eventos.notificar('pendencias')
+    return True
+
+
+def garantir_atualizado():
+    """Reconstroi os agregados se o dia virou ou os prazos mudaram desde o
+    ultimo rebuild. Barato no caso comum (le a linha de controle)."""
+    hoje = date.today()
+    limites = limites_atuais()
+    try:
+        with db.engine.connect() as conn:
+            controle = _ler_controle(conn)
+    except Exception:
+        controle = None
+    if _desatualizado(controle, hoje, limites):
+        return reconstruir(hoje, limites, somente_se_desatualizado=True)
+    return False
+
+
+def _manter(app):
+    while True:
+        try:
+            with app.app_context():
+                garantir_atualizado()
+        except Exception as exc:
+            log_event('resumo_status_manutencao_error', level='WARNING', error=str(exc))
+        time.sleep(_MANUTENCAO_INTERVALO)
+
+
+def iniciar_manutencao(app):
+    """Rebuild no boot e reconferencia periodica (virada do dia/prazos) numa
+    thread propria, para que quem so le o agregado nao precise reconstruir."""
+    global _manutencao_iniciada
+    if _manutencao_iniciada:
+        return
+    _manutencao_iniciada = True
+    threading.Thread(target=_manter, args=(app,), name='resumo-status-manutencao',
+                     daemon=True).start()
+
+
+def _contadores_vazios():
+    counts = {status: 0 for status in STATUS}
+    counts.update({
+        'total': 0, 'tipo_total': 0, 'menor_validade': _MENOR_VALIDADE_VAZIA,
+    })
+    for tipo in TipoCertidao:
+        counts['tipo_' + tipo.name.lower()] = 0
+    return counts
+
+
+def contadores_por_empresa(empresa_ids):
+    """Contadores no formato do dashboard para as empresas pedidas."""
+    resultado = {empresa_id: _contadores_vazios() for empresa_id in empresa_ids}
+    if not resultado:
+        return resultado
+    tabela = ResumoStatus.__table__
+    linhas = db.session.execute(
+        select(tabela.c.empresa_id, tabela.c.tipo, tabela.c.status,
+               tabela.c.quantidade, tabela.c.menor_validade)
+        .where(tabela.c.empresa_id.in_(list(resultado)))
+    ).all()
+    for empresa_id, tipo, status, quantidade, menor_validade in linhas:
+        counts = resultado[empresa_id]
+        counts['total'] += quantidade
+        counts['tipo_total'] += quantidade
+        counts[status] = counts.get(status, 0) + quantidade
+        chave_tipo = 'tipo_' + tipo.lower()
+        counts[chave_tipo] = counts.get(chave_tipo, 0) + quantidade
+        if menor_validade:
+            dval = menor_validade.strftime('%Y-%m-%d')
+            if dval < counts['menor_validade']:
+                counts['menor_validade'] = dval
+    return resultado
+
+
+def total_pendencias():
+    """Total global de certidoes vencidas + a vencer."""
+    tabela = ResumoStatus.__table__
+    total = db.session.execute(
+        select(db.func.coalesce(db.func.sum(tabela.c.quantidade), 0))
+        .where(tabela.c.status.in_(STATUS_PENDENCIA))
+    ).scalar()
+    return int(total or 0)
+
+
+def _condicoes_filtro(status_filtros=None, tipo_filtros=None):
+    """WHERE sobre ResumoStatus para os chips de status/tipo ('todas' = sem filtro)."""
+    tabela = ResumoStatus.__table__
+    condicoes = [tabela.c.quantidade > 0]
+    if status_filtros and 'todas' not in status_filtros:
+        condicoes.append(tabela.c.status.in_(list(status_filtros)))
+    if tipo_filtros and 'todas' not in tipo_filtros:
+        condicoes.append(tabela.c.tipo.in_([t.upper() for t in tipo_filtros]))
+    return condicoes
+
+
+def filtrar_empresas(query, status_filtros=None, tipo_filtros=None):
+    """Restringe uma query de Empresa as que tem ao menos uma certidao no
+    status/tipo pedidos (empresa sem certidao nunca aparece no dashboard)."""
+    tabela = ResumoStatus.__table__
+    existe = (
+        select(tabela.c.empresa_id)
+        .where(tabela.c.empresa_id == Empresa.id, *_condicoes_filtro(status_filtros, tipo_filtros))
+        .exists()
+    )
+    return query.filter(existe)
+
+
+def ordenar_empresas(query, ordem):
+    """ORDER BY do dashboard: 'az', 'vencimento' (menor validade primeiro) ou
+    'urgencia' (vencidas > a vencer > pendentes > nao definida). Desempate
+    por nome e id para a paginacao ser estavel."""
+    tabela = ResumoStatus.__table__
+    nome = db.func.upper(Empresa.nome)
+    if ordem == 'az':
+        return query.order_by(nome, Empresa.id)
+    if ordem == 'vencimento':
+        menor = (
+            select(db.func.min(tabela.c.menor_validade))
+            .where(tabela.c.empresa_id == Empresa.id)
+            .scalar_subquery()
+        )
+        return query.order_by(menor.is_(None), menor, nome, Empresa.id)
+    bucket = case(
+        *((tabela.c.status == status, valor) for status, valor in _BUCKET_URGENCIA.items()),
+        else_=_BUCKET_SEM_URGENCIA,
+    )
+    urgencia = (
+        select(db.func.min(bucket))
+        .where(tabela.c.empresa_id == Empresa.id, tabela.c.quantidade > 0)
+        .scalar_subquery()
+    )
+    return query.order_by(db.func.coalesce(urgencia, _BUCKET_SEM_URGENCIA), nome, Empresa.id)
+
+
+def totais_filtros(empresa_ids, status_filtros=None, tipo_filtros=None):
+    """Contagens dos chips para as empresas do escopo (select de ids): por
+    status respeitando o filtro de tipo e por tipo respeitando o de status."""
+    tabela = ResumoStatus.__table__
+    no_escopo = tabela.c.empresa_id.in_(empresa_ids)
+    totais = {
+        'status': {'todas': 0, **{status: 0 for status in STATUS}},
+        'tipo': {'todas': 0, **{t.name.lower(): 0 for t in TipoCertidao}},
+    }
+    por_status = db.session.execute(
+        select(tabela.c.status, db.func.sum(tabela.c.quantidade))
+        .where(no_escopo, *_condicoes_filtro(None, tipo_filtros))
+        .group_by(tabela.c.status)
+    ).all()
+    for status, quantidade in por_status:
+        totais['status'][status] = int(quantidade or 0)
+        totais['status']['todas'] += int(quantidade or 0)
+    por_tipo = db.session.execute(
+        select(tabela.c.tipo, db.func.sum(tabela.c.quantidade))
+        .where(no_escopo, *_condicoes_filtro(status_filtros, None))
+        .group_by(tabela.c.tipo)
+    ).all()
+    for tipo, quantidade in por_tipo:
+        totais['tipo'][tipo.lower()] = int(quantidade or 0)
+        totais['tipo']['todas'] += int(quantidade or 0)
+    return totais
+
+
+def _empresas_afetadas(session):
+    afetadas = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Certidao):
+            if obj.empresa_id is not None:
+                afetadas.add(obj.empresa_id)
+            # certidao movida de empresa: a antiga tambem muda
+            historico = inspect(obj).attrs.empresa_id.history
+            afetadas.update(e for e in (historico.deleted or ()) if e is not None)
+        elif isinstance(obj, Empresa) and obj in session.deleted and obj.id is not None:
+            afetadas.add(obj.id)
+    return afetadas
+
+
+def _apos_flush(session, flush_context):
+    """Recalcula, na transacao do flush, as empresas cujas certidoes mudaram.
+    Sem controle valido para hoje nao faz nada: o proximo garantir_atualizado
+    reconstroi tudo."""
+    afetadas = _empresas_afetadas(session)
+    if not afetadas:
+        return
+    # a contagem de pendencias do stream SSE so muda quando isto for commitado
+    session.info['resumo_alterado'] = True
+    try:
+        conn = session.connection()
+        controle = _ler_controle(conn)
+        if controle is None or controle.data_referencia != date.today():
+            return
+        # savepoint: um INSERT que falha nao deixa o DELETE na transacao do
+        # chamador (empresa sumiria do dashboard) nem a aborta no Postgres
+        with conn.begin_nested():
+            _gravar(conn, sorted(afetadas), date.today(), json.loads(controle.limites))
+    except Exception as exc:
+        # agregado nunca derruba a escrita principal: marca o controle como
+        # desatualizado e o proximo garantir_atualizado reconstroi tudo
+        log_event('resumo_status_update_failed', level='WARNING', error=str(exc))
+        _invalidar_controle(session)
+
+
+def _invalidar_controle(session):
+    try:
+        session.connection().execute(delete(ResumoStatusControle.__table__))
+    except Exception as exc:
+        log_event('resumo_status_invalidate_failed', level='WARNING', error=str(exc))
+
+
+def _apos_commit(session):
+    if session.info.pop('resumo_alterado', False):
+        stream_eventos.notificar('pendencias')
+
+
+def _apos_rollback(session):
+    session.info.pop('resumo_alterado', None)
+
+
+def registrar_eventos():
+    """Liga o recalculo incremental em todo flush de sessao (idempotente)."""
+    global _eventos_registrados
+    if _eventos_registrados:
+        return
+    event.listen(Session, 'after_flush', _apos_flush)
+    event.listen(Session, 'after_commit', _apos_commit)
+    event.listen(Session, 'after_rollback', _apos_rollback)
+    _eventos_registrados = True
@@ -1,3 +1,4 @@
+import asyncio
 import random
 import time
 
@@ -41,3 +42,36 @@ def retry_call(fn, *, max_attempts=3, base_delay=0.5, jitter=0.2, retry_if=None,
 
     if last_error:
         raise last_error
+
+
+async def retry_call_async(fn, *, max_attempts=3, base_delay=0.5, jitter=0.2, retry_if=None, on_retry=None):
+    """Mesma politica de retry_call para corrotinas: fn() devolve um awaitable
+    e a espera entre tentativas nao bloqueia o event loop."""
+    try:
+        max_attempts = max(1, int(max_attempts))
+    except (TypeError, ValueError):
+        max_attempts = 1
+
+    try:
+        base_delay = max(0.0, float(base_delay))
+    except (TypeError, ValueError):
+        base_delay = 0.0
+
+    try:
+        jitter = max(0.0, float(jitter))
+    except (TypeError, ValueError):
+        jitter = 0.0
+
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return await fn()
+        except Exception as exc:
+            can_retry = attempt < max_attempts and (retry_if(exc) if retry_if else True)
+            if not can_retry:
+                raise
+
+            delay = base_delay * (2 ** (attempt - 1))
+            delay = delay + random.uniform(0, jitter)
+            if on_retry:
+                on_retry(attempt, delay, exc)
+            await asyncio.sleep(delay)
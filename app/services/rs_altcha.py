@@ -1,4 +1,5 @@
 import json
+import threading
 import time
 
 from selenium.webdriver.common.by import By
@@ -6,9 +7,19 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
 
 from app.captcha_solver import (AltchaSolverConfigError, AltchaSolverRuntimeError,
-                                solve_altcha)
+                                solve_altcha, solve_altcha_async)
+from app.services import altcha_local
+from app.services.execution_logger import log_event
 from app.utils import to_bool as _to_bool
 
+# ALTCHA do proximo item do lote, enviado ao 2captcha enquanto o item atual
+# baixa e salva o PDF. So com challenge_url: o 2captcha busca ali um desafio
+# novo (o challenge_json embutido na pagina e do item atual). Nao antecipa
+# quando o item anterior foi resolvido localmente (altcha_local).
+_ANTECIPADO_LOCK = threading.Lock()
+_ANTECIPADO = {}       # challenge_url, page_url, futuro, enviado_em
+_ULTIMO_CONTEXTO = {}  # challenge_url/page_url/local da ultima resolucao
+
 
 def _normalizar_json_altcha(raw_value):
     if isinstance(raw_value, (dict, list)):
@@ -106,6 +117,32 @@ def _coletar_contexto_altcha(driver):
     }
 
 
+def _baixar_desafio_altcha(driver, challenge_url):
+    """JSON do desafio buscado pelo proprio navegador (mesma sessao/cookies
+    do widget); None se nao der."""
+    script = """
+        const done = arguments[arguments.length - 1];
+        fetch(arguments[0], { credentials: 'include', cache: 'no-store' })
+            .then(r => (r.ok ? r.text() : null))
+            .then(done)
+            .catch(() => done(null));
+    """
+    try:
+        return _normalizar_json_altcha(driver.execute_async_script(script, challenge_url))
+    except Exception:
+        return None
+
+
+def _resolver_localmente(driver, config, challenge_json, challenge_url):
+    if not _to_bool(config.get('RS_ALTCHA_LOCAL_ENABLED', True), True):
+        return None
+    desafio = challenge_json or _baixar_desafio_altcha(driver, challenge_url)
+    if not desafio:
+        log_event('altcha_local_unsupported', level='WARNING', motivo='desafio_indisponivel')
+        return None
+    return altcha_local.resolver(config, desafio)
+
+
 def _injetar_resposta_altcha(driver, token):
     script = """
         const token = arguments[0];
@@ -225,7 +262,80 @@ def _injetar_resposta_altcha(driver, token):
         }
 
 
+def _parse_segundos(valor, padrao):
+    try:
+        return max(1, int(valor))
+    except (TypeError, ValueError):
+        return padrao
+
+
+def antecipar_altcha_rs(config, execution_id=None):
+    """Envia ao 2captcha o ALTCHA do proximo item (challenge_url da ultima
+    resolucao) sem esperar. True se enviou."""
+    if not _to_bool(config.get('CAPTCHA_PREFETCH_ENABLED', True), True):
+        return False
+    with _ANTECIPADO_LOCK:
+        challenge_url = _ULTIMO_CONTEXTO.get('challenge_url')
+        page_url = _ULTIMO_CONTEXTO.get('page_url')
+        if not challenge_url or _ANTECIPADO or _ULTIMO_CONTEXTO.get('local'):
+            return False
+        try:
+            futuro = solve_altcha_async(
+                config, page_url=page_url, challenge_url=challenge_url, execution_id=execution_id,
+            )
+        except AltchaSolverConfigError:
+            return False
+        _ANTECIPADO.update({
+            'challenge_url': challenge_url,
+            'page_url': page_url,
+            'futuro': futuro,
+            'enviado_em': time.monotonic(),
+        })
+    log_event('altcha_prefetch_submitted', execution_id=execution_id)
+    return True
+
+
+def descartar_altcha_antecipado(motivo='descartado'):
+    with _ANTECIPADO_LOCK:
+        futuro = _ANTECIPADO.get('futuro')
+        _ANTECIPADO.clear()
+    if futuro is not None:
+        futuro.cancel()
+        log_event('altcha_prefetch_discarded', motivo=motivo)
+
+
+def _consumir_antecipado(config, challenge_url):
+    """Token antecipado para esta challenge_url, se ainda dentro da validade
+    (CAPTCHA_PREFETCH_MAX_IDADE_SEGUNDOS); None para resolver na hora."""
+    with _ANTECIPADO_LOCK:
+        if not _ANTECIPADO:
+            return None
+        item = dict(_ANTECIPADO)
+        _ANTECIPADO.clear()
+    if item['challenge_url'] != challenge_url:
+        item['futuro'].cancel()
+        log_event('altcha_prefetch_discarded', motivo='challenge_url_diferente')
+        return None
+
+    idade_maxima = _parse_segundos(config.get('CAPTCHA_PREFETCH_MAX_IDADE_SEGUNDOS'), 120)
+    espera = _parse_segundos(config.get('CAPTCHA_2_DEFAULT_TIMEOUT'), 180) + 10
+    try:
+        solved = item['futuro'].result(timeout=espera)
+    except Exception as exc:
+        log_event('altcha_prefetch_failed', level='WARNING', error=str(exc))
+        return None
+    idade = time.monotonic() - item['enviado_em']
+    if idade > idade_maxima:
+        log_event('altcha_prefetch_discarded', motivo='expirado', idade_s=int(idade))
+        return None
+    log_event('altcha_prefetch_used', idade_s=int(idade))
+    return solved
+
+
 def resolver_altcha_rs_com_2captcha(driver, config, allow_solver=False):
+    """Resolve o ALTCHA da pagina e injeta o token: primeiro na maquina
+    (RS_ALTCHA_LOCAL_ENABLED), com o 2captcha (antecipado ou na hora) como
+    fallback. O nome ficou por compatibilidade com os chamadores."""
     if not allow_solver:
         return {
             'attempted': False,
@@ -261,13 +371,26 @@ def resolver_altcha_rs_com_2captcha(driver, config, allow_solver=False):
             'widget_count': contexto.get('widgetCount', 0)
         }
 
+    page_url = contexto.get('currentUrl') or driver.current_url
+    solved = _resolver_localmente(driver, config, challenge_json, challenge_url)
+    local = solved is not None
+    if challenge_url:
+        with _ANTECIPADO_LOCK:
+            _ULTIMO_CONTEXTO.update({'challenge_url': challenge_url, 'page_url': page_url, 'local': local})
+        if local:
+            descartar_altcha_antecipado('resolvido_local')
+        else:
+            solved = _consumir_antecipado(config, challenge_url)
+    antecipado = solved is not None and not local
+
     try:
-        solved = solve_altcha(
-            config,
-            page_url=contexto.get('currentUrl') or driver.current_url,
-            challenge_json=challenge_json,
-            challenge_url=challenge_url
-        )
+        if solved is None:
+            solved = solve_altcha(
+                config,
+                page_url=page_url,
+                challenge_json=challenge_json,
+                challenge_url=challenge_url
+            )
     except AltchaSolverConfigError as exc:
         return {
             'attempted': True,
@@ -289,6 +412,8 @@ def resolver_altcha_rs_com_2captcha(driver, config, allow_solver=False):
     return {
         'attempted': True,
         'status': 'solved',
+        'solver': 'local' if local else '2captcha',
+        'prefetched': antecipado,
         'widget_count': contexto.get('widgetCount', 0),
         'injected_fields': int(injecao.get('updated') or 0),
         'injected_widgets': int(injecao.get('widgetCount') or 0),
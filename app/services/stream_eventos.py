@@ -0,0 +1,90 @@
+"""Server-Sent Events do progresso dos lotes e da contagem de pendencias.
+
+Quem muda estado chama notificar(canal) (append_batch_message, fim de lote,
+commit que mexe no resumo de status); cada conexao SSE acorda, tira um
+snapshot das fontes e envia so os campos que mudaram desde o ultimo envio.
+O 1o envio de cada fonte e completo. Sem notificacao, a conexao reconfere as
+fontes a cada `intervalo` (estado alterado fora dos pontos notificados).
+
+Fonte com canal so e recalculada quando aquele canal foi notificado (ex.:
+pendencias, que consulta o banco); sem canal, a cada despertar (snapshot em
+memoria).
+"""
+import json
+import threading
+import time
+
+_cond = threading.Condition()
+_versoes = {}  # canal -> contador
+_versao_global = 0
+
+_AUSENTE = object()
+
+
+def notificar(canal='lote'):
+    global _versao_global
+    with _cond:
+        _versoes[canal] = _versoes.get(canal, 0) + 1
+        _versao_global += 1
+        _cond.notify_all()
+
+
+def versao(canal=None):
+    with _cond:
+        return _versao_global if canal is None else _versoes.get(canal, 0)
+
+
+def esperar(versao_vista, timeout):
+    """Bloqueia ate alguma notificacao posterior a versao_vista (ou timeout);
+    devolve a versao global atual."""
+    with _cond:
+        _cond.wait_for(lambda: _versao_global != versao_vista, timeout=timeout)
+        return _versao_global
+
+
+def delta(anterior, atual):
+    return {k: v for k, v in atual.items() if anterior.get(k, _AUSENTE) != v}
+
+
+def formatar(evento, dados):
+    texto = json.dumps(dados, ensure_ascii=False, default=str)
+    return f'event: {evento}\ndata: {texto}\n\n'
+
+
+def fluxo(fontes, intervalo=1.0, duracao_maxima=300.0, heartbeat=15.0, retry_ms=3000):
+    """Gerador do corpo text/event-stream.
+
+    fontes: lista de (chave, evento, fn, canal). fn() devolve o snapshot
+    (dict); o evento SSE leva {'chave': chave, **campos_alterados}.
+    Encerra apos duracao_maxima segundos: o EventSource reconecta sozinho
+    (retry) e a nova conexao recomeca com snapshots completos."""
+    yield f'retry: {int(retry_ms)}\n\n'
+    enviados = {}
+    canais_vistos = {}
+    versao_vista = versao()
+    inicio = ultimo_envio = time.monotonic()
+
+    while True:
+        for chave, evento, fn, canal in fontes:
+            if canal is not None:
+                atual_canal = versao(canal)
+                if chave in enviados and canais_vistos.get(chave) == atual_canal:
+                    continue
+                canais_vistos[chave] = atual_canal
+            try:
+                snapshot = fn()
+            except Exception:
+                continue
+            mudou = delta(enviados.get(chave, {}), snapshot) if chave in enviados else snapshot
+            if mudou:
+                enviados[chave] = snapshot
+                ultimo_envio = time.monotonic()
+                yield formatar(evento, {'chave': chave, **mudou})
+
+        agora = time.monotonic()
+        if agora - inicio >= duracao_maxima:
+            return
+        if agora - ultimo_envio >= heartbeat:
+            ultimo_envio = agora
+            yield ': ping\n\n'
+        versao_vista = esperar(versao_vista, min(intervalo, max(0.0, duracao_maxima - (agora - inicio))))
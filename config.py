@@ -22,6 +22,16 @@ def _env_int(name, default=0):
     except ValueError:
         return default
 
+
+def _env_float(name, default=0.0):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    try:
+        return float(str(value).strip().replace(',', '.'))
+    except ValueError:
+        return default
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY')
     if not SECRET_KEY:
@@ -50,6 +60,10 @@ class Config:
     LOG_DIR = os.environ.get('LOG_DIR') or os.path.join(basedir, 'logs')
     LOG_CONSOLE_FORMAT = (os.environ.get('LOG_CONSOLE_FORMAT') or 'human').strip().lower()
     LOG_JSON_FILE = _env_bool('LOG_JSON_FILE', True)
+    # Console/arquivo em thread propria (arquivo gravado em blocos) e
+    # amostragem de eventos repetitivos: "evento:N" mantem 1 a cada N
+    LOG_ASSINCRONO = _env_bool('LOG_ASSINCRONO', True)
+    LOG_AMOSTRAGEM = os.environ.get('LOG_AMOSTRAGEM', 'federal_monitor_waiting:6')
     # Historico de diagnostico persistido em banco (sobrevive a restart)
     DIAGNOSTICO_PERSISTIR = _env_bool('DIAGNOSTICO_PERSISTIR', True)
     DIAGNOSTICO_RETENCAO_DIAS = _env_int('DIAGNOSTICO_RETENCAO_DIAS', 30)
@@ -69,11 +83,118 @@ class Config:
 
     RS_ALTCHA_AUTOSOLVE_ENABLED = _env_bool('RS_ALTCHA_AUTOSOLVE_ENABLED', False)
     RS_ALTCHA_MANUAL_FALLBACK = _env_bool('RS_ALTCHA_MANUAL_FALLBACK', True)
+    # ALTCHA resolvido na maquina (prova de trabalho em pool de processos; 0 =
+    # um por nucleo); o 2captcha fica de fallback
+    RS_ALTCHA_LOCAL_ENABLED = _env_bool('RS_ALTCHA_LOCAL_ENABLED', True)
+    RS_ALTCHA_LOCAL_PROCESSOS = _env_int('RS_ALTCHA_LOCAL_PROCESSOS', 0)
+    RS_ALTCHA_LOCAL_TIMEOUT_SEGUNDOS = _env_int('RS_ALTCHA_LOCAL_TIMEOUT_SEGUNDOS', 20)
+
+    # OCR local do captcha de Imbe (backend 'tesseract' exige pytesseract e o
+    # Tesseract instalados; vazio desliga). Abaixo da confianca minima, ou com
+    # a resposta recusada pelo portal, o captcha vai para o 2captcha.
+    IMBE_OCR_BACKEND = (os.environ.get('IMBE_OCR_BACKEND', 'tesseract') or '').strip().lower()
+    IMBE_OCR_CONFIANCA_MINIMA = _env_float('IMBE_OCR_CONFIANCA_MINIMA', 0.8)
+    IMBE_OCR_CARACTERES = os.environ.get('IMBE_OCR_CARACTERES') or ''
+    IMBE_OCR_TAMANHO = _env_int('IMBE_OCR_TAMANHO', 0)
+    # Imagens + palpite/resposta/desfecho de cada tentativa (benchmark offline)
+    IMBE_OCR_AMOSTRAS_ENABLED = _env_bool('IMBE_OCR_AMOSTRAS_ENABLED', True)
+    IMBE_OCR_AMOSTRAS_DIR = os.environ.get('IMBE_OCR_AMOSTRAS_DIR') or \
+        os.path.join(basedir, 'logs', 'ocr_imbe')
+
+    # Emissoes simultaneas por lote (um Chrome por worker). O lote Estadual RS
+    # e sempre sequencial (perfil com certificado nao pode ser compartilhado).
+    FGTS_BATCH_WORKERS = _env_int('FGTS_BATCH_WORKERS', 1)
+    MUNICIPAL_BATCH_WORKERS = _env_int('MUNICIPAL_BATCH_WORKERS', 1)
+
+    # Agendador de emissoes: lotes e emissao individual rodam juntos quando
+    # nao disputam recurso (perfil RS, perfil municipal, vagas de solver,
+    # navegadores; 0 = sem limite). A emissao individual espera na fila ate
+    # AGENDADOR_ESPERA_INDIVIDUAL_SEGUNDOS antes de desistir.
+    AGENDADOR_MAX_NAVEGADORES = _env_int('AGENDADOR_MAX_NAVEGADORES', 0)
+    AGENDADOR_ESPERA_INDIVIDUAL_SEGUNDOS = _env_int('AGENDADOR_ESPERA_INDIVIDUAL_SEGUNDOS', 15)
+
+    # Cache do caminho do chromedriver (webdriver-manager) por versao do Chrome,
+    # persistido em disco; vale por CHROMEDRIVER_CACHE_TTL_HORAS.
+    CHROMEDRIVER_CACHE_FILE = os.environ.get('CHROMEDRIVER_CACHE_FILE') or \
+        os.path.join(basedir, 'instance', 'chromedriver_cache.json')
+    CHROMEDRIVER_CACHE_TTL_HORAS = _env_int('CHROMEDRIVER_CACHE_TTL_HORAS', 24)
+
+    # Pool de navegadores aquecidos para a emissao individual (e FGTS avulso):
+    # ate DRIVER_POOL_TAMANHO Chromes abertos por tipo de perfil, reciclados
+    # apos DRIVER_POOL_MAX_USOS usos. Desligado por padrao (abre janelas).
+    DRIVER_POOL_ENABLED = _env_bool('DRIVER_POOL_ENABLED', False)
+    DRIVER_POOL_TAMANHO = _env_int('DRIVER_POOL_TAMANHO', 2)
+    DRIVER_POOL_MAX_USOS = _env_int('DRIVER_POOL_MAX_USOS', 20)
+
+    # Cache de processo de ConfiguracaoSistema/Municipio: invalidado a cada
+    # gravacao pelo app; o TTL cobre escrita externa (outro processo/SQL).
+    CONFIG_CACHE_TTL_SEGUNDOS = _env_int('CONFIG_CACHE_TTL_SEGUNDOS', 300)
+
+    # Cada emissao automatizada baixa numa subpasta propria desta base (fluxos
+    # simultaneos nao pegam o PDF um do outro); padrao ~/Downloads/certidoes_emissao.
+    DOWNLOADS_EMISSAO_DIR = os.environ.get('DOWNLOADS_EMISSAO_DIR')
+
+    # Cache de extracao de PDF por conteudo (texto/classificacao/validade);
+    # 0 desliga.
+    PDF_CACHE_MAX_ITENS = _env_int('PDF_CACHE_MAX_ITENS', 256)
+
+    # Leitura/classificacao de PDF em pool de processos (fora do GIL das
+    # threads de request/lote): processos (= tarefas em voo), chamadas que
+    # esperam processo livre e timeout por arquivo (contado do inicio da leitura).
+    PDF_POOL_ENABLED = _env_bool('PDF_POOL_ENABLED', True)
+    PDF_POOL_WORKERS = _env_int('PDF_POOL_WORKERS', 2)
+    PDF_POOL_FILA = _env_int('PDF_POOL_FILA', 16)
+    PDF_POOL_TIMEOUT_SEGUNDOS = _env_int('PDF_POOL_TIMEOUT_SEGUNDOS', 60)
+
+    # Relatorios CSV da auditoria em massa dos PDFs (/auditoria)
+    AUDITORIA_DIR = os.environ.get('AUDITORIA_DIR') or \
+        os.path.join(basedir, 'instance', 'auditoria')
+
+    # Indice das pastas de empresa na rede (relistado so quando o mtime da
+    # pasta base muda), persistido em disco entre reinicios.
+    PASTAS_INDICE_FILE = os.environ.get('PASTAS_INDICE_FILE') or \
+        os.path.join(basedir, 'instance', 'pastas_indice.json')
+
+    # Dashboard paginado: empresas por pagina (as seguintes chegam no scroll)
+    DASHBOARD_POR_PAGINA = _env_int('DASHBOARD_POR_PAGINA', 50)
+    # Thread que reconstroi os agregados do dashboard no boot e na virada do dia
+    RESUMO_STATUS_MANUTENCAO = _env_bool('RESUMO_STATUS_MANUTENCAO', True)
+
+    # Estado dos lotes espelhado em banco; no boot, um lote interrompido por
+    # reinicio volta como 'paused' e /retomar continua de onde parou.
+    BATCH_RESTAURAR_NO_BOOT = _env_bool('BATCH_RESTAURAR_NO_BOOT', True)
+    # Ordem da fila dos lotes: 'urgencia' (vencidas e mais perto de vencer
+    # primeiro, pendentes antes, menos falhas recentes antes; refeita a cada
+    # REPRIORIZAR_A_CADA itens, 0 = so no inicio) ou 'id' (ordem de cadastro).
+    BATCH_ORDEM = (os.environ.get('BATCH_ORDEM') or 'urgencia').strip().lower()
+    BATCH_REPRIORIZAR_A_CADA = _env_int('BATCH_REPRIORIZAR_A_CADA', 5)
+    # Alvos/contagens do modal de lote em cache (0 = sem cache); qualquer
+    # commit em Certidao ou na configuracao ja invalida antes do prazo.
+    LOTE_ALVOS_CACHE_SEGUNDOS = _env_int('LOTE_ALVOS_CACHE_SEGUNDOS', 10)
+    # Progresso dos lotes e pendencias por SSE (/eventos/stream): conexao
+    # renovada a cada DURACAO_MAXIMA (o navegador reconecta sozinho);
+    # INTERVALO e a reconferencia sem notificacao.
+    SSE_DURACAO_MAXIMA_SEGUNDOS = _env_int('SSE_DURACAO_MAXIMA_SEGUNDOS', 300)
+    SSE_INTERVALO_SEGUNDOS = _env_float('SSE_INTERVALO_SEGUNDOS', 1.0)
 
     CAPTCHA_2_API_KEY = os.environ.get('CAPTCHA_2_API_KEY') or ''
     CAPTCHA_2_DEFAULT_TIMEOUT = _env_int('CAPTCHA_2_DEFAULT_TIMEOUT', 180)
     CAPTCHA_2_POLLING_INTERVAL = _env_int('CAPTCHA_2_POLLING_INTERVAL', 10)
     CAPTCHA_2_SERVER = os.environ.get('CAPTCHA_2_SERVER') or '2captcha.com'
+    # Resolucoes simultaneas no 2captcha (cliente assincrono) e antecipacao:
+    # ALTCHA do proximo item RS enquanto o atual baixa, captcha de Imbe enquanto
+    # o formulario e preenchido. Token antecipado mais velho que o limite e
+    # descartado.
+    CAPTCHA_2_CONCORRENCIA = _env_int('CAPTCHA_2_CONCORRENCIA', 4)
+    CAPTCHA_PREFETCH_ENABLED = _env_bool('CAPTCHA_PREFETCH_ENABLED', True)
+    CAPTCHA_PREFETCH_MAX_IDADE_SEGUNDOS = _env_int('CAPTCHA_PREFETCH_MAX_IDADE_SEGUNDOS', 120)
+    # Metricas por solver (latencia, sucesso, retries, custo por lote) gravadas
+    # em banco; a distribuicao de latencia ajusta o polling do resultado.
+    # Precos em USD por 1000 resolucoes (tabela do 2captcha).
+    CAPTCHA_METRICAS_PERSISTIR = _env_bool('CAPTCHA_METRICAS_PERSISTIR', True)
+    CAPTCHA_METRICAS_RETENCAO_DIAS = _env_int('CAPTCHA_METRICAS_RETENCAO_DIAS', 90)
+    CAPTCHA_2_PRECO_MIL_ALTCHA = _env_float('CAPTCHA_2_PRECO_MIL_ALTCHA', 1.45)
+    CAPTCHA_2_PRECO_MIL_NORMAL = _env_float('CAPTCHA_2_PRECO_MIL_NORMAL', 1.0)
         
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
@@ -0,0 +1,28 @@
+"""Indices compostos de evento_diagnostico (filtros + paginacao por id)
+
+Revision ID: a7e4c2f9d3b8
+Revises: f6c3a8e2b5d1
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7e4c2f9d3b8'
+down_revision = 'f6c3a8e2b5d1'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_index('ix_evento_diagnostico_execution_id_id', 'evento_diagnostico', ['execution_id', 'id'])
+    op.create_index('ix_evento_diagnostico_certidao_id_id', 'evento_diagnostico', ['certidao_id', 'id'])
+    op.create_index('ix_evento_diagnostico_alvo_id', 'evento_diagnostico', ['alvo', 'id'])
+    op.create_index('ix_evento_diagnostico_error_type_id', 'evento_diagnostico', ['error_type', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_evento_diagnostico_error_type_id', table_name='evento_diagnostico')
+    op.drop_index('ix_evento_diagnostico_alvo_id', table_name='evento_diagnostico')
+    op.drop_index('ix_evento_diagnostico_certidao_id_id', table_name='evento_diagnostico')
+    op.drop_index('ix_evento_diagnostico_execution_id_id', table_name='evento_diagnostico')
@@ -0,0 +1,66 @@
+"""Cria tabelas lote_execucao e lote_item (estado persistente dos lotes)
+
+Revision ID: b7d3e1f9a2c4
+Revises: f5a1b2c3d4e5
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d3e1f9a2c4'
+down_revision = 'f5a1b2c3d4e5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'lote_execucao',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('lote', sa.String(length=20), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('scope', sa.String(length=20), nullable=False),
+        sa.Column('execution_id', sa.String(length=40), nullable=True),
+        sa.Column('total', sa.Integer(), nullable=False),
+        sa.Column('processados', sa.Integer(), nullable=False),
+        sa.Column('sucesso', sa.Integer(), nullable=False),
+        sa.Column('falhas', sa.Integer(), nullable=False),
+        sa.Column('vencidas', sa.Integer(), nullable=False),
+        sa.Column('a_vencer', sa.Integer(), nullable=False),
+        sa.Column('pendentes', sa.Integer(), nullable=False),
+        sa.Column('fgts_marcadas_pendente', sa.Integer(), nullable=False),
+        sa.Column('positivas', sa.Integer(), nullable=False),
+        sa.Column('negativas', sa.Integer(), nullable=False),
+        sa.Column('efeito_negativas', sa.Integer(), nullable=False),
+        sa.Column('mensagem', sa.String(length=500), nullable=True),
+        sa.Column('iniciado_em', sa.DateTime(), nullable=True),
+        sa.Column('finalizado_em', sa.DateTime(), nullable=True),
+        sa.Column('atualizado_em', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_lote_execucao_lote', 'lote_execucao', ['lote'])
+
+    op.create_table(
+        'lote_item',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('execucao_id', sa.Integer(), sa.ForeignKey('lote_execucao.id'), nullable=False),
+        sa.Column('certidao_id', sa.Integer(), nullable=False),
+        sa.Column('ordem', sa.Integer(), nullable=False),
+        sa.Column('concluido_seq', sa.Integer(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('tentativas', sa.Integer(), nullable=False),
+        sa.Column('duracao_ms', sa.Integer(), nullable=True),
+        sa.Column('mensagem', sa.String(length=500), nullable=True),
+        sa.Column('atualizado_em', sa.DateTime(), nullable=True),
+        sa.UniqueConstraint('execucao_id', 'certidao_id', name='uq_lote_item_execucao_certidao'),
+    )
+    op.create_index('ix_lote_item_execucao_id', 'lote_item', ['execucao_id'])
+
+
+def downgrade():
+    op.drop_index('ix_lote_item_execucao_id', table_name='lote_item')
+    op.drop_table('lote_item')
+    op.drop_index('ix_lote_execucao_lote', table_name='lote_execucao')
+    op.drop_table('lote_execucao')
@@ -0,0 +1,45 @@
+"""Cria tabelas resumo_status e resumo_status_controle (agregados do dashboard)
+
+Revision ID: c8e4f2a1d6b9
+Revises: b7d3e1f9a2c4
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8e4f2a1d6b9'
+down_revision = 'b7d3e1f9a2c4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'resumo_status',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('empresa_id', sa.Integer(), nullable=False),
+        sa.Column('tipo', sa.String(length=20), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('quantidade', sa.Integer(), nullable=False),
+        sa.Column('menor_validade', sa.Date(), nullable=True),
+        sa.UniqueConstraint('empresa_id', 'tipo', 'status', name='uq_resumo_status_empresa_tipo_status'),
+    )
+    op.create_index('ix_resumo_status_empresa_id', 'resumo_status', ['empresa_id'])
+
+    # sem linha de controle: o primeiro acesso ao dashboard faz o rebuild
+    op.create_table(
+        'resumo_status_controle',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('data_referencia', sa.Date(), nullable=False),
+        sa.Column('limites', sa.String(length=200), nullable=False),
+        sa.Column('atualizado_em', sa.DateTime(), nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_table('resumo_status_controle')
+    op.drop_index('ix_resumo_status_empresa_id', table_name='resumo_status')
+    op.drop_table('resumo_status')
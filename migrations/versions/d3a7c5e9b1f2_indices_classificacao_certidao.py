@@ -0,0 +1,26 @@
+"""Indices de certidao para a classificacao de status em SQL
+
+Revision ID: d3a7c5e9b1f2
+Revises: c8e4f2a1d6b9
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a7c5e9b1f2'
+down_revision = 'c8e4f2a1d6b9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_certidao_tipo_validade_especial', 'certidao',
+                    ['tipo', 'data_validade', 'status_especial'])
+    op.create_index('ix_certidao_empresa_id', 'certidao', ['empresa_id'])
+
+
+def downgrade():
+    op.drop_index('ix_certidao_empresa_id', table_name='certidao')
+    op.drop_index('ix_certidao_tipo_validade_especial', table_name='certidao')
@@ -0,0 +1,32 @@
+"""Cria tabela pasta_empresa (memo da pasta CERTIDOES de cada empresa na rede)
+
+Revision ID: e8b2d4f6a1c3
+Revises: d3a7c5e9b1f2
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8b2d4f6a1c3'
+down_revision = 'd3a7c5e9b1f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'pasta_empresa',
+        sa.Column('empresa_id', sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column('nome_empresa', sa.String(length=120), nullable=False),
+        sa.Column('caminho_rede', sa.String(length=500), nullable=False),
+        sa.Column('caminho_empresa', sa.String(length=500), nullable=False),
+        sa.Column('caminho_certidoes', sa.String(length=500), nullable=False),
+        sa.Column('atualizado_em', sa.DateTime(), nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_table('pasta_empresa')
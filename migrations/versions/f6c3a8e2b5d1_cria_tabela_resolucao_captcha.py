@@ -0,0 +1,39 @@
+"""Cria tabela resolucao_captcha (metricas dos solvers do 2captcha)
+
+Revision ID: f6c3a8e2b5d1
+Revises: e8b2d4f6a1c3
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6c3a8e2b5d1'
+down_revision = 'e8b2d4f6a1c3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'resolucao_captcha',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('criado_em', sa.DateTime(), nullable=False),
+        sa.Column('solver', sa.String(length=20), nullable=False),
+        sa.Column('sucesso', sa.Boolean(), nullable=False),
+        sa.Column('duracao_ms', sa.Integer(), nullable=False),
+        sa.Column('tentativas', sa.Integer(), nullable=False),
+        sa.Column('consultas', sa.Integer(), nullable=False),
+        sa.Column('error_type', sa.String(length=30), nullable=True),
+        sa.Column('execution_id', sa.String(length=40), nullable=True),
+    )
+    op.create_index('ix_resolucao_captcha_criado_em', 'resolucao_captcha', ['criado_em'])
+    op.create_index('ix_resolucao_captcha_execution_id', 'resolucao_captcha', ['execution_id'])
+
+
+def downgrade():
+    op.drop_index('ix_resolucao_captcha_execution_id', table_name='resolucao_captcha')
+    op.drop_index('ix_resolucao_captcha_criado_em', table_name='resolucao_captcha')
+    op.drop_table('resolucao_captcha')
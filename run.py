@@ -5,11 +5,14 @@ from app import create_app, db
 from app.models import Empresa, Certidao
 from app.services.deps_check import dependencias_faltantes
 
-app = create_app()
+# Os processos do pool de PDF (spawn) reimportam este modulo como
+# __mp_main__: so o processo principal monta o app (migracoes, threads).
+if __name__ != '__mp_main__':
+    app = create_app()
 
-@app.shell_context_processor
-def make_shell_context():
-    return {'db': db, 'Empresa': Empresa, 'Certidao': Certidao}
+    @app.shell_context_processor
+    def make_shell_context():
+        return {'db': db, 'Empresa': Empresa, 'Certidao': Certidao}
 
 if __name__ == '__main__':
     # Fail-fast acionavel: nao sobe meio quebrado se faltar dependencia critica.
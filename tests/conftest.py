@@ -15,6 +15,10 @@ os.environ.setdefault('QUIET_WERKZEUG_LOGS', 'true')
 os.environ.setdefault('LOG_JSON_FILE', 'false')
 # Nao sobe a thread escritora de diagnostico nos testes (sem efeitos colaterais).
 os.environ.setdefault('DIAGNOSTICO_PERSISTIR', 'false')
+os.environ.setdefault('CAPTCHA_METRICAS_PERSISTIR', 'false')
+os.environ.setdefault('RESUMO_STATUS_MANUTENCAO', 'false')
+# PDFs lidos na propria thread (os testes mockam o pdfplumber do processo).
+os.environ.setdefault('PDF_POOL_ENABLED', 'false')
 # Mantem a precondicao do lote RS deterministica (flag desligada) nos testes.
 os.environ.setdefault('RS_ALTCHA_AUTOSOLVE_ENABLED', 'false')
 
@@ -27,11 +31,16 @@ os.environ['DATABASE_URL'] = 'sqlite:///' + _DBPATH.replace(os.sep, '/')
 _TMPDIR = tempfile.mkdtemp()
 os.environ.setdefault('CAMINHO_REDE', _TMPDIR)
 os.environ.setdefault('CHROME_PROFILE_DIR', _TMPDIR)
+# Indice de pastas da rede fora de instance/ do repositorio.
+os.environ.setdefault('PASTAS_INDICE_FILE', os.path.join(tempfile.mkdtemp(), 'pastas_indice.json'))
+# Relatorios da auditoria de PDFs tambem fora do repositorio.
+os.environ.setdefault('AUDITORIA_DIR', tempfile.mkdtemp())
 
 import pytest  # noqa: E402
 
 from app import create_app, db  # noqa: E402
 from app.models import Certidao, Empresa, TipoCertidao  # noqa: E402
+from app.services import config_cache  # noqa: E402
 
 
 @pytest.fixture(scope='session')
@@ -43,6 +52,8 @@ def app():
 def ids(app):
     """Recria o schema, semeia uma empresa RS/Tramandai com as 5 certidoes
     (sem data) e devolve os ids por tipo. Limpa o schema ao final do teste."""
+    # o cache de processo da configuracao nao ve o drop_all/create_all
+    config_cache.invalidar('teste')
     with app.app_context():
         db.create_all()
         empresa = Empresa(nome='Empresa Teste', cnpj='11.111.111/1111-11',
@@ -62,6 +73,7 @@ def ids(app):
     yield mapa
     with app.app_context():
         db.drop_all()
+    config_cache.invalidar('teste')
 
 
 @pytest.fixture()
@@ -73,3 +85,35 @@ def cid(ids):
 @pytest.fixture()
 def client(app, ids):
     return app.test_client()
+
+
+@pytest.fixture()
+def pdf_texto():
+    """Gera bytes de um PDF real minimo (Helvetica/WinAnsi) com uma linha de
+    texto por pagina, legivel pelo pdfplumber (inclusive em processo filho)."""
+    return _pdf_texto
+
+
+def _pdf_texto(paginas):
+    n = len(paginas)
+    kids = ' '.join(f'{3 + 2 * i} 0 R' for i in range(n))
+    fonte = 3 + 2 * n
+    objetos = ['<< /Type /Catalog /Pages 2 0 R >>', f'<< /Type /Pages /Kids [{kids}] /Count {n} >>']
+    for i, texto in enumerate(paginas):
+        conteudo = f'BT /F1 12 Tf 72 720 Td ({texto}) Tj ET'.encode('latin-1')
+        objetos.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+                       f'/Resources << /Font << /F1 {fonte} 0 R >> >> /Contents {4 + 2 * i} 0 R >>'.encode())
+        objetos.append(f'<< /Length {len(conteudo)} >>\nstream\n'.encode() + conteudo + b'\nendstream')
+    objetos.append(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+    saida = b'%PDF-1.4\n'
+    offsets = []
+    for i, obj in enumerate(objetos, start=1):
+        offsets.append(len(saida))
+        obj = obj if isinstance(obj, bytes) else obj.encode()
+        saida += f'{i} 0 obj\n'.encode() + obj + b'\nendobj\n'
+    xref = len(saida)
+    saida += f'xref\n0 {len(objetos) + 1}\n0000000000 65535 f \n'.encode()
+    for off in offsets:
+        saida += f'{off:010d} 00000 n \n'.encode()
+    saida += f'trailer\n<< /Size {len(objetos) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+    return saida
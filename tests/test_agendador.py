@@ -0,0 +1,106 @@
+"""Agendador de emissoes por recurso (services.agendador)."""
+import threading
+import time
+
+import pytest
+
+from app.automation.batch_state import RS_BATCH_LOCK, RS_BATCH_STATE
+from app.services import agendador, batch_engine
+
+
+@pytest.fixture(autouse=True)
+def capacidades():
+    agendador.configurar({'CAPTCHA_2_CONCORRENCIA': 2, 'AGENDADOR_MAX_NAVEGADORES': 0})
+    yield
+    assert agendador.estado()['ativas'] == [] and agendador.estado()['fila'] == []
+    agendador.configurar({})
+
+
+def _reservar_em_thread(nome, recursos, resultados, **kwargs):
+    def alvo():
+        resultados[nome] = agendador.reservar(nome, recursos, **kwargs)
+    thread = threading.Thread(target=alvo, daemon=True)
+    thread.start()
+    return thread
+
+
+def _esperar_na_fila(nome):
+    for _ in range(100):
+        if any(t['nome'] == nome for t in agendador.estado()['fila']):
+            return
+        time.sleep(0.01)
+    raise AssertionError(f'{nome} nao entrou na fila')
+
+
+def test_sem_conflito_roda_junto_e_conflito_espera_na_ordem():
+    lote_rs = agendador.reservar('Lote Estadual RS', {'perfil_rs': 1, 'solver': 1})
+    # FGTS nao disputa nada com o lote RS
+    fgts = agendador.reservar('Lote FGTS', {'navegador': 2}, timeout=0)
+    assert fgts is not None
+
+    # individual RS disputa o perfil: sem espera, desiste
+    assert agendador.reservar('Individual RS', {'perfil_rs': 1}, timeout=0) is None
+    assert agendador.ocupantes({'perfil_rs': 1}) == ['Lote Estadual RS']
+
+    resultados = {}
+    primeiro = _reservar_em_thread('Individual RS', {'perfil_rs': 1, 'solver': 1}, resultados)
+    _esperar_na_fila('Individual RS')
+    # o solver ainda tem vaga, mas a que sobra fica reservada para quem espera
+    assert agendador.reservar('Municipal', {'solver': 1}, timeout=0) is None
+    # quem nao disputa nada com a fila passa na frente
+    passa = agendador.reservar('Individual FGTS', {'navegador': 1}, timeout=0)
+    assert passa is not None
+    passa.liberar()
+
+    lote_rs.liberar()
+    primeiro.join(2)
+    reserva = resultados['Individual RS']
+    assert reserva is not None
+    assert agendador.estado()['em_uso'] == {'perfil_rs': 1, 'solver': 1, 'navegador': 2}
+    reserva.liberar()
+    reserva.liberar()  # idempotente
+    fgts.liberar()
+
+
+def test_lote_na_fila_avisa_e_pausa_sai_da_fila(app):
+    ocupante = agendador.reservar('Emissão individual #9', {'perfil_rs': 1}, tipo='individual')
+    batch_engine.reset_batch_state(RS_BATCH_STATE)
+    RS_BATCH_STATE.update({'status': 'running', 'ids': [1], 'total': 1})
+    emitidos = []
+    thread = threading.Thread(target=batch_engine.run_batch_loop, args=(app,), kwargs={
+        'lock': RS_BATCH_LOCK, 'state': RS_BATCH_STATE,
+        'emit_fn': lambda cid, drv, eid: emitidos.append(cid) or (True, False, 'ok'),
+        'nome_lote': 'Estadual RS', 'curto': 'RS', 'tag': 'T', 'event_prefix': 'teste_lote',
+        'recursos': {'perfil_rs': 1},
+    }, daemon=True)
+    try:
+        thread.start()
+        _esperar_na_fila('Lote Estadual RS')
+        for _ in range(100):
+            if batch_engine.status_payload_locked(RS_BATCH_LOCK, RS_BATCH_STATE)['aguardando']:
+                break
+            time.sleep(0.01)
+        payload = batch_engine.status_payload_locked(RS_BATCH_LOCK, RS_BATCH_STATE)
+        assert payload['aguardando'] == ['Emissão individual #9']
+        assert 'na fila' in payload['last_messages'][-1]['message']
+
+        batch_engine.request_pause(RS_BATCH_LOCK, RS_BATCH_STATE)
+        thread.join(3)
+        assert not thread.is_alive()
+        payload = batch_engine.status_payload_locked(RS_BATCH_LOCK, RS_BATCH_STATE)
+        assert payload['status'] == 'paused' and payload['aguardando'] is None
+        assert emitidos == []
+    finally:
+        ocupante.liberar()
+        batch_engine.reset_batch_state(RS_BATCH_STATE)
+
+
+def test_rota_status_do_agendador(client):
+    reserva = agendador.reservar('Lote FGTS', {'navegador': 1})
+    try:
+        dados = client.get('/agendador/status').get_json()
+    finally:
+        reserva.liberar()
+    assert dados['status'] == 'ok'
+    assert dados['capacidades']['perfil_rs'] == 1
+    assert [t['nome'] for t in dados['ativas']] == ['Lote FGTS']
@@ -0,0 +1,110 @@
+"""Resolucao local do ALTCHA (services.altcha_local) e fallback no rs_altcha."""
+import base64
+import hashlib
+import json
+
+from app.services import altcha_local, rs_altcha
+
+
+def _desafio(numero, maxnumber=200_000, salt='s4lt?expires=1700000000'):
+    return {
+        'algorithm': 'SHA-256',
+        'challenge': hashlib.sha256(f'{salt}{numero}'.encode()).hexdigest(),
+        'salt': salt,
+        'signature': 'assinatura',
+        'maxnumber': maxnumber,
+    }
+
+
+def _decodificar(token):
+    return json.loads(base64.b64decode(token))
+
+
+def test_resolve_na_thread_e_no_pool():
+    desafio = _desafio(31_337)
+    resultado = altcha_local.resolver({'RS_ALTCHA_LOCAL_PROCESSOS': 1}, json.dumps(desafio))
+    assert resultado['number'] == 31_337
+    payload = _decodificar(resultado['code'])
+    assert {k: payload[k] for k in ('algorithm', 'challenge', 'number', 'salt', 'signature')} == {
+        'algorithm': 'SHA-256', 'challenge': desafio['challenge'], 'number': 31_337,
+        'salt': desafio['salt'], 'signature': 'assinatura',
+    }
+
+    try:
+        # numero no 3o bloco: a busca atravessa blocos distribuidos ao pool
+        no_pool = altcha_local.resolver({'RS_ALTCHA_LOCAL_PROCESSOS': 2}, _desafio(123_456))
+        assert no_pool['number'] == 123_456
+    finally:
+        altcha_local.encerrar()
+
+
+def test_desafio_invalido_ou_sem_solucao_devolve_none():
+    assert altcha_local.interpretar_desafio('nao e json') is None
+    assert altcha_local.interpretar_desafio({'algorithm': 'MD5', 'challenge': 'x', 'salt': 'a',
+                                             'signature': 's'}) is None
+    sem_solucao = _desafio(5_000, maxnumber=1_000)
+    assert altcha_local.resolver({'RS_ALTCHA_LOCAL_PROCESSOS': 1}, sem_solucao) is None
+
+
+class _DriverComDesafio:
+    current_url = 'https://rs/solicitacao'
+
+    def __init__(self, challenge_json=None, challenge_url=None, remoto=None):
+        self.challenge_json = challenge_json
+        self.challenge_url = challenge_url
+        self.remoto = remoto
+        self.tokens = []
+
+    def execute_script(self, script, *args):
+        if args:
+            self.tokens.append(args[0])
+            return {'updated': 1, 'widgetCount': 1}
+        return {'hasWidget': True, 'widgetCount': 1, 'challengeJson': self.challenge_json,
+                'challengeUrl': self.challenge_url, 'currentUrl': self.current_url}
+
+    def execute_async_script(self, script, url):
+        assert url == self.challenge_url
+        return self.remoto
+
+
+def test_rs_resolve_localmente_sem_2captcha(monkeypatch):
+    def _sem_2captcha(*args, **kwargs):
+        raise AssertionError('nao deveria chamar o 2captcha')
+
+    monkeypatch.setattr(rs_altcha, 'solve_altcha', _sem_2captcha)
+    rs_altcha._ULTIMO_CONTEXTO.clear()
+    config = {'RS_ALTCHA_AUTOSOLVE_ENABLED': True, 'RS_ALTCHA_LOCAL_PROCESSOS': 1,
+              'CAPTCHA_PREFETCH_ENABLED': True, 'CAPTCHA_2_API_KEY': 'chave'}
+
+    embutido = _DriverComDesafio(challenge_json=json.dumps(_desafio(42)))
+    resultado = rs_altcha.resolver_altcha_rs_com_2captcha(embutido, config, allow_solver=True)
+    assert (resultado['status'], resultado['solver']) == ('solved', 'local')
+    assert _decodificar(embutido.tokens[0])['number'] == 42
+
+    # so challenge_url: o desafio e buscado pelo navegador
+    remoto = _DriverComDesafio(challenge_url='/altcha/challenge', remoto=json.dumps(_desafio(777)))
+    resultado = rs_altcha.resolver_altcha_rs_com_2captcha(remoto, config, allow_solver=True)
+    assert resultado['solver'] == 'local' and _decodificar(remoto.tokens[0])['number'] == 777
+    # resolvido localmente: nada de antecipar o proximo no 2captcha
+    assert rs_altcha.antecipar_altcha_rs(config) is False
+    rs_altcha._ULTIMO_CONTEXTO.clear()
+
+
+def test_rs_cai_no_2captcha_quando_local_nao_resolve(monkeypatch):
+    chamadas = []
+
+    def _fake_2captcha(config, page_url, challenge_json=None, challenge_url=None, execution_id=None):
+        chamadas.append(challenge_json)
+        return {'code': 'token-2captcha'}
+
+    monkeypatch.setattr(rs_altcha, 'solve_altcha', _fake_2captcha)
+    config = {'RS_ALTCHA_AUTOSOLVE_ENABLED': True, 'RS_ALTCHA_LOCAL_PROCESSOS': 1}
+    driver = _DriverComDesafio(challenge_json=json.dumps(_desafio(5_000, maxnumber=1_000)))
+    resultado = rs_altcha.resolver_altcha_rs_com_2captcha(driver, config, allow_solver=True)
+    assert (resultado['status'], resultado['solver']) == ('solved', '2captcha')
+    assert driver.tokens == ['token-2captcha'] and len(chamadas) == 1
+
+    desligado = dict(config, RS_ALTCHA_LOCAL_ENABLED=False)
+    driver = _DriverComDesafio(challenge_json=json.dumps(_desafio(1)))
+    assert rs_altcha.resolver_altcha_rs_com_2captcha(driver, desligado, allow_solver=True)['solver'] == '2captcha'
+    rs_altcha._ULTIMO_CONTEXTO.clear()
@@ -0,0 +1,154 @@
+"""Auditoria em massa dos PDFs de certidao (services.auditoria_pdf, /auditoria)."""
+import csv
+from datetime import date
+
+import pytest
+
+from app import db, file_manager
+from app.automation import pdf
+from app.models import Certidao, StatusEspecial, TipoCertidao
+from app.services import auditoria_pdf, batch_engine, classificacao_pdf
+
+
+@pytest.fixture()
+def auditoria(monkeypatch):
+    """Estado limpo e worker rodando na propria thread do teste."""
+    monkeypatch.setattr(batch_engine, 'run_worker', lambda fn, app_factory: fn(app_factory()))
+    auditoria_pdf.AUDITORIA_STATE.clear()
+    auditoria_pdf.AUDITORIA_STATE.update(auditoria_pdf._estado_padrao())
+    pdf.limpar_cache()
+    yield
+    pdf.limpar_cache()
+
+
+def _linhas_relatorio(caminho):
+    with open(caminho, encoding='utf-8-sig', newline='') as fh:
+        return list(csv.DictReader(fh, delimiter=';'))
+
+
+def test_status_idle_e_sem_relatorio(client, auditoria):
+    dados = client.get('/auditoria/status').get_json()
+    assert dados['status'] == 'idle'
+    assert dados['relatorio_disponivel'] is False
+    assert client.get('/auditoria/relatorio').status_code == 404
+    assert client.post('/auditoria/parar').status_code == 400
+
+
+def test_auditoria_gera_relatorio_de_divergencias(app, client, ids, auditoria, tmp_path, pdf_texto,
+                                                  monkeypatch):
+    arquivos = {}
+    for nome, paginas in {
+        'federal': ['CERTIDÃO NEGATIVA DE DÉBITOS', 'Válida até 31/12/2030'],
+        'fgts': ['CERTIDÃO POSITIVA DE DÉBITOS'],
+        'trabalhista': ['CERTIDÃO NEGATIVA DE DÉBITOS TRABALHISTAS'],
+    }.items():
+        arq = tmp_path / f'{nome}.pdf'
+        arq.write_bytes(pdf_texto(paginas))
+        arquivos[nome] = str(arq)
+    quebrado = tmp_path / 'rs.pdf'
+    quebrado.write_bytes(b'nao e pdf')
+
+    relocalizados = {'FGTS': arquivos['fgts']}
+    monkeypatch.setattr(
+        file_manager, 'localizar_certidao_existente',
+        lambda nome, tipo, subtipo=None, empresa_id=None: relocalizados.get(tipo),
+    )
+
+    with app.app_context():
+        federal = Certidao.query.filter_by(tipo=TipoCertidao.FEDERAL).first()
+        federal.caminho_arquivo = arquivos['federal']
+        federal.data_validade = date(2030, 12, 1)
+        fgts = db.session.get(Certidao, ids['fgts'])
+        fgts.caminho_arquivo = str(tmp_path / 'movido.pdf')
+        db.session.get(Certidao, ids['rs']).caminho_arquivo = str(quebrado)
+        db.session.get(Certidao, ids['municipal']).data_validade = date(2030, 1, 1)
+        trabalhista = db.session.get(Certidao, ids['trabalhista'])
+        trabalhista.caminho_arquivo = arquivos['trabalhista']
+        trabalhista.status_especial = StatusEspecial.PENDENTE
+        db.session.commit()
+        federal_id = federal.id
+
+    resp = client.post('/auditoria/iniciar')
+    assert resp.status_code == 200 and resp.get_json()['total'] == 5
+
+    dados = client.get('/auditoria/status').get_json()
+    assert dados['status'] == 'completed'
+    assert (dados['index'], dados['total'], dados['remaining']) == (5, 5, 0)
+    assert dados['falhas'] == 1
+    assert dados['caminhos_atualizados'] == 1
+    assert dados['por_divergencia'] == {
+        'validade_divergente': 1,
+        'caminho_atualizado': 1,
+        'positiva_nao_pendente': 1,
+        'ilegivel': 1,
+        'sem_arquivo': 1,
+        'pendente_com_negativa': 1,
+    }
+    assert dados['divergencias'] == 5
+
+    with app.app_context():
+        assert db.session.get(Certidao, ids['fgts']).caminho_arquivo == arquivos['fgts']
+
+    resp = client.get('/auditoria/relatorio')
+    assert resp.status_code == 200 and resp.mimetype == 'text/csv'
+    linhas = _linhas_relatorio(auditoria_pdf.caminho_relatorio())
+    por_id = {}
+    for linha in linhas:
+        por_id.setdefault(int(linha['certidao_id']), []).append(linha['divergencia'])
+    assert por_id[federal_id] == ['validade_divergente']
+    assert por_id[ids['fgts']] == ['caminho_atualizado', 'positiva_nao_pendente']
+    assert por_id[ids['rs']] == ['ilegivel']
+    assert por_id[ids['municipal']] == ['sem_arquivo']
+    assert por_id[ids['trabalhista']] == ['pendente_com_negativa']
+    federal_linha = next(linha for linha in linhas if linha['divergencia'] == 'validade_divergente')
+    assert federal_linha['validade_pdf'] == '2030-12-31'
+    assert federal_linha['data_validade'] == '2030-12-01'
+
+
+def test_parar_interrompe_entre_itens(app, client, ids, auditoria, monkeypatch):
+    chamados = []
+
+    def localizar(nome, tipo, subtipo=None, empresa_id=None):
+        chamados.append(tipo)
+        auditoria_pdf.parar()
+        return None
+
+    monkeypatch.setattr(file_manager, 'localizar_certidao_existente', localizar)
+    monkeypatch.setattr(auditoria_pdf, 'TAMANHO_BLOCO', 2)
+
+    assert client.post('/auditoria/iniciar').status_code == 200
+    dados = client.get('/auditoria/status').get_json()
+    assert dados['status'] == 'stopped'
+    assert dados['index'] == 2 and len(chamados) == 2
+    assert client.post('/auditoria/iniciar').status_code == 200
+
+
+def test_pool_ocupado_nao_vira_ilegivel(app, client, ids, auditoria, tmp_path, pdf_texto,
+                                        monkeypatch):
+    arq = tmp_path / 'trabalhista.pdf'
+    arq.write_bytes(pdf_texto(['CERTIDÃO NEGATIVA DE DÉBITOS TRABALHISTAS']))
+    with app.app_context():
+        db.session.get(Certidao, ids['trabalhista']).caminho_arquivo = str(arq)
+        db.session.commit()
+
+    real = classificacao_pdf.analisar_lote
+    chamadas = []
+
+    def ocupado_na_primeira(caminhos, campos=classificacao_pdf.CAMPOS_PADRAO, timeout=None):
+        chamadas.append(list(caminhos))
+        if len(chamadas) == 1:
+            for caminho in caminhos:
+                yield caminho, None, classificacao_pdf.FilaCheiaError('Fila de classificacao de PDF cheia.')
+            return
+        yield from real(caminhos, campos=campos, timeout=timeout)
+
+    monkeypatch.setattr(classificacao_pdf, 'analisar_lote', ocupado_na_primeira)
+    monkeypatch.setattr(auditoria_pdf, 'ESPERA_POOL_OCUPADO', 0)
+    monkeypatch.setattr(file_manager, 'localizar_certidao_existente', lambda *a, **kw: None)
+
+    assert client.post('/auditoria/iniciar').status_code == 200
+    dados = client.get('/auditoria/status').get_json()
+    assert dados['status'] == 'completed'
+    assert dados['index'] == dados['total'] and dados['falhas'] == 0
+    assert 'ilegivel' not in dados['por_divergencia']
+    assert chamadas == [[str(arq)], [str(arq)]]
@@ -6,11 +6,18 @@ Rodar: SECRET_KEY=x python tests/test_batch_loop.py
 """
 import os
 import sys
+import threading
 
 os.environ.setdefault('SECRET_KEY', 'test')
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app.services.batch_engine import run_batch_loop, batch_state_defaults
+from app.services.batch_engine import (
+    _marcar_processado,
+    batch_state_defaults,
+    drivers_do_lote,
+    request_pause,
+    run_batch_loop,
+)
 
 
 class FakeCtx:
@@ -200,6 +207,128 @@ def test_setup_teardown_called():
     print('ok test_setup_teardown_called')
 
 
+def run_paralelo(state, emit, workers=2, **kw):
+    drivers = []
+    criar_lock = threading.Lock()
+
+    def create_driver():
+        with criar_lock:
+            d = FakeDriver(f'd{len(drivers)}')
+            drivers.append(d)
+        return d
+
+    params = dict(COMMON)
+    params.update(kw)
+    params.setdefault('create_driver', create_driver)
+    run_batch_loop(FakeApp(), lock=threading.Lock(), state=state, emit_fn=emit,
+                   workers=workers, **params)
+    return drivers
+
+
+def test_paralelo_all_success():
+    state = make_state([1, 2, 3, 4, 5])
+    vistos = []
+
+    def emit(cid, driver, eid):
+        vistos.append((cid, driver.name))
+        return True, False, None
+
+    drivers = run_paralelo(state, emit, workers=2)
+    assert state['status'] == 'completed', state['status']
+    assert state['success'] == 5
+    assert state['index'] == 5
+    assert sorted(c for c, _ in vistos) == [1, 2, 3, 4, 5]  # cada ID emitido uma vez
+    assert 1 <= len(drivers) <= 2 and all(d.quit_called for d in drivers)
+    assert state['em_andamento'] == [] and state['drivers'] == []
+    print('ok test_paralelo_all_success')
+
+
+def test_paralelo_um_driver_por_worker():
+    state = make_state([1, 2, 3, 4])
+    barreira = threading.Barrier(2, timeout=5)
+    usados = {}
+
+    def emit(cid, driver, eid):
+        usados.setdefault(threading.current_thread().name, set()).add(driver.name)
+        if cid in (1, 2):
+            barreira.wait()  # garante os dois workers simultaneos
+        return True, False, None
+
+    drivers = run_paralelo(state, emit, workers=2)
+    assert state['status'] == 'completed'
+    assert len(drivers) == 2
+    assert all(len(nomes) == 1 for nomes in usados.values())
+    print('ok test_paralelo_um_driver_por_worker')
+
+
+def test_paralelo_falha_contabiliza():
+    state = make_state([1, 2, 3])
+    emit = lambda cid, d, e: (cid != 2, False, 'x' if cid == 2 else None)  # noqa: E731
+    run_paralelo(state, emit)
+    assert state['status'] == 'completed'
+    assert state['success'] == 2 and state['falhas'] == 1
+    assert state['index'] == 3
+    print('ok test_paralelo_falha_contabiliza')
+
+
+def test_paralelo_erro_grave_interrompe():
+    state = make_state([1, 2, 3, 4, 5, 6])
+    emit = lambda cid, d, e: (False, True, 'boom') if cid == 1 else (True, False, None)  # noqa: E731
+    run_paralelo(state, emit)
+    assert state['status'] == 'error', state['status']
+    assert state['message'] == 'boom'
+    assert 1 not in state['ids'][:state['index']]  # item grave nao conta como processado
+    print('ok test_paralelo_erro_grave_interrompe')
+
+
+def test_paralelo_pausa_e_retomada_sem_repetir():
+    state = make_state([1, 2, 3, 4, 5, 6])
+    lock = threading.Lock()
+    emitidos = []
+
+    def emit(cid, driver, eid):
+        emitidos.append(cid)
+        if len(emitidos) == 3:
+            request_pause(lock, state)
+        return True, False, None
+
+    params = dict(COMMON, create_driver=lambda: FakeDriver())
+    run_batch_loop(FakeApp(), lock=lock, state=state, emit_fn=emit, workers=2, **params)
+    assert state['status'] == 'paused', state['status']
+    processados = set(state['ids'][:state['index']])
+    assert len(processados) == state['success']
+
+    state['stop_requested'] = False
+    state['status'] = 'running'
+    emitidos_antes = list(emitidos)
+    run_batch_loop(FakeApp(), lock=lock, state=state, emit_fn=emit, workers=2, **params)
+    assert state['status'] == 'completed', state['status']
+    assert state['index'] == 6 and sorted(state['ids']) == [1, 2, 3, 4, 5, 6]
+    # a retomada nao reemite nada que ja tinha sido contabilizado
+    assert not processados & set(emitidos[len(emitidos_antes):])
+    print('ok test_paralelo_pausa_e_retomada_sem_repetir')
+
+
+def test_conclusao_fora_de_ordem_preserva_ordem_pendente():
+    state = make_state([1, 2, 3, 4, 5, 6])
+    _marcar_processado(state, 4)
+    _marcar_processado(state, 2)
+    assert state['index'] == 2
+    assert state['ids'][:2] == [4, 2]
+    assert state['ids'][2:] == [1, 3, 5, 6]
+    print('ok test_conclusao_fora_de_ordem_preserva_ordem_pendente')
+
+
+def test_drivers_do_lote_sem_repeticao():
+    a, b = FakeDriver('a'), FakeDriver('b')
+    state = batch_state_defaults()
+    state['driver'] = a
+    state['drivers'] = [a, b]
+    assert drivers_do_lote(state) == [a, b]
+    assert drivers_do_lote(batch_state_defaults()) == []
+    print('ok test_drivers_do_lote_sem_repeticao')
+
+
 def main():
     tests = [
         test_all_success,
@@ -211,6 +340,13 @@ def main():
         test_recover_fn,
         test_eager_driver_created_once,
         test_setup_teardown_called,
+        test_paralelo_all_success,
+        test_paralelo_um_driver_por_worker,
+        test_paralelo_falha_contabiliza,
+        test_paralelo_erro_grave_interrompe,
+        test_paralelo_pausa_e_retomada_sem_repetir,
+        test_conclusao_fora_de_ordem_preserva_ordem_pendente,
+        test_drivers_do_lote_sem_repeticao,
     ]
     for t in tests:
         t()
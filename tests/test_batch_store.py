@@ -0,0 +1,125 @@
+"""Persistencia do estado dos lotes (batch_store + write-through do batch_engine).
+
+Roda o loop de lote de verdade (emit_fn falso, sem Selenium) contra o SQLite
+de teste e confere que um lote interrompido volta do banco como 'paused', sem
+reemitir os IDs ja concluidos.
+"""
+import threading
+
+from app import db
+from app.models import LoteExecucao, LoteItem
+from app.services import batch_engine, batch_store
+
+COMMON = dict(nome_lote='Teste', curto='T', tag='TESTE-LOTE', event_prefix='teste_batch_worker')
+
+
+def _iniciar(app, ids, lote='fgts'):
+    state = batch_engine.batch_state_defaults()
+    state.update({
+        'status': 'running', 'ids': list(ids), 'total': len(ids),
+        'execution_id': 'exec-teste', 'lote': lote,
+    })
+    with app.app_context():
+        state['run_id'] = batch_store.criar_execucao(lote, state)
+    return state
+
+
+def test_criar_execucao_grava_itens_pendentes(app, ids):
+    state = _iniciar(app, [11, 12, 13])
+    assert state['run_id']
+    with app.app_context():
+        execucao = db.session.get(LoteExecucao, state['run_id'])
+        assert execucao.status == 'running'
+        assert execucao.total == 3
+        itens = LoteItem.query.filter_by(execucao_id=execucao.id).order_by(LoteItem.ordem).all()
+        assert [i.certidao_id for i in itens] == [11, 12, 13]
+        assert all(i.status == 'pendente' and i.tentativas == 0 for i in itens)
+
+
+def test_pausa_persistida_e_restaurada_sem_repetir(app, ids):
+    lock = threading.Lock()
+    state = _iniciar(app, [21, 22, 23])
+
+    def emit(cid, driver, eid):
+        if cid == 22:
+            state['stop_requested'] = True
+            state['stop_action'] = 'pause'
+            return False, False, 'interrompido'
+        return True, False, 'ok'
+
+    batch_engine.run_batch_loop(app, lock=lock, state=state, emit_fn=emit, **COMMON)
+    assert state['status'] == 'paused'
+    assert state['index'] == 1
+
+    with app.app_context():
+        execucao = db.session.get(LoteExecucao, state['run_id'])
+        assert execucao.status == 'paused'
+        assert execucao.processados == 1 and execucao.sucesso == 1
+        itens = {i.certidao_id: i for i in LoteItem.query.filter_by(execucao_id=execucao.id)}
+        assert itens[21].status == 'sucesso' and itens[21].concluido_seq == 0
+        assert itens[21].duracao_ms is not None
+        assert itens[22].status == 'pendente' and itens[22].tentativas == 1
+        assert itens[23].tentativas == 0
+
+    # "reinicio": estado em memoria zerado, restaurado a partir do banco
+    novo = batch_engine.batch_state_defaults()
+    with app.app_context():
+        assert batch_engine.restore_batch(lock, novo, 'fgts')
+    assert novo['status'] == 'paused'
+    assert novo['ids'] == [21, 22, 23]
+    assert novo['index'] == 1 and novo['total'] == 3
+    assert novo['success'] == 1
+    assert novo['run_id'] == state['run_id']
+
+    emitidos = []
+
+    def emit_retomada(cid, driver, eid):
+        emitidos.append(cid)
+        return True, False, 'ok'
+
+    novo['stop_requested'] = False
+    novo['status'] = 'running'
+    batch_engine.run_batch_loop(app, lock=lock, state=novo, emit_fn=emit_retomada, **COMMON)
+    assert emitidos == [22, 23]
+    assert novo['status'] == 'completed'
+
+    with app.app_context():
+        execucao = db.session.get(LoteExecucao, novo['run_id'])
+        assert execucao.status == 'completed'
+        assert execucao.sucesso == 3 and execucao.processados == 3
+        item = LoteItem.query.filter_by(execucao_id=execucao.id, certidao_id=22).first()
+        assert item.status == 'sucesso' and item.tentativas == 2
+
+
+def test_restaurar_ignora_lote_finalizado(app, ids):
+    lock = threading.Lock()
+    state = _iniciar(app, [31])
+    batch_engine.run_batch_loop(
+        app, lock=lock, state=state, emit_fn=lambda c, d, e: (True, False, 'ok'), **COMMON)
+    assert state['status'] == 'completed'
+
+    novo = batch_engine.batch_state_defaults()
+    with app.app_context():
+        assert not batch_engine.restore_batch(lock, novo, 'fgts')
+    assert novo['status'] == 'idle'
+
+
+def test_novo_lote_encerra_execucao_retomavel_anterior(app, ids):
+    antigo = _iniciar(app, [41, 42])
+    novo = _iniciar(app, [43])
+    with app.app_context():
+        assert db.session.get(LoteExecucao, antigo['run_id']).status == 'stopped'
+        assert db.session.get(LoteExecucao, novo['run_id']).status == 'running'
+        # outro tipo de lote nao e afetado
+        municipal = _iniciar(app, [44], lote='municipal')
+        assert db.session.get(LoteExecucao, novo['run_id']).status == 'running'
+        assert db.session.get(LoteExecucao, municipal['run_id']).status == 'running'
+
+
+def test_parada_de_lote_pausado_persiste(app, ids):
+    lock = threading.Lock()
+    state = _iniciar(app, [51, 52])
+    state['status'] = 'paused'
+    with app.test_request_context():
+        batch_engine.request_stop(lock, state)
+        assert db.session.get(LoteExecucao, state['run_id']).status == 'stopped'
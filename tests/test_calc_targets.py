@@ -1,10 +1,14 @@
 """Testes do cálculo de alvos de lote (batch_engine.calc_targets) com banco."""
-from datetime import date, timedelta
+import threading
+from datetime import date, datetime, timedelta
 
 from app import db
 from app.models import (
     Certidao,
     ConfiguracaoSistema,
+    Empresa,
+    LoteExecucao,
+    LoteItem,
     StatusEspecial,
     TipoCertidao,
 )
@@ -91,3 +95,131 @@ def test_calc_targets_vazio_quando_sem_data(app, ids):
         dados = batch_engine.calc_targets(fgts.id, scope='default')
         assert dados['ids'] == []
         assert dados['total'] == 0
+
+
+def _certidoes_com_validade(dias_por_tipo):
+    hoje = date.today()
+    certidoes = {}
+    for tipo, dias in dias_por_tipo.items():
+        certidao = Certidao.query.filter_by(tipo=tipo).first()
+        certidao.data_validade = hoje + timedelta(days=dias)
+        certidoes[tipo] = certidao
+    db.session.commit()
+    return {tipo: c.id for tipo, c in certidoes.items()}
+
+
+def test_calc_targets_ordem_urgencia(app, ids):
+    # vencidas primeiro (empatadas: menos falhas recentes antes), depois a vencer
+    with app.app_context():
+        alvo = _certidoes_com_validade({
+            TipoCertidao.FGTS: 5,
+            TipoCertidao.ESTADUAL: -1,
+            TipoCertidao.MUNICIPAL: -3,
+            TipoCertidao.TRABALHISTA: 1,
+        })
+        for _ in range(2):
+            execucao = LoteExecucao(lote='municipal', status='completed', total=1)
+            db.session.add(execucao)
+            db.session.flush()
+            db.session.add(LoteItem(execucao_id=execucao.id, certidao_id=alvo[TipoCertidao.MUNICIPAL],
+                                    status='falha', atualizado_em=datetime.utcnow()))
+        db.session.commit()
+
+        inicio = alvo[TipoCertidao.FGTS]
+        dados = batch_engine.calc_targets(inicio, scope='default', ordem='urgencia')
+        assert dados['ordem'] == 'urgencia'
+        assert dados['ids'] == [
+            inicio,                              # inicio sempre primeiro
+            alvo[TipoCertidao.ESTADUAL],         # vencida, sem falhas
+            alvo[TipoCertidao.MUNICIPAL],        # vencida, 2 falhas recentes
+            alvo[TipoCertidao.TRABALHISTA],      # vence amanha
+        ]
+
+        por_id = batch_engine.calc_targets(inicio, scope='default', ordem='id')
+        assert por_id['ordem'] == 'id'
+        assert por_id['ids'][1:] == sorted(por_id['ids'][1:])
+
+
+def test_repriorizar_restantes_reordena_so_o_que_falta(app, ids):
+    with app.app_context():
+        alvo = _certidoes_com_validade({
+            TipoCertidao.FGTS: 1,
+            TipoCertidao.ESTADUAL: 2,
+            TipoCertidao.MUNICIPAL: 3,
+        })
+        fgts, rs, muni = (alvo[TipoCertidao.FGTS], alvo[TipoCertidao.ESTADUAL],
+                          alvo[TipoCertidao.MUNICIPAL])
+        state = batch_engine.batch_state_defaults()
+        state.update({'status': 'running', 'ids': [fgts, rs, muni], 'index': 1,
+                      'total': 3, 'ordem': 'urgencia'})
+        lock = threading.Lock()
+
+        # durante o lote a municipal venceu (ex.: corrigida a mao)
+        Certidao.query.get(muni).data_validade = date.today() - timedelta(days=1)
+        db.session.commit()
+
+        assert batch_engine.repriorizar_restantes(lock, state, forcar=True)
+        assert state['ids'] == [fgts, muni, rs]
+        assert state['repriorizado_em'] == 1
+
+        # abaixo do intervalo configurado nao reconsulta
+        assert not batch_engine.repriorizar_restantes(lock, state)
+
+        state['ordem'] = 'id'
+        assert not batch_engine.repriorizar_restantes(lock, state, forcar=True)
+
+
+def test_calc_targets_cache_invalida_no_commit(app, ids):
+    with app.app_context():
+        batch_engine.limpar_cache_alvos()
+        alvo = _certidoes_com_validade({TipoCertidao.FGTS: -2})
+        fgts = alvo[TipoCertidao.FGTS]
+
+        dados = batch_engine.calc_targets(fgts, scope='default', cache_chave='teste')
+        assert dados['ids'] == [fgts] and dados['vencidas'] == 1
+        dados['ids'].append(999)  # o lote muta ids: o cache devolve copias
+
+        # escrita fora do ORM nao invalida: vale o cache ate o TTL
+        db.session.execute(
+            db.text('UPDATE certidao SET data_validade = NULL WHERE id = :id'), {'id': fgts})
+        db.session.commit()
+        db.session.expire_all()
+        assert batch_engine.calc_targets(fgts, cache_chave='teste')['ids'] == [fgts]
+        assert batch_engine.calc_targets(fgts)['ids'] == []
+
+        # commit em Certidao pelo ORM invalida na hora
+        Certidao.query.get(fgts).data_validade = date.today() - timedelta(days=1)
+        db.session.commit()
+        Certidao.query.get(fgts).data_validade = None
+        db.session.commit()
+        dados = batch_engine.calc_targets(fgts, cache_chave='teste')
+        assert dados['ids'] == [] and dados['vencidas'] == 0
+        batch_engine.limpar_cache_alvos()
+
+
+def test_calc_targets_cache_invalida_com_empresa_e_falhas(app, ids):
+    # filtros por empresa (estado/cidade) e o historico de falhas tambem
+    # mudam o resultado: commits neles invalidam o cache
+    with app.app_context():
+        batch_engine.limpar_cache_alvos()
+        alvo = _certidoes_com_validade({TipoCertidao.FGTS: -2, TipoCertidao.ESTADUAL: -2})
+        fgts, rs = alvo[TipoCertidao.FGTS], alvo[TipoCertidao.ESTADUAL]
+
+        def _so_rs(query):
+            return (query.join(Empresa, Empresa.id == Certidao.empresa_id)
+                         .filter(Empresa.estado == 'RS'))
+
+        assert batch_engine.calc_targets(rs, extra_filter=_so_rs, cache_chave='rs')['total'] == 2
+        db.session.get(Empresa, ids['empresa']).estado = 'SC'
+        db.session.commit()
+        assert batch_engine.calc_targets(rs, extra_filter=_so_rs, cache_chave='rs')['total'] == 0
+
+        assert batch_engine.calc_targets(None, ordem='urgencia', cache_chave='u')['ids'] == [fgts, rs]
+        execucao = LoteExecucao(lote='fgts', status='completed', total=1)
+        db.session.add(execucao)
+        db.session.flush()
+        db.session.add(LoteItem(execucao_id=execucao.id, certidao_id=fgts, status='falha',
+                                atualizado_em=datetime.utcnow()))
+        db.session.commit()
+        assert batch_engine.calc_targets(None, ordem='urgencia', cache_chave='u')['ids'] == [rs, fgts]
+        batch_engine.limpar_cache_alvos()
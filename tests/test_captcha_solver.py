@@ -0,0 +1,138 @@
+"""Cliente assincrono do 2captcha e antecipacao do ALTCHA RS."""
+import asyncio
+import threading
+
+import pytest
+
+from app import captcha_solver
+from app.services import rs_altcha
+
+CONFIG = {'CAPTCHA_2_API_KEY': 'chave', 'CAPTCHA_2_CONCORRENCIA': 2, 'CAPTCHA_PREFETCH_ENABLED': True}
+
+
+class _FakeAsyncTwoCaptcha:
+    em_voo = 0
+    max_em_voo = 0
+    chamadas = []
+    falhas = []
+    lock = threading.Lock()
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+    async def _resolver(self, resposta, **payload):
+        cls = type(self)
+        with cls.lock:
+            cls.chamadas.append(payload)
+            cls.em_voo += 1
+            cls.max_em_voo = max(cls.max_em_voo, cls.em_voo)
+        try:
+            await asyncio.sleep(0.05)
+            if cls.falhas:
+                raise cls.falhas.pop(0)
+            return {'captchaId': '1', 'code': resposta}
+        finally:
+            with cls.lock:
+                cls.em_voo -= 1
+
+    async def altcha(self, **payload):
+        return await self._resolver('token-altcha', **payload)
+
+    async def normal(self, file, **kwargs):
+        return await self._resolver('abc12', file=file)
+
+
+@pytest.fixture()
+def solver(monkeypatch):
+    monkeypatch.setattr(captcha_solver, 'AsyncTwoCaptcha', _FakeAsyncTwoCaptcha)
+    _FakeAsyncTwoCaptcha.em_voo = 0
+    _FakeAsyncTwoCaptcha.max_em_voo = 0
+    _FakeAsyncTwoCaptcha.chamadas = []
+    _FakeAsyncTwoCaptcha.falhas = []
+    rs_altcha.descartar_altcha_antecipado('teste')
+    rs_altcha._ULTIMO_CONTEXTO.clear()
+    yield _FakeAsyncTwoCaptcha
+    rs_altcha.descartar_altcha_antecipado('teste')
+    rs_altcha._ULTIMO_CONTEXTO.clear()
+
+
+def test_tarefas_simultaneas_limitadas_pela_concorrencia(solver):
+    futuros = [
+        captcha_solver.solve_altcha_async(CONFIG, 'https://rs', challenge_url=f'https://rs/c{i}')
+        for i in range(5)
+    ]
+    assert [f.result(timeout=5)['code'] for f in futuros] == ['token-altcha'] * 5
+    assert solver.max_em_voo == 2
+
+
+def test_imagem_em_bytes_vai_em_base64(solver):
+    resultado = captcha_solver.solve_normal_captcha(CONFIG, image_bytes=b'\x89PNG' * 20)
+    assert resultado['code'] == 'abc12'
+    enviado = solver.chamadas[0]['file']
+    assert '.' not in enviado and len(enviado) > 50
+
+
+def test_erros_de_configuracao_e_de_resolucao(solver):
+    with pytest.raises(captcha_solver.AltchaSolverConfigError):
+        captcha_solver.solve_altcha_async({}, 'https://rs', challenge_url='https://rs/c')
+    with pytest.raises(captcha_solver.AltchaSolverConfigError):
+        captcha_solver.solve_normal_captcha_async(CONFIG)
+
+    solver.falhas = [TimeoutError('timeout 180 exceeded')]
+    assert captcha_solver.solve_altcha(CONFIG, 'https://rs', challenge_url='https://rs/c')['code'] == 'token-altcha'
+
+    solver.falhas = [ValueError('ERROR_KEY_DOES_NOT_EXIST')]
+    with pytest.raises(captcha_solver.AltchaSolverRuntimeError, match='ERROR_KEY_DOES_NOT_EXIST'):
+        captcha_solver.solve_altcha(CONFIG, 'https://rs', challenge_url='https://rs/c')
+
+
+class _DriverAltcha:
+    current_url = 'https://rs/solicitacao'
+
+    def __init__(self, challenge_url):
+        self.challenge_url = challenge_url
+        self.tokens = []
+
+    def execute_script(self, script, *args):
+        if args:
+            self.tokens.append(args[0])
+            return {'updated': 1, 'widgetCount': 1}
+        return {'hasWidget': True, 'widgetCount': 1, 'challengeJson': None,
+                'challengeUrl': self.challenge_url, 'currentUrl': self.current_url}
+
+
+def test_altcha_do_proximo_item_e_antecipado(solver):
+    config = dict(CONFIG, RS_ALTCHA_AUTOSOLVE_ENABLED=True)
+    driver = _DriverAltcha('https://rs/altcha/challenge')
+
+    # sem resolucao anterior nao ha challenge_url para antecipar
+    assert rs_altcha.antecipar_altcha_rs(config) is False
+
+    primeiro = rs_altcha.resolver_altcha_rs_com_2captcha(driver, config, allow_solver=True)
+    assert primeiro['status'] == 'solved' and primeiro['prefetched'] is False
+
+    assert rs_altcha.antecipar_altcha_rs(config) is True
+    assert rs_altcha.antecipar_altcha_rs(config) is False  # ja ha um em voo
+    segundo = rs_altcha.resolver_altcha_rs_com_2captcha(driver, config, allow_solver=True)
+    assert segundo['status'] == 'solved' and segundo['prefetched'] is True
+    assert len(solver.chamadas) == 2
+    assert solver.chamadas[1]['challenge_url'] == 'https://rs/altcha/challenge'
+    assert driver.tokens == ['token-altcha', 'token-altcha']
+
+    # pagina com outro desafio: o antecipado e descartado e resolve na hora
+    assert rs_altcha.antecipar_altcha_rs(config) is True
+    driver.challenge_url = 'https://rs/altcha/outro'
+    terceiro = rs_altcha.resolver_altcha_rs_com_2captcha(driver, config, allow_solver=True)
+    assert terceiro['prefetched'] is False
+
+
+def test_antecipado_expirado_nao_e_usado(solver):
+    config = dict(CONFIG, RS_ALTCHA_AUTOSOLVE_ENABLED=True)
+    driver = _DriverAltcha('https://rs/altcha/challenge')
+    rs_altcha.resolver_altcha_rs_com_2captcha(driver, config, allow_solver=True)
+    assert rs_altcha.antecipar_altcha_rs(config) is True
+    rs_altcha._ANTECIPADO['enviado_em'] -= 500
+
+    resultado = rs_altcha.resolver_altcha_rs_com_2captcha(driver, config, allow_solver=True)
+    assert resultado['status'] == 'solved' and resultado['prefetched'] is False
+    assert rs_altcha.antecipar_altcha_rs(dict(config, CAPTCHA_PREFETCH_ENABLED=False)) is False
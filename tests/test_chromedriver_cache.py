@@ -0,0 +1,68 @@
+"""Testes do cache do caminho do chromedriver (driver._resolver_chromedriver).
+
+Substitui o ChromeDriverManager por um falso que conta as chamadas a
+install(); nada e baixado nem nenhum navegador e aberto.
+"""
+import json
+import time
+
+import pytest
+
+from app.automation import driver
+
+
+@pytest.fixture()
+def ambiente(monkeypatch, tmp_path):
+    binario = tmp_path / 'chromedriver'
+    binario.write_text('bin')
+    cache_file = tmp_path / 'cache' / 'chromedriver_cache.json'
+    chamadas = []
+
+    class FakeManager:
+        def install(self):
+            chamadas.append(1)
+            return str(binario)
+
+    monkeypatch.setattr(driver, 'ChromeDriverManager', FakeManager)
+    monkeypatch.setattr(driver, '_CHROMEDRIVER_CACHE', {})
+    monkeypatch.setenv('CHROMEDRIVER_CACHE_FILE', str(cache_file))
+    monkeypatch.setenv('CHROME_UC_VERSION_MAIN', '131')
+    return {'binario': binario, 'cache_file': cache_file, 'chamadas': chamadas}
+
+
+def test_resolve_uma_vez_e_reusa_memoria_e_disco(ambiente, monkeypatch):
+    assert driver._resolver_chromedriver() == str(ambiente['binario'])
+    assert driver._resolver_chromedriver() == str(ambiente['binario'])
+    assert len(ambiente['chamadas']) == 1
+
+    dados = json.loads(ambiente['cache_file'].read_text())
+    assert dados['131']['path'] == str(ambiente['binario'])
+
+    # "reinicio": memoria vazia, arquivo em disco continua valendo
+    monkeypatch.setattr(driver, '_CHROMEDRIVER_CACHE', {})
+    assert driver._resolver_chromedriver() == str(ambiente['binario'])
+    assert len(ambiente['chamadas']) == 1
+
+
+def test_ttl_expirado_resolve_de_novo(ambiente, monkeypatch):
+    ambiente['cache_file'].parent.mkdir(parents=True)
+    ambiente['cache_file'].write_text(json.dumps({
+        '131': {'path': str(ambiente['binario']), 'resolvido_em': time.time() - 48 * 3600},
+    }))
+    driver._resolver_chromedriver()
+    assert len(ambiente['chamadas']) == 1
+
+
+def test_chave_por_versao_do_chrome(ambiente, monkeypatch):
+    driver._resolver_chromedriver()
+    monkeypatch.setenv('CHROME_UC_VERSION_MAIN', '132')
+    driver._resolver_chromedriver()
+    assert len(ambiente['chamadas']) == 2
+    assert set(json.loads(ambiente['cache_file'].read_text())) == {'131', '132'}
+
+
+def test_binario_removido_invalida_cache(ambiente):
+    driver._resolver_chromedriver()
+    ambiente['binario'].unlink()
+    driver._resolver_chromedriver()
+    assert len(ambiente['chamadas']) == 2
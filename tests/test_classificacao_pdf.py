@@ -0,0 +1,100 @@
+"""Classificacao de PDFs em pool de processos (services.classificacao_pdf).
+
+Usa PDFs reais minimos (pdfplumber roda no processo filho, onde mock nao
+alcanca)."""
+import os
+
+import pytest
+
+from app.automation import pdf
+from app.services import classificacao_pdf
+
+
+@pytest.fixture()
+def pdfs(tmp_path, pdf_texto):
+    pdf.limpar_cache()
+    textos = {
+        'negativa.pdf': ['CERTIDÃO NEGATIVA DE DÉBITOS', 'Válida até 31/12/2030'],
+        'positiva.pdf': ['CERTIDÃO POSITIVA DE DÉBITOS'],
+        'efeito.pdf': ['CERTIDÃO POSITIVA COM EFEITOS DE NEGATIVA'],
+        'outro.pdf': ['relatorio qualquer'],
+    }
+    caminhos = {}
+    for nome, paginas in textos.items():
+        arq = tmp_path / nome
+        arq.write_bytes(pdf_texto(paginas))
+        caminhos[nome] = str(arq)
+    yield caminhos
+    pdf.limpar_cache()
+
+
+@pytest.fixture()
+def pool(monkeypatch):
+    monkeypatch.setenv('PDF_POOL_ENABLED', 'true')
+    monkeypatch.setenv('PDF_POOL_WORKERS', '2')
+    monkeypatch.setenv('PDF_POOL_FILA', '2')
+    yield
+    classificacao_pdf.encerrar('teste')
+
+
+def test_inline_quando_desligado(pdfs):
+    r = classificacao_pdf.analisar(pdfs['negativa.pdf'])
+    assert r['classificacao'] == 'negativa'
+    assert r['validade_federal'].isoformat() == '2030-12-31'
+    assert pdf.classificar_status(pdfs['efeito.pdf']) == 'efeito_negativa'
+    assert classificacao_pdf._pool is None
+
+
+def test_lote_no_pool_de_processos(pdfs, tmp_path, pool):
+    quebrado = tmp_path / 'quebrado.pdf'
+    quebrado.write_bytes(b'nao e pdf')
+    caminhos = list(pdfs.values()) + [str(quebrado)]
+
+    resultados = {c: (r, e) for c, r, e in classificacao_pdf.analisar_lote(caminhos, campos=('classificacao',))}
+    assert classificacao_pdf._pool is not None
+    assert resultados[pdfs['negativa.pdf']][0] == {'classificacao': 'negativa'}
+    assert resultados[pdfs['positiva.pdf']][0] == {'classificacao': 'positiva'}
+    assert resultados[pdfs['efeito.pdf']][0] == {'classificacao': 'efeito_negativa'}
+    assert resultados[pdfs['outro.pdf']][0] == {'classificacao': 'desconhecida'}
+    assert resultados[str(quebrado)][0] is None and resultados[str(quebrado)][1]
+
+    # resultado do filho ficou no cache do processo principal
+    assert pdf.analise_em_cache(pdfs['positiva.pdf'], ('classificacao',)) == {'classificacao': 'positiva'}
+    assert pdf.classificar_status(pdfs['positiva.pdf']) == 'positiva'
+
+
+@pytest.mark.skipif(not hasattr(os, 'mkfifo'), reason='precisa de FIFO para travar o parser')
+def test_timeout_falha_so_o_arquivo_travado(pdfs, tmp_path, pool, monkeypatch):
+    # abrir uma FIFO sem escritor trava o filho; no processo principal o cache
+    # (que calcularia o hash do arquivo) fica de fora
+    travado = str(tmp_path / 'travado.pdf')
+    os.mkfifo(travado)
+    monkeypatch.setattr(classificacao_pdf.pdf, 'analise_em_cache', lambda caminho, campos: None)
+    caminhos = [travado, pdfs['negativa.pdf'], pdfs['positiva.pdf'], pdfs['outro.pdf']]
+
+    resultados = {c: (r, e) for c, r, e in classificacao_pdf.analisar_lote(
+        caminhos, campos=('classificacao',), timeout=3)}
+    assert resultados[travado][0] is None and 'excedeu' in resultados[travado][1]
+    # os outros arquivos do mesmo pool nao pagam pelo travado
+    assert resultados[pdfs['negativa.pdf']] == ({'classificacao': 'negativa'}, None)
+    assert resultados[pdfs['positiva.pdf']] == ({'classificacao': 'positiva'}, None)
+    assert resultados[pdfs['outro.pdf']] == ({'classificacao': 'desconhecida'}, None)
+
+    antigo = classificacao_pdf._pool
+    assert antigo.aposentado and antigo._encerrado  # processo travado encerrado
+    # proxima chamada vai para um pool novo
+    assert classificacao_pdf.analisar(pdfs['efeito.pdf'])['classificacao'] == 'efeito_negativa'
+    assert classificacao_pdf._pool is not antigo
+
+
+def test_fila_cheia_le_inline_na_emissao(pdfs, pool, monkeypatch):
+    def sem_vaga(*a, **kw):
+        raise classificacao_pdf.FilaCheiaError('Fila de classificacao de PDF cheia.')
+
+    monkeypatch.setattr(classificacao_pdf, '_submeter', sem_vaga)
+    # quem pede o erro (auditoria) recebe para tentar depois
+    with pytest.raises(classificacao_pdf.FilaCheiaError):
+        classificacao_pdf.analisar(pdfs['positiva.pdf'], ('classificacao',), levantar_fila_cheia=True)
+    # a emissao nao classifica errado por falta de vaga
+    assert pdf.classificar_status(pdfs['positiva.pdf']) == 'positiva'
+    assert pdf.extrair_validade_federal(pdfs['negativa.pdf']) is not None
@@ -0,0 +1,64 @@
+"""Cache de processo da configuracao e das regras municipais (services.config_cache)."""
+from sqlalchemy import text
+
+from app import db, file_manager
+from app.automation.emissao import _buscar_municipio_por_cidade
+from app.models import ConfiguracaoSistema, Municipio, TipoCertidao, get_a_vencer_dias
+from app.services import config_cache
+
+
+def test_configuracao_fica_em_cache_ate_commit(app, ids):
+    with app.app_context():
+        db.session.add(ConfiguracaoSistema(id=1, a_vencer_dias=10))
+        db.session.commit()
+        assert get_a_vencer_dias() == 10
+
+        # escrita fora do ORM nao invalida: segue o valor em cache
+        db.session.execute(text('UPDATE configuracao_sistema SET a_vencer_dias = 20'))
+        db.session.commit()
+        assert get_a_vencer_dias() == 10
+
+        versao = config_cache.versao()
+        cfg = db.session.get(ConfiguracaoSistema, 1)
+        cfg.a_vencer_dias_fgts = 30
+        db.session.commit()
+        assert config_cache.versao() == versao + 1
+        assert get_a_vencer_dias() == 20
+        assert get_a_vencer_dias(tipo=TipoCertidao.FGTS) == 30
+
+
+def test_rollback_nao_invalida(app, ids):
+    with app.app_context():
+        db.session.add(ConfiguracaoSistema(id=1, a_vencer_dias=10))
+        db.session.commit()
+        versao = config_cache.versao()
+        db.session.get(ConfiguracaoSistema, 1).a_vencer_dias = 15
+        db.session.flush()
+        db.session.rollback()
+        assert config_cache.versao() == versao
+        assert get_a_vencer_dias() == 10
+
+
+def test_post_configuracoes_troca_a_versao(app, client, ids):
+    with app.app_context():
+        assert file_manager.get_caminho_rede() == file_manager.CAMINHO_REDE
+    versao = config_cache.versao()
+    client.post('/configuracoes', data={'a_vencer_dias': '12', 'caminho_rede': r'Y:\REDE'})
+    assert config_cache.versao() > versao
+    with app.app_context():
+        assert get_a_vencer_dias() == 12
+        assert file_manager.get_caminho_rede() == r'Y:\REDE'
+
+
+def test_municipio_por_cidade_sem_acento_e_invalidado(app, ids):
+    with app.app_context():
+        db.session.add(Municipio(nome='Tramandaí', url_certidao='https://a.exemplo'))
+        db.session.commit()
+        regra = _buscar_municipio_por_cidade('TRAMANDAI ')
+        assert regra.url_certidao == 'https://a.exemplo'
+        assert _buscar_municipio_por_cidade('Osorio') is None
+
+        m = Municipio.query.filter_by(nome='Tramandaí').one()
+        m.url_certidao = 'https://b.exemplo'
+        db.session.commit()
+        assert _buscar_municipio_por_cidade('Tramandai').url_certidao == 'https://b.exemplo'
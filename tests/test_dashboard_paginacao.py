@@ -0,0 +1,94 @@
+"""Paginacao do dashboard (GET / + /api/dashboard/empresas).
+
+Filtros de status/tipo/estado/cidade/busca e a ordem sao aplicados no banco
+(sobre o agregado resumo_status) e a lista chega em paginas.
+"""
+from datetime import date, timedelta
+
+import pytest
+
+from app import db
+from app.models import Certidao, Empresa, StatusEspecial, TipoCertidao
+
+
+@pytest.fixture()
+def empresas(app, ids):
+    """Quatro empresas extras, uma por situacao, alem da 'Empresa Teste'
+    (5 certidoes sem data)."""
+    hoje = date.today()
+    cenarios = [
+        ('Alfa Vencida', 'SP', 'Santos', TipoCertidao.FGTS, hoje - timedelta(days=3), None),
+        ('Beta Valida', 'RS', 'Osorio', TipoCertidao.FEDERAL, hoje + timedelta(days=90), None),
+        ('Gama A Vencer', 'RS', 'Osorio', TipoCertidao.FEDERAL, hoje + timedelta(days=2), None),
+        ('Delta Pendente', 'RS', 'Osorio', TipoCertidao.TRABALHISTA, None, StatusEspecial.PENDENTE),
+    ]
+    with app.app_context():
+        for i, (nome, uf, cidade, tipo, validade, especial) in enumerate(cenarios):
+            emp = Empresa(nome=nome, cnpj=f'44.444.444/000{i}-44', estado=uf, cidade=cidade)
+            db.session.add(emp)
+            db.session.flush()
+            db.session.add(Certidao(tipo=tipo, empresa=emp, data_validade=validade,
+                                    status_especial=especial))
+        db.session.commit()
+
+
+def _nomes(client, query):
+    data = client.get('/api/dashboard/empresas?' + query).get_json()
+    html = data['html']
+    nomes = [n for n in ('Alfa Vencida', 'Beta Valida', 'Gama A Vencer', 'Delta Pendente', 'Empresa Teste')
+             if n in html]
+    return sorted(nomes, key=html.index), data
+
+
+def test_ordem_urgencia_paginada(client, empresas):
+    nomes, data = _nomes(client, 'por_pagina=2')
+    assert nomes == ['Alfa Vencida', 'Gama A Vencer']
+    assert data['proxima_pagina'] == 2
+
+    nomes, data = _nomes(client, 'por_pagina=2&pagina=2')
+    assert nomes == ['Delta Pendente', 'Empresa Teste']
+    nomes, data = _nomes(client, 'por_pagina=2&pagina=3')
+    assert nomes == ['Beta Valida'] and data['proxima_pagina'] is None
+
+
+def test_ordem_az_e_vencimento(client, empresas):
+    nomes, _ = _nomes(client, 'ordem=az')
+    assert nomes == ['Alfa Vencida', 'Beta Valida', 'Delta Pendente', 'Empresa Teste', 'Gama A Vencer']
+    nomes, _ = _nomes(client, 'ordem=vencimento')
+    # sem validade ficam no fim, por nome
+    assert nomes == ['Alfa Vencida', 'Gama A Vencer', 'Beta Valida', 'Delta Pendente', 'Empresa Teste']
+
+
+def test_filtros_status_tipo_e_local_no_banco(client, empresas):
+    nomes, _ = _nomes(client, 'status=vencidas&status=pendentes')
+    assert nomes == ['Alfa Vencida', 'Delta Pendente']
+    nomes, _ = _nomes(client, 'tipo=federal&status=validas')
+    assert nomes == ['Beta Valida']
+    nomes, _ = _nomes(client, 'cidade=Osorio&ordem=az')
+    assert nomes == ['Beta Valida', 'Delta Pendente', 'Gama A Vencer']
+    nomes, _ = _nomes(client, 'q=alfa')
+    assert nomes == ['Alfa Vencida']
+
+
+def test_totais_dos_chips_cobrem_o_escopo(client, empresas):
+    data = client.get('/api/dashboard/empresas?por_pagina=1&tipo=federal').get_json()
+    # status contados so no tipo filtrado; tipos contados em todos os status
+    assert data['totais']['status']['todas'] == 3
+    assert data['totais']['status']['validas'] == 1
+    assert data['totais']['status']['nao_definida'] == 1
+    assert data['totais']['tipo']['todas'] == 9
+    assert data['totais']['tipo']['federal'] == 3
+
+    so_totais = client.get('/api/dashboard/empresas?apenas_totais=1&tipo=federal').get_json()
+    assert so_totais == {'totais': data['totais']}
+
+
+def test_pagina_inicial_limitada(app, client, empresas):
+    app.config['DASHBOARD_POR_PAGINA'] = 2
+    try:
+        r = client.get('/?ordem=az')
+    finally:
+        app.config['DASHBOARD_POR_PAGINA'] = 50
+    assert b'Alfa Vencida' in r.data and b'Beta Valida' in r.data
+    assert b'Delta Pendente' not in r.data
+    assert b'data-proxima-pagina="2"' in r.data
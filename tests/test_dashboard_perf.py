@@ -1,7 +1,7 @@
 """Testes para as otimizações de performance do dashboard (perf/dashboard-filters).
 
 Cobre:
-- _get_config_cached: caching por contexto de app (flask.g)
+- _get_config_cached: cache de processo da configuracao (config_cache)
 - Rota GET / (dashboard): renderiza sem erro, filtro de cidade funciona
 - Rota GET /certidao/<id>/token-visualizar: lazy token
 """
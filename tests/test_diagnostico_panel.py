@@ -1,4 +1,6 @@
 """Testes da persistencia e das rotas do painel de diagnostico."""
+import queue
+
 from app import db
 from app.services import diagnostics
 
@@ -31,3 +33,67 @@ def test_rota_pagina_diagnostico(client):
     r = client.get('/diagnostico')
     assert r.status_code == 200
     assert 'Diagn'.encode() in r.data
+
+
+def test_escritora_grava_em_lote_e_conta_descartes(app, ids, monkeypatch):
+    monkeypatch.setattr(diagnostics, '_fila', queue.Queue(maxsize=3))
+    monkeypatch.setattr(diagnostics, '_writer_iniciado', True)
+    monkeypatch.setattr(diagnostics, '_descartados', 0)
+    monkeypatch.setattr(diagnostics, '_LOTE_ESPERA_SEGUNDOS', 0.05)
+    diagnostics.limpar()
+
+    for i in range(5):
+        diagnostics.registrar({'event': 'rs_emit_error', 'level': 'ERROR', 'error_type': 'PORTAL',
+                               'message': f'falha {i}'})
+    diagnostics.registrar({'event': 'rs_ok', 'level': 'INFO'})  # INFO nao e persistido
+    stats = diagnostics.estatisticas_persistencia()
+    assert (stats['pendentes'], stats['descartados']) == (3, 2)
+
+    lote = diagnostics._coletar_lote(0.1)
+    assert len(lote) == 3
+    with app.app_context():
+        assert diagnostics.gravar_lote(lote) == 3
+        from app.models import EventoDiagnostico
+        assert [e.mensagem for e in EventoDiagnostico.query.order_by(EventoDiagnostico.id)] == [
+            'falha 0', 'falha 1', 'falha 2',
+        ]
+        EventoDiagnostico.query.delete()
+        db.session.commit()
+    assert diagnostics._coletar_lote(0.01) == []
+
+
+def test_historico_filtrado_paginado_e_delta(app, ids, client):
+    with app.app_context():
+        diagnostics.gravar_lote([
+            ({'event': 'rs_emit_error', 'level': 'ERROR', 'error_type': 'PORTAL',
+              'execution_id': 'lote-1', 'certidao_id': ids['rs'], 'message': f'rs {i}'}, None)
+            for i in range(5)
+        ] + [({'event': 'fgts_emit_error', 'level': 'WARNING', 'error_type': 'TIMEOUT',
+               'execution_id': 'lote-2', 'message': 'fgts'}, None)])
+
+    pagina = client.get('/diagnostico/eventos?execution_id=lote-1&limite=2').get_json()
+    assert pagina['fonte'] == 'banco'
+    assert [e['mensagem'] for e in pagina['eventos']] == ['rs 4', 'rs 3']
+    vistos = [e['mensagem'] for e in pagina['eventos']]
+    while pagina['proximo_cursor']:
+        pagina = client.get(
+            f'/diagnostico/eventos?execution_id=lote-1&limite=2&antes_de={pagina["proximo_cursor"]}'
+        ).get_json()
+        vistos += [e['mensagem'] for e in pagina['eventos']]
+    assert vistos == ['rs 4', 'rs 3', 'rs 2', 'rs 1', 'rs 0']
+
+    filtrado = client.get(f'/diagnostico/eventos?certidao_id={ids["rs"]}&nivel=error').get_json()
+    assert len(filtrado['eventos']) == 5
+    assert client.get('/diagnostico/eventos?alvo=FGTS').get_json()['eventos'][0]['error_type'] == 'TIMEOUT'
+    assert client.get('/diagnostico/eventos?certidao_id=abc').status_code == 400
+
+    ultimo = client.get('/diagnostico/eventos').get_json()['ultimo_id']
+    delta = client.get(f'/diagnostico/eventos?desde_id={ultimo}').get_json()
+    assert delta['eventos'] == [] and delta['ultimo_id'] == ultimo
+    with app.app_context():
+        diagnostics.gravar_evento({'event': 'municipal_emit_error', 'level': 'ERROR', 'message': 'novo'})
+        diagnostics.gravar_evento({'event': 'municipal_emit_error', 'level': 'ERROR', 'message': 'novo 2'})
+    delta = client.get(f'/diagnostico/eventos?desde_id={ultimo}').get_json()
+    assert [e['mensagem'] for e in delta['eventos']] == ['novo 2', 'novo']
+    assert delta['ultimo_id'] == ultimo + 2 and delta['truncado'] is False
+    assert client.get(f'/diagnostico/eventos?desde_id={ultimo}&limite=1').get_json()['truncado'] is True
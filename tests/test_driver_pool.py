@@ -0,0 +1,164 @@
+"""Testes do pool de navegadores aquecidos (driver.DriverPool).
+
+Usa drivers falsos (sem Chrome): cobre reuso, reciclagem por limite de usos
+ou falha, descarte de ocioso morto, tipos exclusivos e pool desligado.
+"""
+import time
+
+import pytest
+
+from app.automation import driver as drv
+
+
+class FakeDriver:
+    def __init__(self):
+        self.vivo = True
+        self.quit_called = 0
+        self.handles = ['w1']
+        self.urls = []
+        self.cdp = []
+        self.switch_to = self
+
+    @property
+    def window_handles(self):
+        if not self.vivo:
+            raise RuntimeError('sessao encerrada')
+        return list(self.handles)
+
+    def window(self, handle):
+        self.atual = handle
+
+    def close(self):
+        self.handles.remove(self.atual)
+
+    def execute_cdp_cmd(self, cmd, params):
+        self.cdp.append(cmd)
+
+    def get(self, url):
+        self.urls.append(url)
+
+    def minimize_window(self):
+        pass
+
+    def maximize_window(self):
+        pass
+
+    def quit(self):
+        self.quit_called += 1
+        self.vivo = False
+
+
+class Fabrica:
+    def __init__(self):
+        self.criados = []
+
+    def __call__(self):
+        d = FakeDriver()
+        self.criados.append(d)
+        return d
+
+
+@pytest.fixture()
+def pool_ativo(monkeypatch):
+    def _ligar(tamanho=1, max_usos=3):
+        monkeypatch.setattr(drv, '_driver_pool_config', lambda: (True, tamanho, max_usos))
+    monkeypatch.setattr(drv, '_POOLS', {})
+    return _ligar
+
+
+def test_pool_desligado_cria_e_encerra(monkeypatch):
+    monkeypatch.setattr(drv, '_driver_pool_config', lambda: (False, 2, 20))
+    fab = Fabrica()
+    d1 = drv.obter_driver('incognito', fab)
+    drv.devolver_driver(d1)
+    d2 = drv.obter_driver('incognito', fab)
+    assert d1 is not d2
+    assert d1.quit_called == 1
+
+
+def test_reuso_de_perfil_exclusivo(pool_ativo):
+    pool_ativo()
+    fab = Fabrica()
+    d1 = drv.obter_driver('rs_cert', fab)
+    d1.handles.append('w2')  # aba extra aberta pelo portal
+    drv.devolver_driver(d1)
+    assert d1.quit_called == 0
+    assert d1.handles == ['w1'] and d1.urls[-1] == 'about:blank'
+    # perfil persistente: cookies preservados
+    assert 'Network.clearBrowserCookies' not in d1.cdp
+
+    d2 = drv.obter_driver('rs_cert', fab)
+    assert d2 is d1
+    assert len(fab.criados) == 1  # nada pre-lancado para tipo exclusivo
+
+
+def test_incognito_limpa_cookies_e_aquece_em_background(pool_ativo):
+    pool_ativo(tamanho=1)
+    fab = Fabrica()
+    d1 = drv.obter_driver('incognito', fab)
+    pool = drv._POOLS['incognito']
+    for _ in range(100):
+        if pool._ociosos:
+            break
+        time.sleep(0.01)
+    assert len(fab.criados) == 2  # o entregue + 1 aquecido
+    d2 = drv.obter_driver('incognito', fab)
+    assert d2 is fab.criados[1]
+
+    pool_ativo(tamanho=2)
+    drv.devolver_driver(d1)
+    assert 'Network.clearBrowserCookies' in d1.cdp
+
+
+def test_recicla_apos_max_usos(pool_ativo):
+    pool_ativo(max_usos=2)
+    fab = Fabrica()
+    d = drv.obter_driver('municipal_uc', fab)
+    drv.devolver_driver(d)
+    assert drv.obter_driver('municipal_uc', fab) is d
+    drv.devolver_driver(d)  # 2o uso -> reciclado
+    for _ in range(100):
+        if d.quit_called:
+            break
+        time.sleep(0.01)
+    assert d.quit_called == 1
+    assert drv.obter_driver('municipal_uc', fab) is not d
+
+
+def test_falha_recicla_e_devolucao_idempotente(pool_ativo):
+    pool_ativo()
+    fab = Fabrica()
+    d = drv.obter_driver('rs_cert', fab)
+    drv.devolver_driver(d, falhou=True)
+    for _ in range(100):
+        if d.quit_called:
+            break
+        time.sleep(0.01)
+    assert d.quit_called >= 1
+    assert not drv._POOLS['rs_cert'].possui(d)
+
+    ok = drv.obter_driver('rs_cert', fab)
+    drv.devolver_driver(ok)
+    drv.devolver_driver(ok)  # finally apos devolucao: ignorado
+    assert drv._POOLS['rs_cert']._ociosos == [ok]
+
+
+def test_ocioso_morto_e_descartado_no_obter(pool_ativo):
+    pool_ativo()
+    fab = Fabrica()
+    d = drv.obter_driver('rs_cert', fab)
+    drv.devolver_driver(d)
+    d.vivo = False  # operador fechou a janela ociosa
+    novo = drv.obter_driver('rs_cert', fab)
+    assert novo is not d
+    assert len(fab.criados) == 2
+
+
+def test_descartar_ociosos_libera_perfil(pool_ativo):
+    pool_ativo()
+    fab = Fabrica()
+    d = drv.obter_driver('rs_cert', fab)
+    drv.devolver_driver(d)
+    assert drv.descartar_ociosos('rs_cert') == 1
+    assert d.quit_called == 1
+    assert drv.descartar_ociosos('municipal_uc') == 0
@@ -1,7 +1,7 @@
 """Testes de funcoes puras de emissao.py — sem Selenium, sem rede.
 
 Cobre suporte de lote municipal, normalizacao de texto, deteccao de
-impedimento FGTS (driver falso) e o diff de downloads (snapshot/pick).
+impedimento FGTS (driver falso) e a pasta de download por emissao.
 """
 import os
 from datetime import date, timedelta
@@ -71,54 +71,26 @@ def test_fgts_status_por_data(app):
         assert emissao._fgts_status_por_data(date.today() - timedelta(days=1)) == 'status-vermelho'
 
 
-def test_snapshot_downloads_pdf(tmp_path, monkeypatch):
-    downloads = tmp_path / 'Downloads'
-    downloads.mkdir()
-    (downloads / 'cert.pdf').write_bytes(b'%PDF-1.4 conteudo')
-    (downloads / 'parcial.crdownload').write_bytes(b'x')
-    (downloads / 'temp.tmp').write_bytes(b'x')
-    (downloads / 'nota.txt').write_bytes(b'x')
-    (downloads / 'subdir').mkdir()
-
+def test_iniciar_monitor_usa_pasta_da_emissao(tmp_path, monkeypatch):
+    monkeypatch.setenv('DOWNLOADS_EMISSAO_DIR', str(tmp_path / 'emissoes'))
+    driver = MagicMock()
+    monitor = emissao._iniciar_monitor_download(driver, 7)
+    try:
+        assert os.path.dirname(monitor.pasta) == str(tmp_path / 'emissoes')
+        assert os.path.basename(monitor.pasta).startswith('7-')
+        args = driver.execute_cdp_cmd.call_args_list[0][0]
+        assert args[0] == 'Page.setDownloadBehavior' and args[1]['downloadPath'] == monitor.pasta
+    finally:
+        monitor.fechar()
+    assert not os.path.exists(monitor.pasta)
+
+
+def test_iniciar_monitor_sem_cdp_observa_downloads(tmp_path, monkeypatch):
+    monkeypatch.setenv('DOWNLOADS_EMISSAO_DIR', str(tmp_path / 'emissoes'))
     monkeypatch.setattr(os.path, 'expanduser', lambda _p: str(tmp_path))
-    snap = emissao._snapshot_downloads_pdf()
-
-    nomes = {os.path.basename(p) for p in snap}
-    assert nomes == {'cert.pdf'}
-    info = next(iter(snap.values()))
-    assert 'mtime' in info and 'size' in info
-
-
-def test_pick_changed_download_arquivo_novo(monkeypatch):
-    antes = {'/dl/a.pdf': {'mtime': 100.0, 'size': 10}}
-    agora = {
-        '/dl/a.pdf': {'mtime': 100.0, 'size': 10},
-        '/dl/b.pdf': {'mtime': 200.0, 'size': 20},
-    }
-    monkeypatch.setattr(emissao, '_snapshot_downloads_pdf', lambda: agora)
-    assert emissao._pick_changed_download_pdf(antes) == '/dl/b.pdf'
-
-
-def test_pick_changed_download_modificado(monkeypatch):
-    antes = {'/dl/a.pdf': {'mtime': 100.0, 'size': 10}}
-    agora = {'/dl/a.pdf': {'mtime': 150.0, 'size': 10}}
-    monkeypatch.setattr(emissao, '_snapshot_downloads_pdf', lambda: agora)
-    assert emissao._pick_changed_download_pdf(antes) == '/dl/a.pdf'
-
-
-def test_pick_changed_download_sem_mudanca(monkeypatch):
-    antes = {'/dl/a.pdf': {'mtime': 100.0, 'size': 10}}
-    agora = {'/dl/a.pdf': {'mtime': 100.0, 'size': 10}}
-    monkeypatch.setattr(emissao, '_snapshot_downloads_pdf', lambda: agora)
-    assert emissao._pick_changed_download_pdf(antes) is None
-
-
-def test_pick_changed_download_mais_recente(monkeypatch):
-    antes = {}
-    agora = {
-        '/dl/a.pdf': {'mtime': 100.0, 'size': 10},
-        '/dl/b.pdf': {'mtime': 300.0, 'size': 20},
-        '/dl/c.pdf': {'mtime': 200.0, 'size': 30},
-    }
-    monkeypatch.setattr(emissao, '_snapshot_downloads_pdf', lambda: agora)
-    assert emissao._pick_changed_download_pdf(antes) == '/dl/b.pdf'
+    driver = MagicMock()
+    driver.execute_cdp_cmd.side_effect = RuntimeError('sem cdp')
+    monitor = emissao._iniciar_monitor_download(driver, 7)
+    monitor.fechar()
+    assert monitor.pasta == str(tmp_path / 'Downloads')
+    assert os.listdir(tmp_path / 'emissoes') == []
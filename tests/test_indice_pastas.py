@@ -0,0 +1,123 @@
+"""Indice das pastas de empresa na rede e memo empresa -> pasta (file_manager)."""
+import json
+import os
+import threading
+
+import pytest
+
+from app import db, file_manager
+from app.models import Certidao, PastaEmpresa
+from app.services import indice_pastas
+
+
+@pytest.fixture()
+def rede(tmp_path, monkeypatch, app):
+    base = tmp_path / 'rede'
+    base.mkdir()
+    for nome in ('EMPRESA TESTE', 'EMPRESA TESTE FILIAL', 'CONSTRUÇÕES SÃO JOSÉ LTDA', 'OUTRA COISA'):
+        (base / nome).mkdir()
+    (base / 'EMPRESA TESTE' / 'DOCUMENTOS EMPRESA').mkdir()
+    indice_file = tmp_path / 'pastas_indice.json'
+    monkeypatch.setattr(file_manager, 'CAMINHO_REDE', str(base))
+    monkeypatch.setenv('PASTAS_INDICE_FILE', str(indice_file))
+    monkeypatch.setitem(app.config, 'PASTAS_INDICE_FILE', str(indice_file))
+    indice_pastas.limpar()
+    yield base
+    indice_pastas.limpar()
+
+
+@pytest.fixture()
+def listdir_contado(monkeypatch):
+    chamadas = []
+    original = os.listdir
+
+    def contar(caminho='.'):
+        chamadas.append(str(caminho))
+        return original(caminho)
+
+    monkeypatch.setattr(os, 'listdir', contar)
+    return chamadas
+
+
+def test_match_usa_indice_sem_relistar(rede, listdir_contado):
+    assert file_manager.buscar_na_pasta_especifica(str(rede), 'Empresa Teste') == str(rede / 'EMPRESA TESTE')
+    assert file_manager.buscar_na_pasta_especifica(str(rede), 'Construcoes Sao Jose') == \
+        str(rede / 'CONSTRUÇÕES SÃO JOSÉ LTDA')
+    assert listdir_contado.count(str(rede)) == 1
+    # sem match na listagem em cache: confere a rede uma vez e memoriza
+    assert file_manager.buscar_na_pasta_especifica(str(rede), 'Inexistente SA') is None
+    assert file_manager.buscar_na_pasta_especifica(str(rede), 'Inexistente SA') is None
+    assert listdir_contado.count(str(rede)) == 2
+
+    # pasta nova muda o mtime da base: relista uma vez
+    (rede / 'NOVA EMPRESA').mkdir()
+    os.utime(rede, (os.stat(rede).st_atime, os.stat(rede).st_mtime + 5))
+    assert file_manager.buscar_na_pasta_especifica(str(rede), 'Nova Empresa') == str(rede / 'NOVA EMPRESA')
+    assert listdir_contado.count(str(rede)) == 3
+
+
+def test_memorizar_match_respeita_o_lock_do_indice(rede):
+    indice, _ = indice_pastas.obter_indice(str(rede))
+    with indice_pastas._lock:
+        t = threading.Thread(target=indice_pastas.memorizar_match, args=(indice, 'Empresa X', None))
+        t.start()
+        t.join(0.1)
+        assert t.is_alive() and 'EMPRESA X' not in indice['matches']
+    t.join(1)
+    assert indice_pastas.match_memorizado(indice, 'empresa x ') == (True, None)
+
+
+def test_indice_persiste_em_disco(rede, tmp_path, listdir_contado):
+    file_manager.buscar_na_pasta_especifica(str(rede), 'Empresa Teste')
+    dados = json.loads((tmp_path / 'pastas_indice.json').read_text(encoding='utf-8'))
+    assert 'OUTRA COISA' in [p['pasta'] for p in dados[str(rede)]['pastas']]
+
+    # "reinicio": memoria limpa, indice volta do disco sem listar a rede
+    indice_pastas.limpar()
+    assert file_manager.buscar_na_pasta_especifica(str(rede), 'Outra Coisa') == str(rede / 'OUTRA COISA')
+    assert listdir_contado.count(str(rede)) == 1
+
+
+def test_caminho_final_lista_a_empresa_uma_vez(rede, listdir_contado):
+    caminho_empresa = str(rede / 'EMPRESA TESTE')
+    esperado = os.path.join(caminho_empresa, 'DOCUMENTOS EMPRESA', 'CERTIDOES')
+    assert file_manager.encontrar_caminho_final(caminho_empresa) == esperado
+    assert file_manager.encontrar_caminho_final(caminho_empresa) == esperado
+    assert listdir_contado.count(caminho_empresa) == 1
+
+
+def test_memo_em_banco_por_empresa(app, ids, rede, tmp_path, listdir_contado):
+    origem = tmp_path / 'download.pdf'
+    origem.write_bytes(b'%PDF-1.4')
+    with app.app_context():
+        cert = db.session.get(Certidao, ids['fgts'])
+        ok, destino = file_manager.mover_e_renomear(
+            str(origem), cert.empresa.nome, 'FGTS', empresa_id=cert.empresa_id)
+        assert ok and os.path.isfile(destino)
+        db.session.commit()
+        memo = db.session.get(PastaEmpresa, ids['empresa'])
+        assert memo.caminho_certidoes == os.path.dirname(destino)
+
+        # sem cache em memoria, o memo em banco evita listar a rede
+        indice_pastas.limpar()
+        listdir_contado.clear()
+        assert file_manager.localizar_certidao_existente(
+            cert.empresa.nome, 'FGTS', empresa_id=cert.empresa_id) == destino
+        assert str(rede) not in listdir_contado
+
+        # empresa renomeada: memo nao vale mais
+        assert file_manager.resolver_pasta_certidoes('Outra Coisa', empresa_id=cert.empresa_id) == \
+            os.path.join(str(rede / 'OUTRA COISA'), 'CERTIDOES')
+
+
+def test_memo_em_banco_invalido_se_pasta_some(app, ids, rede):
+    with app.app_context():
+        fantasma = rede / 'SUMIU' / 'CERTIDOES'
+        db.session.add(PastaEmpresa(
+            empresa_id=ids['empresa'], nome_empresa='Empresa Teste', caminho_rede=str(rede),
+            caminho_empresa=str(rede / 'SUMIU'), caminho_certidoes=str(fantasma)))
+        db.session.commit()
+        destino = file_manager.resolver_pasta_certidoes('Empresa Teste', empresa_id=ids['empresa'])
+        assert destino == os.path.join(str(rede / 'EMPRESA TESTE'), 'DOCUMENTOS EMPRESA', 'CERTIDOES')
+        db.session.commit()
+        assert db.session.get(PastaEmpresa, ids['empresa']).caminho_certidoes == destino
@@ -1,8 +1,11 @@
-"""Testes do HumanFormatter (saida legivel do console)."""
+"""Testes do HumanFormatter (saida legivel do console) e do pipeline de log."""
+import json
 import logging
+import queue
 from datetime import datetime
 
-from app.services.execution_logger import HumanFormatter
+from app.services import execution_logger
+from app.services.execution_logger import HumanFormatter, _ArquivoEmLote, _Escoador, _PayloadJson
 
 
 def _registro(payload):
@@ -46,3 +49,80 @@ def test_human_formatter_colore_por_nivel():
 def test_human_formatter_sem_payload_cai_para_mensagem():
     rec = logging.LogRecord('certidoes', logging.INFO, __file__, 0, 'texto cru', None, None)
     assert HumanFormatter(usar_cor=False).format(rec) == 'texto cru'
+
+
+def test_arquivo_em_lote_grava_por_bloco_e_no_ocioso(tmp_path):
+    destino = tmp_path / 'app.jsonl'
+    arquivo = _ArquivoEmLote(str(destino), maxBytes=0, encoding='utf-8', lote=3)
+    arquivo.setFormatter(logging.Formatter('%(message)s'))
+    fila = queue.SimpleQueue()
+    listener = _Escoador(fila, arquivo, intervalo=0.05)
+
+    def _rec(n, nivel=logging.INFO):
+        payload = {'event': f'e{n}'}
+        rec = logging.LogRecord('certidoes', nivel, __file__, 0, _PayloadJson(payload), None, None)
+        rec.payload = payload
+        return rec
+
+    for n in range(2):
+        arquivo.handle(_rec(n))
+    assert destino.read_text(encoding='utf-8') == ''   # abaixo do lote: ainda em memoria
+    arquivo.handle(_rec(2))
+    assert len(destino.read_text(encoding='utf-8').splitlines()) == 3
+    arquivo.handle(_rec(3, logging.ERROR))                # erro descarrega na hora
+    assert json.loads(destino.read_text(encoding='utf-8').splitlines()[-1]) == {'event': 'e3'}
+
+    listener.start()
+    fila.put(_rec(4))
+    listener.stop()
+    assert len(destino.read_text(encoding='utf-8').splitlines()) == 5
+    arquivo.close()
+
+
+def test_amostragem_mantem_um_a_cada_n_e_nunca_descarta_erro(monkeypatch):
+    monkeypatch.setattr(execution_logger, '_amostragem', {})
+    monkeypatch.setattr(execution_logger, '_contagens', {})
+    execution_logger.definir_amostragem('federal_monitor_waiting:3, invalido:x, outro:1')
+    assert execution_logger._amostragem == {'federal_monitor_waiting': 3}
+
+    mantidos = [execution_logger._amostrado('federal_monitor_waiting', 'INFO') for _ in range(7)]
+    assert mantidos == [3, 0, 0, 3, 0, 0, 3]
+    assert execution_logger._amostrado('federal_monitor_waiting', 'ERROR') is None
+    assert execution_logger._amostrado('fgts_emit_success', 'INFO') is None
+
+
+def test_amostragem_so_na_saida_diagnostico_ve_todos(monkeypatch):
+    monkeypatch.setattr(execution_logger, '_amostragem', {})
+    monkeypatch.setattr(execution_logger, '_contagens', {})
+    execution_logger.definir_amostragem('federal_monitor_waiting:3')
+
+    class _Coleta(logging.Handler):
+        def __init__(self):
+            super().__init__()
+            self.payloads = []
+
+        def emit(self, record):
+            self.payloads.append(record.payload)
+
+    logger = logging.getLogger('teste_amostragem_saida')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    saida, diagnostico = _Coleta(), _Coleta()
+    saida.addFilter(execution_logger._FiltroAmostragem())
+    outra_saida = _Coleta()
+    outra_saida.addFilter(execution_logger._FiltroAmostragem())
+    for handler in (saida, outra_saida, diagnostico):
+        logger.addHandler(handler)
+    try:
+        for i in range(6):
+            payload = {'event': 'federal_monitor_waiting', 'level': 'INFO', 'i': i}
+            logger.info(execution_logger._PayloadJson(payload), extra={'payload': payload})
+    finally:
+        for handler in (saida, outra_saida, diagnostico):
+            logger.removeHandler(handler)
+
+    # a decisao vale por registro: os dois handlers de saida mantem os mesmos
+    assert [p['i'] for p in saida.payloads] == [0, 3]
+    assert [p['i'] for p in outra_saida.payloads] == [0, 3]
+    assert all(p['amostragem'] == 3 for p in saida.payloads)
+    assert [p['i'] for p in diagnostico.payloads] == list(range(6))
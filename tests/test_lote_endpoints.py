@@ -50,13 +50,16 @@ def test_iniciar_vazio_ou_precondicao(client, ids):
     assert 'RS_ALTCHA_AUTOSOLVE_ENABLED' in r.get_json()['message'], r.get_json()['message']
 
 
-def test_iniciar_bloqueado_por_emissao_individual(client, ids):
-    from app.automation import batch_state
-    batch_state.marcar_emissao_individual(True)
+def test_emissao_individual_nao_bloqueia_iniciar_lote(client, ids):
+    # o agendador so enfileira por recurso: emissao individual com o perfil RS
+    # nao impede o lote FGTS de seguir para as validacoes dele
+    from app.services import agendador
+    reserva = agendador.reservar('Emissão individual #1', {'perfil_rs': 1, 'navegador': 1},
+                                 tipo='individual', timeout=0)
     try:
         r = client.post('/fgts/lote/iniciar', json={'certidao_id': ids['fgts']})
     finally:
-        batch_state.marcar_emissao_individual(False)
+        reserva.liberar()
     assert r.status_code == 400, r.status_code
-    assert r.get_json()['status'] == 'error'
-    assert 'individual' in r.get_json()['message'].lower()
+    assert 'individual' not in r.get_json()['message'].lower()
+    assert 'FGTS' in r.get_json()['message']
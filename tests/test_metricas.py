@@ -0,0 +1,59 @@
+"""Registro de metricas em processo e endpoint /metrics (services.metricas)."""
+import pytest
+
+from app.services import metricas
+from app.services.execution_logger import log_event
+
+
+@pytest.fixture(autouse=True)
+def registro_limpo():
+    metricas.limpar()
+    yield
+    metricas.limpar()
+
+
+def test_eventos_de_log_alimentam_contadores_e_histogramas(app):
+    log_event('fgts_emit_success', certidao_id=1, duration_ms=4000, status='ok')
+    log_event('fgts_emit_success', certidao_id=2, duration_ms=6000, status='ok')
+    log_event('rs_batch_stage', stage='login', duration_ms=9000, etapa_ms=1500)
+    log_event('municipal_emit_error', level='ERROR', municipio='Gravataí', duration_ms=70000)
+    log_event('startup_health_checks', checks={})
+
+    dados = metricas.exportar_json()
+    eventos = {(e['event'], e['level']): e['total'] for e in dados['eventos']}
+    assert eventos[('fgts_emit_success', 'INFO')] == 2
+    assert eventos[('municipal_emit_error', 'ERROR')] == 1
+
+    series = {(d['event'], d['stage'], d['portal'], d['municipio']): d for d in dados['duracoes']}
+    fgts = series[('fgts_emit_success', '', 'FGTS', '')]
+    assert (fgts['contagem'], fgts['total_ms'], fgts['max_ms']) == (2, 10000, 6000)
+    assert 2500 < fgts['p50_ms'] <= 5000
+    # etapa_ms (tempo so da etapa) tem precedencia sobre o acumulado
+    assert series[('rs_batch_stage', 'login', 'RS', '')]['total_ms'] == 1500
+    assert series[('municipal_emit_error', '', 'MUNI', 'Gravataí')]['p95_ms'] == 70000
+    # a serie com mais tempo total vem primeiro
+    assert dados['duracoes'][0]['event'] == 'municipal_emit_error'
+
+
+def test_endpoint_prometheus_e_json(client):
+    log_event('arquivo_movido', duration_ms=120)
+    log_event('arquivo_movido', duration_ms=400000)
+
+    resp = client.get('/metrics')
+    assert resp.status_code == 200
+    assert resp.content_type.startswith('text/plain; version=0.0.4')
+    texto = resp.get_data(as_text=True)
+    assert '# TYPE certidoes_duracao_ms histogram' in texto
+    assert 'certidoes_duracao_ms_bucket{event="arquivo_movido",le="100"} 0' in texto
+    assert 'certidoes_duracao_ms_bucket{event="arquivo_movido",le="250"} 1' in texto
+    assert 'certidoes_duracao_ms_bucket{event="arquivo_movido",le="+Inf"} 2' in texto
+    assert 'certidoes_duracao_ms_sum{event="arquivo_movido"} 400120' in texto
+    assert 'certidoes_duracao_ms_count{event="arquivo_movido"} 2' in texto
+    assert 'certidoes_eventos_total{event="arquivo_movido",level="INFO"} 2' in texto
+
+    dados = client.get('/metrics?format=json').get_json()
+    assert dados['status'] == 'ok'
+    assert dados['duracoes'][0]['contagem'] == 2
+    # coleta do /metrics nao gera http_request
+    texto = client.get('/metrics').get_data(as_text=True)
+    assert 'event="http_request"' not in texto
@@ -0,0 +1,144 @@
+"""Metricas dos solvers de captcha e polling adaptativo (services.metricas_captcha)."""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from twocaptcha import NetworkException, TimeoutException
+
+from app import captcha_solver, db
+from app.models import ResolucaoCaptcha
+from app.services import metricas_captcha
+
+
+@pytest.fixture(autouse=True)
+def janelas_limpas():
+    metricas_captcha.limpar()
+    yield
+    metricas_captcha.limpar()
+
+
+def test_agenda_padrao_ate_ter_amostras_e_depois_segue_a_distribuicao():
+    assert metricas_captcha.agenda_polling('altcha', 10) == (5.0, 10.0, 0.0, 10.0)
+
+    for segundos in range(20, 41):  # 20s..40s: p50=30s, p95=39s
+        metricas_captcha.registrar('altcha', True, segundos * 1000)
+    metricas_captcha.registrar('altcha', False, 500)  # falha nao entra na janela
+
+    espera, rapido, fim_rapido, padrao = metricas_captcha.agenda_polling('altcha', 10)
+    assert espera == pytest.approx(30.0)
+    assert rapido == pytest.approx(5.0)
+    assert fim_rapido == pytest.approx(39.0)
+    assert padrao == 10.0
+    # outro solver continua no padrao
+    assert metricas_captcha.agenda_polling('normal_captcha', 10)[0] == 5.0
+
+
+class _ClienteLento:
+    def __init__(self, prontos_apos):
+        self.restantes = prontos_apos
+
+    async def get_result(self, id_):
+        if self.restantes:
+            self.restantes -= 1
+            raise NetworkException('CAPCHA_NOT_READY')
+        return 'token'
+
+
+def test_wait_result_adaptativo_conta_consultas(monkeypatch):
+    monkeypatch.setattr(metricas_captcha, 'agenda_polling', lambda nome, padrao: (0.01, 0.01, 1.0, 0.05))
+
+    cliente = _ClienteLento(prontos_apos=3)
+    contador = captcha_solver._polling_adaptativo(cliente, 'altcha')
+    assert asyncio.run(cliente.wait_result('1', 5, 10)) == 'token'
+    assert contador['consultas'] == 4
+
+    cliente = _ClienteLento(prontos_apos=1000)
+    contador = captcha_solver._polling_adaptativo(cliente, 'altcha')
+    with pytest.raises(TimeoutException):
+        asyncio.run(cliente.wait_result('1', 0.2, 10))
+    assert contador['consultas'] >= 2
+
+
+class _FakeAsyncTwoCaptcha:
+    falhas = []
+
+    def __init__(self, **kwargs):
+        pass
+
+    async def altcha(self, **payload):
+        if self.falhas:
+            raise self.falhas.pop(0)
+        return {'captchaId': '1', 'code': 'token-altcha'}
+
+
+def test_resolucao_registra_tentativas_e_falhas(monkeypatch):
+    monkeypatch.setattr(captcha_solver, 'AsyncTwoCaptcha', _FakeAsyncTwoCaptcha)
+    registros = []
+    monkeypatch.setattr(metricas_captcha, 'registrar', lambda *a, **kw: registros.append((a, kw)))
+    config = {'CAPTCHA_2_API_KEY': 'chave'}
+
+    _FakeAsyncTwoCaptcha.falhas = [TimeoutError('timeout 180 exceeded')]
+    captcha_solver.solve_altcha(config, 'https://rs', challenge_url='https://rs/c', execution_id='lote-1')
+    (solver, sucesso, _duracao), kw = registros[-1]
+    assert (solver, sucesso, kw['tentativas'], kw['execution_id']) == ('altcha', True, 2, 'lote-1')
+
+    _FakeAsyncTwoCaptcha.falhas = [ValueError('ERROR_ZERO_BALANCE')]
+    with pytest.raises(captcha_solver.AltchaSolverRuntimeError):
+        captcha_solver.solve_altcha(config, 'https://rs', challenge_url='https://rs/c', execution_id='lote-1')
+    (solver, sucesso, _duracao), kw = registros[-1]
+    assert sucesso is False and kw['error_type']
+
+
+def test_resumo_por_solver_e_por_lote(app, client):
+    agora = datetime.utcnow()
+    with app.app_context():
+        for i, duracao in enumerate([10_000, 20_000, 30_000, 40_000]):
+            db.session.add(ResolucaoCaptcha(
+                solver='altcha', sucesso=True, duracao_ms=duracao, tentativas=1 + (i == 0),
+                consultas=2, execution_id='lote-a', criado_em=agora - timedelta(minutes=10 - i),
+            ))
+        db.session.add(ResolucaoCaptcha(
+            solver='altcha', sucesso=False, duracao_ms=180_000, tentativas=3, consultas=18,
+            error_type='TIMEOUT', execution_id='lote-a', criado_em=agora - timedelta(minutes=5),
+        ))
+        db.session.add(ResolucaoCaptcha(
+            solver='normal_captcha', sucesso=True, duracao_ms=8_000, consultas=1,
+            execution_id='lote-b', criado_em=agora - timedelta(minutes=1),
+        ))
+        # fora da janela
+        db.session.add(ResolucaoCaptcha(
+            solver='altcha', sucesso=True, duracao_ms=1, criado_em=agora - timedelta(days=60),
+        ))
+        db.session.commit()
+
+    app.config['CAPTCHA_2_PRECO_MIL_ALTCHA'] = 2.0
+    app.config['CAPTCHA_2_PRECO_MIL_NORMAL'] = 1.0
+    dados = client.get('/diagnostico/captcha').get_json()
+    altcha = dados['solvers']['altcha']
+    assert altcha['resolucoes'] == 5 and altcha['sucessos'] == 4
+    assert altcha['taxa_sucesso'] == 0.8
+    assert (altcha['p50_ms'], altcha['p95_ms']) == (25_000, 38_500)
+    assert altcha['retries'] == 3 and altcha['consultas'] == 26
+    assert altcha['custo_estimado'] == 0.008
+
+    assert [e['execution_id'] for e in dados['execucoes']] == ['lote-b', 'lote-a']
+    assert dados['execucoes'][1]['custo_estimado'] == 0.008
+    assert dados['execucoes'][0]['custo_estimado'] == 0.001
+
+
+def test_fila_limitada_e_gravacao_em_lote(app, ids, monkeypatch):
+    fila = metricas_captcha.queue.Queue(maxsize=3)
+    monkeypatch.setattr(metricas_captcha, '_fila', fila)
+    monkeypatch.setattr(metricas_captcha, '_writer_iniciado', True)
+    monkeypatch.setattr(metricas_captcha, '_descartados', 0)
+
+    for i in range(5):
+        metricas_captcha.registrar('altcha', True, 1_000 * (i + 1), execution_id='lote-q')
+    assert fila.qsize() == 3
+    assert metricas_captcha._descartados == 2
+
+    lote = metricas_captcha.coletar_lote(fila, 0.1)
+    with app.app_context():
+        assert metricas_captcha.gravar_lote(lote) == 3
+        assert ResolucaoCaptcha.query.filter_by(execution_id='lote-q').count() == 3
+        assert metricas_captcha.resumo(app.config)['descartados'] == 2
@@ -0,0 +1,107 @@
+"""Deteccao de download concluido (services.monitor_download): inotify no
+Linux e varredura como fallback."""
+import os
+import threading
+import time
+
+import pytest
+
+from app.services import monitor_download
+
+
+def _concluir_depois(pasta, nome, atraso=0.2, conteudo=b'%PDF-1.4 certidao'):
+    """Simula o Chrome: grava .crdownload e renomeia ao terminar."""
+    def _run():
+        parcial = os.path.join(pasta, nome + '.crdownload')
+        with open(parcial, 'wb') as fh:
+            fh.write(conteudo)
+        time.sleep(atraso)
+        os.rename(parcial, os.path.join(pasta, nome))
+
+    t = threading.Thread(target=_run)
+    t.start()
+    return t
+
+
+@pytest.fixture(params=['inotify', 'polling'])
+def modo(request, monkeypatch):
+    if request.param == 'polling':
+        monkeypatch.setattr(monitor_download.sys, 'platform', 'win32')
+    elif not monitor_download.sys.platform.startswith('linux'):
+        pytest.skip('inotify so no Linux')
+    return request.param
+
+
+def test_detecta_download_concluido_e_ignora_existentes(tmp_path, modo):
+    (tmp_path / 'antigo.pdf').write_bytes(b'%PDF antigo')
+    (tmp_path / 'subdir').mkdir()
+    with monitor_download.MonitorDownload(str(tmp_path)) as monitor:
+        assert (monitor._inotify is not None) == (modo == 'inotify')
+        assert monitor.esperar(0.3) is None
+
+        t = _concluir_depois(str(tmp_path), 'cert.pdf')
+        (tmp_path / 'nota.txt').write_bytes(b'x')
+        inicio = time.monotonic()
+        caminho = None
+        while caminho is None and time.monotonic() - inicio < 5:
+            caminho = monitor.esperar(1.0)
+        t.join()
+        assert caminho == str(tmp_path / 'cert.pdf')
+        # ja entregue: nao volta de novo
+        assert monitor.esperar(0.6) is None
+
+
+def test_arquivo_existente_alterado_conta_como_novo(tmp_path, modo):
+    alvo = tmp_path / 'certidao.pdf'
+    alvo.write_bytes(b'%PDF v1')
+    os.utime(alvo, (1, 1))
+    with monitor_download.MonitorDownload(str(tmp_path)) as monitor:
+        with open(alvo, 'wb') as fh:
+            fh.write(b'%PDF versao 2')
+        assert monitor.esperar(3.0) == str(alvo)
+
+
+def test_termos_ignorados(tmp_path, modo):
+    with monitor_download.MonitorDownload(str(tmp_path), termos_ignorar=['CNDT']) as monitor:
+        _concluir_depois(str(tmp_path), 'cndt_123.pdf', atraso=0).join()
+        assert monitor.esperar(1.2) is None
+
+
+def test_pasta_emissao_preserva_arquivo_nao_movido(tmp_path, monkeypatch):
+    monkeypatch.setenv('DOWNLOADS_EMISSAO_DIR', str(tmp_path / 'emissoes'))
+    monkeypatch.setattr(os.path, 'expanduser', lambda _p: str(tmp_path))
+    (tmp_path / 'Downloads').mkdir()
+
+    pasta = monitor_download.pasta_emissao(42)
+    with open(os.path.join(pasta, 'sobrou.pdf'), 'wb') as fh:
+        fh.write(b'%PDF')
+    with open(os.path.join(pasta, 'x.crdownload'), 'wb') as fh:
+        fh.write(b'parcial')
+    monitor_download.MonitorDownload(pasta, pasta_propria=True).fechar()
+
+    assert not os.path.exists(pasta)
+    assert os.listdir(tmp_path / 'Downloads') == ['sobrou.pdf']
+
+    # fora da base de emissoes nada e removido
+    outra = tmp_path / 'outra'
+    outra.mkdir()
+    monitor_download.remover_pasta_emissao(str(outra))
+    assert outra.exists()
+
+
+def test_arquivo_concluido_entre_watch_e_base_nao_se_perde(tmp_path, monkeypatch):
+    if not monitor_download.sys.platform.startswith('linux'):
+        pytest.skip('inotify so no Linux')
+    varrer = monitor_download.MonitorDownload._varrer
+
+    def _varrer_com_download(self):
+        # o download termina depois do watch e antes da varredura da base
+        if not hasattr(self, '_base'):
+            (tmp_path / 'cert.pdf').write_bytes(b'%PDF-1.4 certidao')
+        return varrer(self)
+
+    monkeypatch.setattr(monitor_download.MonitorDownload, '_varrer', _varrer_com_download)
+    with monitor_download.MonitorDownload(str(tmp_path)) as monitor:
+        assert str(tmp_path / 'cert.pdf') in monitor._base
+        assert monitor.esperar(1.0) == str(tmp_path / 'cert.pdf')
+        assert monitor.esperar(0.3) is None
@@ -0,0 +1,92 @@
+"""OCR local do captcha de Imbe (services.ocr_captcha)."""
+import io
+import json
+
+import pytest
+from PIL import Image, ImageDraw
+
+from app.services import ocr_captcha
+
+
+def _png(texto='ab12'):
+    imagem = Image.new('RGB', (90, 30), (40, 40, 120))
+    ImageDraw.Draw(imagem).text((10, 8), texto, fill=(230, 230, 230))
+    saida = io.BytesIO()
+    imagem.save(saida, format='PNG')
+    return saida.getvalue()
+
+
+@pytest.fixture()
+def backend_fake():
+    respostas = {}
+    chamadas = []
+
+    def reconhecer(imagem, caracteres):
+        chamadas.append(imagem.size)
+        return respostas.get('texto', ''), respostas.get('confianca', 0.0)
+
+    ocr_captcha.registrar_backend('fake', reconhecer)
+    ocr_captcha.limpar_cache()
+    yield respostas, chamadas
+    ocr_captcha.BACKENDS.pop('fake', None)
+    ocr_captcha.limpar_cache()
+
+
+def test_preprocessamento_binariza_com_texto_escuro():
+    binaria, cinza = ocr_captcha.preprocessar(_png())
+    assert binaria.size == cinza.size == (270, 90)
+    cores = binaria.getcolors()
+    assert {c for _n, c in cores} <= {0, 255}
+    # fundo (maioria) claro depois da binarizacao, mesmo com imagem escura
+    assert dict((c, n) for n, c in cores)[255] > binaria.width * binaria.height / 2
+
+
+def test_confianca_decide_entre_ocr_e_2captcha(backend_fake):
+    respostas, chamadas = backend_fake
+    config = {'IMBE_OCR_BACKEND': 'fake', 'IMBE_OCR_CONFIANCA_MINIMA': 0.8, 'IMBE_OCR_TAMANHO': 4}
+
+    respostas.update(texto='ab 12', confianca=0.93)
+    palpite = ocr_captcha.reconhecer(config, _png())
+    assert (palpite['texto'], palpite['aceito'], palpite['backend']) == ('ab12', True, 'fake')
+    assert len(chamadas) == 2  # uma chamada por variante
+    # mesma imagem (antecipacao e depois resolucao): resultado em cache
+    assert ocr_captcha.reconhecer(config, _png())['aceito'] is True and len(chamadas) == 2
+
+    respostas.update(texto='ab1', confianca=0.99)  # tamanho errado: confianca zero
+    assert ocr_captcha.reconhecer(config, _png('x'))['aceito'] is False
+    respostas.update(texto='ab12', confianca=0.5)
+    assert ocr_captcha.reconhecer(config, _png('y'))['aceito'] is False
+
+    assert ocr_captcha.reconhecer({'IMBE_OCR_BACKEND': ''}, _png()) is None
+    assert ocr_captcha.reconhecer({'IMBE_OCR_BACKEND': 'inexistente'}, _png()) is None
+
+
+def test_amostras_gravadas_e_avaliadas_offline(backend_fake, tmp_path):
+    respostas, _ = backend_fake
+    config = {'IMBE_OCR_BACKEND': 'fake', 'IMBE_OCR_AMOSTRAS_DIR': str(tmp_path)}
+
+    respostas.update(texto='ab12', confianca=0.9)
+    certa = _png('ab12')
+    ocr = ocr_captcha.reconhecer(config, certa)
+    ocr_captcha.registrar_tentativa(config, {'imagem': certa, 'solver': 'ocr', 'resposta': 'ab12',
+                                             'ocr': ocr}, 'aceito')
+    # OCR recusado pelo portal e a 2a tentativa (2captcha) aceita: vira rotulo
+    errada = _png('zz99')
+    ocr = ocr_captcha.reconhecer(config, errada)
+    ocr_captcha.registrar_tentativa(config, {'imagem': errada, 'solver': 'ocr', 'resposta': 'ab12',
+                                             'ocr': ocr}, 'recusado')
+    ocr_captcha.registrar_tentativa(config, {'imagem': errada, 'solver': '2captcha',
+                                             'resposta': 'zz99', 'ocr': None}, 'aceito')
+
+    linhas = [json.loads(linha) for linha in (tmp_path / 'amostras.jsonl').read_text().splitlines()]
+    assert [(item['solver'], item['desfecho']) for item in linhas] == [
+        ('ocr', 'aceito'), ('ocr', 'recusado'), ('2captcha', 'aceito'),
+    ]
+    assert len(list(tmp_path.glob('*.png'))) == 2
+    assert ocr_captcha.registrar_tentativa(dict(config, IMBE_OCR_AMOSTRAS_ENABLED=False),
+                                           {'imagem': certa}, 'aceito') is None
+
+    resultado = ocr_captcha.avaliar_amostras(config, diretorio=str(tmp_path), backend='fake')
+    assert resultado['amostras'] == 2
+    assert resultado['acuracia'] == 0.5 and resultado['cobertura'] == 1.0
+    assert resultado['p50_ms'] is not None
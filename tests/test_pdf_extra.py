@@ -1,4 +1,5 @@
-"""Testes de pdf.py: extracao de texto/validade e tratamento de POSITIVA.
+"""Testes de pdf.py: extracao de texto/validade, cache por conteudo e
+tratamento de POSITIVA.
 
 pdfplumber e mockado com um PDF falso; o tratamento de POSITIVA usa um
 arquivo real em tmp_path + a certidao semeada pelo conftest.
@@ -85,3 +86,80 @@ def test_classificar_e_tratar_nao_positivo(app, ids, tmp_path, monkeypatch):
         assert classe == 'negativa'
         assert msg is None
         assert os.path.exists(str(arq))
+
+
+class _PaginaContada(_FakePage):
+    def __init__(self, texto, leituras):
+        super().__init__(texto)
+        self._leituras = leituras
+
+    def extract_text(self):
+        self._leituras.append(self._texto)
+        return self._texto
+
+
+def _pdf_contado(monkeypatch, paginas):
+    """pdfplumber falso que registra aberturas e paginas extraidas."""
+    aberturas, leituras = [], []
+
+    def _abrir(caminho):
+        aberturas.append(caminho)
+        return _FakePdf([_PaginaContada(t, leituras) for t in paginas])
+
+    monkeypatch.setattr(pdf.pdfplumber, 'open', _abrir)
+    pdf.limpar_cache()
+    return aberturas, leituras
+
+
+def test_cache_evita_reler_o_mesmo_arquivo(tmp_path, monkeypatch):
+    aberturas, _ = _pdf_contado(monkeypatch, ['CERTIDÃO NEGATIVA', 'Válida até 31/12/2030'])
+    arq = tmp_path / 'cert.pdf'
+    arq.write_bytes(b'%PDF conteudo A')
+
+    assert pdf.classificar_status(str(arq)) == 'negativa'
+    assert pdf.classificar_status(str(arq)) == 'negativa'
+    assert pdf.extrair_validade_federal(str(arq)) == date(2030, 12, 31)
+    assert pdf.extrair_texto(str(arq)).endswith('31/12/2030')
+    # 1a pagina (classificacao) + documento inteiro (validade na pagina 2)
+    assert len(aberturas) == 2
+
+    # mesmo conteudo em outro caminho: chave e o hash
+    copia = tmp_path / 'copia.pdf'
+    copia.write_bytes(b'%PDF conteudo A')
+    assert pdf.classificar_status(str(copia)) == 'negativa'
+    assert len(aberturas) == 2
+
+    # conteudo mudou: le de novo
+    arq.write_bytes(b'%PDF conteudo B (outro tamanho)')
+    pdf.classificar_status(str(arq))
+    assert len(aberturas) == 3
+    pdf.limpar_cache()
+
+
+def test_primeira_pagina_decide_sem_ler_o_resto(tmp_path, monkeypatch):
+    _, leituras = _pdf_contado(monkeypatch, ['CERTIDÃO POSITIVA', 'anexo', 'anexo'])
+    arq = tmp_path / 'cert.pdf'
+    arq.write_bytes(b'%PDF')
+    assert pdf.classificar_status(str(arq)) == 'positiva'
+    assert leituras == ['CERTIDÃO POSITIVA']
+
+    # sem veredito na 1a pagina: cai para o documento inteiro
+    _, leituras = _pdf_contado(monkeypatch, ['cabecalho', 'CERTIDÃO NEGATIVA'])
+    assert pdf.classificar_status(str(arq)) == 'negativa'
+    assert len(leituras) == 3
+    pdf.limpar_cache()
+
+
+def test_falha_de_leitura_nao_entra_no_cache(tmp_path, monkeypatch):
+    arq = tmp_path / 'cert.pdf'
+    arq.write_bytes(b'%PDF')
+    pdf.limpar_cache()
+
+    def _boom(_c):
+        raise OSError('arquivo ainda sendo gravado')
+    monkeypatch.setattr(pdf.pdfplumber, 'open', _boom)
+    assert pdf.classificar_status(str(arq)) == 'desconhecida'
+
+    monkeypatch.setattr(pdf.pdfplumber, 'open', lambda _c: _FakePdf([_FakePage('CERTIDÃO NEGATIVA')]))
+    assert pdf.classificar_status(str(arq)) == 'negativa'
+    pdf.limpar_cache()
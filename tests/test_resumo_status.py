@@ -0,0 +1,199 @@
+"""Agregados de status do dashboard (services.resumo_status).
+
+Cobre o recalculo incremental na escrita (certidao_service e commit direto),
+a virada do dia/mudanca de prazo (rebuild) e o consumo pelo dashboard e pelo
+contador de pendencias.
+"""
+from datetime import date, timedelta
+
+from app import db, routes
+from app.models import (
+    Certidao,
+    ConfiguracaoSistema,
+    Empresa,
+    ResumoStatus,
+    ResumoStatusControle,
+    StatusEspecial,
+    TipoCertidao,
+)
+from app.services import certidao_service, resumo_status
+
+
+def _contadores(empresa_id):
+    return resumo_status.contadores_por_empresa([empresa_id])[empresa_id]
+
+
+def test_rebuild_inicial_conta_por_status_e_tipo(app, ids):
+    with app.app_context():
+        resumo_status.garantir_atualizado()
+        ct = _contadores(ids['empresa'])
+        assert ct['total'] == 5 and ct['nao_definida'] == 5
+        assert ct['tipo_fgts'] == 1 and ct['tipo_municipal'] == 1
+        assert ct['menor_validade'] == '9999-12-31'
+        assert resumo_status.total_pendencias() == 0
+
+
+def test_escrita_atualiza_sem_rebuild(app, ids):
+    hoje = date.today()
+    with app.app_context():
+        resumo_status.garantir_atualizado()
+        controle_antes = db.session.get(ResumoStatusControle, 1).atualizado_em
+
+        cert = db.session.get(Certidao, ids['fgts'])
+        ok, _ = certidao_service.aplicar_validade(cert, hoje - timedelta(days=2))
+        assert ok
+        cert = db.session.get(Certidao, ids['trabalhista'])
+        certidao_service.marcar_pendente(cert)
+        # commit direto (como fazem os workers de lote)
+        cert = db.session.get(Certidao, ids['rs'])
+        cert.data_validade = hoje + timedelta(days=3)
+        db.session.commit()
+
+        ct = _contadores(ids['empresa'])
+        assert ct['vencidas'] == 1
+        assert ct['pendentes'] == 1
+        assert ct['a_vencer'] == 1
+        assert ct['nao_definida'] == 2
+        assert ct['menor_validade'] == (hoje - timedelta(days=2)).isoformat()
+        assert resumo_status.total_pendencias() == 2
+        assert db.session.get(ResumoStatusControle, 1).atualizado_em == controle_antes
+
+
+def test_virada_do_dia_reconstroi(app, ids):
+    hoje = date.today()
+    with app.app_context():
+        cert = db.session.get(Certidao, ids['fgts'])
+        cert.data_validade = hoje + timedelta(days=5)
+        db.session.commit()
+
+        # agregado calculado "ha 5 dias": a certidao ainda contava como valida
+        resumo_status.reconstruir(hoje=hoje - timedelta(days=5))
+        assert _contadores(ids['empresa'])['validas'] == 1
+        resumo_status.garantir_atualizado()
+        assert db.session.get(ResumoStatusControle, 1).data_referencia == hoje
+        assert _contadores(ids['empresa'])['a_vencer'] == 1
+        assert _contadores(ids['empresa'])['validas'] == 0
+
+
+def test_mudanca_de_prazo_reconstroi(app, ids):
+    hoje = date.today()
+    with app.app_context():
+        cert = db.session.get(Certidao, ids['fgts'])
+        cert.data_validade = hoje + timedelta(days=20)
+        db.session.commit()
+        resumo_status.garantir_atualizado()
+        assert _contadores(ids['empresa'])['validas'] == 1
+
+    with app.app_context():
+        db.session.add(ConfiguracaoSistema(id=1, a_vencer_dias=7, a_vencer_dias_fgts=30))
+        db.session.commit()
+    with app.app_context():
+        resumo_status.garantir_atualizado()
+        assert _contadores(ids['empresa'])['a_vencer'] == 1
+
+
+def test_remover_empresa_limpa_agregado(app, ids):
+    with app.app_context():
+        emp = Empresa(nome='Outra', cnpj='22.222.222/2222-22', estado='RS', cidade='Osorio')
+        db.session.add(emp)
+        db.session.flush()
+        db.session.add(Certidao(tipo=TipoCertidao.FEDERAL, empresa=emp))
+        db.session.commit()
+        resumo_status.garantir_atualizado()
+        assert ResumoStatus.query.filter_by(empresa_id=emp.id).count() == 1
+
+        db.session.delete(emp)
+        db.session.commit()
+        assert ResumoStatus.query.filter_by(empresa_id=emp.id).count() == 0
+
+
+def test_dashboard_e_api_usam_agregado(app, client, ids):
+    with app.app_context():
+        cert = db.session.get(Certidao, ids['fgts'])
+        cert.data_validade = date.today() - timedelta(days=1)
+        db.session.commit()
+    r = client.get('/')
+    assert r.status_code == 200
+    assert b'data-count-vencidas="1"' in r.data
+    assert client.get('/api/pendencias').get_json()['total'] == 1
+
+
+def test_expressao_sql_igual_a_classificar(app, ids):
+    """O CASE em SQL (com prazo por tipo) bate com a regra em Python."""
+    hoje = date.today()
+    limites = {t.name: 7 for t in TipoCertidao}
+    limites['FGTS'] = 30
+    cenarios = {
+        'fgts': (hoje + timedelta(days=20), None),
+        'rs': (hoje + timedelta(days=20), None),
+        'municipal': (hoje + timedelta(days=7), None),
+        'trabalhista': (hoje - timedelta(days=1), StatusEspecial.PENDENTE),
+    }
+    with app.app_context():
+        for chave, (validade, especial) in cenarios.items():
+            cert = db.session.get(Certidao, ids[chave])
+            cert.data_validade = validade
+            cert.status_especial = especial
+        db.session.commit()
+
+        via_sql = resumo_status.status_por_certidao([ids['empresa']], hoje, limites)
+        for cert in Certidao.query.filter_by(empresa_id=ids['empresa']):
+            esperado = resumo_status.classificar(
+                cert.tipo, cert.data_validade, cert.status_especial, hoje, limites)
+            assert via_sql[cert.id] == esperado
+        assert via_sql[ids['fgts']] == 'a_vencer'
+        assert via_sql[ids['rs']] == 'validas'
+        assert via_sql[ids['municipal']] == 'a_vencer'
+        assert via_sql[ids['trabalhista']] == 'pendentes'
+
+
+def test_rebuild_nao_mexe_na_sessao_do_request(app, ids):
+    # o rebuild roda em transacao propria: o que o request deixou pendente na
+    # sessao nao e commitado nem descartado por ele
+    hoje = date.today()
+    with app.app_context():
+        resumo_status.reconstruir(hoje=hoje - timedelta(days=1))
+        cert = db.session.get(Certidao, ids['fgts'])
+        cert.data_validade = hoje - timedelta(days=1)   # pendente, sem flush
+
+        assert resumo_status.garantir_atualizado()
+        assert cert in db.session.dirty
+        assert not resumo_status.garantir_atualizado()  # ja atualizado: nao refaz
+        db.session.rollback()
+        assert db.session.get(Certidao, ids['fgts']).data_validade is None
+
+
+def test_contador_de_pendencias_so_le(app, ids):
+    hoje = date.today()
+    with app.app_context():
+        resumo_status.reconstruir(hoje=hoje - timedelta(days=1))
+        routes._contar_pendencias()
+        assert db.session.get(ResumoStatusControle, 1).data_referencia == hoje - timedelta(days=1)
+
+
+def test_falha_incremental_mantem_empresa_e_marca_rebuild(app, ids, monkeypatch):
+    # INSERT ... SELECT falhando: o DELETE volta com o savepoint, a escrita do
+    # usuario e commitada e o controle fica desatualizado para o rebuild
+    hoje = date.today()
+    with app.app_context():
+        resumo_status.garantir_atualizado()
+        linhas_antes = ResumoStatus.query.filter_by(empresa_id=ids['empresa']).count()
+
+        def falhar(*a, **kw):
+            raise RuntimeError('agregado indisponivel')
+
+        monkeypatch.setattr(resumo_status, '_select_agregado', falhar)
+        cert = db.session.get(Certidao, ids['fgts'])
+        cert.data_validade = hoje - timedelta(days=2)
+        db.session.commit()
+        db.session.expire_all()
+
+        assert db.session.get(Certidao, ids['fgts']).data_validade == hoje - timedelta(days=2)
+        assert ResumoStatus.query.filter_by(empresa_id=ids['empresa']).count() == linhas_antes
+        visiveis = resumo_status.filtrar_empresas(Empresa.query).all()
+        assert ids['empresa'] in [e.id for e in visiveis]
+        assert db.session.get(ResumoStatusControle, 1) is None
+
+        monkeypatch.undo()
+        assert resumo_status.garantir_atualizado()
+        assert _contadores(ids['empresa'])['vencidas'] == 1
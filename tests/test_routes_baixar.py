@@ -70,18 +70,22 @@ def test_validar_baixar_federal_redireciona(app, ids):
         assert resp.status_code == 302  # redirect para a Receita
 
 
-def test_validar_baixar_rs_lote_ativo(app, ids):
-    original = routes.RS_BATCH_STATE.get('status')
+def test_baixar_rs_espera_perfil_do_lote_no_agendador(app, client, ids, monkeypatch):
+    # o perfil RS e disputado pelo agendador: com o lote segurando o perfil, a
+    # emissao individual espera na fila e desiste com 409 indicando o ocupante
+    from app.services import agendador
+    _mock_automacao(monkeypatch, routes._resultado_baixar_vazio())
+    monkeypatch.setitem(app.config, 'AGENDADOR_ESPERA_INDIVIDUAL_SEGUNDOS', 0)
     with app.app_context():
         cert = Certidao.query.filter_by(tipo=TipoCertidao.ESTADUAL).first()  # empresa semeada e RS
-        routes.RS_BATCH_STATE['status'] = 'running'
-        try:
-            resp = routes._validar_baixar(cert)
-        finally:
-            routes.RS_BATCH_STATE['status'] = original
-    assert resp is not None
-    _body, code = resp  # _json_error -> (response, code)
-    assert code == 400
+    lote = agendador.reservar('Lote Estadual RS', {'perfil_rs': 1})
+    try:
+        r = client.get(f'/certidao/baixar/{cert.id}')
+    finally:
+        lote.liberar()
+    assert r.status_code == 409
+    assert 'Lote Estadual RS' in r.get_json()['message']
+    assert agendador.estado()['fila'] == []
 
 
 def test_validar_baixar_fgts_lote_ativo(app, ids):
@@ -201,3 +205,28 @@ def test_resposta_rs_positiva(app, ids):
         j = resp.get_json()
         assert j['status'] == 'estadual_rs_positiva'
         assert j['message'] == 'POSITIVA detectada'
+
+
+def test_fechar_navegador_nao_devolve_driver_ao_pool(monkeypatch):
+    # a devolucao ao pool acontece uma vez so, no finally da automacao: devolver
+    # aqui tambem entregaria o mesmo Chrome a duas emissoes
+    devolvidos = []
+    monkeypatch.setattr(routes, 'devolver_driver', lambda d, falhou=False: devolvidos.append(d))
+    monkeypatch.setattr(routes.time, 'sleep', lambda s: None)
+
+    class _Driver:
+        window_handles = ['a', 'b']
+        fechadas = 0
+
+        class switch_to:
+            @staticmethod
+            def window(handle):
+                pass
+
+        def close(self):
+            self.fechadas += 1
+
+    driver = _Driver()
+    routes._baixar_fechar_navegador(driver, Certidao(id=1))
+    assert driver.fechadas == 1
+    assert devolvidos == []
@@ -0,0 +1,62 @@
+"""Stream SSE de progresso dos lotes e pendencias (services.stream_eventos)."""
+import json
+
+from app.services import stream_eventos
+
+
+def _eventos(blocos):
+    saida = []
+    for bloco in blocos:
+        if bloco.startswith('event: '):
+            cabecalho, dados = bloco.strip().split('\n', 1)
+            saida.append((cabecalho[len('event: '):], json.loads(dados[len('data: '):])))
+    return saida
+
+
+def test_fluxo_envia_snapshot_e_depois_so_o_que_mudou():
+    estado = {'status': 'running', 'index': 0, 'total': 3}
+    chamadas = {'pend': 0}
+
+    def pendencias():
+        chamadas['pend'] += 1
+        return {'total': 7}
+
+    fontes = [
+        ('fgts', 'lote', lambda: dict(estado), None),
+        ('pendencias', 'pendencias', pendencias, 'pendencias'),
+    ]
+    gerador = stream_eventos.fluxo(fontes, intervalo=0.01, duracao_maxima=5, retry_ms=1500)
+    assert next(gerador) == 'retry: 1500\n\n'
+    assert _eventos([next(gerador), next(gerador)]) == [
+        ('lote', {'chave': 'fgts', 'status': 'running', 'index': 0, 'total': 3}),
+        ('pendencias', {'chave': 'pendencias', 'total': 7}),
+    ]
+
+    estado['index'] = 1
+    stream_eventos.notificar('lote')
+    assert _eventos([next(gerador)]) == [('lote', {'chave': 'fgts', 'index': 1})]
+    # fonte com canal so e recalculada quando o canal e notificado
+    assert chamadas['pend'] == 1
+
+    stream_eventos.notificar('pendencias')
+    estado['status'] = 'completed'
+    assert _eventos([next(gerador)]) == [('lote', {'chave': 'fgts', 'status': 'completed'})]
+    assert chamadas['pend'] == 2  # recalculou, mas total igual nao gera evento
+    gerador.close()
+
+
+def test_rota_stream_envia_lotes_e_pendencias(app, ids, client):
+    app.config['SSE_DURACAO_MAXIMA_SEGUNDOS'] = 0
+    try:
+        resp = client.get('/eventos/stream')
+        assert resp.status_code == 200
+        assert resp.mimetype == 'text/event-stream'
+        assert resp.headers['Cache-Control'] == 'no-cache'
+        eventos = _eventos(resp.get_data(as_text=True).split('\n\n'))
+    finally:
+        app.config['SSE_DURACAO_MAXIMA_SEGUNDOS'] = 300
+    chaves = {dados['chave']: evento for evento, dados in eventos}
+    assert chaves == {'fgts': 'lote', 'estadual_rs': 'lote', 'municipal': 'lote', 'pendencias': 'pendencias'}
+    lote = next(dados for evento, dados in eventos if dados['chave'] == 'fgts')
+    assert 'status' in lote
+    assert isinstance(next(d for _, d in eventos if d['chave'] == 'pendencias')['total'], int)
@@ -0,0 +1,37 @@
+"""Mede acuracia e latencia do OCR local do captcha de Imbe sobre as
+amostras gravadas pelo fluxo (IMBE_OCR_AMOSTRAS_DIR): so as respostas
+aceitas pelo portal contam como rotulo.
+
+    python tools/benchmark_ocr_imbe.py [diretorio] [--backend tesseract] [--minima 0.8]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import Config  # noqa: E402
+from app.services import ocr_captcha  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('diretorio', nargs='?', default=Config.IMBE_OCR_AMOSTRAS_DIR)
+    parser.add_argument('--backend', default=Config.IMBE_OCR_BACKEND or 'tesseract')
+    parser.add_argument('--minima', type=float, default=Config.IMBE_OCR_CONFIANCA_MINIMA)
+    args = parser.parse_args()
+
+    config = {
+        'IMBE_OCR_CONFIANCA_MINIMA': args.minima,
+        'IMBE_OCR_CARACTERES': Config.IMBE_OCR_CARACTERES,
+        'IMBE_OCR_TAMANHO': Config.IMBE_OCR_TAMANHO,
+    }
+    resultado = ocr_captcha.avaliar_amostras(config, diretorio=args.diretorio, backend=args.backend)
+    print(json.dumps(resultado, indent=2))
+
+
+if __name__ == '__main__':
+    main()